@@ -1,22 +1,24 @@
 from __future__ import annotations
 
+import logging
 import os
 import tempfile
+import threading
+import time
+from datetime import date, datetime
+from decimal import Decimal
 from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
-import pandas as pd
 import psycopg
 from fastapi import APIRouter, Header, HTTPException, Query
-from fastapi.responses import FileResponse
-
-import matplotlib
-
-matplotlib.use("Agg")
-
-import matplotlib.pyplot as plt
-import seaborn as sns
+from fastapi.responses import FileResponse, JSONResponse, Response
+from starlette.concurrency import run_in_threadpool
 
 from ..db import get_conn
+from .chart_cache import CachedChart, ChartCache
+from .downsample import bucket_bounds, bucket_mean, lttb_multi_indices
+from .render_pool import RenderTimeout, render_pool
 
 
 router = APIRouter(prefix="/api/admin/analytics", tags=["admin_analytics"])
@@ -25,6 +27,42 @@ router = APIRouter(prefix="/api/admin/analytics", tags=["admin_analytics"])
 _PROJECT_ROOT = Path(__file__).resolve().parents[2]
 _STATIC_DIR = _PROJECT_ROOT / "static"
 _OUT_DIR = _STATIC_DIR / "analytics"
+_CACHE_DIR = _OUT_DIR / "cache"
+
+_log = logging.getLogger("globalcart")
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, str(default)))
+    except ValueError:
+        return default
+
+
+def _watermark_check_seconds() -> int:
+    return max(0, _env_int("CHART_WATERMARK_CHECK_SECONDS", 5))
+
+
+def _fallback_ttl_seconds() -> int:
+    return max(1, _env_int("CHART_CACHE_TTL_SECONDS", 300))
+
+
+def _prewarm_interval_seconds() -> int:
+    return max(1, _env_int("CHART_PREWARM_INTERVAL_SECONDS", 30))
+
+
+def _cache_max_age_seconds() -> int:
+    return max(0, _env_int("CHART_CACHE_MAX_AGE_SECONDS", 60))
+
+
+_CHART_CACHE = ChartCache(
+    cache_dir=_CACHE_DIR,
+    publish_dir=_OUT_DIR,
+    max_entries=_env_int("CHART_CACHE_MAX_ENTRIES", 64),
+)
+
+_WM_LOCK = threading.Lock()
+_WM_STATE: Dict[str, Any] = {"value": None, "checked_at": 0.0}
 
 
 def _require_admin(admin_key: str | None) -> None:
@@ -33,58 +71,213 @@ def _require_admin(admin_key: str | None) -> None:
         raise HTTPException(status_code=403, detail="Admin access required")
 
 
-def _read_df(sql: str, params: tuple | None = None) -> pd.DataFrame:
+def _read_rows(sql: str, params: tuple | None = None) -> Tuple[List[str], List[tuple]]:
     with get_conn() as conn:
         conn.execute("SET TIME ZONE 'UTC';", prepare=False)
         with conn.cursor() as cur:
             cur.execute(sql, params or ())
             rows = cur.fetchall()
             cols = [c.name for c in (cur.description or [])]
-    return pd.DataFrame(rows, columns=cols)
+    return cols, rows
+
+
+def _png_response(path: Path) -> FileResponse:
+    return FileResponse(path=path, media_type="image/png", filename=path.name)
 
 
-def _save_png(fig, filename: str) -> Path:
+def _placeholder_chart(filename: str, title: str, subtitle: str = "Demo mode: PostgreSQL unavailable") -> FileResponse:
     _OUT_DIR.mkdir(parents=True, exist_ok=True)
     out_path = _OUT_DIR / filename
     with tempfile.NamedTemporaryFile(dir=str(_OUT_DIR), suffix=".png", delete=False) as tmp:
         tmp_path = Path(tmp.name)
-    fig.tight_layout()
-    fig.savefig(tmp_path, dpi=180, bbox_inches="tight", pad_inches=0.05)
-    os.replace(tmp_path, out_path)
-    return out_path
+    try:
+        render_pool.render("placeholder", tmp_path, [], [], {"title": title, "subtitle": subtitle})
+        os.replace(tmp_path, out_path)
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
+    return _png_response(out_path)
+
+
+def _etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = [t.strip() for t in if_none_match.split(",")]
+    return "*" in tags or etag in tags or f"W/{etag}" in tags
+
+
+def _cached_png_response(cached: CachedChart, if_none_match: str | None) -> Response:
+    headers = {
+        "ETag": cached.etag,
+        "Cache-Control": f"private, max-age={_cache_max_age_seconds()}",
+        "X-Chart-Watermark": cached.watermark,
+    }
+    if _etag_matches(if_none_match, cached.etag):
+        return Response(status_code=304, headers=headers)
+    return FileResponse(
+        path=cached.path,
+        media_type="image/png",
+        filename=f"{cached.chart}.png",
+        headers=headers,
+    )
 
 
-def _png_response(path: Path) -> FileResponse:
-    return FileResponse(path=path, media_type="image/png", filename=path.name)
+def _mart_watermark(force: bool = False) -> str:
+    """Timestamp of the last refresh_bi_marts() run, checked at most every few seconds."""
+    now = time.time()
+    with _WM_LOCK:
+        cached = _WM_STATE["value"]
+        if not force and cached is not None and now - float(_WM_STATE["checked_at"]) < _watermark_check_seconds():
+            return str(cached)
 
+    wm: Optional[str] = None
+    try:
+        with get_conn() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    "SELECT last_processed_ts FROM globalcart.etl_watermarks WHERE source_name = %s;",
+                    ("bi_marts",),
+                )
+                row = cur.fetchone()
+        if row and row[0] is not None:
+            wm = row[0].isoformat()
+    except (psycopg.errors.UndefinedTable, psycopg.errors.InvalidSchemaName):
+        wm = None
+
+    if wm is None:
+        # Marts built before the watermark existed: fall back to time-bucketed expiry.
+        wm = f"ttl-{int(now // _fallback_ttl_seconds())}"
+
+    with _WM_LOCK:
+        _WM_STATE["value"] = wm
+        _WM_STATE["checked_at"] = now
+    return wm
+
+
+def _render_chart(chart: str, params: Dict[str, Any], out_path: Path) -> None:
+    # SQL runs in the calling (threadpool) thread; only the drawing goes to the render pool.
+    cols, rows = _CHART_FETCHERS[chart](**params)
+    render_pool.render(chart, out_path, cols, rows, params)
+
+
+async def _serve_chart(
+    chart: str,
+    params: Dict[str, Any],
+    if_none_match: str | None,
+) -> Response:
+    watermark = await run_in_threadpool(_mart_watermark)
+    cached = _CHART_CACHE.peek(chart, params, watermark)
+    if cached is None:
+        cached = await run_in_threadpool(
+            _CHART_CACHE.get_or_render,
+            chart,
+            params,
+            watermark,
+            lambda path: _render_chart(chart, params, path),
+        )
+    return _cached_png_response(cached, if_none_match)
 
-def _placeholder_chart(filename: str, title: str) -> FileResponse:
-    sns.set_theme(style="whitegrid")
-    fig, ax = plt.subplots(figsize=(10, 5.0))
-    ax.text(
-        0.5,
-        0.55,
-        title,
-        ha="center",
-        va="center",
-        fontsize=14,
-    )
-    ax.text(
-        0.5,
-        0.40,
-        "Demo mode: PostgreSQL unavailable",
-        ha="center",
-        va="center",
-        fontsize=11,
-        color="#6b7280",
-    )
-    ax.axis("off")
-    path = _save_png(fig, filename)
-    plt.close(fig)
-    return _png_response(path)
 
+_MARTS_MISSING = "Mart tables not found. Run: python3 -m src.run_sql --sql sql/06_bi_marts.sql"
+_RENDER_TIMED_OUT = "Chart rendering timed out; try again shortly"
+
+
+def _fetch_sales_trend(window_days: int) -> Tuple[List[str], List[tuple]]:
+    sql = """
+        SELECT
+          kpi_dt::date AS dt,
+          orders,
+          revenue_ex_tax,
+          net_profit_ex_tax,
+          refund_amount_return_dt
+        FROM globalcart.mart_exec_daily_kpis
+        WHERE kpi_dt >= (CURRENT_DATE - (%s::int * INTERVAL '1 day'))
+        ORDER BY kpi_dt;
+    """
+    cols, rows = _read_rows(sql, (int(window_days),))
+    if not rows:
+        raise HTTPException(status_code=404, detail="No data in mart_exec_daily_kpis")
+    return cols, rows
+
+
+def _fetch_orders_vs_revenue(window_days: int) -> Tuple[List[str], List[tuple]]:
+    sql = """
+        SELECT
+          kpi_dt::date AS dt,
+          orders,
+          revenue_ex_tax
+        FROM globalcart.mart_exec_daily_kpis
+        WHERE kpi_dt >= (CURRENT_DATE - (%s::int * INTERVAL '1 day'))
+        ORDER BY kpi_dt;
+    """
+    cols, rows = _read_rows(sql, (int(window_days),))
+    if not rows:
+        raise HTTPException(status_code=404, detail="No data in mart_exec_daily_kpis")
+    return cols, rows
+
+
+def _fetch_funnel_conversion(window_days: int) -> Tuple[List[str], List[tuple]]:
+    sql = """
+        SELECT
+          COALESCE(SUM(product_views),0) AS product_views,
+          COALESCE(SUM(add_to_cart),0) AS add_to_cart,
+          COALESCE(SUM(checkout_started),0) AS checkout_started,
+          COALESCE(SUM(payment_attempts),0) AS payment_attempts,
+          COALESCE(SUM(orders_placed),0) AS orders_placed
+        FROM globalcart.mart_funnel_conversion
+        WHERE event_dt >= (CURRENT_DATE - (%s::int * INTERVAL '1 day'));
+    """
+    cols, rows = _read_rows(sql, (int(window_days),))
+    if not rows:
+        raise HTTPException(status_code=404, detail="No data in mart_funnel_conversion")
+    return cols, rows
+
+
+def _fetch_top_products(window_days: int, top_n: int) -> Tuple[List[str], List[tuple]]:
+    sql = """
+        SELECT
+          p.product_id,
+          dp.product_name,
+          COALESCE(SUM(p.revenue_ex_tax),0) AS revenue_ex_tax
+        FROM globalcart.mart_product_performance p
+        JOIN globalcart.dim_product dp ON dp.product_id = p.product_id
+        WHERE p.dt >= (CURRENT_DATE - (%s::int * INTERVAL '1 day'))
+        GROUP BY 1,2
+        ORDER BY revenue_ex_tax DESC
+        LIMIT %s;
+    """
+    cols, rows = _read_rows(sql, (int(window_days), int(top_n)))
+    if not rows:
+        raise HTTPException(status_code=404, detail="No data in mart_product_performance")
+    return cols, rows
+
+
+def _fetch_category_contribution(window_days: int, level: str, top_n: int) -> Tuple[List[str], List[tuple]]:
+    if level not in {"category_l1", "category_l2"}:
+        raise HTTPException(status_code=400, detail="level must be category_l1 or category_l2")
+
+    sql = f"""
+        SELECT
+          {level} AS category,
+          COALESCE(SUM(revenue_ex_tax),0) AS revenue_ex_tax
+        FROM globalcart.mart_product_performance
+        WHERE dt >= (CURRENT_DATE - (%s::int * INTERVAL '1 day'))
+          AND {level} IS NOT NULL
+        GROUP BY 1
+        ORDER BY revenue_ex_tax DESC
+        LIMIT %s;
+    """
+    cols, rows = _read_rows(sql, (int(window_days), int(top_n)))
+    if not rows:
+        raise Exception("No data in mart_product_performance for window")
+
+    total = sum(float(r[1] or 0) for r in rows)
+    if total <= 0:
+        raise Exception("Zero revenue in mart_product_performance for window")
+    return cols, rows
 
-def _build_refund_leakage_chart(window_days: int) -> Path:
+
+def _fetch_refund_leakage(window_days: int) -> Tuple[List[str], List[tuple]]:
     sql = """
         SELECT
           order_dt::date AS dt,
@@ -96,347 +289,423 @@ def _build_refund_leakage_chart(window_days: int) -> Path:
         GROUP BY 1
         ORDER BY 1;
     """
-    df = _read_df(sql, (int(window_days),))
-    if df.empty:
+    cols, rows = _read_rows(sql, (int(window_days),))
+    if not rows:
         raise HTTPException(status_code=404, detail="No data in mart_finance_profitability")
+    return cols, rows
+
+
+_CHART_FETCHERS: Dict[str, Callable[..., Tuple[List[str], List[tuple]]]] = {
+    "sales_trend": _fetch_sales_trend,
+    "orders_vs_revenue": _fetch_orders_vs_revenue,
+    "funnel_conversion": _fetch_funnel_conversion,
+    "top_products": _fetch_top_products,
+    "category_contribution": _fetch_category_contribution,
+    "refund_leakage": _fetch_refund_leakage,
+}
+
+# Parameters the admin dashboard requests by default; these are re-rendered after each mart refresh.
+_PREWARM_CHARTS: List[Tuple[str, Dict[str, Any]]] = [
+    ("sales_trend", {"window_days": 90}),
+    ("orders_vs_revenue", {"window_days": 90}),
+    ("funnel_conversion", {"window_days": 30}),
+    ("top_products", {"window_days": 30, "top_n": 10}),
+    ("category_contribution", {"window_days": 30, "level": "category_l1", "top_n": 10}),
+    ("refund_leakage", {"window_days": 90}),
+]
+
+
+async def _chart_route(chart: str, params: Dict[str, Any], if_none_match: str | None, title: str) -> Response:
+    try:
+        return await _serve_chart(chart, params, if_none_match)
+    except HTTPException:
+        raise
+    except RenderTimeout:
+        raise HTTPException(status_code=504, detail=_RENDER_TIMED_OUT)
+    except psycopg.OperationalError:
+        return await run_in_threadpool(_placeholder_chart, f"{chart}.png", title)
+    except (psycopg.errors.UndefinedTable, psycopg.errors.InvalidSchemaName):
+        raise HTTPException(status_code=500, detail=_MARTS_MISSING)
+    except Exception:
+        _log.exception("chart %s failed", chart)
+        raise HTTPException(status_code=500, detail=f"Failed to generate {chart} chart")
 
-    sns.set_theme(style="whitegrid")
-    fig, ax1 = plt.subplots(figsize=(12, 5.6))
 
-    sns.lineplot(data=df, x="dt", y="refund_amount", ax=ax1, color="#dc2626", label="Refunds")
-    ax1.set_ylabel("Refunds", color="#dc2626")
-    ax1.tick_params(axis="y", labelcolor="#dc2626")
+@router.get("/sales_trend")
+async def sales_trend(
+    window_days: int = Query(90, ge=7, le=365),
+    admin_key: str | None = Header(None, alias="X-Admin-Key"),
+    if_none_match: str | None = Header(None, alias="If-None-Match"),
+) -> Response:
+    _require_admin(admin_key)
+    return await _chart_route("sales_trend", {"window_days": int(window_days)}, if_none_match, "Daily Revenue Trend")
 
-    ax2 = ax1.twinx()
-    sns.lineplot(data=df, x="dt", y="net_profit_ex_tax", ax=ax2, color="#16a34a", label="Net profit (ex tax)")
-    ax2.set_ylabel("Net profit (ex tax)", color="#16a34a")
-    ax2.tick_params(axis="y", labelcolor="#16a34a")
 
-    ax1.set_title("Refund / Leakage Trend")
-    ax1.set_xlabel("")
-    ax1.tick_params(axis="x", rotation=30)
+@router.get("/orders_vs_revenue")
+async def orders_vs_revenue(
+    window_days: int = Query(90, ge=7, le=3650),
+    admin_key: str | None = Header(None, alias="X-Admin-Key"),
+    if_none_match: str | None = Header(None, alias="If-None-Match"),
+) -> Response:
+    _require_admin(admin_key)
+    return await _chart_route("orders_vs_revenue", {"window_days": int(window_days)}, if_none_match, "Orders vs Revenue")
 
-    h1, l1 = ax1.get_legend_handles_labels()
-    h2, l2 = ax2.get_legend_handles_labels()
-    ax1.legend(h1 + h2, l1 + l2, loc="upper left")
 
-    path = _save_png(fig, "refund_leakage.png")
-    plt.close(fig)
-    return path
+@router.get("/funnel_conversion")
+async def funnel_conversion(
+    window_days: int = Query(30, ge=7, le=3650),
+    admin_key: str | None = Header(None, alias="X-Admin-Key"),
+    if_none_match: str | None = Header(None, alias="If-None-Match"),
+) -> Response:
+    _require_admin(admin_key)
+    return await _chart_route("funnel_conversion", {"window_days": int(window_days)}, if_none_match, "Funnel Conversion")
 
 
-@router.get("/sales_trend")
-def sales_trend(
-    window_days: int = Query(90, ge=7, le=365),
+@router.get("/top_products")
+async def top_products(
+    window_days: int = Query(30, ge=7, le=3650),
+    top_n: int = Query(10, ge=5, le=50),
     admin_key: str | None = Header(None, alias="X-Admin-Key"),
-) -> FileResponse:
-    try:
-        _require_admin(admin_key)
-
-        sql = """
-            SELECT
-              kpi_dt::date AS dt,
-              orders,
-              revenue_ex_tax,
-              net_profit_ex_tax,
-              refund_amount_return_dt
-            FROM globalcart.mart_exec_daily_kpis
-            WHERE kpi_dt >= (CURRENT_DATE - (%s::int * INTERVAL '1 day'))
-            ORDER BY kpi_dt;
-        """
-        df = _read_df(sql, (int(window_days),))
-        if df.empty:
-            raise HTTPException(status_code=404, detail="No data in mart_exec_daily_kpis")
-
-        sns.set_theme(style="whitegrid")
-        fig, ax = plt.subplots(figsize=(12, 5.6))
-        sns.lineplot(data=df, x="dt", y="revenue_ex_tax", ax=ax, label="Revenue (ex tax)")
-        sns.lineplot(data=df, x="dt", y="refund_amount_return_dt", ax=ax, label="Refunds")
-        ax.set_title("Daily Revenue Trend")
-        ax.set_xlabel("")
-        ax.set_ylabel("Amount")
-        ax.tick_params(axis="x", rotation=30)
-
-        path = _save_png(fig, "sales_trend.png")
-        plt.close(fig)
+    if_none_match: str | None = Header(None, alias="If-None-Match"),
+) -> Response:
+    _require_admin(admin_key)
+    return await _chart_route(
+        "top_products",
+        {"window_days": int(window_days), "top_n": int(top_n)},
+        if_none_match,
+        "Top Products",
+    )
 
-        try:
-            _build_refund_leakage_chart(int(window_days))
-        except HTTPException:
-            pass
 
-        return _png_response(path)
+@router.get("/category_contribution")
+async def category_contribution(
+    window_days: int = Query(30, ge=7, le=3650),
+    level: str = Query("category_l1"),
+    top_n: int = Query(10, ge=3, le=50),
+    admin_key: str | None = Header(None, alias="X-Admin-Key"),
+    if_none_match: str | None = Header(None, alias="If-None-Match"),
+) -> Response:
+    _require_admin(admin_key)
+
+    lvl = (level or "").strip().lower()
+    if lvl not in {"category_l1", "category_l2"}:
+        raise HTTPException(status_code=400, detail="level must be category_l1 or category_l2")
 
-    except psycopg.OperationalError:
-        return _placeholder_chart("sales_trend.png", "Daily Revenue Trend")
-    except (psycopg.errors.UndefinedTable, psycopg.errors.InvalidSchemaName):
-        raise HTTPException(
-            status_code=500,
-            detail="Mart tables not found. Run: python3 -m src.run_sql --sql sql/06_bi_marts.sql",
+    try:
+        return await _serve_chart(
+            "category_contribution",
+            {"window_days": int(window_days), "level": lvl, "top_n": int(top_n)},
+            if_none_match,
         )
-    except Exception as e:
-        import traceback, sys
-        print("ERROR in sales_trend:", e, file=sys.stderr)
-        print(traceback.format_exc(), file=sys.stderr)
-        raise HTTPException(status_code=500, detail="Failed to generate sales_trend chart")
+    except RenderTimeout:
+        raise HTTPException(status_code=504, detail=_RENDER_TIMED_OUT)
+    except Exception:
+        _log.exception("chart %s failed", "category_contribution")
+        # Fallback: generate a placeholder chart
+        try:
+            return await run_in_threadpool(
+                _placeholder_chart,
+                "category_contribution.png",
+                "Category Revenue Share (Last 30 days)",
+                "No data available",
+            )
+        except Exception:
+            _log.exception("chart %s placeholder failed", "category_contribution")
+            raise HTTPException(status_code=500, detail="Failed to generate category_contribution chart")
 
 
-@router.get("/orders_vs_revenue")
-def orders_vs_revenue(
+@router.get("/refund_leakage")
+async def refund_leakage(
     window_days: int = Query(90, ge=7, le=3650),
     admin_key: str | None = Header(None, alias="X-Admin-Key"),
-) -> FileResponse:
-    try:
-        _require_admin(admin_key)
-
-        sql = """
-            SELECT
-              kpi_dt::date AS dt,
-              orders,
-              revenue_ex_tax
-            FROM globalcart.mart_exec_daily_kpis
-            WHERE kpi_dt >= (CURRENT_DATE - (%s::int * INTERVAL '1 day'))
-            ORDER BY kpi_dt;
-        """
-        df = _read_df(sql, (int(window_days),))
-        if df.empty:
-            raise HTTPException(status_code=404, detail="No data in mart_exec_daily_kpis")
-
-        sns.set_theme(style="whitegrid")
-        fig, ax1 = plt.subplots(figsize=(12, 5.6))
-
-        sns.lineplot(data=df, x="dt", y="orders", ax=ax1, color="#2563eb", label="Orders")
-        ax1.set_ylabel("Orders", color="#2563eb")
-        ax1.tick_params(axis="y", labelcolor="#2563eb")
-
-        ax2 = ax1.twinx()
-        sns.lineplot(data=df, x="dt", y="revenue_ex_tax", ax=ax2, color="#16a34a", label="Revenue (ex tax)")
-        ax2.set_ylabel("Revenue (ex tax)", color="#16a34a")
-        ax2.tick_params(axis="y", labelcolor="#16a34a")
-
-        ax1.set_title("Orders vs Revenue")
-        ax1.set_xlabel("")
-        ax1.tick_params(axis="x", rotation=30)
-
-        h1, l1 = ax1.get_legend_handles_labels()
-        h2, l2 = ax2.get_legend_handles_labels()
-        ax1.legend(h1 + h2, l1 + l2, loc="upper left")
-
-        path = _save_png(fig, "orders_vs_revenue.png")
-        plt.close(fig)
-
-        return _png_response(path)
+    if_none_match: str | None = Header(None, alias="If-None-Match"),
+) -> Response:
+    _require_admin(admin_key)
+    return await _chart_route("refund_leakage", {"window_days": int(window_days)}, if_none_match, "Refund / Leakage Trend")
 
-    except psycopg.OperationalError:
-        return _placeholder_chart("orders_vs_revenue.png", "Orders vs Revenue")
-    except (psycopg.errors.UndefinedTable, psycopg.errors.InvalidSchemaName):
-        raise HTTPException(
-            status_code=500,
-            detail="Mart tables not found. Run: python3 -m src.run_sql --sql sql/06_bi_marts.sql",
-        )
-    except Exception as e:
-        import traceback, sys
-        print("ERROR in orders_vs_revenue:", e, file=sys.stderr)
-        print(traceback.format_exc(), file=sys.stderr)
-        raise HTTPException(status_code=500, detail="Failed to generate orders_vs_revenue chart")
 
+# --- Chart data (JSON) -------------------------------------------------------------------------
+# Same aggregates as the PNG routes, as compact columnar JSON so the UI can draw charts itself.
 
-@router.get("/funnel_conversion")
-def funnel_conversion(
-    window_days: int = Query(30, ge=7, le=3650),
-    admin_key: str | None = Header(None, alias="X-Admin-Key"),
-):
-    try:
-        _require_admin(admin_key)
-
-        sql = """
-            SELECT
-              COALESCE(SUM(product_views),0) AS product_views,
-              COALESCE(SUM(add_to_cart),0) AS add_to_cart,
-              COALESCE(SUM(checkout_started),0) AS checkout_started,
-              COALESCE(SUM(payment_attempts),0) AS payment_attempts,
-              COALESCE(SUM(orders_placed),0) AS orders_placed
-            FROM globalcart.mart_funnel_conversion
-            WHERE event_dt >= (CURRENT_DATE - (%s::int * INTERVAL '1 day'));
-        """
-        df = _read_df(sql, (int(window_days),))
-        if df.empty:
-            raise HTTPException(status_code=404, detail="No data in mart_funnel_conversion")
-
-        row = df.iloc[0].to_dict()
-        stages = [
-            ("Product Views", float(row.get("product_views") or 0)),
-            ("Add To Cart", float(row.get("add_to_cart") or 0)),
-            ("Checkout Started", float(row.get("checkout_started") or 0)),
-            ("Payment Attempts", float(row.get("payment_attempts") or 0)),
-            ("Orders Placed", float(row.get("orders_placed") or 0)),
+_TIME_SERIES_CHARTS = {"sales_trend", "orders_vs_revenue", "refund_leakage"}
+
+
+def _json_value(v: Any) -> Any:
+    if isinstance(v, Decimal):
+        return float(v)
+    if isinstance(v, (date, datetime)):
+        return v.isoformat()
+    return v
+
+
+def _downsample_rows(rows: List[tuple], max_points: int, method: str) -> List[tuple]:
+    # Time-series rows are (dt, value, value, ...).
+    if method == "bucket":
+        bounds = bucket_bounds(len(rows), max_points)
+        width = len(rows[0])
+        means = [bucket_mean([float(r[i] or 0) for r in rows], bounds) for i in range(1, width)]
+        return [
+            (rows[b.start][0],) + tuple(m[k] for m in means)
+            for k, b in enumerate(bounds)
         ]
-        plot_df = pd.DataFrame(stages, columns=["stage", "count"])
 
-        sns.set_theme(style="whitegrid")
-        fig, ax = plt.subplots(figsize=(10, 4.5))
-        sns.barplot(data=plot_df, x="stage", y="count", ax=ax, palette="Blues")
-        ax.set_title(f"Funnel Conversion (Last {int(window_days)} days)")
-        ax.set_xlabel("")
-        ax.set_ylabel("Count")
-        ax.tick_params(axis="x", rotation=20)
+    xs = [float(r[0].toordinal()) for r in rows]
+    series = [[float(r[i] or 0) for r in rows] for i in range(1, len(rows[0]))]
+    return [rows[i] for i in lttb_multi_indices(xs, series, max_points)]
+
+
+def _chart_data_payload(
+    chart: str,
+    cols: List[str],
+    rows: List[tuple],
+    max_points: int | None,
+    method: str,
+) -> Dict[str, Any]:
+    total_rows = len(rows)
+    downsampled = None
+    if chart in _TIME_SERIES_CHARTS and max_points and total_rows > max_points:
+        rows = _downsample_rows(rows, int(max_points), method)
+        downsampled = {"method": method, "from_points": total_rows, "to_points": len(rows)}
+
+    if chart == "funnel_conversion":
+        row = dict(zip(cols, rows[0])) if rows else {}
+        labels = ["Product Views", "Add To Cart", "Checkout Started", "Payment Attempts", "Orders Placed"]
+        keys = ["product_views", "add_to_cart", "checkout_started", "payment_attempts", "orders_placed"]
+        cols = ["stage", "count"]
+        data: Dict[str, List[Any]] = {
+            "stage": labels,
+            "count": [float(row.get(k) or 0) for k in keys],
+        }
+    else:
+        data = {c: [_json_value(r[i]) for r in rows] for i, c in enumerate(cols)}
+
+    if chart == "category_contribution" and data.get("revenue_ex_tax"):
+        total = float(sum(data["revenue_ex_tax"]) or 0)
+        cols = cols + ["share_pct"]
+        data["share_pct"] = [round((float(v) / total) * 100.0, 4) if total > 0 else 0.0 for v in data["revenue_ex_tax"]]
+
+    return {
+        "columns": cols,
+        "data": data,
+        "points": len(next(iter(data.values()), [])),
+        "downsampled": downsampled,
+    }
+
+
+def _chart_data_route(
+    chart: str,
+    params: Dict[str, Any],
+    max_points: int | None,
+    method: str,
+    if_none_match: str | None,
+) -> Response:
+    method = (method or "lttb").strip().lower()
+    if method not in {"lttb", "bucket"}:
+        raise HTTPException(status_code=400, detail="method must be lttb or bucket")
+
+    try:
+        watermark = _mart_watermark()
+        etag = '"' + ChartCache.cache_key(
+            f"{chart}.json",
+            {**params, "max_points": max_points, "method": method},
+            watermark,
+        ) + '"'
+        headers = {
+            "ETag": etag,
+            "Cache-Control": f"private, max-age={_cache_max_age_seconds()}",
+            "X-Chart-Watermark": watermark,
+        }
+        if _etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers=headers)
+
+        try:
+            cols, rows = _CHART_FETCHERS[chart](**params)
+        except HTTPException:
+            raise
+        except psycopg.Error:
+            raise
+        except Exception:
+            # category_contribution signals "no data" with a plain exception for the PNG placeholder.
+            raise HTTPException(status_code=404, detail="No data in mart_product_performance")
 
-        path = _save_png(fig, "funnel_conversion.png")
-        plt.close(fig)
-        return _png_response(path)
+        payload = {"chart": chart, "params": params, "watermark": watermark, "demo": False}
+        payload.update(_chart_data_payload(chart, cols, rows, max_points, method))
+        return JSONResponse(content=payload, headers=headers)
 
+    except HTTPException:
+        raise
     except psycopg.OperationalError:
-        return _placeholder_chart("funnel_conversion.png", "Funnel Conversion")
-    except (psycopg.errors.UndefinedTable, psycopg.errors.InvalidSchemaName):
-        raise HTTPException(
-            status_code=500,
-            detail="Mart tables not found. Run: python3 -m src.run_sql --sql sql/06_bi_marts.sql",
+        return JSONResponse(
+            content={
+                "chart": chart,
+                "params": params,
+                "watermark": None,
+                "demo": True,
+                "columns": [],
+                "data": {},
+                "points": 0,
+                "downsampled": None,
+            },
+            headers={"Cache-Control": "no-store"},
         )
-    except Exception as e:
-        import traceback, sys
-        print("ERROR in funnel_conversion:", e, file=sys.stderr)
-        print(traceback.format_exc(), file=sys.stderr)
-        raise HTTPException(status_code=500, detail="Failed to generate funnel_conversion chart")
+    except (psycopg.errors.UndefinedTable, psycopg.errors.InvalidSchemaName):
+        raise HTTPException(status_code=500, detail=_MARTS_MISSING)
+    except Exception:
+        _log.exception("chart %s data failed", chart)
+        raise HTTPException(status_code=500, detail=f"Failed to load {chart} data")
 
 
-@router.get("/top_products")
-def top_products(
-    window_days: int = Query(30, ge=7, le=3650),
-    top_n: int = Query(10, ge=5, le=50),
+@router.get("/sales_trend/data")
+def sales_trend_data(
+    window_days: int = Query(90, ge=7, le=365),
+    max_points: int | None = Query(None, ge=10, le=5000),
+    method: str = Query("lttb"),
     admin_key: str | None = Header(None, alias="X-Admin-Key"),
-) -> FileResponse:
-    try:
-        _require_admin(admin_key)
-
-        sql = """
-            SELECT
-              p.product_id,
-              dp.product_name,
-              COALESCE(SUM(p.revenue_ex_tax),0) AS revenue_ex_tax
-            FROM globalcart.mart_product_performance p
-            JOIN globalcart.dim_product dp ON dp.product_id = p.product_id
-            WHERE p.dt >= (CURRENT_DATE - (%s::int * INTERVAL '1 day'))
-            GROUP BY 1,2
-            ORDER BY revenue_ex_tax DESC
-            LIMIT %s;
-        """
-        df = _read_df(sql, (int(window_days), int(top_n)))
-        if df.empty:
-            raise HTTPException(status_code=404, detail="No data in mart_product_performance")
+    if_none_match: str | None = Header(None, alias="If-None-Match"),
+) -> Response:
+    _require_admin(admin_key)
+    return _chart_data_route("sales_trend", {"window_days": int(window_days)}, max_points, method, if_none_match)
 
-        df = df.sort_values("revenue_ex_tax", ascending=True)
 
-        sns.set_theme(style="whitegrid")
-        fig, ax = plt.subplots(figsize=(10, 5.5))
-        sns.barplot(data=df, x="revenue_ex_tax", y="product_name", ax=ax, palette="Greens")
-        ax.set_title(f"Top {int(top_n)} Products by Revenue (Last {int(window_days)} days)")
-        ax.set_xlabel("Revenue (ex tax)")
-        ax.set_ylabel("")
+@router.get("/orders_vs_revenue/data")
+def orders_vs_revenue_data(
+    window_days: int = Query(90, ge=7, le=3650),
+    max_points: int | None = Query(None, ge=10, le=5000),
+    method: str = Query("lttb"),
+    admin_key: str | None = Header(None, alias="X-Admin-Key"),
+    if_none_match: str | None = Header(None, alias="If-None-Match"),
+) -> Response:
+    _require_admin(admin_key)
+    return _chart_data_route("orders_vs_revenue", {"window_days": int(window_days)}, max_points, method, if_none_match)
 
-        path = _save_png(fig, "top_products.png")
-        plt.close(fig)
-        return _png_response(path)
 
-    except psycopg.OperationalError:
-        return _placeholder_chart("top_products.png", "Top Products")
-    except (psycopg.errors.UndefinedTable, psycopg.errors.InvalidSchemaName):
-        raise HTTPException(
-            status_code=500,
-            detail="Mart tables not found. Run: python3 -m src.run_sql --sql sql/06_bi_marts.sql",
-        )
-    except Exception as e:
-        import traceback, sys
-        print("ERROR in top_products:", e, file=sys.stderr)
-        print(traceback.format_exc(), file=sys.stderr)
-        raise HTTPException(status_code=500, detail="Failed to generate top_products chart")
+@router.get("/funnel_conversion/data")
+def funnel_conversion_data(
+    window_days: int = Query(30, ge=7, le=3650),
+    admin_key: str | None = Header(None, alias="X-Admin-Key"),
+    if_none_match: str | None = Header(None, alias="If-None-Match"),
+) -> Response:
+    _require_admin(admin_key)
+    return _chart_data_route("funnel_conversion", {"window_days": int(window_days)}, None, "lttb", if_none_match)
 
 
-@router.get("/category_contribution")
-def category_contribution(
+@router.get("/top_products/data")
+def top_products_data(
+    window_days: int = Query(30, ge=7, le=3650),
+    top_n: int = Query(10, ge=5, le=50),
+    admin_key: str | None = Header(None, alias="X-Admin-Key"),
+    if_none_match: str | None = Header(None, alias="If-None-Match"),
+) -> Response:
+    _require_admin(admin_key)
+    return _chart_data_route(
+        "top_products",
+        {"window_days": int(window_days), "top_n": int(top_n)},
+        None,
+        "lttb",
+        if_none_match,
+    )
+
+
+@router.get("/category_contribution/data")
+def category_contribution_data(
     window_days: int = Query(30, ge=7, le=3650),
     level: str = Query("category_l1"),
     top_n: int = Query(10, ge=3, le=50),
     admin_key: str | None = Header(None, alias="X-Admin-Key"),
-) -> FileResponse:
-    try:
-        _require_admin(admin_key)
-
-        lvl = (level or "").strip().lower()
-        if lvl not in {"category_l1", "category_l2"}:
-            raise HTTPException(status_code=400, detail="level must be category_l1 or category_l2")
-
-        sql = f"""
-            SELECT
-              {lvl} AS category,
-              COALESCE(SUM(revenue_ex_tax),0) AS revenue_ex_tax
-            FROM globalcart.mart_product_performance
-            WHERE dt >= (CURRENT_DATE - (%s::int * INTERVAL '1 day'))
-              AND {lvl} IS NOT NULL
-            GROUP BY 1
-            ORDER BY revenue_ex_tax DESC
-            LIMIT %s;
-        """
-        df = _read_df(sql, (int(window_days), int(top_n)))
-        if df.empty:
-            raise Exception("No data in mart_product_performance for window")
-
-        total = float(df["revenue_ex_tax"].sum() or 0)
-        if total <= 0:
-            raise Exception("Zero revenue in mart_product_performance for window")
-
-        df["share_pct"] = (df["revenue_ex_tax"] / total) * 100.0
-        df = df.sort_values("share_pct", ascending=True)
-
-        sns.set_theme(style="whitegrid")
-        fig, ax = plt.subplots(figsize=(10, 5.0))
-        sns.barplot(data=df, x="share_pct", y="category", ax=ax, palette="Purples")
-        ax.set_title(f"Category Revenue Share ({lvl}) - Last {int(window_days)} days")
-        ax.set_xlabel("Revenue share (%)")
-        ax.set_ylabel("")
-
-        path = _save_png(fig, "category_contribution.png")
-        plt.close(fig)
-        return _png_response(path)
-
-    except Exception as e:
-        import traceback, sys
-        print("ERROR in category_contribution:", e, file=sys.stderr)
-        print(traceback.format_exc(), file=sys.stderr)
-        # Fallback: generate a placeholder chart
-        try:
-            sns.set_theme(style="whitegrid")
-            fig, ax = plt.subplots(figsize=(10, 5.0))
-            ax.text(0.5, 0.5, "Category Revenue Share\n(No data available)", ha="center", va="center", fontsize=14)
-            ax.set_title("Category Revenue Share (Last 30 days)")
-            ax.axis("off")
-            path = _save_png(fig, "category_contribution.png")
-            plt.close(fig)
-            return _png_response(path)
-        except Exception as fallback_e:
-            print("Fallback also failed:", fallback_e, file=sys.stderr)
-            raise HTTPException(status_code=500, detail="Failed to generate category_contribution chart")
+    if_none_match: str | None = Header(None, alias="If-None-Match"),
+) -> Response:
+    _require_admin(admin_key)
+
+    lvl = (level or "").strip().lower()
+    if lvl not in {"category_l1", "category_l2"}:
+        raise HTTPException(status_code=400, detail="level must be category_l1 or category_l2")
+
+    return _chart_data_route(
+        "category_contribution",
+        {"window_days": int(window_days), "level": lvl, "top_n": int(top_n)},
+        None,
+        "lttb",
+        if_none_match,
+    )
 
 
-@router.get("/refund_leakage")
-def refund_leakage(
+@router.get("/refund_leakage/data")
+def refund_leakage_data(
     window_days: int = Query(90, ge=7, le=3650),
+    max_points: int | None = Query(None, ge=10, le=5000),
+    method: str = Query("lttb"),
     admin_key: str | None = Header(None, alias="X-Admin-Key"),
-) -> FileResponse:
-    try:
-        _require_admin(admin_key)
+    if_none_match: str | None = Header(None, alias="If-None-Match"),
+) -> Response:
+    _require_admin(admin_key)
+    return _chart_data_route("refund_leakage", {"window_days": int(window_days)}, max_points, method, if_none_match)
 
-        path = _build_refund_leakage_chart(int(window_days))
-        return _png_response(path)
 
-    except psycopg.OperationalError:
-        return _placeholder_chart("refund_leakage.png", "Refund / Leakage Trend")
-    except (psycopg.errors.UndefinedTable, psycopg.errors.InvalidSchemaName):
-        raise HTTPException(
-            status_code=500,
-            detail="Mart tables not found. Run: python3 -m src.run_sql --sql sql/06_bi_marts.sql",
-        )
+@router.get("/render_stats")
+def render_stats(admin_key: str | None = Header(None, alias="X-Admin-Key")) -> Dict[str, Any]:
+    _require_admin(admin_key)
+    return {"render_pool": render_pool.stats(), "cache": _CHART_CACHE.stats()}
+
+
+_PREWARM_STOP = threading.Event()
+_PREWARM_THREAD: Optional[threading.Thread] = None
+
+
+def prewarm_charts(watermark: str) -> int:
+    """Render the dashboard's default charts for ``watermark``; returns how many are ready."""
+    ready = 0
+    for chart, params in _PREWARM_CHARTS:
+        if _PREWARM_STOP.is_set():
+            break
+        try:
+            _CHART_CACHE.get_or_render(
+                chart,
+                params,
+                watermark,
+                lambda path, c=chart, p=params: _render_chart(c, p, path),
+            )
+            ready += 1
+        except Exception as e:
+            _log.warning("chart prewarm failed chart=%s error=%s", chart, e)
+    return ready
+
+
+def _prewarm_loop() -> None:
+    try:
+        render_pool.start()
     except Exception as e:
-        import traceback, sys
-        print("ERROR in refund_leakage:", e, file=sys.stderr)
-        print(traceback.format_exc(), file=sys.stderr)
-        raise HTTPException(status_code=500, detail="Failed to generate refund_leakage chart")
+        _log.warning("chart render pool failed to start error=%s", e)
+
+    last_seen: Optional[str] = None
+    while not _PREWARM_STOP.is_set():
+        try:
+            watermark = _mart_watermark(force=True)
+            # Time-bucketed fallback keys expire on their own; only re-render for real mart refreshes
+            # (and once at startup so the first dashboard load is warm).
+            if watermark != last_seen and (last_seen is None or not watermark.startswith("ttl-")):
+                ready = prewarm_charts(watermark)
+                _log.info("chart prewarm watermark=%s ready=%s/%s", watermark, ready, len(_PREWARM_CHARTS))
+            last_seen = watermark
+        except psycopg.OperationalError:
+            pass
+        except Exception as e:
+            _log.warning("chart prewarm loop error=%s", e)
+        _PREWARM_STOP.wait(_prewarm_interval_seconds())
+
+
+def start_chart_prewarmer() -> None:
+    global _PREWARM_THREAD
+    if _PREWARM_THREAD is not None and _PREWARM_THREAD.is_alive():
+        return
+    _PREWARM_STOP.clear()
+    _PREWARM_THREAD = threading.Thread(target=_prewarm_loop, name="chart-prewarm", daemon=True)
+    _PREWARM_THREAD.start()
+
+
+def stop_chart_prewarmer(timeout: float = 5.0) -> None:
+    global _PREWARM_THREAD
+    _PREWARM_STOP.set()
+    if _PREWARM_THREAD is not None:
+        _PREWARM_THREAD.join(timeout=timeout)
+    _PREWARM_THREAD = None
+    render_pool.shutdown()
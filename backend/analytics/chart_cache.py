@@ -0,0 +1,185 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Mapping, Optional
+
+
+@dataclass(frozen=True)
+class CachedChart:
+    chart: str
+    key: str
+    path: Path
+    watermark: str
+    rendered_at: float
+
+    @property
+    def etag(self) -> str:
+        return f'"{self.key}"'
+
+
+class ChartCache:
+    """Rendered chart PNGs keyed by (chart, params, data watermark).
+
+    Concurrent requests for the same key share one render (single-flight). Files are
+    named after the key, so several API workers pointing at the same directory reuse
+    each other's renders instead of overwriting a shared file.
+    """
+
+    def __init__(
+        self,
+        cache_dir: Path,
+        publish_dir: Optional[Path] = None,
+        max_entries: int = 64,
+        stale_file_seconds: int = 24 * 3600,
+    ) -> None:
+        self._cache_dir = Path(cache_dir)
+        self._publish_dir = Path(publish_dir) if publish_dir is not None else None
+        self._max_entries = max(1, int(max_entries))
+        self._stale_file_seconds = int(stale_file_seconds)
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, CachedChart]" = OrderedDict()
+        self._inflight: Dict[str, Future] = {}
+        self._pruned = False
+
+    @staticmethod
+    def cache_key(chart: str, params: Mapping[str, Any], watermark: str) -> str:
+        raw = json.dumps(
+            {"chart": chart, "params": dict(params), "watermark": watermark},
+            sort_keys=True,
+            default=str,
+        )
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:20]
+
+    def _path_for(self, chart: str, key: str) -> Path:
+        return self._cache_dir / f"{chart}-{key}.png"
+
+    def _prune_stale_files(self) -> None:
+        # Leftovers from earlier processes; entries evicted by this process are removed directly.
+        self._pruned = True
+        if not self._cache_dir.exists():
+            return
+        cutoff = time.time() - self._stale_file_seconds
+        for p in self._cache_dir.glob("*.png"):
+            try:
+                if p.stat().st_mtime < cutoff:
+                    p.unlink()
+            except OSError:
+                pass
+
+    def _lookup_locked(self, chart: str, key: str, watermark: str) -> Optional[CachedChart]:
+        entry = self._entries.get(key)
+        if entry is not None and entry.path.exists():
+            self._entries.move_to_end(key)
+            return entry
+
+        # Another worker sharing the directory may already have rendered this key.
+        path = self._path_for(chart, key)
+        try:
+            mtime = path.stat().st_mtime
+        except OSError:
+            self._entries.pop(key, None)
+            return None
+        entry = CachedChart(chart=chart, key=key, path=path, watermark=watermark, rendered_at=mtime)
+        self._entries[key] = entry
+        return entry
+
+    def _evict_locked(self) -> List[CachedChart]:
+        evicted: List[CachedChart] = []
+        while len(self._entries) > self._max_entries:
+            _, old = self._entries.popitem(last=False)
+            evicted.append(old)
+        return evicted
+
+    def peek(self, chart: str, params: Mapping[str, Any], watermark: str) -> Optional[CachedChart]:
+        key = self.cache_key(chart, params, watermark)
+        with self._lock:
+            return self._lookup_locked(chart, key, watermark)
+
+    def get_or_render(
+        self,
+        chart: str,
+        params: Mapping[str, Any],
+        watermark: str,
+        render: Callable[[Path], None],
+    ) -> CachedChart:
+        """Return the cached chart for this key, calling ``render(path)`` at most once per key."""
+        key = self.cache_key(chart, params, watermark)
+        with self._lock:
+            if not self._pruned:
+                self._prune_stale_files()
+            hit = self._lookup_locked(chart, key, watermark)
+            if hit is not None:
+                return hit
+            fut = self._inflight.get(key)
+            owner = fut is None
+            if owner:
+                fut = Future()
+                self._inflight[key] = fut
+
+        if not owner:
+            return fut.result()
+
+        try:
+            entry = self._render(chart, key, watermark, render)
+        except BaseException as exc:
+            with self._lock:
+                self._inflight.pop(key, None)
+            fut.set_exception(exc)
+            raise
+
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            evicted = self._evict_locked()
+            self._inflight.pop(key, None)
+        fut.set_result(entry)
+
+        for old in evicted:
+            try:
+                old.path.unlink()
+            except OSError:
+                pass
+        return entry
+
+    def _render(self, chart: str, key: str, watermark: str, render: Callable[[Path], None]) -> CachedChart:
+        self._cache_dir.mkdir(parents=True, exist_ok=True)
+        out_path = self._path_for(chart, key)
+        with tempfile.NamedTemporaryFile(dir=str(self._cache_dir), suffix=".tmp", delete=False) as tmp:
+            tmp_path = Path(tmp.name)
+        try:
+            render(tmp_path)
+            os.replace(tmp_path, out_path)
+        finally:
+            if tmp_path.exists():
+                tmp_path.unlink()
+
+        self._publish(chart, out_path)
+        return CachedChart(chart=chart, key=key, path=out_path, watermark=watermark, rendered_at=time.time())
+
+    def _publish(self, chart: str, src: Path) -> None:
+        # Keep the stable /static/analytics/<chart>.png URL pointing at the latest render.
+        if self._publish_dir is None:
+            return
+        self._publish_dir.mkdir(parents=True, exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=str(self._publish_dir), suffix=".tmp", delete=False) as tmp:
+            tmp_path = Path(tmp.name)
+        try:
+            shutil.copyfile(src, tmp_path)
+            os.replace(tmp_path, self._publish_dir / f"{chart}.png")
+        finally:
+            if tmp_path.exists():
+                tmp_path.unlink()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"entries": len(self._entries), "inflight": len(self._inflight)}
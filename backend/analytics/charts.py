@@ -0,0 +1,180 @@
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Sequence
+
+import matplotlib
+
+matplotlib.use("Agg")
+
+import matplotlib.pyplot as plt
+import pandas as pd
+import seaborn as sns
+
+# Pure drawing functions: (columns, rows, params) -> PNG at out_path. They never touch the
+# database, so they can run in the render worker processes (see render_pool.py).
+
+
+def _save_png(fig, out_path: Path) -> None:
+    fig.tight_layout()
+    fig.savefig(out_path, format="png", dpi=180, bbox_inches="tight", pad_inches=0.05)
+
+
+def _frame(columns: Sequence[str], rows: Sequence[Sequence[Any]]) -> pd.DataFrame:
+    df = pd.DataFrame(list(rows), columns=list(columns))
+    # psycopg returns NUMERIC as Decimal; seaborn wants floats.
+    for col in df.columns:
+        if df[col].dtype == object and len(df) and not isinstance(df[col].iloc[0], str):
+            try:
+                df[col] = pd.to_numeric(df[col])
+            except (TypeError, ValueError):
+                pass
+    return df
+
+
+def draw_sales_trend(out_path: Path, columns, rows, window_days: int) -> None:
+    df = _frame(columns, rows)
+    sns.set_theme(style="whitegrid")
+    fig, ax = plt.subplots(figsize=(12, 5.6))
+    sns.lineplot(data=df, x="dt", y="revenue_ex_tax", ax=ax, label="Revenue (ex tax)")
+    sns.lineplot(data=df, x="dt", y="refund_amount_return_dt", ax=ax, label="Refunds")
+    ax.set_title("Daily Revenue Trend")
+    ax.set_xlabel("")
+    ax.set_ylabel("Amount")
+    ax.tick_params(axis="x", rotation=30)
+
+    _save_png(fig, out_path)
+    plt.close(fig)
+
+
+def draw_orders_vs_revenue(out_path: Path, columns, rows, window_days: int) -> None:
+    df = _frame(columns, rows)
+    sns.set_theme(style="whitegrid")
+    fig, ax1 = plt.subplots(figsize=(12, 5.6))
+
+    sns.lineplot(data=df, x="dt", y="orders", ax=ax1, color="#2563eb", label="Orders")
+    ax1.set_ylabel("Orders", color="#2563eb")
+    ax1.tick_params(axis="y", labelcolor="#2563eb")
+
+    ax2 = ax1.twinx()
+    sns.lineplot(data=df, x="dt", y="revenue_ex_tax", ax=ax2, color="#16a34a", label="Revenue (ex tax)")
+    ax2.set_ylabel("Revenue (ex tax)", color="#16a34a")
+    ax2.tick_params(axis="y", labelcolor="#16a34a")
+
+    ax1.set_title("Orders vs Revenue")
+    ax1.set_xlabel("")
+    ax1.tick_params(axis="x", rotation=30)
+
+    h1, l1 = ax1.get_legend_handles_labels()
+    h2, l2 = ax2.get_legend_handles_labels()
+    ax1.legend(h1 + h2, l1 + l2, loc="upper left")
+
+    _save_png(fig, out_path)
+    plt.close(fig)
+
+
+def draw_funnel_conversion(out_path: Path, columns, rows, window_days: int) -> None:
+    row = dict(zip(columns, rows[0])) if rows else {}
+    stages = [
+        ("Product Views", float(row.get("product_views") or 0)),
+        ("Add To Cart", float(row.get("add_to_cart") or 0)),
+        ("Checkout Started", float(row.get("checkout_started") or 0)),
+        ("Payment Attempts", float(row.get("payment_attempts") or 0)),
+        ("Orders Placed", float(row.get("orders_placed") or 0)),
+    ]
+    plot_df = pd.DataFrame(stages, columns=["stage", "count"])
+
+    sns.set_theme(style="whitegrid")
+    fig, ax = plt.subplots(figsize=(10, 4.5))
+    sns.barplot(data=plot_df, x="stage", y="count", ax=ax, palette="Blues")
+    ax.set_title(f"Funnel Conversion (Last {int(window_days)} days)")
+    ax.set_xlabel("")
+    ax.set_ylabel("Count")
+    ax.tick_params(axis="x", rotation=20)
+
+    _save_png(fig, out_path)
+    plt.close(fig)
+
+
+def draw_top_products(out_path: Path, columns, rows, window_days: int, top_n: int) -> None:
+    df = _frame(columns, rows).sort_values("revenue_ex_tax", ascending=True)
+
+    sns.set_theme(style="whitegrid")
+    fig, ax = plt.subplots(figsize=(10, 5.5))
+    sns.barplot(data=df, x="revenue_ex_tax", y="product_name", ax=ax, palette="Greens")
+    ax.set_title(f"Top {int(top_n)} Products by Revenue (Last {int(window_days)} days)")
+    ax.set_xlabel("Revenue (ex tax)")
+    ax.set_ylabel("")
+
+    _save_png(fig, out_path)
+    plt.close(fig)
+
+
+def draw_category_contribution(out_path: Path, columns, rows, window_days: int, level: str, top_n: int) -> None:
+    df = _frame(columns, rows)
+    total = float(df["revenue_ex_tax"].sum() or 0)
+    df["share_pct"] = (df["revenue_ex_tax"] / total) * 100.0
+    df = df.sort_values("share_pct", ascending=True)
+
+    sns.set_theme(style="whitegrid")
+    fig, ax = plt.subplots(figsize=(10, 5.0))
+    sns.barplot(data=df, x="share_pct", y="category", ax=ax, palette="Purples")
+    ax.set_title(f"Category Revenue Share ({level}) - Last {int(window_days)} days")
+    ax.set_xlabel("Revenue share (%)")
+    ax.set_ylabel("")
+
+    _save_png(fig, out_path)
+    plt.close(fig)
+
+
+def draw_refund_leakage(out_path: Path, columns, rows, window_days: int) -> None:
+    df = _frame(columns, rows)
+    sns.set_theme(style="whitegrid")
+    fig, ax1 = plt.subplots(figsize=(12, 5.6))
+
+    sns.lineplot(data=df, x="dt", y="refund_amount", ax=ax1, color="#dc2626", label="Refunds")
+    ax1.set_ylabel("Refunds", color="#dc2626")
+    ax1.tick_params(axis="y", labelcolor="#dc2626")
+
+    ax2 = ax1.twinx()
+    sns.lineplot(data=df, x="dt", y="net_profit_ex_tax", ax=ax2, color="#16a34a", label="Net profit (ex tax)")
+    ax2.set_ylabel("Net profit (ex tax)", color="#16a34a")
+    ax2.tick_params(axis="y", labelcolor="#16a34a")
+
+    ax1.set_title("Refund / Leakage Trend")
+    ax1.set_xlabel("")
+    ax1.tick_params(axis="x", rotation=30)
+
+    h1, l1 = ax1.get_legend_handles_labels()
+    h2, l2 = ax2.get_legend_handles_labels()
+    ax1.legend(h1 + h2, l1 + l2, loc="upper left")
+
+    _save_png(fig, out_path)
+    plt.close(fig)
+
+
+def draw_placeholder(out_path: Path, columns, rows, title: str, subtitle: str = "") -> None:
+    sns.set_theme(style="whitegrid")
+    fig, ax = plt.subplots(figsize=(10, 5.0))
+    ax.text(0.5, 0.55, title, ha="center", va="center", fontsize=14)
+    if subtitle:
+        ax.text(0.5, 0.40, subtitle, ha="center", va="center", fontsize=11, color="#6b7280")
+    ax.axis("off")
+    _save_png(fig, out_path)
+    plt.close(fig)
+
+
+DRAWERS: Dict[str, Callable[..., None]] = {
+    "sales_trend": draw_sales_trend,
+    "orders_vs_revenue": draw_orders_vs_revenue,
+    "funnel_conversion": draw_funnel_conversion,
+    "top_products": draw_top_products,
+    "category_contribution": draw_category_contribution,
+    "refund_leakage": draw_refund_leakage,
+    "placeholder": draw_placeholder,
+}
+
+
+def draw(chart: str, out_path: str, columns: List[str], rows: List[Sequence[Any]], params: Dict[str, Any]) -> str:
+    DRAWERS[chart](Path(out_path), columns, rows, **params)
+    return out_path
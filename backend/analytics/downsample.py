@@ -0,0 +1,66 @@
+from __future__ import annotations
+
+from typing import List, Sequence
+
+
+def lttb_indices(xs: Sequence[float], ys: Sequence[float], threshold: int) -> List[int]:
+    """Largest-Triangle-Three-Buckets: indices of ``threshold`` points that keep the series' shape.
+
+    Always keeps the first and last point. Returns every index when the series is already short.
+    """
+    n = len(xs)
+    if threshold >= n or threshold < 3:
+        return list(range(n))
+
+    out = [0]
+    every = (n - 2) / (threshold - 2)
+    a = 0
+    for i in range(threshold - 2):
+        # Average of the next bucket is the third triangle vertex.
+        nxt_start = int((i + 1) * every) + 1
+        nxt_end = min(int((i + 2) * every) + 1, n)
+        span = max(1, nxt_end - nxt_start)
+        avg_x = sum(xs[nxt_start:nxt_end]) / span
+        avg_y = sum(ys[nxt_start:nxt_end]) / span
+
+        start = int(i * every) + 1
+        end = int((i + 1) * every) + 1
+        ax, ay = xs[a], ys[a]
+        best, best_area = start, -1.0
+        for j in range(start, end):
+            area = abs((ax - avg_x) * (ys[j] - ay) - (ax - xs[j]) * (avg_y - ay))
+            if area > best_area:
+                best, best_area = j, area
+        out.append(best)
+        a = best
+    out.append(n - 1)
+    return out
+
+
+def lttb_multi_indices(xs: Sequence[float], series: Sequence[Sequence[float]], threshold: int) -> List[int]:
+    """LTTB over several y-series sharing one x axis, so every column stays aligned.
+
+    Each series is min-max normalised and the normalised values are summed, so a feature in
+    any one series pulls the selection towards it regardless of the series' scale.
+    """
+    if threshold >= len(xs) or not series:
+        return list(range(len(xs)))
+    combined = [0.0] * len(xs)
+    for ys in series:
+        lo, hi = min(ys), max(ys)
+        span = (hi - lo) or 1.0
+        for i, y in enumerate(ys):
+            combined[i] += (y - lo) / span
+    return lttb_indices(xs, combined, threshold)
+
+
+def bucket_bounds(n: int, buckets: int) -> List[range]:
+    """Split ``range(n)`` into at most ``buckets`` contiguous, near-equal slices."""
+    if buckets >= n or buckets < 1:
+        return [range(i, i + 1) for i in range(n)]
+    size = n / buckets
+    return [range(int(b * size), int((b + 1) * size)) for b in range(buckets)]
+
+
+def bucket_mean(values: Sequence[float], bounds: Sequence[range]) -> List[float]:
+    return [sum(values[i] for i in r) / len(r) for r in bounds]
@@ -0,0 +1,228 @@
+from __future__ import annotations
+
+import concurrent.futures
+import logging
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+_log = logging.getLogger("globalcart")
+
+
+class RenderTimeout(Exception):
+    pass
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, str(default)))
+    except ValueError:
+        return default
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, str(default)))
+    except ValueError:
+        return default
+
+
+def render_workers() -> int:
+    return max(0, _env_int("CHART_RENDER_WORKERS", 2))
+
+
+def render_timeout_seconds() -> float:
+    return max(1.0, _env_float("CHART_RENDER_TIMEOUT_SECONDS", 30.0))
+
+
+def _warm_worker() -> None:
+    # Pay the matplotlib/seaborn import and font-cache cost once per worker, not per chart.
+    from . import charts
+
+    charts.sns.set_theme(style="whitegrid")
+
+
+def _ping() -> int:
+    return os.getpid()
+
+
+def _draw(chart: str, out_path: str, columns: List[str], rows: List[Sequence[Any]], params: Dict[str, Any]) -> str:
+    from . import charts
+
+    return charts.draw(chart, out_path, columns, rows, params)
+
+
+class RenderPool:
+    """Fixed-size process pool for matplotlib rendering.
+
+    Rendering holds the GIL for hundreds of milliseconds per figure and pyplot is not
+    thread-safe, so figures are drawn in separate processes; API threads only wait on
+    the result. With ``workers=0`` charts are drawn inline under a lock instead.
+    """
+
+    def __init__(self, workers: int, timeout_seconds: float) -> None:
+        self.workers = int(workers)
+        self.timeout_seconds = float(timeout_seconds)
+        self._executor: Optional[concurrent.futures.ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._inline_lock = threading.Lock()
+        self._pending = 0
+        self._completed = 0
+        self._failed = 0
+        self._timeouts = 0
+        self._render_ms_total = 0.0
+
+    def _ensure_executor(self) -> concurrent.futures.ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = concurrent.futures.ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_warm_worker,
+                )
+            return self._executor
+
+    def start(self) -> None:
+        """Spawn and warm every worker up front so the first chart request doesn't pay for it."""
+        if self.workers <= 0:
+            return
+        executor = self._ensure_executor()
+        futures = [executor.submit(_ping) for _ in range(self.workers)]
+        concurrent.futures.wait(futures, timeout=60)
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _recycle(self, executor: concurrent.futures.ProcessPoolExecutor) -> None:
+        """Replace ``executor`` and kill its workers.
+
+        A running job cannot be cancelled, so after a timeout the stuck process would keep its
+        slot (and keep drawing) indefinitely. Renders in flight on the same pool fail with
+        BrokenProcessPool and are retried once on the replacement by :meth:`render`.
+        """
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        # ProcessPoolExecutor has no public way to stop a running task before Python 3.14.
+        processes = list((getattr(executor, "_processes", None) or {}).values())
+        executor.shutdown(wait=False, cancel_futures=True)
+        for proc in processes:
+            try:
+                if proc.is_alive():
+                    proc.terminate()
+                    proc.join(timeout=2)
+            except Exception:
+                pass
+
+    def _on_done(self, started: float, timed_out: Dict[str, bool], fut: concurrent.futures.Future) -> None:
+        with self._lock:
+            self._pending = max(0, self._pending - 1)
+            if fut.cancelled() or timed_out.get("value"):
+                return
+            if fut.exception() is not None:
+                self._failed += 1
+            else:
+                self._completed += 1
+                self._render_ms_total += (time.perf_counter() - started) * 1000.0
+
+    def _submit(self, args, started: float, timed_out: Dict[str, bool]):
+        with self._lock:
+            self._pending += 1
+        try:
+            try:
+                executor = self._ensure_executor()
+                fut = executor.submit(*args)
+            except BrokenProcessPool:
+                # A worker died (OOM, segfault); replace the pool and retry once.
+                _log.warning("chart render pool broken; restarting")
+                self.shutdown()
+                executor = self._ensure_executor()
+                fut = executor.submit(*args)
+        except BaseException:
+            with self._lock:
+                self._pending -= 1
+            raise
+        fut.add_done_callback(lambda f: self._on_done(started, timed_out, f))
+        return executor, fut
+
+    def render(
+        self,
+        chart: str,
+        out_path: Path,
+        columns: List[str],
+        rows: List[Sequence[Any]],
+        params: Dict[str, Any],
+    ) -> Path:
+        """Draw ``chart`` to ``out_path``, blocking the calling thread (not the GIL) until done.
+
+        The worker draws to a private temp file that is moved to ``out_path`` only once the
+        render finished in time, so a timed-out render can never overwrite ``out_path`` later.
+        """
+        tmp_path = out_path.with_name(f".{out_path.name}.{uuid.uuid4().hex}.render")
+        try:
+            if self.workers <= 0:
+                with self._inline_lock:
+                    _draw(chart, str(tmp_path), columns, rows, params)
+            else:
+                self._render_in_pool(chart, tmp_path, columns, rows, params)
+            os.replace(tmp_path, out_path)
+        finally:
+            try:
+                tmp_path.unlink(missing_ok=True)
+            except OSError:
+                pass
+        return out_path
+
+    def _render_in_pool(
+        self,
+        chart: str,
+        tmp_path: Path,
+        columns: List[str],
+        rows: List[Sequence[Any]],
+        params: Dict[str, Any],
+    ) -> None:
+        args = (_draw, chart, str(tmp_path), list(columns), list(rows), params)
+        deadline = time.monotonic() + self.timeout_seconds
+        for attempt in range(2):
+            started = time.perf_counter()
+            timed_out: Dict[str, bool] = {}
+            executor, fut = self._submit(args, started, timed_out)
+            try:
+                fut.result(timeout=max(0.0, deadline - time.monotonic()))
+                return
+            except concurrent.futures.TimeoutError:
+                with self._lock:
+                    timed_out["value"] = True
+                    self._timeouts += 1
+                self._recycle(executor)
+                raise RenderTimeout(f"Rendering {chart} exceeded {self.timeout_seconds:.0f}s")
+            except BrokenProcessPool:
+                recycled = self._executor is not executor
+                if not recycled:
+                    self.shutdown()
+                # Killed because another render on the same pool timed out: retry on the new pool.
+                if not recycled or attempt or time.monotonic() >= deadline:
+                    raise
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            completed = self._completed
+            return {
+                "workers": self.workers,
+                "queue_depth": self._pending,
+                "completed": completed,
+                "failed": self._failed,
+                "timeouts": self._timeouts,
+                "avg_render_ms": round(self._render_ms_total / completed, 1) if completed else None,
+            }
+
+
+render_pool = RenderPool(workers=render_workers(), timeout_seconds=render_timeout_seconds())
@@ -1,11 +1,15 @@
 from __future__ import annotations
 
 import os
+import time
 from contextlib import contextmanager
 
 import psycopg
 from dotenv import load_dotenv
 
+from .db_metrics import InstrumentedCursor, query_stats
+from .metrics import DB_CONNECT_SECONDS, DB_CONNECTIONS_OPEN
+
 
 load_dotenv()
 
@@ -22,8 +26,14 @@ def _dsn() -> str:
 
 @contextmanager
 def get_conn():
-    conn = psycopg.connect(_dsn())
+    started = time.perf_counter()
+    conn = psycopg.connect(_dsn(), cursor_factory=InstrumentedCursor)
+    connect_seconds = time.perf_counter() - started
+    query_stats.observe_connect(connect_seconds)
+    DB_CONNECT_SECONDS.observe(connect_seconds)
+    DB_CONNECTIONS_OPEN.inc()
     try:
         yield conn
     finally:
+        DB_CONNECTIONS_OPEN.dec()
         conn.close()
@@ -0,0 +1,282 @@
+from __future__ import annotations
+
+import logging
+import os
+import re
+import threading
+import time
+from collections import Counter, deque
+from contextvars import ContextVar, Token
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, Optional
+
+import psycopg
+
+from .metrics import DB_QUERY_SECONDS
+
+_log = logging.getLogger("globalcart")
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, str(default)))
+    except ValueError:
+        return default
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, str(default)))
+    except ValueError:
+        return default
+
+
+@dataclass
+class RequestDbStats:
+    """DB work done on behalf of one HTTP request (all connections, all threads)."""
+
+    request_id: str
+    method: str = ""
+    path: str = ""
+    queries: int = 0
+    rows: int = 0
+    db_ms: float = 0.0
+    connections: int = 0
+    connect_ms: float = 0.0
+    slow_queries: int = 0
+    statements: Counter = field(default_factory=Counter)
+
+    def most_repeated(self) -> tuple[Optional[str], int]:
+        if not self.statements:
+            return None, 0
+        sql, n = self.statements.most_common(1)[0]
+        return sql, n
+
+
+_current: ContextVar[Optional[RequestDbStats]] = ContextVar("globalcart_db_stats", default=None)
+
+
+def begin_request(stats: RequestDbStats) -> Token:
+    return _current.set(stats)
+
+
+def end_request(token: Token) -> None:
+    _current.reset(token)
+
+
+def current_request_stats() -> Optional[RequestDbStats]:
+    return _current.get()
+
+
+_COMMENT = re.compile(r"--[^\n]*|/\*.*?\*/", re.S)
+_PARAM = re.compile(r"%\(\w+\)s|%s|\$\d+")
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?\b")
+_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_WS = re.compile(r"\s+")
+
+
+def normalize_sql(sql: str, max_len: int = 500) -> str:
+    """Literals and placeholders become ``?`` so the same statement groups together in logs."""
+    s = _COMMENT.sub(" ", sql)
+    s = _PARAM.sub("?", s)
+    s = _STRING.sub("?", s)
+    s = _NUMBER.sub("?", s)
+    s = _WS.sub(" ", s).strip()
+    s = _LIST.sub("(?, ...)", s)
+    return s if len(s) <= max_len else s[: max_len - 3] + "..."
+
+
+def _sql_text(cursor: Any, query: Any) -> str:
+    if isinstance(query, str):
+        return query
+    if isinstance(query, bytes):
+        return query.decode("utf-8", "replace")
+    try:
+        return query.as_string(cursor)
+    except Exception:
+        return str(query)
+
+
+@dataclass
+class _EndpointTotals:
+    requests: int = 0
+    queries: int = 0
+    rows: int = 0
+    db_ms: float = 0.0
+    connect_ms: float = 0.0
+    request_ms: float = 0.0
+    max_queries: int = 0
+    slow_queries: int = 0
+    repeated_requests: int = 0
+
+    def as_dict(self, endpoint: str) -> Dict[str, Any]:
+        n = max(self.requests, 1)
+        return {
+            "endpoint": endpoint,
+            "requests": self.requests,
+            "queries_total": self.queries,
+            "queries_per_request": round(self.queries / n, 2),
+            "max_queries": self.max_queries,
+            "rows_per_request": round(self.rows / n, 2),
+            "db_ms_total": round(self.db_ms, 2),
+            "db_ms_per_request": round(self.db_ms / n, 2),
+            "connect_ms_per_request": round(self.connect_ms / n, 2),
+            "request_ms_per_request": round(self.request_ms / n, 2),
+            "slow_queries": self.slow_queries,
+            "repeated_statement_requests": self.repeated_requests,
+        }
+
+
+class QueryStats:
+    """Process-wide query accounting fed by ``InstrumentedCursor`` and the HTTP middleware.
+
+    Statements slower than ``slow_query_ms`` are logged (normalized) and kept in a bounded
+    recent list. A request that runs one statement ``repeat_threshold`` or more times is
+    flagged as a likely N+1 loop.
+    """
+
+    def __init__(self, slow_query_ms: float = 200.0, slow_log_size: int = 100, repeat_threshold: int = 10) -> None:
+        self.slow_query_ms = float(slow_query_ms)
+        self.repeat_threshold = max(2, int(repeat_threshold))
+        self._lock = threading.Lock()
+        self._endpoints: Dict[str, _EndpointTotals] = {}
+        self._slow: Deque[Dict[str, Any]] = deque(maxlen=max(1, int(slow_log_size)))
+        self._since = time.time()
+        self.connects = 0
+        self.connect_seconds = 0.0
+
+    @classmethod
+    def from_env(cls) -> "QueryStats":
+        return cls(
+            slow_query_ms=_env_float("SLOW_QUERY_MS", 200.0),
+            slow_log_size=_env_int("SLOW_QUERY_LOG_SIZE", 100),
+            repeat_threshold=_env_int("REPEATED_QUERY_THRESHOLD", 10),
+        )
+
+    def observe_connect(self, seconds: float) -> None:
+        with self._lock:
+            self.connects += 1
+            self.connect_seconds += seconds
+        stats = _current.get()
+        if stats is not None:
+            stats.connections += 1
+            stats.connect_ms += seconds * 1000.0
+
+    def observe(self, cursor: Any, query: Any, seconds: float) -> None:
+        DB_QUERY_SECONDS.observe(seconds)
+        ms = seconds * 1000.0
+        rows = max(int(getattr(cursor, "rowcount", -1) or 0), 0)
+        stats = _current.get()
+        if stats is not None:
+            stats.queries += 1
+            stats.rows += rows
+            stats.db_ms += ms
+            stats.statements[query if isinstance(query, (str, bytes)) else _sql_text(cursor, query)] += 1
+        if ms < self.slow_query_ms:
+            return
+
+        sql = normalize_sql(_sql_text(cursor, query))
+        rid = stats.request_id if stats is not None else "-"
+        if stats is not None:
+            stats.slow_queries += 1
+        _log.warning("slow_query rid=%s ms=%.1f rows=%s sql=%s", rid, ms, rows, sql)
+        with self._lock:
+            self._slow.append(
+                {
+                    "ts": time.time(),
+                    "request_id": rid,
+                    "method": stats.method if stats is not None else None,
+                    "path": stats.path if stats is not None else None,
+                    "ms": round(ms, 2),
+                    "rows": rows,
+                    "sql": sql,
+                }
+            )
+
+    def finish_request(self, endpoint: str, stats: RequestDbStats, request_ms: float) -> None:
+        sql, repeats = stats.most_repeated()
+        repeated = repeats >= self.repeat_threshold
+        if repeated and sql is not None:
+            text = sql if isinstance(sql, str) else sql.decode("utf-8", "replace")
+            _log.warning(
+                "repeated_query rid=%s endpoint=%s count=%s sql=%s",
+                stats.request_id,
+                endpoint,
+                repeats,
+                normalize_sql(text),
+            )
+        with self._lock:
+            t = self._endpoints.get(endpoint)
+            if t is None:
+                t = self._endpoints[endpoint] = _EndpointTotals()
+            t.requests += 1
+            t.queries += stats.queries
+            t.rows += stats.rows
+            t.db_ms += stats.db_ms
+            t.connect_ms += stats.connect_ms
+            t.request_ms += request_ms
+            t.max_queries = max(t.max_queries, stats.queries)
+            t.slow_queries += stats.slow_queries
+            t.repeated_requests += int(repeated)
+
+    def snapshot(self, limit: int = 100) -> Dict[str, Any]:
+        with self._lock:
+            endpoints = [t.as_dict(name) for name, t in self._endpoints.items()]
+            slow = list(self._slow)
+            since = self._since
+        endpoints.sort(key=lambda e: e["db_ms_total"], reverse=True)
+        return {
+            "pid": os.getpid(),
+            "since": since,
+            "slow_query_ms": self.slow_query_ms,
+            "repeat_threshold": self.repeat_threshold,
+            "endpoints": endpoints[: max(1, int(limit))],
+            "slow_queries": list(reversed(slow))[: max(1, int(limit))],
+        }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._endpoints.clear()
+            self._slow.clear()
+            self._since = time.time()
+
+
+query_stats = QueryStats.from_env()
+
+
+class InstrumentedCursor(psycopg.Cursor):
+    """Cursor that reports every statement's duration and row count to ``query_stats``."""
+
+    def execute(self, query, params=None, *, prepare=None, binary=None):
+        started = time.perf_counter()
+        try:
+            return super().execute(query, params, prepare=prepare, binary=binary)
+        finally:
+            query_stats.observe(self, query, time.perf_counter() - started)
+
+    def executemany(self, query, params_seq, *, returning=False):
+        started = time.perf_counter()
+        try:
+            return super().executemany(query, params_seq, returning=returning)
+        finally:
+            query_stats.observe(self, query, time.perf_counter() - started)
+
+
+def route_template(scope: Dict[str, Any]) -> str:
+    """Path template of the matched route ("<other>" for static files and 404s), so path ids
+    don't explode per-endpoint stats."""
+    route = scope.get("route")
+    path = getattr(route, "path", None) if route is not None else None
+    return path or "<other>"
+
+
+def route_label(scope: Dict[str, Any]) -> str:
+    return f"{scope.get('method', '')} {route_template(scope)}"
+
+
+def server_timing(stats: RequestDbStats, request_ms: float) -> str:
+    return (
+        f'db;dur={stats.db_ms:.2f};desc="queries={stats.queries} rows={stats.rows}", '
+        f"dbconn;dur={stats.connect_ms:.2f}, app;dur={request_ms:.2f}"
+    )
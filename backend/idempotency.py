@@ -0,0 +1,378 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional, Tuple, Union
+
+import psycopg
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, Response
+
+from .db import get_conn
+from .metrics import REGISTRY
+from .schema_caps import schema_caps
+
+# Idempotency-Key support for the write endpoints that clients retry (checkout, order creation,
+# payment confirmation). The first request with a key claims an IN_PROGRESS row and runs the
+# handler; the handler commits its writes through IdempotencyGuard.commit, which stores the response
+# in the same transaction, so the key can never be freed once the writes it guards are committed.
+# Retries get the stored response. Duplicates that arrive while the first request is still running
+# wait for it (on an in-process event when it runs in the same worker, by polling the row otherwise)
+# without holding a database connection. Errors release the key so the client can retry with it.
+# Without sql/15_idempotency.sql, or with the database down, requests run exactly as they would
+# without the header.
+
+_log = logging.getLogger("globalcart")
+
+IDEMPOTENCY_TABLE = "globalcart.idempotency_keys"
+MAX_KEY_LENGTH = 255
+REPLAY_HEADER = "Idempotent-Replayed"
+# Keys from callers without a customer id are scoped to the endpoint alone.
+ANONYMOUS_CUSTOMER_ID = 0
+
+IDEMPOTENCY_REQUESTS = REGISTRY.counter(
+    "globalcart_idempotency_requests_total",
+    "Requests carrying an Idempotency-Key, by endpoint and outcome.",
+    ("endpoint", "result"),
+)
+
+Ident = Tuple[int, str, str]
+
+
+@dataclass
+class _Claim:
+    ident: Ident
+    token: str
+    status_code: int
+    recorded: bool = False
+
+
+# The claim held by the request running on this thread/task, for IdempotencyGuard.commit.
+_active_claim: ContextVar[Optional[_Claim]] = ContextVar("idempotency_claim", default=None)
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, str(default)))
+    except ValueError:
+        return default
+
+
+def request_hash(fingerprint: Any) -> str:
+    """SHA-256 of the request as canonical JSON (pydantic models, dicts and path params alike)."""
+    raw = json.dumps(jsonable_encoder(fingerprint), sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+@dataclass(frozen=True)
+class StoredKey:
+    request_hash: str
+    status: str
+    response_code: Optional[int]
+    response_body: Any
+    expired: bool
+    lease_expired: bool
+
+
+def lookup(conn, ident: Ident) -> Optional[StoredKey]:
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            SELECT request_hash, status, response_code, response_body,
+                   expires_at < NOW(), status = 'IN_PROGRESS' AND locked_until < NOW()
+            FROM globalcart.idempotency_keys
+            WHERE customer_id = %s AND endpoint = %s AND idempotency_key = %s;
+            """,
+            ident,
+        )
+        row = cur.fetchone()
+    if row is None:
+        return None
+    return StoredKey(
+        request_hash=str(row[0]),
+        status=str(row[1]),
+        response_code=int(row[2]) if row[2] is not None else None,
+        response_body=row[3],
+        expired=bool(row[4]),
+        lease_expired=bool(row[5]),
+    )
+
+
+def try_claim(conn, ident: Ident, req_hash: str, token: str, lease_seconds: float, ttl_seconds: float) -> bool:
+    """Insert an IN_PROGRESS row, or take over an expired key / abandoned lease. True if claimed.
+
+    ``token`` identifies this claim, so a request whose lease was taken over cannot complete it.
+    """
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            INSERT INTO globalcart.idempotency_keys AS k
+              (customer_id, endpoint, idempotency_key, request_hash, status, claim_token, locked_until, expires_at)
+            VALUES (%s, %s, %s, %s, 'IN_PROGRESS', %s,
+                    NOW() + make_interval(secs => %s), NOW() + make_interval(secs => %s))
+            ON CONFLICT (customer_id, endpoint, idempotency_key) DO UPDATE
+            SET request_hash = EXCLUDED.request_hash,
+                status = 'IN_PROGRESS',
+                response_code = NULL,
+                response_body = NULL,
+                claim_token = EXCLUDED.claim_token,
+                locked_until = EXCLUDED.locked_until,
+                created_at = NOW(),
+                expires_at = EXCLUDED.expires_at
+            WHERE k.expires_at < NOW()
+               OR (k.status = 'IN_PROGRESS' AND k.locked_until < NOW() AND k.request_hash = EXCLUDED.request_hash)
+            RETURNING 1;
+            """,
+            (*ident, req_hash, token, float(lease_seconds), float(ttl_seconds)),
+        )
+        return cur.fetchone() is not None
+
+
+def complete(conn, ident: Ident, token: str, response_code: int, body: Any) -> bool:
+    """Store the response for the claim ``token``; False if the claim is no longer held."""
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            UPDATE globalcart.idempotency_keys
+            SET status = 'COMPLETED', response_code = %s, response_body = %s::jsonb, locked_until = NULL
+            WHERE customer_id = %s AND endpoint = %s AND idempotency_key = %s
+              AND status = 'IN_PROGRESS' AND claim_token = %s;
+            """,
+            (int(response_code), json.dumps(body), *ident, token),
+        )
+        return cur.rowcount == 1
+
+
+def release(conn, ident: Ident, token: str) -> None:
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            DELETE FROM globalcart.idempotency_keys
+            WHERE customer_id = %s AND endpoint = %s AND idempotency_key = %s
+              AND status = 'IN_PROGRESS' AND claim_token = %s;
+            """,
+            (*ident, token),
+        )
+
+
+def purge_expired(conn, limit: int = 1000) -> None:
+    conn.execute("SELECT globalcart.idempotency_purge(%s);", (int(limit),))
+
+
+def _encode(response: Any, status_code: int) -> Tuple[int, Any]:
+    if isinstance(response, JSONResponse):
+        return int(response.status_code), json.loads(response.body) if response.body else None
+    return int(status_code), jsonable_encoder(response)
+
+
+class IdempotencyGuard:
+    def __init__(
+        self,
+        ttl_seconds: float = 86400.0,
+        lease_seconds: float = 60.0,
+        wait_seconds: float = 10.0,
+        poll_seconds: float = 0.1,
+        max_poll_seconds: float = 1.0,
+        purge_every_seconds: float = 300.0,
+    ) -> None:
+        self.ttl_seconds = max(1.0, float(ttl_seconds))
+        self.lease_seconds = max(1.0, float(lease_seconds))
+        self.wait_seconds = max(0.0, float(wait_seconds))
+        self.poll_seconds = max(0.01, float(poll_seconds))
+        self.max_poll_seconds = max(self.poll_seconds, float(max_poll_seconds))
+        self.purge_every_seconds = float(purge_every_seconds)
+        self._lock = threading.Lock()
+        self._inflight: Dict[Ident, threading.Event] = {}
+        self._last_purge = 0.0
+
+    @classmethod
+    def from_env(cls) -> "IdempotencyGuard":
+        return cls(
+            ttl_seconds=_env_float("IDEMPOTENCY_TTL_SECONDS", 86400.0),
+            lease_seconds=_env_float("IDEMPOTENCY_LEASE_SECONDS", 60.0),
+            wait_seconds=_env_float("IDEMPOTENCY_WAIT_SECONDS", 10.0),
+        )
+
+    def run(
+        self,
+        key: Optional[str],
+        *,
+        customer_id: Optional[int],
+        endpoint: str,
+        fingerprint: Any,
+        handler: Callable[[], Any],
+        status_code: int = 200,
+    ) -> Any:
+        """Run ``handler`` at most once per (customer, endpoint, key) and replay its response.
+
+        ``status_code`` is the route's success status, stored with model responses so replays
+        answer with it. ``customer_id`` None scopes the key to the endpoint alone.
+        """
+        key = (key or "").strip()
+        if not key:
+            return handler()
+        if len(key) > MAX_KEY_LENGTH:
+            raise HTTPException(status_code=400, detail=f"Idempotency-Key must be at most {MAX_KEY_LENGTH} characters")
+
+        ident: Ident = (int(customer_id) if customer_id is not None else ANONYMOUS_CUSTOMER_ID, endpoint, key)
+        req_hash = request_hash(fingerprint)
+        started = False
+
+        def guarded() -> Any:
+            nonlocal started
+            started = True
+            return handler()
+
+        try:
+            return self._run(ident, req_hash, guarded, status_code)
+        except psycopg.OperationalError:
+            if started:
+                raise
+            _log.warning("idempotency store unavailable endpoint=%s; running without it", endpoint)
+        return handler()
+
+    def commit(self, conn, response: Any) -> None:
+        """Commit the handler's transaction together with the response for its Idempotency-Key.
+
+        Guarded handlers call this instead of ``conn.commit()`` once their writes are done. Outside
+        a guarded request it is just ``conn.commit()``.
+        """
+        claim = _active_claim.get()
+        if claim is None or claim.recorded:
+            conn.commit()
+            return
+        code, body = _encode(response, claim.status_code)
+        if not complete(conn, claim.ident, claim.token, code, body):
+            # The lease ran out and a retry took the key over; it, not this request, gets to write.
+            conn.rollback()
+            IDEMPOTENCY_REQUESTS.inc(endpoint=claim.ident[1], result="lease_lost")
+            raise HTTPException(
+                status_code=409,
+                detail="A request with this Idempotency-Key is still in progress",
+                headers={"Retry-After": "1"},
+            )
+        conn.commit()
+        claim.recorded = True
+
+    def _run(self, ident: Ident, req_hash: str, handler: Callable[[], Any], status_code: int = 200) -> Any:
+        claimed = self._claim(ident, req_hash, status_code)
+        if claimed is None:
+            return handler()
+        if isinstance(claimed, Response):
+            return claimed
+        return self._execute(claimed, handler)
+
+    def _claim(self, ident: Ident, req_hash: str, status_code: int) -> Union[_Claim, Response, None]:
+        """Claim ``ident``, or wait for whoever holds it and return its stored response.
+
+        None means the idempotency table does not exist. Each attempt uses its own short-lived
+        connection, so no connection is held while waiting or while the handler runs.
+        """
+        endpoint = ident[1]
+        deadline = time.monotonic() + self.wait_seconds
+        poll = self.poll_seconds
+        waited = False
+        while True:
+            with get_conn() as conn:
+                conn.autocommit = True
+                if not schema_caps.has(conn, IDEMPOTENCY_TABLE):
+                    return None
+                stored, claim = self._lookup_or_claim(conn, ident, req_hash, status_code)
+            if claim is not None:
+                return claim
+
+            if stored.request_hash != req_hash:
+                IDEMPOTENCY_REQUESTS.inc(endpoint=endpoint, result="mismatch")
+                raise HTTPException(
+                    status_code=422, detail="Idempotency-Key was already used with a different request"
+                )
+            if stored.status == "COMPLETED":
+                IDEMPOTENCY_REQUESTS.inc(endpoint=endpoint, result="coalesced" if waited else "replayed")
+                return JSONResponse(
+                    content=stored.response_body,
+                    status_code=stored.response_code or 200,
+                    headers={REPLAY_HEADER: "true"},
+                )
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                IDEMPOTENCY_REQUESTS.inc(endpoint=endpoint, result="in_progress")
+                raise HTTPException(
+                    status_code=409,
+                    detail="A request with this Idempotency-Key is still in progress",
+                    headers={"Retry-After": "1"},
+                )
+            waited = True
+            with self._lock:
+                event = self._inflight.get(ident)
+            if event is not None:
+                event.wait(min(remaining, self.lease_seconds))
+            else:
+                time.sleep(min(remaining, poll))
+                poll = min(poll * 2, self.max_poll_seconds)
+
+    def _lookup_or_claim(
+        self, conn, ident: Ident, req_hash: str, status_code: int
+    ) -> Tuple[Optional[StoredKey], Optional[_Claim]]:
+        while True:
+            stored = lookup(conn, ident)
+            if stored is None or stored.expired or (stored.lease_expired and stored.request_hash == req_hash):
+                token = uuid.uuid4().hex
+                if try_claim(conn, ident, req_hash, token, self.lease_seconds, self.ttl_seconds):
+                    self._maybe_purge(conn)
+                    return None, _Claim(ident, token, int(status_code))
+                continue
+            return stored, None
+
+    def _execute(self, claim: _Claim, handler: Callable[[], Any]) -> Any:
+        event = threading.Event()
+        with self._lock:
+            self._inflight[claim.ident] = event
+        reset = _active_claim.set(claim)
+        try:
+            result = handler()
+            if claim.recorded:
+                IDEMPOTENCY_REQUESTS.inc(endpoint=claim.ident[1], result="executed")
+            return result
+        finally:
+            _active_claim.reset(reset)
+            if not claim.recorded:
+                # Nothing was committed under this key (an error, or an answer that wrote nothing),
+                # so the client may retry with it.
+                self._release(claim)
+            with self._lock:
+                self._inflight.pop(claim.ident, None)
+            event.set()
+
+    def _release(self, claim: _Claim) -> None:
+        try:
+            with get_conn() as conn:
+                conn.autocommit = True
+                release(conn, claim.ident, claim.token)
+        except psycopg.Error as e:
+            # Harmless: the lease expiry frees the key instead.
+            _log.warning("idempotency key not released endpoint=%s error=%s", claim.ident[1], e)
+
+    def _maybe_purge(self, conn) -> None:
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_purge < self.purge_every_seconds:
+                return
+            self._last_purge = now
+        try:
+            purge_expired(conn)
+        except psycopg.OperationalError:
+            raise
+        except psycopg.Error as e:
+            _log.warning("idempotency purge failed error=%s", e)
+
+
+idempotency = IdempotencyGuard.from_env()
@@ -4,21 +4,15 @@ from typing import Iterable, Tuple
 
 from fastapi import HTTPException
 
+from .schema_caps import schema_caps
+
 
 def _require_inventory_tables(conn) -> None:
-    with conn.cursor() as cur:
-        cur.execute("SELECT to_regclass('globalcart.product_inventory');")
-        if cur.fetchone()[0] is None:
-            raise HTTPException(
-                status_code=500,
-                detail="Inventory tables not found. Run: python3 -m src.run_sql --sql sql/12_inventory.sql",
-            )
-        cur.execute("SELECT to_regclass('globalcart.order_inventory_reservations');")
-        if cur.fetchone()[0] is None:
-            raise HTTPException(
-                status_code=500,
-                detail="Inventory tables not found. Run: python3 -m src.run_sql --sql sql/12_inventory.sql",
-            )
+    if not schema_caps.has_all(conn, ("globalcart.product_inventory", "globalcart.order_inventory_reservations")):
+        raise HTTPException(
+            status_code=500,
+            detail="Inventory tables not found. Run: python3 -m src.run_sql --sql sql/12_inventory.sql",
+        )
 
 
 def reserve_inventory(conn, *, order_id: int, items: Iterable[Tuple[int, int]]) -> None:
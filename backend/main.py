@@ -1,20 +1,28 @@
 from __future__ import annotations
 
+import asyncio
 import logging
-import time
-import uuid
+import signal
+from contextlib import asynccontextmanager
 from pathlib import Path
-from typing import Any, Dict, Tuple
 
+import psycopg
 from dotenv import load_dotenv
 from fastapi import FastAPI
 from fastapi.exceptions import RequestValidationError
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse, RedirectResponse
+from starlette.concurrency import run_in_threadpool
 from starlette.exceptions import HTTPException as StarletteHTTPException
 from starlette.requests import Request
 from fastapi.staticfiles import StaticFiles
 
+from .metrics import start_metrics_flusher, stop_metrics_flusher
+from .middleware import GlobalCartMiddleware
+from .outbox import start_outbox_dispatcher, stop_outbox_dispatcher
+from .rate_limit import PostgresRateLimitBackend, RateLimiter
+from .razorpay_client import razorpay_client
+from .schema_caps import schema_caps, start_schema_listener, stop_schema_listener
 from .settings import load_settings
 from .routes.addresses import router as addresses_router
 from .routes.api_admin import router as api_admin_router
@@ -22,7 +30,9 @@ from .routes.api_auth import router as api_auth_router
 from .routes.api_customer import router as api_customer_router
 from .routes.api_events import router as api_events_router
 from .routes.api_payments import router as api_payments_router
+from .routes.metrics import router as metrics_router
 from .analytics.admin_analytics import router as admin_analytics_router
+from .analytics.admin_analytics import start_chart_prewarmer, stop_chart_prewarmer
 
 
 _PROJECT_ROOT = Path(__file__).resolve().parents[1]
@@ -34,22 +44,47 @@ except Exception as e:
     # Fail fast in prod-like environments. In dev, show a clear startup error.
     raise RuntimeError(f"Invalid environment configuration: {e}")
 
-app = FastAPI(title="GlobalCart Demo API")
+
+
+@asynccontextmanager
+async def _lifespan(app: FastAPI):
+    try:
+        await run_in_threadpool(schema_caps.refresh)
+    except psycopg.OperationalError:
+        pass  # demo mode; probed lazily once the database is reachable
+    if _SETTINGS.schema_listen_enabled:
+        start_schema_listener()
+    try:
+        # `kill -HUP <pid>` makes this worker re-probe optional tables/views.
+        asyncio.get_running_loop().add_signal_handler(signal.SIGHUP, schema_caps.invalidate)
+    except (NotImplementedError, RuntimeError, AttributeError, ValueError):
+        pass
+
+    if _SETTINGS.outbox_dispatcher_enabled:
+        start_outbox_dispatcher()
+    if _SETTINGS.chart_prewarm_enabled:
+        start_chart_prewarmer()
+    # Publishes this worker's counters so /metrics on any sibling worker can sum them.
+    start_metrics_flusher()
+    try:
+        yield
+    finally:
+        stop_metrics_flusher()
+        stop_chart_prewarmer()
+        stop_outbox_dispatcher()
+        stop_schema_listener()
+        if isinstance(_RATE_LIMITER.backend, PostgresRateLimitBackend):
+            _RATE_LIMITER.backend.close()
+        await razorpay_client.aclose()
+
+
+app = FastAPI(title="GlobalCart Demo API", lifespan=_lifespan)
 
 _log = logging.getLogger("globalcart")
 if not _log.handlers:
     logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
 
 
-@app.middleware("http")
-async def request_id_middleware(request: Request, call_next):
-    rid = request.headers.get("x-request-id") or uuid.uuid4().hex[:12]
-    response = await call_next(request)
-    response.headers["X-Request-ID"] = rid
-    _log.info("rid=%s method=%s path=%s status=%s", rid, request.method, request.url.path, response.status_code)
-    return response
-
-
 @app.exception_handler(StarletteHTTPException)
 async def http_exception_handler(request: Request, exc: StarletteHTTPException):
     rid = request.headers.get("x-request-id")
@@ -97,119 +132,11 @@ async def unhandled_exception_handler(request: Request, exc: Exception):
     )
 
 
-_RL_BUCKET: Dict[Tuple[str, str], Tuple[float, int]] = {}
-
-
-@app.middleware("http")
-async def security_headers_and_rate_limit_middleware(request: Request, call_next):
-    # Basic in-memory rate limiting (best effort; suitable for demo). Applies to /api/* only.
-    try:
-        if _SETTINGS.rate_limit_enabled and request.url.path.startswith("/api/"):
-            ip = request.headers.get("x-forwarded-for") or (request.client.host if request.client else "")
-            ip = (ip or "").split(",")[0].strip() or "unknown"
-            key = (ip, request.url.path)
-            now = time.time()
-            window_start, count = _RL_BUCKET.get(key, (now, 0))
-            if now - window_start >= float(_SETTINGS.rate_limit_window_seconds):
-                window_start, count = now, 0
-            count += 1
-            _RL_BUCKET[key] = (window_start, count)
-            if count > int(_SETTINGS.rate_limit_requests):
-                return JSONResponse(
-                    status_code=429,
-                    content={
-                        "error": {
-                            "type": "rate_limited",
-                            "message": "Too many requests",
-                            "request_id": request.headers.get("x-request-id"),
-                        }
-                    },
-                )
-    except Exception:
-        # Never block the request due to rate limit errors
-        pass
-
-    response = await call_next(request)
+_RATE_LIMITER = RateLimiter(_SETTINGS, app.router.routes)
 
-    # Security headers (safe defaults for demo)
-    response.headers.setdefault("X-Content-Type-Options", "nosniff")
-    response.headers.setdefault("X-Frame-Options", "DENY")
-    response.headers.setdefault("Referrer-Policy", "no-referrer")
-    response.headers.setdefault("Permissions-Policy", "geolocation=(), microphone=(), camera=()")
-    response.headers.setdefault("Cross-Origin-Opener-Policy", "same-origin")
-    response.headers.setdefault("Cross-Origin-Resource-Policy", "same-origin")
-
-    return response
-
-
-@app.middleware("http")
-async def shop_html_no_cache_middleware(request: Request, call_next):
-    try:
-        path = request.url.path or ""
-        is_shop_html = (
-            request.method == "GET"
-            and (path == "/shop" or path == "/shop/" or (path.startswith("/shop/") and path.endswith(".html")))
-        )
-        if is_shop_html:
-            # Prevent stale cached HTML for the shop UI (especially on mobile) so changes like
-            # updated script version query params take effect immediately.
-            hdrs = list(request.scope.get("headers") or [])
-            hdrs = [
-                (k, v)
-                for (k, v) in hdrs
-                if k.lower() not in (b"if-none-match", b"if-modified-since")
-            ]
-            request.scope["headers"] = hdrs
-    except Exception:
-        pass
-
-    response = await call_next(request)
-    try:
-        path = request.url.path or ""
-        is_shop_html = (
-            request.method == "GET"
-            and (path == "/shop" or path == "/shop/" or (path.startswith("/shop/") and path.endswith(".html")))
-        )
-        if is_shop_html:
-            response.headers["Cache-Control"] = "no-store, no-cache, must-revalidate, max-age=0"
-            response.headers["Pragma"] = "no-cache"
-            response.headers["Expires"] = "0"
-            response.headers.pop("ETag", None)
-            response.headers.pop("Last-Modified", None)
-    except Exception:
-        pass
-    return response
-
-
-@app.middleware("http")
-async def admin_no_cache_middleware(request: Request, call_next):
-    try:
-        path = request.url.path or ""
-        if request.method == "GET" and (path == "/admin" or path.startswith("/admin/")):
-            # Prevent browser from negotiating 304 Not Modified for admin HTML/CSS/JS.
-            # Starlette's StaticFiles supports ETag/Last-Modified, so browsers may cache aggressively.
-            hdrs = list(request.scope.get("headers") or [])
-            hdrs = [
-                (k, v)
-                for (k, v) in hdrs
-                if k.lower() not in (b"if-none-match", b"if-modified-since")
-            ]
-            request.scope["headers"] = hdrs
-    except Exception:
-        pass
-
-    response = await call_next(request)
-    try:
-        path = request.url.path or ""
-        if request.method == "GET" and (path == "/admin" or path.startswith("/admin/")):
-            response.headers["Cache-Control"] = "no-store, no-cache, must-revalidate, max-age=0"
-            response.headers["Pragma"] = "no-cache"
-            response.headers["Expires"] = "0"
-            response.headers.pop("ETag", None)
-            response.headers.pop("Last-Modified", None)
-    except Exception:
-        pass
-    return response
+# Request id + access log, rate limiting (/api/* only), security headers and no-cache for shop/admin
+# HTML in a single pure-ASGI layer; see backend/middleware.py. CORS stays outermost.
+app.add_middleware(GlobalCartMiddleware, rate_limiter=_RATE_LIMITER)
 
 app.add_middleware(
     CORSMiddleware,
@@ -226,6 +153,7 @@ app.include_router(api_payments_router)
 app.include_router(api_admin_router)
 app.include_router(admin_analytics_router)
 app.include_router(api_auth_router)
+app.include_router(metrics_router)
 
 
 _FRONTEND_ROOT = _PROJECT_ROOT / "frontend"
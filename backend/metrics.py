@@ -0,0 +1,390 @@
+from __future__ import annotations
+
+import json
+import logging
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+_log = logging.getLogger("globalcart")
+
+LabelValues = Tuple[str, ...]
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, str(default)))
+    except ValueError:
+        return default
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()) -> None:
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> LabelValues:
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {sorted(labels)}")
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()) -> None:
+        super().__init__(name, help, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def set(self, value: float, **labels: Any) -> None:
+        """Mirror a cumulative count that is kept elsewhere (e.g. by the chart render pool)."""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+    def samples(self) -> List[Tuple[LabelValues, float]]:
+        with self._lock:
+            return list(self._values.items())
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount: float = 1.0, **labels: Any) -> None:
+        self.inc(-amount, **labels)
+
+    @contextmanager
+    def track_inprogress(self, **labels: Any) -> Iterator[None]:
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> None:
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(float(b) for b in buckets))
+        # Per label set: [per-bucket counts (non-cumulative, last slot = +Inf), sum]
+        self._values: Dict[LabelValues, List[Any]] = {}
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        idx = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                idx = i
+                break
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][idx] += 1
+            entry[1] += value
+
+    def samples(self) -> List[Tuple[LabelValues, Dict[str, Any]]]:
+        with self._lock:
+            return [(k, {"counts": list(v[0]), "sum": v[1]}) for k, v in self._values.items()]
+
+
+class Registry:
+    """Metric families for one worker process, plus collectors run just before each snapshot."""
+
+    def __init__(self) -> None:
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: List[Callable[[], None]] = []
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> Any:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Duplicate metric {metric.name}")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, help, labelnames))
+
+    def gauge(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, help, labelnames))
+
+    def histogram(
+        self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self._register(Histogram(name, help, labelnames, buckets))
+
+    def add_collector(self, fn: Callable[[], None]) -> None:
+        self._collectors.append(fn)
+
+    def snapshot(self) -> Dict[str, Any]:
+        for fn in list(self._collectors):
+            try:
+                fn()
+            except Exception:
+                _log.exception("metrics collector failed")
+        families: Dict[str, Any] = {}
+        for m in list(self._metrics.values()):
+            fam: Dict[str, Any] = {
+                "type": m.kind,
+                "help": m.help,
+                "labelnames": list(m.labelnames),
+                "samples": [[list(k), v] for k, v in m.samples()],  # type: ignore[attr-defined]
+            }
+            if isinstance(m, Histogram):
+                fam["buckets"] = list(m.buckets)
+            families[m.name] = fam
+        return {"pid": os.getpid(), "ts": time.time(), "families": families}
+
+
+def merge_snapshots(snapshots: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    """Sum counters, gauges and histogram buckets of the same label set across workers."""
+    merged: Dict[str, Any] = {}
+    for snap in snapshots:
+        for name, fam in (snap.get("families") or {}).items():
+            out = merged.get(name)
+            if out is None:
+                out = merged[name] = {
+                    "type": fam["type"],
+                    "help": fam.get("help", ""),
+                    "labelnames": list(fam.get("labelnames") or []),
+                    "buckets": list(fam.get("buckets") or []),
+                    "values": {},
+                }
+            if fam["type"] == "histogram" and list(fam.get("buckets") or []) != out["buckets"]:
+                continue
+            values = out["values"]
+            for labels, v in fam.get("samples") or []:
+                key = tuple(labels)
+                if fam["type"] == "histogram":
+                    cur = values.get(key)
+                    if cur is None:
+                        values[key] = {"counts": list(v["counts"]), "sum": float(v["sum"])}
+                    else:
+                        cur["counts"] = [a + b for a, b in zip(cur["counts"], v["counts"])]
+                        cur["sum"] += float(v["sum"])
+                else:
+                    values[key] = values.get(key, 0.0) + float(v)
+    return merged
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{n}="{_escape(str(v))}"' for n, v in zip(names, values)]
+    if extra is not None:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _num(v: float) -> str:
+    if math.isinf(v):
+        return "+Inf" if v > 0 else "-Inf"
+    if float(v).is_integer():
+        return str(int(v))
+    return repr(float(v))
+
+
+def render_text(merged: Dict[str, Any]) -> str:
+    """Prometheus text exposition format (version 0.0.4)."""
+    lines: List[str] = []
+    for name in sorted(merged):
+        fam = merged[name]
+        lines.append(f"# HELP {name} {fam['help']}")
+        lines.append(f"# TYPE {name} {fam['type']}")
+        names = fam["labelnames"]
+        for key in sorted(fam["values"]):
+            v = fam["values"][key]
+            if fam["type"] == "histogram":
+                cumulative = 0
+                for bound, count in zip(list(fam["buckets"]) + [math.inf], v["counts"]):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_labels(names, key, ('le', _num(bound)))} {cumulative}")
+                lines.append(f"{name}_sum{_labels(names, key)} {_num(v['sum'])}")
+                lines.append(f"{name}_count{_labels(names, key)} {cumulative}")
+            else:
+                lines.append(f"{name}{_labels(names, key)} {_num(v)}")
+    return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+HTTP_REQUESTS = REGISTRY.counter(
+    "globalcart_http_requests_total", "HTTP requests by route template and status.", ("method", "route", "status")
+)
+HTTP_LATENCY = REGISTRY.histogram(
+    "globalcart_http_request_duration_seconds",
+    "HTTP request latency by route template and status.",
+    ("method", "route", "status"),
+)
+DB_CONNECT_SECONDS = REGISTRY.histogram(
+    "globalcart_db_connect_seconds",
+    "Time to obtain a database connection (connections are opened per request; there is no pool).",
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+)
+DB_CONNECTIONS_OPEN = REGISTRY.gauge("globalcart_db_connections_open", "Database connections currently open via get_conn().")
+DB_QUERY_SECONDS = REGISTRY.histogram(
+    "globalcart_db_query_duration_seconds",
+    "Duration of individual SQL statements.",
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0),
+)
+FUNNEL_EVENTS = REGISTRY.counter("globalcart_funnel_events_total", "Funnel events received by result.", ("result",))
+FUNNEL_EVENTS_INFLIGHT = REGISTRY.gauge(
+    "globalcart_funnel_events_inflight", "Funnel events accepted but not yet written to the database."
+)
+
+
+def metrics_dir() -> Optional[Path]:
+    """Where workers publish snapshots: ``METRICS_DIR``, else ``PROMETHEUS_MULTIPROC_DIR``.
+
+    Unset (or ``off``) disables cross-worker aggregation and each scrape sees one worker. Every
+    server (one uvicorn/gunicorn master and its workers) needs its own directory; anything found
+    there from a live process is summed in.
+    """
+    raw = (os.getenv("METRICS_DIR") or os.getenv("PROMETHEUS_MULTIPROC_DIR") or "").strip()
+    if not raw or raw.lower() in {"off", "0", "false"}:
+        return None
+    return Path(raw)
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    except OSError:
+        return False
+    return True
+
+
+def publish_snapshot(directory: Optional[Path] = None) -> Dict[str, Any]:
+    snap = REGISTRY.snapshot()
+    directory = directory if directory is not None else metrics_dir()
+    if directory is None:
+        return snap
+    try:
+        directory.mkdir(parents=True, exist_ok=True)
+        tmp = directory / f".{snap['pid']}.json.tmp"
+        tmp.write_text(json.dumps(snap), encoding="utf-8")
+        os.replace(tmp, directory / f"{snap['pid']}.json")
+    except OSError:
+        _log.warning("metrics snapshot not written to %s", directory, exc_info=True)
+    return snap
+
+
+def _stale_after() -> float:
+    return max(30.0, 6 * flush_interval_seconds())
+
+
+def _sibling_snapshots(directory: Path, own_pid: int) -> Iterator[Path]:
+    """Snapshot files of other live, recently flushing workers; dead or stale ones are deleted."""
+    now = time.time()
+    for path in directory.glob("*.json"):
+        try:
+            pid = int(path.stem)
+        except ValueError:
+            continue
+        if pid == own_pid:
+            continue
+        try:
+            if not _pid_alive(pid) or now - path.stat().st_mtime > _stale_after():
+                path.unlink(missing_ok=True)
+                continue
+        except OSError:
+            continue
+        yield path
+
+
+def prune_snapshots(directory: Optional[Path] = None) -> None:
+    """Remove snapshots left by a previous server run (dead, or no longer flushing, workers).
+
+    Called at worker startup so a PID reused since then cannot carry old counters into the sum.
+    """
+    directory = directory if directory is not None else metrics_dir()
+    if directory is not None and directory.exists():
+        for _ in _sibling_snapshots(directory, os.getpid()):
+            pass
+        (directory / f"{os.getpid()}.json").unlink(missing_ok=True)
+
+
+def collect_all(directory: Optional[Path] = None) -> Tuple[Dict[str, Any], int]:
+    """This worker's fresh snapshot merged with the latest published by its sibling workers."""
+    own = publish_snapshot(directory)
+    directory = directory if directory is not None else metrics_dir()
+    snaps = [own]
+    if directory is not None and directory.exists():
+        for path in _sibling_snapshots(directory, own["pid"]):
+            try:
+                snaps.append(json.loads(path.read_text(encoding="utf-8")))
+            except (OSError, ValueError):
+                continue
+    return merge_snapshots(snaps), len(snaps)
+
+
+def flush_interval_seconds() -> float:
+    return max(1.0, _env_float("METRICS_FLUSH_SECONDS", 5.0))
+
+
+_FLUSH_STOP = threading.Event()
+_FLUSH_THREAD: Optional[threading.Thread] = None
+
+
+def _flush_loop() -> None:
+    interval = flush_interval_seconds()
+    while not _FLUSH_STOP.wait(interval):
+        publish_snapshot()
+
+
+def start_metrics_flusher() -> None:
+    global _FLUSH_THREAD
+    if metrics_dir() is None or (_FLUSH_THREAD is not None and _FLUSH_THREAD.is_alive()):
+        return
+    _FLUSH_STOP.clear()
+    try:
+        prune_snapshots()
+    except OSError:
+        _log.warning("metrics snapshot dir %s not pruned", metrics_dir(), exc_info=True)
+    publish_snapshot()
+    _FLUSH_THREAD = threading.Thread(target=_flush_loop, name="metrics-flush", daemon=True)
+    _FLUSH_THREAD.start()
+
+
+def stop_metrics_flusher() -> None:
+    global _FLUSH_THREAD
+    _FLUSH_STOP.set()
+    t, _FLUSH_THREAD = _FLUSH_THREAD, None
+    if t is not None:
+        t.join(timeout=5)
+    directory = metrics_dir()
+    if directory is not None:
+        try:
+            (directory / f"{os.getpid()}.json").unlink(missing_ok=True)
+        except OSError:
+            pass
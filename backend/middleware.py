@@ -0,0 +1,174 @@
+from __future__ import annotations
+
+import json
+import logging
+import re
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List, MutableMapping, Optional, Tuple
+
+from starlette.concurrency import run_in_threadpool
+
+from . import db_metrics
+from .metrics import HTTP_LATENCY, HTTP_REQUESTS
+from .rate_limit import PostgresRateLimitBackend, RateLimiter, retry_after_header
+
+Scope = MutableMapping[str, Any]
+Message = MutableMapping[str, Any]
+Receive = Callable[[], Awaitable[Message]]
+Send = Callable[[Message], Awaitable[None]]
+
+_log = logging.getLogger("globalcart")
+
+# Shop HTML and the admin UI must never be served stale (script version bumps have to take effect
+# immediately, especially on mobile), so conditional requests are stripped and caching disabled.
+_NO_CACHE_PATH = re.compile(r"^(?:/shop/?|/shop/.*\.html|/admin|/admin/.*)$")
+
+_SECURITY_HEADERS: List[Tuple[bytes, bytes]] = [
+    (b"x-content-type-options", b"nosniff"),
+    (b"x-frame-options", b"DENY"),
+    (b"referrer-policy", b"no-referrer"),
+    (b"permissions-policy", b"geolocation=(), microphone=(), camera=()"),
+    (b"cross-origin-opener-policy", b"same-origin"),
+    (b"cross-origin-resource-policy", b"same-origin"),
+]
+
+_NO_CACHE_HEADERS: List[Tuple[bytes, bytes]] = [
+    (b"cache-control", b"no-store, no-cache, must-revalidate, max-age=0"),
+    (b"pragma", b"no-cache"),
+    (b"expires", b"0"),
+]
+_NO_CACHE_DROP = {b"cache-control", b"pragma", b"expires", b"etag", b"last-modified"}
+_CONDITIONAL_REQUEST_HEADERS = {b"if-none-match", b"if-modified-since"}
+
+
+class GlobalCartMiddleware:
+    """Request id, access log, request/DB metrics, rate limiting, security and no-cache headers in
+    one ASGI pass.
+
+    Headers are added to the ``http.response.start`` message, so response bodies (including
+    streaming and file responses) pass through untouched.
+    """
+
+    def __init__(self, app: Callable[..., Awaitable[None]], rate_limiter: Optional[RateLimiter] = None) -> None:
+        self.app = app
+        self.rate_limiter = rate_limiter
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method: str = scope["method"]
+        path: str = scope["path"]
+        no_cache = method == "GET" and _NO_CACHE_PATH.match(path) is not None
+
+        rid: Optional[str] = None
+        forwarded_for: Optional[str] = None
+        headers: List[Tuple[bytes, bytes]] = []
+        for key, value in scope["headers"]:
+            if key == b"x-request-id":
+                rid = value.decode("latin-1")
+            elif key == b"x-forwarded-for":
+                forwarded_for = value.decode("latin-1")
+            elif no_cache and key in _CONDITIONAL_REQUEST_HEADERS:
+                continue
+            headers.append((key, value))
+        if rid is None:
+            rid = uuid.uuid4().hex[:12]
+            # Expose the generated id to exception handlers, which read it from the request.
+            headers.append((b"x-request-id", rid.encode("latin-1")))
+        scope["headers"] = headers
+
+        rid_header = (b"x-request-id", rid.encode("latin-1"))
+        status_code = 500
+        started = time.perf_counter()
+        db_stats = db_metrics.RequestDbStats(request_id=rid, method=method, path=path)
+        db_token = db_metrics.begin_request(db_stats)
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                raw = [
+                    (k, v)
+                    for (k, v) in message.get("headers", [])
+                    if k.lower() != b"x-request-id" and not (no_cache and k.lower() in _NO_CACHE_DROP)
+                ]
+                present = {k.lower() for k, _ in raw}
+                raw.append(rid_header)
+                timing = db_metrics.server_timing(db_stats, (time.perf_counter() - started) * 1000.0)
+                raw.append((b"server-timing", timing.encode("latin-1")))
+                raw.extend(h for h in _SECURITY_HEADERS if h[0] not in present)
+                if no_cache:
+                    raw.extend(_NO_CACHE_HEADERS)
+                message["headers"] = raw
+            await send(message)
+
+        try:
+            limited = await self._rate_limited(scope, method, path, forwarded_for, rid)
+            if limited is not None:
+                await _send_json(send_wrapper, 429, limited[0], limited[1])
+                return
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            db_metrics.end_request(db_token)
+            elapsed_ms = (time.perf_counter() - started) * 1000.0
+            route = db_metrics.route_template(scope)
+            HTTP_REQUESTS.inc(method=method, route=route, status=status_code)
+            HTTP_LATENCY.observe(elapsed_ms / 1000.0, method=method, route=route, status=status_code)
+            if db_stats.queries or path.startswith("/api/"):
+                db_metrics.query_stats.finish_request(f"{method} {route}", db_stats, elapsed_ms)
+            _log.info(
+                "rid=%s method=%s path=%s status=%s ms=%.1f queries=%s db_ms=%.1f",
+                rid,
+                method,
+                path,
+                status_code,
+                elapsed_ms,
+                db_stats.queries,
+                db_stats.db_ms,
+            )
+
+    async def _rate_limited(
+        self,
+        scope: Scope,
+        method: str,
+        path: str,
+        forwarded_for: Optional[str],
+        rid: str,
+    ) -> Optional[Tuple[Dict[str, Any], List[Tuple[bytes, bytes]]]]:
+        limiter = self.rate_limiter
+        if limiter is None or not limiter.enabled or not path.startswith("/api/"):
+            return None
+        try:
+            client = scope.get("client")
+            ip = forwarded_for or (client[0] if client else "")
+            ip = (ip or "").split(",")[0].strip() or "unknown"
+            if isinstance(limiter.backend, PostgresRateLimitBackend):
+                decision = await run_in_threadpool(limiter.check, ip, method, path)
+            else:
+                decision = limiter.check(ip, method, path)
+        except Exception:
+            # Never block the request due to rate limit errors
+            return None
+        if decision is None or decision.allowed:
+            return None
+        body = {"error": {"type": "rate_limited", "message": "Too many requests", "request_id": rid}}
+        return body, [(b"retry-after", retry_after_header(decision).encode("latin-1"))]
+
+
+async def _send_json(send: Send, status: int, content: Dict[str, Any], headers: List[Tuple[bytes, bytes]]) -> None:
+    body = json.dumps(content, separators=(",", ":")).encode("utf-8")
+    await send(
+        {
+            "type": "http.response.start",
+            "status": status,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode("latin-1")),
+            ]
+            + headers,
+        }
+    )
+    await send({"type": "http.response.body", "body": body})
@@ -514,6 +514,15 @@ class FunnelDailyMetricOut(BaseModel):
     payment_failure_rate: float
 
 
+class RevenueForecastOut(BaseModel):
+    segment_type: str
+    segment_value: str
+    forecast_dt: str
+    forecast_lr: float
+    forecast_arima: Optional[float] = None
+    generated_at: str
+
+
 class FunnelProductLeakageOut(BaseModel):
     product_id: int
     product_name: str
@@ -0,0 +1,46 @@
+from __future__ import annotations
+
+from datetime import date, datetime
+from typing import Any, Iterable, Optional
+
+from .schema_caps import schema_caps
+
+HISTORY_TABLE = "globalcart.customer_order_history"
+
+HISTORY_COLUMNS = (
+    "order_id, customer_id, order_ts, order_status, net_amount, items, "
+    "shipped_ts, delivered_dt, cancelled_at, cancel_reason"
+)
+
+
+def history_available(conn) -> bool:
+    return schema_caps.has(conn, HISTORY_TABLE)
+
+
+def refresh_order_history(conn, order_ids: Iterable[int]) -> None:
+    """Re-derive the read-model rows for ``order_ids`` inside the caller's transaction.
+
+    A no-op until sql/14_customer_order_history.sql is applied. Errors propagate so the write that
+    triggered the refresh rolls back with it; the list and timeline never see a stale row.
+    """
+    ids = sorted({int(i) for i in order_ids})
+    if not ids or not history_available(conn):
+        return
+    conn.execute("SELECT globalcart.refresh_customer_order_history(%s::bigint[]);", (ids,))
+
+
+def derive_order_status(
+    order_status: Any,
+    shipped_ts: Optional[datetime],
+    delivered_dt: Optional[date],
+    now: datetime,
+) -> str:
+    """PLACED/SHIPPED/DELIVERED from shipment timestamps; CANCELLED orders stay cancelled."""
+    status = str(order_status or "").upper()
+    if status == "CANCELLED":
+        return status
+    if delivered_dt is not None and delivered_dt <= now.date():
+        return "DELIVERED"
+    if shipped_ts is not None and shipped_ts <= now:
+        return "SHIPPED"
+    return "PLACED"
@@ -0,0 +1,565 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+import random
+import smtplib
+import sys
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from email.message import EmailMessage
+from typing import Any, List, Optional, Sequence, Tuple
+
+import httpx
+import psycopg
+
+from .db import _dsn
+
+_log = logging.getLogger("globalcart")
+
+# Enqueueing sends this (delivered on commit) so an idle dispatcher wakes up immediately.
+OUTBOX_CHANNEL = "globalcart_outbox"
+
+# OTP mails keep their row for the inbox/audit trail, but not the code once the row is final
+# (sent, failed or expired).
+REDACTED_KINDS = ("OTP_LOGIN", "OTP_SIGNUP")
+REDACTED_BODY = "[redacted]"
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, str(default)))
+    except ValueError:
+        return default
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, str(default)))
+    except ValueError:
+        return default
+
+
+def _env_flag(name: str, default: str = "1") -> bool:
+    return str(os.getenv(name, default)).strip().lower() not in {"0", "false"}
+
+
+# --- enqueue (called inside the request transaction) ------------------------------------------
+
+
+def enqueue_email(
+    cur,
+    *,
+    to_email: str,
+    subject: str,
+    body: str,
+    kind: str,
+    customer_id: Optional[int] = None,
+    order_id: Optional[int] = None,
+    expires_in_seconds: Optional[float] = None,
+) -> None:
+    """Queue a mail; with ``expires_in_seconds`` it is marked FAILED rather than sent after that."""
+    cur.execute(
+        """
+        INSERT INTO globalcart.app_email_outbox (customer_id, to_email, subject, body, kind, order_id, expires_at)
+        VALUES (%s, %s, %s, %s, %s, %s, NOW() + %s * INTERVAL '1 second');
+        """,
+        (
+            customer_id,
+            str(to_email),
+            str(subject),
+            str(body),
+            str(kind),
+            order_id,
+            None if expires_in_seconds is None else float(expires_in_seconds),
+        ),
+    )
+    cur.execute("SELECT pg_notify(%s, '');", (OUTBOX_CHANNEL,))
+
+
+def enqueue_customer_email(
+    cur,
+    *,
+    customer_id: int,
+    subject: str,
+    body: str,
+    kind: str,
+    order_id: Optional[int] = None,
+) -> bool:
+    """Queue a mail to the customer's most recently updated login email; False if they have none."""
+    cur.execute(
+        """
+        INSERT INTO globalcart.app_email_outbox (customer_id, to_email, subject, body, kind, order_id)
+        SELECT u.customer_id, u.email, %s, %s, %s, %s
+        FROM globalcart.app_users u
+        WHERE u.customer_id = %s AND COALESCE(u.email, '') <> ''
+        ORDER BY u.updated_at DESC
+        LIMIT 1;
+        """,
+        (str(subject), str(body), str(kind), order_id, int(customer_id)),
+    )
+    if cur.rowcount <= 0:
+        return False
+    cur.execute("SELECT pg_notify(%s, '');", (OUTBOX_CHANNEL,))
+    return True
+
+
+# --- sinks ------------------------------------------------------------------------------------
+
+
+class PermanentDeliveryError(Exception):
+    """The provider rejected the message itself; retrying will not help."""
+
+
+class SmtpSink:
+    """One SMTP session reused across messages and batches; closed after it sits idle."""
+
+    name = "smtp"
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        user: str,
+        password: str,
+        from_email: str,
+        use_tls: bool = True,
+        timeout: float = 10.0,
+        idle_seconds: float = 30.0,
+    ) -> None:
+        self._host = host
+        self._port = int(port)
+        self._user = user
+        self._password = password
+        self._from = from_email
+        self._use_tls = bool(use_tls)
+        self._timeout = float(timeout)
+        self._idle_seconds = float(idle_seconds)
+        self._server: Optional[smtplib.SMTP] = None
+        self._last_used = 0.0
+
+    def _connect(self) -> smtplib.SMTP:
+        server = smtplib.SMTP(self._host, self._port, timeout=self._timeout)
+        server.ehlo()
+        if self._use_tls:
+            server.starttls()
+            server.ehlo()
+        server.login(self._user, self._password)
+        return server
+
+    def send(self, to_email: str, subject: str, body: str) -> None:
+        msg = EmailMessage()
+        msg["Subject"] = subject
+        msg["From"] = self._from
+        msg["To"] = to_email
+        msg.set_content(body)
+
+        for attempt in (1, 2):
+            if self._server is None:
+                self._server = self._connect()
+            try:
+                self._server.send_message(msg)
+                self._last_used = time.monotonic()
+                return
+            except smtplib.SMTPServerDisconnected:
+                # The server dropped our idle session; reconnect once.
+                self._server = None
+                if attempt == 2:
+                    raise
+            except smtplib.SMTPRecipientsRefused as e:
+                # Refused before DATA (smtplib has already sent RSET), so the session stays usable.
+                # 4xx is a temporary refusal (greylisting, full mailbox): retry later.
+                if all(400 <= code < 500 for code, _ in e.recipients.values()):
+                    raise
+                raise PermanentDeliveryError(str(e)) from e
+            except Exception as e:
+                # A timeout or an error mid-transaction leaves the session in an unknown protocol
+                # state; the next message must not reuse it.
+                self._drop()
+                if isinstance(e, smtplib.SMTPSenderRefused) and not 400 <= e.smtp_code < 500:
+                    raise PermanentDeliveryError(str(e)) from e
+                raise
+
+    def _drop(self) -> None:
+        server, self._server = self._server, None
+        if server is not None:
+            try:
+                server.close()
+            except Exception:
+                pass
+
+    def idle(self) -> None:
+        if self._server is not None and time.monotonic() - self._last_used >= self._idle_seconds:
+            self.close()
+
+    def close(self) -> None:
+        server, self._server = self._server, None
+        if server is not None:
+            try:
+                server.quit()
+            except Exception:
+                pass
+
+
+class SendGridSink:
+    name = "sendgrid"
+
+    def __init__(self, api_key: str, from_email: str, timeout: float = 10.0) -> None:
+        self._api_key = api_key
+        self._from = from_email
+        self._client = httpx.Client(timeout=timeout, headers={"Authorization": f"Bearer {api_key}"})
+
+    def send(self, to_email: str, subject: str, body: str) -> None:
+        payload = {
+            "personalizations": [{"to": [{"email": to_email}]}],
+            "from": {"email": self._from},
+            "subject": subject,
+            "content": [{"type": "text/plain", "value": body}],
+        }
+        resp = self._client.post("https://api.sendgrid.com/v3/mail/send", json=payload)
+        if resp.status_code in (200, 202):
+            return
+        detail = f"SendGrid status={resp.status_code} body={resp.text[:500]}"
+        if resp.status_code in (400, 403, 413):
+            raise PermanentDeliveryError(detail)
+        raise RuntimeError(detail)
+
+    def idle(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self._client.close()
+
+
+class FileSink:
+    """Appends one JSON line per message to ``path`` ("-" for stdout). For local runs and tests."""
+
+    name = "file"
+
+    def __init__(self, path: str) -> None:
+        self._path = path
+        self._lock = threading.Lock()
+
+    def send(self, to_email: str, subject: str, body: str) -> None:
+        line = json.dumps(
+            {
+                "to": to_email,
+                "subject": subject,
+                "body": body,
+                "ts": datetime.now(timezone.utc).isoformat(),
+            }
+        )
+        with self._lock:
+            if self._path == "-":
+                sys.stdout.write(line + "\n")
+                sys.stdout.flush()
+                return
+            with open(self._path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+    def idle(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+def _sink_kind() -> Optional[str]:
+    mode = str(os.getenv("OUTBOX_SINK", "auto")).strip().lower() or "auto"
+    if mode in {"none", "file"}:
+        return None if mode == "none" else "file"
+    if mode in {"auto", "sendgrid"} and os.getenv("SENDGRID_API_KEY", "").strip() and os.getenv(
+        "SENDGRID_FROM_EMAIL", ""
+    ).strip():
+        return "sendgrid"
+    smtp_keys = ("SMTP_HOST", "SMTP_USER", "SMTP_PASSWORD", "SMTP_FROM_EMAIL")
+    if mode in {"auto", "smtp"} and all(os.getenv(k, "").strip() for k in smtp_keys):
+        return "smtp"
+    return None
+
+
+def delivery_configured() -> bool:
+    return _sink_kind() is not None
+
+
+def sink_from_env() -> Optional[Any]:
+    """OUTBOX_SINK=auto|sendgrid|smtp|file|none. ``auto`` prefers SendGrid, then SMTP; None if neither is configured."""
+    kind = _sink_kind()
+    if kind == "file":
+        return FileSink(os.getenv("OUTBOX_FILE_PATH", "-").strip() or "-")
+    if kind == "sendgrid":
+        return SendGridSink(os.getenv("SENDGRID_API_KEY", "").strip(), os.getenv("SENDGRID_FROM_EMAIL", "").strip())
+    if kind == "smtp":
+        return SmtpSink(
+            os.getenv("SMTP_HOST", "").strip(),
+            _env_int("SMTP_PORT", 587),
+            os.getenv("SMTP_USER", "").strip(),
+            os.getenv("SMTP_PASSWORD", "").strip().replace(" ", ""),
+            os.getenv("SMTP_FROM_EMAIL", "").strip(),
+            use_tls=_env_flag("SMTP_USE_TLS"),
+            idle_seconds=_env_float("OUTBOX_SMTP_IDLE_SECONDS", 30.0),
+        )
+    return None
+
+
+# --- dispatcher -------------------------------------------------------------------------------
+
+
+def retry_delay_seconds(attempts: int, base: float = 30.0, cap: float = 3600.0) -> float:
+    """Exponential backoff after the ``attempts``-th failed try, with +/-20% jitter."""
+    delay = min(cap, base * (2 ** max(0, int(attempts) - 1)))
+    return delay * random.uniform(0.8, 1.2)
+
+
+@dataclass(frozen=True)
+class OutboxMessage:
+    email_id: int
+    to_email: str
+    subject: str
+    body: str
+    kind: str
+    attempts: int
+
+
+# Mails past their expires_at (OTPs) are failed instead of sent; a SENDING row only once its lease
+# has lapsed, so a delivery in flight is left to finish.
+_EXPIRE_SQL = """
+UPDATE globalcart.app_email_outbox
+SET status = 'FAILED',
+    error = 'expired before delivery',
+    next_attempt_at = NULL,
+    body = CASE WHEN kind = ANY(%s) THEN %s ELSE body END
+WHERE status IN ('PENDING', 'SENDING')
+  AND expires_at <= NOW()
+  AND (status = 'PENDING' OR next_attempt_at <= NOW());
+"""
+
+# SENDING rows carry a lease in next_attempt_at: if the worker dies mid-batch they become claimable
+# again once it expires. SKIP LOCKED lets several dispatchers (one per API worker) share the table.
+_CLAIM_SQL = """
+WITH batch AS (
+  SELECT email_id
+  FROM globalcart.app_email_outbox
+  WHERE status IN ('PENDING', 'SENDING')
+    AND COALESCE(next_attempt_at, created_at) <= NOW()
+    AND (expires_at IS NULL OR expires_at > NOW())
+  ORDER BY email_id
+  LIMIT %s
+  FOR UPDATE SKIP LOCKED
+)
+UPDATE globalcart.app_email_outbox o
+SET status = 'SENDING',
+    attempts = o.attempts + 1,
+    next_attempt_at = NOW() + make_interval(secs => %s)
+FROM batch
+WHERE o.email_id = batch.email_id
+RETURNING o.email_id, o.to_email, o.subject, o.body, o.kind, o.attempts;
+"""
+
+_SENT_SQL = """
+UPDATE globalcart.app_email_outbox
+SET status = 'SENT',
+    sent_at = NOW(),
+    provider = %s,
+    error = NULL,
+    next_attempt_at = NULL,
+    body = CASE WHEN kind = ANY(%s) THEN %s ELSE body END
+WHERE email_id = ANY(%s);
+"""
+
+# A retry that would come after the mail's expires_at fails it now instead.
+_FAILED_SQL = """
+WITH f AS (
+  SELECT o.email_id,
+         CASE WHEN f.status = 'PENDING' AND o.expires_at <= NOW() + make_interval(secs => f.delay)
+              THEN 'FAILED' ELSE f.status END AS status,
+         f.error,
+         f.delay
+  FROM unnest(%s::bigint[], %s::text[], %s::text[], %s::float8[]) AS f(email_id, status, error, delay)
+  JOIN globalcart.app_email_outbox o ON o.email_id = f.email_id
+)
+UPDATE globalcart.app_email_outbox o
+SET status = f.status,
+    provider = %s,
+    error = f.error,
+    next_attempt_at = CASE WHEN f.status = 'PENDING' THEN NOW() + make_interval(secs => f.delay) ELSE NULL END,
+    body = CASE WHEN f.status = 'FAILED' AND o.kind = ANY(%s) THEN %s ELSE o.body END
+FROM f
+WHERE o.email_id = f.email_id;
+"""
+
+
+class OutboxDispatcher:
+    def __init__(
+        self,
+        sink: Any,
+        batch_size: int = 50,
+        max_attempts: int = 8,
+        lease_seconds: float = 300.0,
+        retry_base_seconds: float = 30.0,
+        retry_cap_seconds: float = 3600.0,
+    ) -> None:
+        self.sink = sink
+        self.batch_size = max(1, int(batch_size))
+        self.max_attempts = max(1, int(max_attempts))
+        self.lease_seconds = float(lease_seconds)
+        self.retry_base_seconds = float(retry_base_seconds)
+        self.retry_cap_seconds = float(retry_cap_seconds)
+
+    @classmethod
+    def from_env(cls, sink: Any) -> "OutboxDispatcher":
+        return cls(
+            sink,
+            batch_size=_env_int("OUTBOX_BATCH_SIZE", 50),
+            max_attempts=_env_int("OUTBOX_MAX_ATTEMPTS", 8),
+            lease_seconds=_env_float("OUTBOX_LEASE_SECONDS", 300.0),
+            retry_base_seconds=_env_float("OUTBOX_RETRY_BASE_SECONDS", 30.0),
+            retry_cap_seconds=_env_float("OUTBOX_RETRY_CAP_SECONDS", 3600.0),
+        )
+
+    def claim(self, conn) -> List[OutboxMessage]:
+        with conn.cursor() as cur:
+            cur.execute(_CLAIM_SQL, (self.batch_size, self.lease_seconds))
+            rows = cur.fetchall()
+        return [
+            OutboxMessage(int(r[0]), str(r[1]), str(r[2]), str(r[3]), str(r[4]), int(r[5]))
+            for r in rows
+        ]
+
+    def deliver(self, messages: Sequence[OutboxMessage]) -> Tuple[List[int], List[Tuple[int, str, str, float]]]:
+        sent: List[int] = []
+        failed: List[Tuple[int, str, str, float]] = []
+        for m in messages:
+            try:
+                self.sink.send(m.to_email, m.subject, m.body)
+                sent.append(m.email_id)
+            except Exception as e:
+                permanent = isinstance(e, PermanentDeliveryError) or m.attempts >= self.max_attempts
+                delay = 0.0 if permanent else retry_delay_seconds(
+                    m.attempts, self.retry_base_seconds, self.retry_cap_seconds
+                )
+                failed.append((m.email_id, "FAILED" if permanent else "PENDING", str(e)[:1000], delay))
+                _log.warning(
+                    "outbox delivery failed email_id=%s kind=%s attempt=%s retry=%s error=%s",
+                    m.email_id,
+                    m.kind,
+                    m.attempts,
+                    not permanent,
+                    e,
+                )
+        return sent, failed
+
+    def record(self, conn, sent: Sequence[int], failed: Sequence[Tuple[int, str, str, float]]) -> None:
+        with conn.cursor() as cur:
+            if sent:
+                cur.execute(_SENT_SQL, (self.sink.name, list(REDACTED_KINDS), REDACTED_BODY, list(sent)))
+            if failed:
+                cur.execute(
+                    _FAILED_SQL,
+                    (
+                        [f[0] for f in failed],
+                        [f[1] for f in failed],
+                        [f[2] for f in failed],
+                        [f[3] for f in failed],
+                        self.sink.name,
+                        list(REDACTED_KINDS),
+                        REDACTED_BODY,
+                    ),
+                )
+
+    def expire(self, conn) -> None:
+        with conn.cursor() as cur:
+            cur.execute(_EXPIRE_SQL, (list(REDACTED_KINDS), REDACTED_BODY))
+
+    def dispatch_once(self, conn) -> int:
+        """Expire overdue mail, then claim, deliver and record one batch on an autocommit
+        connection; returns rows claimed."""
+        self.expire(conn)
+        messages = self.claim(conn)
+        if not messages:
+            self.sink.idle()
+            return 0
+        sent, failed = self.deliver(messages)
+        self.record(conn, sent, failed)
+        return len(messages)
+
+
+_DISPATCH_STOP = threading.Event()
+_DISPATCH_THREAD: Optional[threading.Thread] = None
+
+
+def _dispatch_loop(dispatcher: OutboxDispatcher) -> None:
+    poll = max(0.1, _env_float("OUTBOX_POLL_SECONDS", 5.0))
+    backoff = 1.0
+    try:
+        while not _DISPATCH_STOP.is_set():
+            try:
+                with psycopg.connect(_dsn(), autocommit=True) as conn:
+                    conn.execute(f"LISTEN {OUTBOX_CHANNEL};")
+                    backoff = 1.0
+                    while not _DISPATCH_STOP.is_set():
+                        # Drain full batches back to back; otherwise sleep until notified or polled.
+                        if dispatcher.dispatch_once(conn) >= dispatcher.batch_size:
+                            continue
+                        for _ in conn.notifies(timeout=poll, stop_after=1):
+                            pass
+            except psycopg.OperationalError:
+                _DISPATCH_STOP.wait(backoff)
+                backoff = min(backoff * 2, 60.0)
+            except (psycopg.errors.UndefinedTable, psycopg.errors.UndefinedColumn, psycopg.errors.InvalidSchemaName):
+                _log.warning("outbox tables not ready. Run: python3 -m src.run_sql --sql sql/10_shop_features.sql")
+                _DISPATCH_STOP.wait(60.0)
+            except Exception as e:
+                _log.warning("outbox dispatcher error=%s", e)
+                _DISPATCH_STOP.wait(backoff)
+                backoff = min(backoff * 2, 60.0)
+    finally:
+        dispatcher.sink.close()
+
+
+def start_outbox_dispatcher() -> bool:
+    global _DISPATCH_THREAD
+    if _DISPATCH_THREAD is not None and _DISPATCH_THREAD.is_alive():
+        return True
+    sink = sink_from_env()
+    if sink is None:
+        _log.info("outbox dispatcher not started: no mail sink configured")
+        return False
+    _DISPATCH_STOP.clear()
+    _DISPATCH_THREAD = threading.Thread(
+        target=_dispatch_loop,
+        args=(OutboxDispatcher.from_env(sink),),
+        name="outbox-dispatcher",
+        daemon=True,
+    )
+    _DISPATCH_THREAD.start()
+    return True
+
+
+def stop_outbox_dispatcher(timeout: float = 10.0) -> None:
+    global _DISPATCH_THREAD
+    _DISPATCH_STOP.set()
+    if _DISPATCH_THREAD is not None:
+        _DISPATCH_THREAD.join(timeout=timeout)
+    _DISPATCH_THREAD = None
+
+
+def main() -> None:
+    # Standalone worker for deployments that run API workers with OUTBOX_DISPATCHER_ENABLED=0.
+    logging.basicConfig(level=logging.INFO)
+    if not start_outbox_dispatcher():
+        raise SystemExit("No mail sink configured (set SENDGRID_*, SMTP_* or OUTBOX_SINK=file)")
+    try:
+        while _DISPATCH_THREAD is not None and _DISPATCH_THREAD.is_alive():
+            _DISPATCH_THREAD.join(timeout=1.0)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop_outbox_dispatcher()
+
+
+if __name__ == "__main__":
+    main()
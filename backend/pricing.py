@@ -0,0 +1,227 @@
+from __future__ import annotations
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from decimal import ROUND_HALF_UP, Decimal
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from .schema_caps import schema_caps
+
+# Single source of truth for storefront prices: product sell prices, cart/checkout/order line math
+# and promo discounts. Amounts are Decimal end to end and rounded half-up to paise, matching the
+# NUMERIC(14,2) columns they are written to; routes convert to float only for JSON responses.
+
+CENT = Decimal("0.01")
+TAX_RATE = Decimal("0.07")
+DISCOUNT_TIERS = (5, 8, 10, 12, 15, 18, 20)
+
+CART_VERSIONS_TABLE = "globalcart.customer_cart_versions"
+
+
+def money(value: Any) -> Decimal:
+    d = value if isinstance(value, Decimal) else Decimal(str(value))
+    return d.quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+def discount_pct(product_id: int) -> int:
+    return DISCOUNT_TIERS[int(product_id) % len(DISCOUNT_TIERS)]
+
+
+def sell_price(list_price: Any, product_id: int) -> Decimal:
+    return money(money(list_price) * (100 - discount_pct(product_id)) / 100)
+
+
+@dataclass(frozen=True)
+class PricedProduct:
+    product_id: int
+    sku: str
+    product_name: str
+    category_l1: str
+    category_l2: str
+    brand: str
+    unit_cost: Decimal
+    list_price: Decimal
+    discount_pct: int
+    sell_price: Decimal
+
+    @classmethod
+    def build(cls, product_id: int, list_price: Any, unit_cost: Any = 0, **attrs: str) -> "PricedProduct":
+        pid = int(product_id)
+        return cls(
+            product_id=pid,
+            sku=attrs.get("sku", f"SKU-{pid:05d}"),
+            product_name=attrs.get("product_name", ""),
+            category_l1=attrs.get("category_l1", ""),
+            category_l2=attrs.get("category_l2", ""),
+            brand=attrs.get("brand", ""),
+            unit_cost=money(unit_cost),
+            list_price=money(list_price),
+            discount_pct=discount_pct(pid),
+            sell_price=sell_price(list_price, pid),
+        )
+
+
+def load_products(conn, product_ids: Iterable[int]) -> Dict[int, PricedProduct]:
+    """Catalog rows for ``product_ids`` in one query, with discount and sell price precomputed."""
+    ids = sorted({int(p) for p in product_ids})
+    if not ids:
+        return {}
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            SELECT product_id, sku, product_name, category_l1, category_l2, brand, unit_cost, list_price
+            FROM globalcart.vw_customer_products
+            WHERE product_id = ANY(%s);
+            """,
+            (ids,),
+        )
+        rows = cur.fetchall()
+
+    return {
+        int(r[0]): PricedProduct.build(
+            r[0],
+            r[7],
+            r[6],
+            sku=str(r[1]),
+            product_name=str(r[2]),
+            category_l1=str(r[3]),
+            category_l2=str(r[4]),
+            brand=str(r[5]),
+        )
+        for r in rows
+    }
+
+
+@dataclass(frozen=True)
+class PricedLine:
+    product: PricedProduct
+    qty: int
+    line_gross: Decimal
+    line_discount: Decimal
+    line_tax: Decimal
+    line_total: Decimal
+
+
+@dataclass(frozen=True)
+class PricedCart:
+    lines: Tuple[PricedLine, ...]
+    gross_amount: Decimal
+    discount_amount: Decimal
+    tax_amount: Decimal
+    net_amount: Decimal
+
+
+def price_items(items: Sequence[Tuple[int, int]], products: Dict[int, PricedProduct]) -> PricedCart:
+    """Line and cart totals for ``(product_id, qty)`` pairs. Raises KeyError for unknown products."""
+    lines: List[PricedLine] = []
+    for pid, qty in items:
+        p = products[int(pid)]
+        qty = int(qty)
+        extended = p.sell_price * qty
+        line_tax = money(extended * TAX_RATE)
+        lines.append(
+            PricedLine(
+                product=p,
+                qty=qty,
+                line_gross=money(p.list_price * qty),
+                line_discount=money((p.list_price - p.sell_price) * qty),
+                line_tax=line_tax,
+                line_total=money(extended + line_tax),
+            )
+        )
+    return PricedCart(
+        lines=tuple(lines),
+        gross_amount=sum((l.line_gross for l in lines), Decimal("0.00")),
+        discount_amount=sum((l.line_discount for l in lines), Decimal("0.00")),
+        tax_amount=sum((l.line_tax for l in lines), Decimal("0.00")),
+        net_amount=sum((l.line_total for l in lines), Decimal("0.00")),
+    )
+
+
+def promo_discount(amount: Any, discount_type: str, discount_value: Any, max_discount: Any = None) -> Decimal:
+    """Discount a promo gives on ``amount``; raises ValueError for an unknown discount type."""
+    amount = money(amount)
+    kind = str(discount_type or "").upper()
+    if kind == "PERCENT":
+        disc = money(amount * money(discount_value or 0) / 100)
+    elif kind == "FLAT":
+        disc = money(discount_value or 0)
+    else:
+        raise ValueError(f"Unknown promo discount type {discount_type!r}")
+    if max_discount is not None:
+        disc = min(disc, money(max_discount))
+    return max(Decimal("0.00"), min(disc, amount))
+
+
+# --- cart summary cache ---------------------------------------------------------------------------
+# Cart summaries are cached per customer and keyed by customer_cart_versions.version, which a
+# trigger on customer_cart_items bumps on every insert/update/delete. A hit costs one primary-key
+# read instead of the cart + catalog queries; the TTL bounds staleness after catalog price edits.
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, str(default)))
+    except ValueError:
+        return default
+
+
+def cart_version(conn, customer_id: int) -> Optional[int]:
+    """Current cart version, or None when the versions table is not installed."""
+    if not schema_caps.has(conn, CART_VERSIONS_TABLE):
+        return None
+    with conn.cursor() as cur:
+        cur.execute(
+            "SELECT version FROM globalcart.customer_cart_versions WHERE customer_id = %s;",
+            (int(customer_id),),
+        )
+        row = cur.fetchone()
+    return int(row[0]) if row else 0
+
+
+class CartSummaryCache:
+    def __init__(self, max_entries: int = 10000, ttl_seconds: float = 60.0) -> None:
+        self.max_entries = max(1, int(max_entries))
+        self.ttl_seconds = float(ttl_seconds)
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[int, Tuple[int, float, Any]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, customer_id: int, version: Optional[int]) -> Any:
+        if version is None:
+            return None
+        with self._lock:
+            entry = self._entries.get(int(customer_id))
+            if entry is None or entry[0] != version or time.monotonic() - entry[1] > self.ttl_seconds:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(int(customer_id))
+            self.hits += 1
+            return entry[2]
+
+    def put(self, customer_id: int, version: Optional[int], summary: Any) -> None:
+        if version is None:
+            return
+        with self._lock:
+            self._entries[int(customer_id)] = (version, time.monotonic(), summary)
+            self._entries.move_to_end(int(customer_id))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, customer_id: int) -> None:
+        with self._lock:
+            self._entries.pop(int(customer_id), None)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+cart_cache = CartSummaryCache(
+    max_entries=_env_int("CART_CACHE_MAX_ENTRIES", 10000),
+    ttl_seconds=_env_int("CART_CACHE_TTL_SECONDS", 60),
+)
@@ -0,0 +1,269 @@
+from __future__ import annotations
+
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+import psycopg
+from starlette.routing import Match
+
+from .db import _dsn
+from .settings import RouteLimit, Settings
+
+_log = logging.getLogger("globalcart")
+
+
+@dataclass(frozen=True)
+class RateDecision:
+    allowed: bool
+    limit: int
+    remaining: int
+    retry_after: float
+
+
+# --- algorithms -------------------------------------------------------------------------------
+# State is a small tuple so the in-memory store stays compact; each step returns (new_state, decision).
+
+
+def token_bucket_step(
+    state: Optional[Tuple[float, float]],
+    now: float,
+    limit: int,
+    window_seconds: float,
+) -> Tuple[Tuple[float, float], RateDecision]:
+    capacity = float(limit)
+    rate = capacity / float(window_seconds)
+    if state is None:
+        tokens, updated = capacity, now
+    else:
+        tokens, updated = state
+        tokens = min(capacity, tokens + max(0.0, now - updated) * rate)
+    if tokens >= 1.0:
+        tokens -= 1.0
+        return (tokens, now), RateDecision(True, limit, int(tokens), 0.0)
+    return (tokens, now), RateDecision(False, limit, 0, (1.0 - tokens) / rate)
+
+
+def sliding_window_step(
+    state: Optional[Tuple[float, int, int]],
+    now: float,
+    limit: int,
+    window_seconds: float,
+) -> Tuple[Tuple[float, int, int], RateDecision]:
+    window = float(window_seconds)
+    if state is None:
+        window_start, prev_count, curr_count = now, 0, 0
+    else:
+        window_start, prev_count, curr_count = state
+        elapsed = now - window_start
+        if elapsed >= window:
+            windows = int(elapsed // window)
+            prev_count = curr_count if windows == 1 else 0
+            curr_count = 0
+            window_start += windows * window
+
+    elapsed = now - window_start
+    estimate = prev_count * (1.0 - elapsed / window) + curr_count
+    if estimate + 1 <= limit:
+        curr_count += 1
+        return (window_start, prev_count, curr_count), RateDecision(True, limit, int(limit - estimate - 1), 0.0)
+    return (window_start, prev_count, curr_count), RateDecision(False, limit, 0, window - elapsed)
+
+
+_ALGORITHMS = {
+    "token_bucket": token_bucket_step,
+    "sliding_window": sliding_window_step,
+}
+
+
+# --- backends ---------------------------------------------------------------------------------
+
+
+class MemoryRateLimitBackend:
+    """Per-process buckets in an LRU map; idle buckets expire and the key count is capped."""
+
+    def __init__(self, algorithm: str, max_keys: int, idle_ttl_seconds: float) -> None:
+        self._step = _ALGORITHMS[algorithm]
+        self._max_keys = max(1, int(max_keys))
+        self._idle_ttl = float(idle_ttl_seconds)
+        self._lock = threading.Lock()
+        self._buckets: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+
+    def hit(self, key: str, limit: int, window_seconds: int) -> RateDecision:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._buckets.pop(key, None)
+            state = entry[1] if entry is not None and now - entry[0] < self._idle_ttl else None
+            new_state, decision = self._step(state, now, limit, window_seconds)
+            self._buckets[key] = (now, new_state)
+            self._evict_locked(now)
+        return decision
+
+    def _evict_locked(self, now: float) -> None:
+        # Oldest-touched first: drop expired buckets, then anything over the cap.
+        while self._buckets:
+            key, (touched, _) = next(iter(self._buckets.items()))
+            if len(self._buckets) > self._max_keys or now - touched >= self._idle_ttl:
+                self._buckets.popitem(last=False)
+            else:
+                break
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._buckets)
+
+
+class PostgresRateLimitBackend:
+    """Buckets in the UNLOGGED globalcart.api_rate_limits table, shared by every API worker.
+
+    Each worker keeps one autocommit connection for limiter calls (one round trip per request).
+    """
+
+    _SQL = {
+        "token_bucket": "SELECT allowed, remaining, retry_after FROM globalcart.rate_limit_token_bucket(%s, %s, %s);",
+        "sliding_window": "SELECT allowed, remaining, retry_after FROM globalcart.rate_limit_sliding_window(%s, %s, %s);",
+    }
+
+    def __init__(self, algorithm: str, idle_ttl_seconds: float, purge_every_seconds: float = 60.0) -> None:
+        self._algorithm = algorithm
+        self._idle_ttl = int(idle_ttl_seconds)
+        self._purge_every = float(purge_every_seconds)
+        self._last_purge = 0.0
+        self._lock = threading.Lock()
+        self._conn: Optional[psycopg.Connection] = None
+
+    def _connection(self) -> psycopg.Connection:
+        if self._conn is None or self._conn.closed:
+            self._conn = psycopg.connect(_dsn(), autocommit=True)
+        return self._conn
+
+    def hit(self, key: str, limit: int, window_seconds: int) -> RateDecision:
+        if self._algorithm == "token_bucket":
+            args: Tuple[Any, ...] = (key, float(limit), float(limit) / float(window_seconds))
+        else:
+            args = (key, int(limit), float(window_seconds))
+
+        with self._lock:
+            try:
+                conn = self._connection()
+                row = conn.execute(self._SQL[self._algorithm], args).fetchone()
+                now = time.monotonic()
+                if now - self._last_purge >= self._purge_every:
+                    self._last_purge = now
+                    conn.execute("SELECT globalcart.rate_limit_purge(%s);", (self._idle_ttl,))
+            except psycopg.OperationalError:
+                self._conn = None
+                raise
+
+        allowed, remaining, retry_after = row
+        return RateDecision(bool(allowed), int(limit), max(0, int(remaining or 0)), float(retry_after or 0.0))
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+            self._conn = None
+
+
+# --- limiter ----------------------------------------------------------------------------------
+
+
+class RouteTemplateResolver:
+    """Maps raw paths to the app's route templates (``/api/customer/products/{product_id}``).
+
+    Results are memoised in a bounded LRU so scanning traffic can't grow it without limit.
+    """
+
+    UNMATCHED = "<unmatched>"
+
+    def __init__(self, routes: Sequence[Any], max_entries: int = 4096) -> None:
+        self._routes = routes
+        self._max_entries = max(1, int(max_entries))
+        self._lock = threading.Lock()
+        self._cache: "OrderedDict[Tuple[str, str], str]" = OrderedDict()
+
+    def resolve(self, method: str, path: str) -> str:
+        cache_key = (method, path)
+        with self._lock:
+            hit = self._cache.get(cache_key)
+            if hit is not None:
+                self._cache.move_to_end(cache_key)
+                return hit
+
+        template = self.UNMATCHED
+        scope = {"type": "http", "method": method, "path": path, "root_path": ""}
+        partial = None
+        for route in self._routes:
+            path_format = getattr(route, "path_format", None) or getattr(route, "path", None)
+            if not path_format:
+                continue
+            try:
+                match, _ = route.matches(scope)
+            except Exception:
+                continue
+            if match == Match.FULL:
+                template = path_format
+                break
+            if match == Match.PARTIAL and partial is None:
+                # Same path, other method (-> 405): still the same route for limiting purposes.
+                partial = path_format
+        else:
+            if partial is not None:
+                template = partial
+
+        with self._lock:
+            self._cache[cache_key] = template
+            while len(self._cache) > self._max_entries:
+                self._cache.popitem(last=False)
+        return template
+
+
+class RateLimiter:
+    def __init__(self, settings: Settings, routes: Sequence[Any]) -> None:
+        self.enabled = bool(settings.rate_limit_enabled)
+        self._default = RouteLimit(
+            method="*",
+            path="*",
+            requests=int(settings.rate_limit_requests),
+            window_seconds=int(settings.rate_limit_window_seconds),
+        )
+        self._route_limits: Dict[Tuple[str, str], RouteLimit] = {
+            (r.method, r.path): r for r in settings.rate_limit_routes
+        }
+        longest_window = max([self._default.window_seconds] + [r.window_seconds for r in settings.rate_limit_routes])
+        idle_ttl = max(60, 2 * longest_window)
+
+        algorithm = settings.rate_limit_algorithm
+        if settings.rate_limit_backend == "postgres":
+            self.backend: Any = PostgresRateLimitBackend(algorithm, idle_ttl_seconds=idle_ttl)
+        else:
+            self.backend = MemoryRateLimitBackend(algorithm, settings.rate_limit_max_keys, idle_ttl_seconds=idle_ttl)
+        self.resolver = RouteTemplateResolver(routes)
+
+    def limit_for(self, method: str, template: str) -> RouteLimit:
+        return (
+            self._route_limits.get((method, template))
+            or self._route_limits.get(("*", template))
+            or self._default
+        )
+
+    def check(self, client_ip: str, method: str, path: str) -> Optional[RateDecision]:
+        """Count one request; returns None when the request isn't subject to limiting."""
+        if not self.enabled or not path.startswith("/api/"):
+            return None
+        template = self.resolver.resolve(method, path)
+        limit = self.limit_for(method, template)
+        if limit.requests <= 0:
+            return None
+        # Route-specific limits get their own bucket per method; the default limit is per route.
+        method_key = limit.method if limit is not self._default else "*"
+        key = f"{client_ip}|{method_key}|{template}"
+        return self.backend.hit(key, limit.requests, limit.window_seconds)
+
+
+def retry_after_header(decision: RateDecision) -> str:
+    return str(max(1, int(math.ceil(decision.retry_after))))
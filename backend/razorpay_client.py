@@ -0,0 +1,226 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+from typing import Any, Dict, Optional
+
+import httpx
+
+from .metrics import REGISTRY
+
+# Shared Razorpay API client for the payment routes. One httpx.AsyncClient per worker keeps TLS
+# connections alive between calls, so an order create costs one round trip instead of a fresh
+# TCP+TLS handshake, and awaiting it does not hold a threadpool thread. Transient failures
+# (connect errors, timeouts, 429, 5xx) are retried with jittered backoff; after repeated failures
+# the circuit breaker opens and calls fail fast until the provider has had time to recover.
+# Order creation is not idempotent on Razorpay's side: a read timeout or 5xx may mean the order
+# was created anyway, so it is only retried when the request provably was not processed.
+
+_log = logging.getLogger("globalcart")
+
+RAZORPAY_CALLS = REGISTRY.counter(
+    "globalcart_razorpay_requests_total", "Razorpay API calls by operation and outcome.", ("op", "result")
+)
+RAZORPAY_LATENCY = REGISTRY.histogram("globalcart_razorpay_request_seconds", "Razorpay API call latency.", ("op",))
+RAZORPAY_CIRCUIT_OPEN = REGISTRY.gauge("globalcart_razorpay_circuit_open", "1 while the Razorpay circuit breaker is open.")
+
+_RETRY_STATUS = {429, 500, 502, 503, 504}
+# Failures after which a non-idempotent request is known not to have been acted on: the
+# connection was never made, or the provider rate-limited the call before handling it.
+_UNSENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+_UNSENT_STATUS = {429}
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, str(default)))
+    except ValueError:
+        return default
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, str(default)))
+    except ValueError:
+        return default
+
+
+class RazorpayError(Exception):
+    """A Razorpay call that failed; ``status_code`` is what the API route should answer with."""
+
+    def __init__(self, detail: str, status_code: int = 502, retry_after: Optional[float] = None) -> None:
+        super().__init__(detail)
+        self.detail = detail
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Opens after ``failure_threshold`` consecutive failures; after ``reset_seconds`` one trial
+    call is let through (half-open) and its outcome closes or re-opens the circuit."""
+
+    def __init__(self, failure_threshold: int = 5, reset_seconds: float = 30.0) -> None:
+        self.failure_threshold = max(1, int(failure_threshold))
+        self.reset_seconds = float(reset_seconds)
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if time.monotonic() - self._opened_at >= self.reset_seconds:
+                return "half_open"
+            return "open"
+
+    def retry_after(self) -> float:
+        with self._lock:
+            if self._opened_at is None:
+                return 0.0
+            return max(0.0, self.reset_seconds - (time.monotonic() - self._opened_at))
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at < self.reset_seconds or self._trial_in_flight:
+                return False
+            self._trial_in_flight = True
+            return True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+        RAZORPAY_CIRCUIT_OPEN.set(0)
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            tripped = self._trial_in_flight or self._failures >= self.failure_threshold
+            self._trial_in_flight = False
+            if tripped:
+                if self._opened_at is None:
+                    _log.warning("razorpay circuit open failures=%s", self._failures)
+                self._opened_at = time.monotonic()
+        if tripped:
+            RAZORPAY_CIRCUIT_OPEN.set(1)
+
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    """Full-jitter exponential backoff before retry number ``attempt`` (1-based)."""
+    return random.uniform(0.0, min(cap, base * (2 ** (attempt - 1))))
+
+
+class RazorpayClient:
+    def __init__(
+        self,
+        base_url: str = "https://api.razorpay.com/v1",
+        connect_timeout: float = 3.0,
+        read_timeout: float = 8.0,
+        max_retries: int = 2,
+        backoff_base: float = 0.2,
+        backoff_cap: float = 2.0,
+        max_connections: int = 20,
+        breaker: Optional[CircuitBreaker] = None,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ) -> None:
+        self.base_url = base_url.rstrip("/")
+        self.timeout = httpx.Timeout(read_timeout, connect=connect_timeout, pool=connect_timeout)
+        self.max_retries = max(0, int(max_retries))
+        self.backoff_base = float(backoff_base)
+        self.backoff_cap = float(backoff_cap)
+        self.limits = httpx.Limits(
+            max_connections=max(1, int(max_connections)),
+            max_keepalive_connections=max(1, int(max_connections)),
+            keepalive_expiry=60.0,
+        )
+        self.breaker = breaker or CircuitBreaker()
+        self._transport = transport
+        self._client: Optional[httpx.AsyncClient] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @classmethod
+    def from_env(cls) -> "RazorpayClient":
+        return cls(
+            base_url=os.getenv("RAZORPAY_API_BASE", "https://api.razorpay.com/v1"),
+            connect_timeout=_env_float("RAZORPAY_CONNECT_TIMEOUT_SECONDS", 3.0),
+            read_timeout=_env_float("RAZORPAY_TIMEOUT_SECONDS", 8.0),
+            max_retries=_env_int("RAZORPAY_MAX_RETRIES", 2),
+            max_connections=_env_int("RAZORPAY_MAX_CONNECTIONS", 20),
+            breaker=CircuitBreaker(
+                failure_threshold=_env_int("RAZORPAY_BREAKER_FAILURES", 5),
+                reset_seconds=_env_float("RAZORPAY_BREAKER_RESET_SECONDS", 30.0),
+            ),
+        )
+
+    def _http(self) -> httpx.AsyncClient:
+        # The client's pooled connections belong to the event loop that opened them; a new loop
+        # (e.g. a fresh TestClient) gets a fresh client.
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client.is_closed or self._loop is not loop:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url, timeout=self.timeout, limits=self.limits, transport=self._transport
+            )
+            self._loop = loop
+        return self._client
+
+    async def aclose(self) -> None:
+        client, self._client, self._loop = self._client, None, None
+        if client is not None and not client.is_closed:
+            await client.aclose()
+
+    async def _request(
+        self, op: str, method: str, path: str, *, auth: str, json: Any = None, idempotent: bool = True
+    ) -> Dict[str, Any]:
+        if not self.breaker.allow():
+            RAZORPAY_CALLS.inc(op=op, result="circuit_open")
+            raise RazorpayError(
+                "Payment provider temporarily unavailable", status_code=503, retry_after=self.breaker.retry_after()
+            )
+
+        headers = {"Authorization": auth, "Content-Type": "application/json"}
+        attempt = 0
+        while True:
+            attempt += 1
+            started = time.perf_counter()
+            try:
+                resp = await self._http().request(method, path, headers=headers, json=json)
+            except httpx.TransportError as e:
+                RAZORPAY_LATENCY.observe(time.perf_counter() - started, op=op)
+                failure = RazorpayError(f"Razorpay request failed: {e.__class__.__name__}")
+                retryable = idempotent or isinstance(e, _UNSENT_ERRORS)
+            else:
+                RAZORPAY_LATENCY.observe(time.perf_counter() - started, op=op)
+                if resp.status_code < 400:
+                    self.breaker.record_success()
+                    RAZORPAY_CALLS.inc(op=op, result="ok")
+                    return resp.json()
+                retryable = resp.status_code in (_RETRY_STATUS if idempotent else _UNSENT_STATUS)
+                failure = RazorpayError(f"Razorpay {op} failed: {resp.text}")
+                if resp.status_code not in _RETRY_STATUS:
+                    # 4xx is our request being rejected, not the provider being down.
+                    self.breaker.record_success()
+                    RAZORPAY_CALLS.inc(op=op, result="rejected")
+                    raise failure
+
+            if attempt > self.max_retries or not retryable:
+                self.breaker.record_failure()
+                RAZORPAY_CALLS.inc(op=op, result="failed")
+                raise failure
+            RAZORPAY_CALLS.inc(op=op, result="retried")
+            await asyncio.sleep(backoff_delay(attempt, self.backoff_base, self.backoff_cap))
+
+    async def create_order(self, payload: Dict[str, Any], *, auth: str) -> Dict[str, Any]:
+        return await self._request("create_order", "POST", "/orders", auth=auth, json=payload, idempotent=False)
+
+
+razorpay_client = RazorpayClient.from_env()
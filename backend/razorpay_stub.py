@@ -0,0 +1,98 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import secrets
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List
+
+from fastapi import FastAPI, Header, HTTPException
+from fastapi.responses import JSONResponse
+
+# Local stand-in for the Razorpay Orders API, for tests and offline development:
+#
+#   python3 -m backend.razorpay_stub --port 9100
+#   RAZORPAY_API_BASE=http://127.0.0.1:9100/v1 python3 -m uvicorn backend.main:app
+#
+# Tests mount ``create_app()`` through httpx.ASGITransport instead of a socket. Queue failures
+# with ``state.fail_next(503, 503)`` or set RAZORPAY_STUB_DELAY_MS to exercise timeouts.
+
+
+class StubState:
+    def __init__(self, delay_ms: float = 0.0) -> None:
+        self.delay_ms = float(delay_ms)
+        self._lock = threading.Lock()
+        self._failures: Deque[int] = deque()
+        self.orders: Dict[str, Dict[str, Any]] = {}
+        self.requests = 0
+
+    def fail_next(self, *status_codes: int) -> None:
+        with self._lock:
+            self._failures.extend(int(s) for s in status_codes)
+
+    def _next_failure(self) -> int | None:
+        with self._lock:
+            self.requests += 1
+            return self._failures.popleft() if self._failures else None
+
+
+def create_app(state: StubState | None = None) -> FastAPI:
+    state = state or StubState(delay_ms=float(os.getenv("RAZORPAY_STUB_DELAY_MS", "0") or 0))
+    app = FastAPI(title="Razorpay stub")
+    app.state.stub = state
+
+    @app.post("/v1/orders")
+    async def create_order(body: Dict[str, Any], authorization: str | None = Header(None)) -> Any:
+        if state.delay_ms > 0:
+            await asyncio.sleep(state.delay_ms / 1000.0)
+        failure = state._next_failure()
+        if failure is not None:
+            return JSONResponse(status_code=failure, content={"error": {"code": "SERVER_ERROR"}})
+        if not (authorization or "").startswith("Basic "):
+            raise HTTPException(status_code=401, detail="Authentication failed")
+        amount = body.get("amount")
+        if not isinstance(amount, int) or amount < 100:
+            return JSONResponse(
+                status_code=400,
+                content={"error": {"code": "BAD_REQUEST_ERROR", "description": "amount must be at least 100 paise"}},
+            )
+        order = {
+            "id": f"order_{secrets.token_hex(7)}",
+            "entity": "order",
+            "amount": amount,
+            "amount_paid": 0,
+            "amount_due": amount,
+            "currency": body.get("currency", "INR"),
+            "receipt": body.get("receipt"),
+            "status": "created",
+            "attempts": 0,
+            "notes": body.get("notes") or {},
+            "created_at": int(time.time()),
+        }
+        state.orders[order["id"]] = order
+        return order
+
+    @app.get("/v1/orders")
+    async def list_orders() -> Dict[str, List[Dict[str, Any]]]:
+        items = list(state.orders.values())
+        return {"entity": "collection", "count": len(items), "items": items}
+
+    return app
+
+
+def main() -> None:
+    import uvicorn
+
+    ap = argparse.ArgumentParser(description="Serve a local Razorpay Orders API stub.")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=9100)
+    ap.add_argument("--delay-ms", type=float, default=float(os.getenv("RAZORPAY_STUB_DELAY_MS", "0") or 0))
+    args = ap.parse_args()
+    uvicorn.run(create_app(StubState(delay_ms=args.delay_ms)), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -6,13 +6,16 @@ import re
 from pathlib import Path
 from urllib.parse import quote
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional
+from typing import Any, Dict, List, Optional
 
 from fastapi import APIRouter, Header, HTTPException, Query
 from fastapi.responses import Response
 import psycopg
 
+from .. import pricing
 from ..db import get_conn
+from ..db_metrics import query_stats
+from ..schema_caps import schema_caps
 from ..security import decode_access_token, parse_bearer_token, require_admin_from_token_payload
 from ..models import (
     AdminAuditLogItemOut,
@@ -31,6 +34,7 @@ from ..models import (
     JourneyEventOut,
     JourneySessionOut,
     ProductDetailOut,
+    RevenueForecastOut,
 )
 
 
@@ -66,10 +70,6 @@ def _require_admin(admin_key: str | None, authorization: str | None = None) -> N
         raise HTTPException(status_code=403, detail="Admin access required")
 
 
-def _stable_discount_pct(product_id: int) -> int:
-    return [5, 8, 10, 12, 15, 18, 20][product_id % 7]
-
-
 def _image_url(seed: str, label: str) -> str:
     bg = hashlib.md5(seed.encode("utf-8")).hexdigest()[:6]
     label_short = (label or "Product")[:32]
@@ -491,6 +491,40 @@ def export_bi_mart_csv(
         )
 
 
+@router.post("/schema/refresh")
+def schema_refresh(
+    admin_key: str | None = Header(None, alias="X-Admin-Key"),
+    authorization: str | None = Header(None, alias="Authorization"),
+) -> Dict[str, Any]:
+    """Re-probe optional tables/views (e.g. after applying a migration) for this worker."""
+    _require_admin(admin_key, authorization=authorization)
+    try:
+        return {"objects": schema_caps.refresh()}
+    except psycopg.OperationalError:
+        raise HTTPException(status_code=503, detail="Database unavailable")
+
+
+@router.get("/db/stats")
+def db_stats(
+    limit: int = Query(50, ge=1, le=500),
+    admin_key: str | None = Header(None, alias="X-Admin-Key"),
+    authorization: str | None = Header(None, alias="Authorization"),
+) -> Dict[str, Any]:
+    """Per-endpoint query counts/time and recent slow queries recorded by this worker."""
+    _require_admin(admin_key, authorization=authorization)
+    return query_stats.snapshot(limit=limit)
+
+
+@router.post("/db/stats/reset")
+def db_stats_reset(
+    admin_key: str | None = Header(None, alias="X-Admin-Key"),
+    authorization: str | None = Header(None, alias="Authorization"),
+) -> Dict[str, Any]:
+    _require_admin(admin_key, authorization=authorization)
+    query_stats.reset()
+    return {"detail": "Reset"}
+
+
 @router.post("/login", response_model=AdminLoginOut)
 def admin_login(req: AdminLoginIn) -> AdminLoginOut:
     expected_user = os.getenv("ADMIN_USER", "admin")
@@ -538,8 +572,7 @@ def audit_log(
         with get_conn() as conn:
             conn.execute("SET TIME ZONE 'UTC';", prepare=False)
             with conn.cursor() as cur:
-                cur.execute("SELECT to_regclass('globalcart.vw_admin_order_cancellations');")
-                has_cancel = cur.fetchone()[0] is not None
+                has_cancel = schema_caps.has(conn, "globalcart.vw_admin_order_cancellations")
 
                 parts: List[str] = [
                     """
@@ -790,8 +823,8 @@ def admin_product_detail(
         brand = str(row[5])
         list_price = float(row[7])
 
-        disc = _stable_discount_pct(pid)
-        sell_price = round(list_price * (1 - disc / 100.0), 2)
+        disc = pricing.discount_pct(pid)
+        sell_price = pricing.sell_price(list_price, pid)
 
         stock_qty = 0 if (pid % 17 == 0) else (5 + (pid % 23))
         in_stock = stock_qty > 0
@@ -834,8 +867,8 @@ def admin_product_detail(
         brand = brands[pid % len(brands)]
         product_name = f"Demo Product {pid}"
         list_price = float(199 + (pid % 200) * 10)
-        disc = _stable_discount_pct(pid)
-        sell_price = round(list_price * (1 - disc / 100.0), 2)
+        disc = pricing.discount_pct(pid)
+        sell_price = pricing.sell_price(list_price, pid)
         stock_qty = 0 if (pid % 17 == 0) else (5 + (pid % 23))
         in_stock = stock_qty > 0
         return ProductDetailOut(
@@ -1608,3 +1641,53 @@ def funnel_payment_failures(
                 "Run: python3 -m src.run_sql --sql sql/02_views.sql"
             ),
         )
+
+
+_FORECAST_SEGMENT_TYPES = {"total", "channel", "region", "country", "category_l1", "category_l2"}
+
+
+@router.get("/forecasts", response_model=List[RevenueForecastOut])
+def revenue_forecasts(
+    segment_type: str = Query("total"),
+    segment_value: str | None = Query(None, max_length=60),
+    admin_key: str | None = Header(None, alias="X-Admin-Key"),
+    authorization: str | None = Header(None, alias="Authorization"),
+):
+    _require_admin(admin_key, authorization=authorization)
+    seg = (segment_type or "").strip().lower()
+    if seg not in _FORECAST_SEGMENT_TYPES:
+        raise HTTPException(status_code=400, detail=f"segment_type must be one of {sorted(_FORECAST_SEGMENT_TYPES)}")
+
+    try:
+        sql = """
+            SELECT segment_type, segment_value, forecast_dt, forecast_lr, forecast_arima, generated_at
+            FROM globalcart.revenue_forecasts
+            WHERE segment_type = %s
+              AND (%s::text IS NULL OR segment_value = %s)
+            ORDER BY segment_value, forecast_dt;
+        """
+        with get_conn() as conn:
+            conn.execute("SET TIME ZONE 'UTC';", prepare=False)
+            with conn.cursor() as cur:
+                cur.execute(sql, (seg, segment_value, segment_value))
+                rows = cur.fetchall()
+
+        return [
+            RevenueForecastOut(
+                segment_type=str(r[0]),
+                segment_value=str(r[1]),
+                forecast_dt=r[2].isoformat(),
+                forecast_lr=float(r[3]),
+                forecast_arima=None if r[4] is None else float(r[4]),
+                generated_at=r[5].isoformat(),
+            )
+            for r in rows
+        ]
+
+    except psycopg.OperationalError:
+        raise HTTPException(status_code=503, detail="Database unavailable")
+    except (psycopg.errors.UndefinedTable, psycopg.errors.InvalidSchemaName):
+        raise HTTPException(
+            status_code=404,
+            detail="No forecasts yet (missing globalcart.revenue_forecasts). Run: python3 -m src.analytics.forecasting",
+        )
@@ -7,13 +7,10 @@ import logging
 import os
 import re
 import secrets
-import smtplib
 from datetime import datetime, timedelta, timezone
-from email.message import EmailMessage
 from typing import Optional
 
 from fastapi import APIRouter, Header, HTTPException
-import httpx
 import psycopg
 
 from ..db import get_conn
@@ -32,6 +29,8 @@ from ..models import (
     AuthVerifyOtpIn,
     AuthVerifyOtpOut,
 )
+from ..outbox import delivery_configured, enqueue_email, sink_from_env
+from ..schema_caps import schema_caps
 from ..security import create_access_token, decode_access_token, parse_bearer_token
 
 
@@ -139,106 +138,40 @@ def _password_verify(password: str, stored: str) -> bool:
         return False
 
 
-def _send_otp_email(email: str, otp: str, ttl_seconds: int) -> bool:
-    logger = logging.getLogger("api_auth")
-
-    subject = "Your GlobalCart verification code"
+def _otp_email(otp: str, ttl_seconds: int) -> tuple[str, str]:
     minutes = max(1, int(ttl_seconds // 60))
-    body = f"Your GlobalCart OTP is: {otp}. It expires in {minutes} minutes."
-
-    # Prefer SendGrid if configured
-    api_key = os.getenv("SENDGRID_API_KEY", "").strip()
-    from_email = os.getenv("SENDGRID_FROM_EMAIL", "").strip()
-    logger.info(
-        "[OTP_EMAIL] sendgrid_configured=%s smtp_configured=%s demo_show_otp=%s",
-        bool(api_key and from_email),
-        bool(
-            os.getenv("SMTP_HOST", "").strip()
-            and os.getenv("SMTP_USER", "").strip()
-            and os.getenv("SMTP_PASSWORD", "").strip()
-            and os.getenv("SMTP_FROM_EMAIL", "").strip()
-        ),
-        _show_demo_otp(),
-    )
-    if api_key and from_email:
-        logger.info("[OTP_EMAIL] using=sendgrid to=%s", email)
-        payload = {
-            "personalizations": [{"to": [{"email": email}]}],
-            "from": {"email": from_email},
-            "subject": subject,
-            "content": [{"type": "text/plain", "value": body}],
-        }
-
-        try:
-            with httpx.Client(timeout=10.0) as client:
-                resp = client.post(
-                    "https://api.sendgrid.com/v3/mail/send",
-                    headers={"Authorization": f"Bearer {api_key}"},
-                    json=payload,
-                )
-                if resp.status_code in (200, 202):
-                    return True
+    return "Your GlobalCart verification code", f"Your GlobalCart OTP is: {otp}. It expires in {minutes} minutes."
 
-                logger.error(
-                    "SendGrid send failed status=%s body=%s",
-                    resp.status_code,
-                    resp.text,
-                )
-                raise HTTPException(status_code=502, detail="Failed to send OTP email")
-        except httpx.HTTPError:
-            logger.exception("SendGrid HTTP error")
-            raise HTTPException(status_code=502, detail="Failed to send OTP email")
-
-    # SMTP fallback (e.g., Gmail App Password)
-    smtp_host = os.getenv("SMTP_HOST", "").strip()
-    smtp_user = os.getenv("SMTP_USER", "").strip()
-    smtp_password = os.getenv("SMTP_PASSWORD", "").strip().replace(" ", "")
-    smtp_from = os.getenv("SMTP_FROM_EMAIL", "").strip()
-    if not (smtp_host and smtp_user and smtp_password and smtp_from):
-        logger.info(
-            "[OTP_EMAIL] smtp_missing host=%s user=%s password=%s from=%s",
-            bool(smtp_host),
-            bool(smtp_user),
-            bool(smtp_password),
-            bool(smtp_from),
-        )
-    if smtp_host and smtp_user and smtp_password and smtp_from:
-        try:
-            smtp_port = int(os.getenv("SMTP_PORT", "587").strip() or "587")
-        except ValueError:
-            smtp_port = 587
-
-        use_tls = str(os.getenv("SMTP_USE_TLS", "1")).strip() not in {"0", "false", "False"}
-
-        msg = EmailMessage()
-        msg["Subject"] = subject
-        msg["From"] = smtp_from
-        msg["To"] = email
-        msg.set_content(body)
-
-        try:
-            logger.info(
-                "[OTP_EMAIL] using=smtp host=%s port=%s tls=%s user=%s from=%s to=%s",
-                smtp_host,
-                smtp_port,
-                use_tls,
-                smtp_user,
-                smtp_from,
-                email,
-            )
-            with smtplib.SMTP(smtp_host, smtp_port, timeout=10) as server:
-                server.ehlo()
-                if use_tls:
-                    server.starttls()
-                    server.ehlo()
-                server.login(smtp_user, smtp_password)
-                server.send_message(msg)
-            return True
-        except Exception:
-            logger.exception("SMTP send failed")
-            raise HTTPException(status_code=502, detail="Failed to send OTP email")
 
-    return False
+def _queue_otp_email(conn, email: str, otp: str, ttl_seconds: int, kind: str) -> bool:
+    """Queue the OTP mail in the caller's transaction; False when nothing will deliver it."""
+    if not delivery_configured() or not schema_caps.has(conn, "globalcart.app_email_outbox"):
+        return False
+    subject, body = _otp_email(otp, ttl_seconds)
+    with conn.cursor() as cur:
+        # A code that arrives after it expired is useless, so it is not retried past its TTL.
+        enqueue_email(cur, to_email=email, subject=subject, body=body, kind=kind, expires_in_seconds=ttl_seconds)
+    return True
+
+
+def _send_otp_email(email: str, otp: str, ttl_seconds: int) -> bool:
+    # Inline fallback for databases without globalcart.app_email_outbox (sql/10_shop_features.sql).
+    logger = logging.getLogger("api_auth")
+    sink = sink_from_env()
+    if sink is None:
+        logger.info("[OTP_EMAIL] no mail sink configured demo_show_otp=%s", _show_demo_otp())
+        return False
+
+    subject, body = _otp_email(otp, ttl_seconds)
+    try:
+        logger.info("[OTP_EMAIL] using=%s to=%s", sink.name, email)
+        sink.send(email, subject, body)
+        return True
+    except Exception:
+        logger.exception("OTP email send failed provider=%s", sink.name)
+        raise HTTPException(status_code=502, detail="Failed to send OTP email")
+    finally:
+        sink.close()
 
 
 def _pick_customer_for_email(conn, email: str) -> tuple[int, int]:
@@ -307,14 +240,16 @@ def request_otp(req: AuthRequestOtpIn) -> AuthRequestOtpOut:
                 )
                 logger.info("[DEBUG] post-insert latest otp row (same tx): %s", cur.fetchone())
 
+            queued = _queue_otp_email(conn, email, otp, ttl, kind="OTP_LOGIN")
             conn.commit()
 
-        emailed = False
-        try:
-            emailed = _send_otp_email(email, otp, ttl)
-        except HTTPException:
-            if not _show_demo_otp():
-                raise
+        emailed = queued
+        if not queued:
+            try:
+                emailed = _send_otp_email(email, otp, ttl)
+            except HTTPException:
+                if not _show_demo_otp():
+                    raise
 
         return AuthRequestOtpOut(
             email=email,
@@ -374,14 +309,16 @@ def signup_request_otp(req: AuthSignupRequestOtpIn) -> AuthSignupRequestOtpOut:
                     """,
                     (email, otp_hash, expires_at, display_name, pwd_hash),
                 )
+            queued = _queue_otp_email(conn, email, otp, ttl, kind="OTP_SIGNUP")
             conn.commit()
 
-        emailed = False
-        try:
-            emailed = _send_otp_email(email, otp, ttl)
-        except HTTPException:
-            if not _show_demo_otp():
-                raise
+        emailed = queued
+        if not queued:
+            try:
+                emailed = _send_otp_email(email, otp, ttl)
+            except HTTPException:
+                if not _show_demo_otp():
+                    raise
         return AuthSignupRequestOtpOut(
             email=email,
             otp_sent=True,
@@ -11,8 +11,14 @@ from urllib.parse import quote
 from fastapi import APIRouter, Header, HTTPException, Query
 import psycopg
 
+from .. import pricing
 from ..db import get_conn
+from ..idempotency import idempotency
 from ..inventory import consume_inventory, release_inventory, reserve_inventory
+from ..order_history import HISTORY_COLUMNS, derive_order_status, history_available, refresh_order_history
+from ..outbox import enqueue_customer_email
+from ..pricing import cart_cache, cart_version, load_products, price_items, promo_discount
+from ..schema_caps import schema_caps
 from ..security import decode_access_token, parse_bearer_token
 from ..models import (
     CartItemIn,
@@ -83,10 +89,6 @@ def _ts(x) -> str | None:
     return str(x)
 
 
-def _stable_discount_pct(product_id: int) -> int:
-    return [5, 8, 10, 12, 15, 18, 20][product_id % 7]
-
-
 def _demo_catalog(
     limit: int,
     offset: int,
@@ -131,8 +133,8 @@ def _demo_catalog(
         sku = f"SKU-{pid:05d}"
         name = f"{brand} {c2} {pid}"
         list_price = float(299 + ((pid * 37) % 2200))
-        disc = _stable_discount_pct(pid)
-        sell_price = round(list_price * (1 - disc / 100.0), 2)
+        disc = pricing.discount_pct(pid)
+        sell_price = pricing.sell_price(list_price, pid)
 
         if min_price is not None and list_price < float(min_price):
             continue
@@ -247,37 +249,12 @@ def _next_id(conn, table: str, pk: str) -> int:
         return int(row[0])
 
 
-def _product_map(conn, product_ids: List[int]) -> Dict[int, dict]:
-    if not product_ids:
-        return {}
-
-    placeholders = ",".join(["%s"] * len(product_ids))
-    sql = f"""
-        SELECT product_id, sku, product_name, category_l1, category_l2, brand, unit_cost, list_price
-        FROM globalcart.vw_customer_products
-        WHERE product_id IN ({placeholders});
-    """
-
-    with conn.cursor() as cur:
-        cur.execute(sql, tuple(product_ids))
-        rows = cur.fetchall()
-
-    out: Dict[int, dict] = {}
-    for r in rows:
-        out[int(r[0])] = {
-            "product_id": int(r[0]),
-            "sku": str(r[1]),
-            "product_name": str(r[2]),
-            "category_l1": str(r[3]),
-            "category_l2": str(r[4]),
-            "brand": str(r[5]),
-            "unit_cost": float(r[6]),
-            "list_price": float(r[7]),
-        }
-    return out
-
-
 def _cart_summary(conn, customer_id: int) -> CartSummaryOut:
+    version = cart_version(conn, customer_id)
+    cached = cart_cache.get(customer_id, version)
+    if cached is not None:
+        return cached
+
     with conn.cursor() as cur:
         cur.execute(
             """
@@ -291,104 +268,70 @@ def _cart_summary(conn, customer_id: int) -> CartSummaryOut:
         rows = cur.fetchall()
 
     items_in = [(int(r[0]), int(r[1])) for r in rows]
-    prod = _product_map(conn, [pid for (pid, _) in items_in])
+    prod = load_products(conn, [pid for (pid, _) in items_in])
     missing = [pid for (pid, _) in items_in if pid not in prod]
     if missing:
         raise HTTPException(status_code=400, detail=f"Cart contains invalid product_ids: {missing}")
 
-    gross_amount = 0.0
-    discount_amount = 0.0
-    tax_amount = 0.0
-    net_amount = 0.0
-
+    priced = price_items(items_in, prod)
     out_items = []
-    for (pid, qty) in items_in:
-        p = prod[pid]
-        list_price = float(p["list_price"])
-        disc_pct = _stable_discount_pct(pid)
-        sell_price = round(list_price * (1 - disc_pct / 100.0), 2)
-
-        line_gross = round(list_price * qty, 2)
-        line_discount = round((list_price - sell_price) * qty, 2)
-        line_tax = round(0.07 * (sell_price * qty), 2)
-        line_total = round((sell_price * qty) + line_tax, 2)
-
-        gross_amount += line_gross
-        discount_amount += line_discount
-        tax_amount += line_tax
-        net_amount += line_total
-
+    for line in priced.lines:
+        p = line.product
         out_items.append(
             {
-                "product_id": pid,
-                "sku": p["sku"],
-                "product_name": p["product_name"],
-                "category_l1": p["category_l1"],
-                "category_l2": p["category_l2"],
-                "brand": p["brand"],
-                "list_price": float(list_price),
-                "discount_pct": int(disc_pct),
-                "sell_price": float(sell_price),
+                "product_id": p.product_id,
+                "sku": p.sku,
+                "product_name": p.product_name,
+                "category_l1": p.category_l1,
+                "category_l2": p.category_l2,
+                "brand": p.brand,
+                "list_price": float(p.list_price),
+                "discount_pct": int(p.discount_pct),
+                "sell_price": float(p.sell_price),
                 "image_url": _product_photo_url(
-                    seed=f"{p['sku']}:{pid}",
-                    label=p["product_name"],
-                    category_l1=p["category_l1"],
-                    category_l2=p["category_l2"],
-                    product_id=pid,
-                    sku=p["sku"],
+                    seed=f"{p.sku}:{p.product_id}",
+                    label=p.product_name,
+                    category_l1=p.category_l1,
+                    category_l2=p.category_l2,
+                    product_id=p.product_id,
+                    sku=p.sku,
                 ),
-                "qty": int(qty),
-                "line_gross": float(line_gross),
-                "line_discount": float(line_discount),
-                "line_tax": float(line_tax),
-                "line_total": float(line_total),
+                "qty": int(line.qty),
+                "line_gross": float(line.line_gross),
+                "line_discount": float(line.line_discount),
+                "line_tax": float(line.line_tax),
+                "line_total": float(line.line_total),
             }
         )
 
-    return CartSummaryOut(
+    summary = CartSummaryOut(
         customer_id=int(customer_id),
         items=out_items,
-        gross_amount=float(round(gross_amount, 2)),
-        discount_amount=float(round(discount_amount, 2)),
-        tax_amount=float(round(tax_amount, 2)),
-        net_amount=float(round(net_amount, 2)),
+        gross_amount=float(priced.gross_amount),
+        discount_amount=float(priced.discount_amount),
+        tax_amount=float(priced.tax_amount),
+        net_amount=float(priced.net_amount),
     )
+    cart_cache.put(customer_id, version, summary)
+    return summary
 
 
 def _send_outbox_email_safe(conn, customer_id: int, kind: str, subject: str, body: str, order_id: int) -> None:
+    # Queued in the caller's transaction; backend/outbox.py delivers after commit. The savepoint
+    # keeps a failed insert from aborting the order transaction around it.
     try:
-        with conn.cursor() as cur:
-            cur.execute("SELECT to_regclass('globalcart.app_users');")
-            has_users = cur.fetchone()[0] is not None
-            cur.execute("SELECT to_regclass('globalcart.app_email_outbox');")
-            has_outbox = cur.fetchone()[0] is not None
-            if not (has_users and has_outbox):
-                return
-
-            cur.execute(
-                """
-                SELECT email
-                FROM globalcart.app_users
-                WHERE customer_id = %s
-                ORDER BY updated_at DESC
-                LIMIT 1;
-                """,
-                (int(customer_id),),
-            )
-            er = cur.fetchone()
-            if er is None:
-                return
-            to_email = str(er[0] or "").strip()
-            if not to_email:
-                return
-
-            cur.execute(
-                """
-                INSERT INTO globalcart.app_email_outbox (customer_id, to_email, subject, body, kind, order_id)
-                VALUES (%s, %s, %s, %s, %s, %s);
-                """,
-                (int(customer_id), to_email, str(subject), str(body), str(kind), int(order_id)),
-            )
+        if not schema_caps.has_all(conn, ("globalcart.app_users", "globalcart.app_email_outbox")):
+            return
+        with conn.transaction():
+            with conn.cursor() as cur:
+                enqueue_customer_email(
+                    cur,
+                    customer_id=int(customer_id),
+                    subject=str(subject),
+                    body=str(body),
+                    kind=str(kind),
+                    order_id=int(order_id),
+                )
     except Exception:
         return
 
@@ -441,6 +384,7 @@ def cart_add(
                     (int(customer_id), int(payload.product_id), int(payload.qty), now_ts, now_ts),
                 )
             conn.commit()
+            cart_cache.invalidate(customer_id)
             return {"detail": "Added"}
     except psycopg.OperationalError:
         return {"detail": "Added"}
@@ -478,6 +422,7 @@ def cart_update(
                     (int(customer_id), int(payload.product_id), int(payload.qty), now_ts, now_ts),
                 )
             conn.commit()
+            cart_cache.invalidate(customer_id)
             return {"detail": "Updated"}
     except psycopg.OperationalError:
         return {"detail": "Updated"}
@@ -508,6 +453,7 @@ def cart_remove(
                     (int(customer_id), int(product_id)),
                 )
             conn.commit()
+            cart_cache.invalidate(customer_id)
             return {"detail": "Removed"}
     except psycopg.OperationalError:
         return {"detail": "Removed"}
@@ -537,6 +483,7 @@ def cart_clear(
                     (int(customer_id),),
                 )
             conn.commit()
+            cart_cache.invalidate(customer_id)
             return {"detail": "Cleared"}
     except psycopg.OperationalError:
         return {"detail": "Cleared"}
@@ -595,8 +542,6 @@ def validate_promo(
             return PromoValidateOut(code=c, valid=False, discount_amount=0.0, message="Invalid code")
 
         discount_type = str(row[0] or "").upper()
-        discount_value = float(row[1] or 0)
-        max_discount = float(row[2]) if row[2] is not None else None
         min_order_amount = float(row[3]) if row[3] is not None else None
         active = bool(row[4])
         expires_at = row[5]
@@ -608,19 +553,12 @@ def validate_promo(
         if min_order_amount is not None and float(amount) < min_order_amount:
             return PromoValidateOut(code=c, valid=False, discount_amount=0.0, message=f"Minimum order amount is {min_order_amount}")
 
-        if discount_type == "PERCENT":
-            disc = round((float(amount) * discount_value) / 100.0, 2)
-        elif discount_type == "FLAT":
-            disc = round(discount_value, 2)
-        else:
+        try:
+            disc = promo_discount(amount, discount_type, row[1], row[2])
+        except ValueError:
             return PromoValidateOut(code=c, valid=False, discount_amount=0.0, message="Invalid configuration")
 
-        if max_discount is not None:
-            disc = min(disc, round(max_discount, 2))
-        disc = min(disc, float(amount))
-        disc = round(disc, 2)
-
-        return PromoValidateOut(code=c, valid=True, discount_amount=disc, message="Applied")
+        return PromoValidateOut(code=c, valid=True, discount_amount=float(disc), message="Applied")
 
     except psycopg.OperationalError:
         return PromoValidateOut(
@@ -672,8 +610,8 @@ def wishlist_list(
             c2 = str(r[5])
             brand = str(r[6])
             list_price = float(r[8])
-            disc = _stable_discount_pct(pid)
-            sell = round(list_price * (1 - disc / 100.0), 2)
+            disc = pricing.discount_pct(pid)
+            sell = pricing.sell_price(list_price, pid)
             out.append(
                 WishlistItemOut(
                     product_id=pid,
@@ -1179,6 +1117,52 @@ def order_detail(
         )
 
 
+def _order_timeline_from_facts(conn, cur, order_id: int) -> tuple | None:
+    # Same row shape as globalcart.customer_order_history, for databases without sql/14 applied.
+    cur.execute(
+        """
+        SELECT order_id, customer_id, order_ts, order_status, net_amount
+        FROM globalcart.vw_customer_orders
+        WHERE order_id = %s;
+        """,
+        (int(order_id),),
+    )
+    row = cur.fetchone()
+    if row is None:
+        return None
+
+    cur.execute(
+        """
+        SELECT MAX(shipped_ts) AS shipped_ts, MAX(delivered_dt) AS delivered_dt
+        FROM globalcart.vw_customer_shipments_timeline
+        WHERE order_id = %s
+        """,
+        (int(order_id),),
+    )
+    ship = cur.fetchone()
+    shipped_ts = ship[0] if ship else None
+    delivered_dt = ship[1] if ship else None
+
+    cancel_ts = None
+    cancel_reason = None
+    if schema_caps.has(conn, "globalcart.vw_customer_order_cancellations"):
+        cur.execute(
+            """
+            SELECT created_at, reason
+            FROM globalcart.vw_customer_order_cancellations
+            WHERE order_id = %s AND customer_id = %s
+            ORDER BY created_at DESC
+            LIMIT 1;
+            """,
+            (int(order_id), int(row[1])),
+        )
+        c = cur.fetchone()
+        if c is not None:
+            cancel_ts, cancel_reason = c[0], c[1]
+
+    return (row[0], row[1], row[2], row[3], row[4], [], shipped_ts, delivered_dt, cancel_ts, cancel_reason)
+
+
 @router.get("/orders/{order_id}/timeline", response_model=OrderTimelineOut)
 def order_timeline(
     order_id: int,
@@ -1192,70 +1176,32 @@ def order_timeline(
             conn.execute("SET TIME ZONE 'UTC';", prepare=False)
 
             with conn.cursor() as cur:
-                cur.execute(
-                    """
-                    SELECT customer_id, order_ts, order_status
-                    FROM globalcart.vw_customer_orders
-                    WHERE order_id = %s;
-                    """,
-                    (int(order_id),),
-                )
-                row = cur.fetchone()
+                if history_available(conn):
+                    cur.execute(
+                        f"""
+                        SELECT {HISTORY_COLUMNS}
+                        FROM globalcart.customer_order_history
+                        WHERE order_id = %s;
+                        """,
+                        (int(order_id),),
+                    )
+                    h = cur.fetchone()
+                else:
+                    h = _order_timeline_from_facts(conn, cur, int(order_id))
 
-                if row is None:
+                if h is None:
                     raise HTTPException(status_code=404, detail="Order not found")
-
-                owner_customer_id = int(row[0])
-                order_ts = row[1]
-                order_status = str(row[2] or "").upper()
-
-                if owner_customer_id != int(customer_id):
+                if int(h[1]) != int(customer_id):
                     raise HTTPException(status_code=403, detail="Order does not belong to this customer")
 
-                cur.execute(
-                    """
-                    SELECT MAX(shipped_ts) AS shipped_ts, MAX(delivered_dt) AS delivered_dt
-                    FROM globalcart.vw_customer_shipments_timeline
-                    WHERE order_id = %s
-                    """,
-                    (int(order_id),),
-                )
-                ship = cur.fetchone()
-                shipped_ts = ship[0] if ship else None
-                delivered_dt = ship[1] if ship else None
-
-                cancel_ts = None
-                cancel_reason = None
-                cur.execute("SELECT to_regclass('globalcart.vw_customer_order_cancellations');")
-                has_cancel = cur.fetchone()[0] is not None
-                if has_cancel:
-                    cur.execute(
-                        """
-                        SELECT created_at, reason
-                        FROM globalcart.vw_customer_order_cancellations
-                        WHERE order_id = %s AND customer_id = %s
-                        ORDER BY created_at DESC
-                        LIMIT 1;
-                        """,
-                        (int(order_id), int(customer_id)),
-                    )
-                    c = cur.fetchone()
-                    if c is not None:
-                        cancel_ts = c[0]
-                        cancel_reason = str(c[1])
+        order_ts, shipped_ts, delivered_dt = h[2], h[6], h[7]
+        cancel_ts = h[8]
+        cancel_reason = str(h[9]) if h[9] is not None else None
 
         now = _utc_now()
         shipped_done = shipped_ts is not None and shipped_ts <= now
         delivered_done = delivered_dt is not None and delivered_dt <= now.date()
-
-        if order_status == "CANCELLED":
-            current = "CANCELLED"
-        elif delivered_done:
-            current = "DELIVERED"
-        elif shipped_done:
-            current = "SHIPPED"
-        else:
-            current = "PLACED"
+        current = derive_order_status(h[3], shipped_ts, delivered_dt, now)
 
         stages = [
             OrderTimelineStageOut(stage="PLACED", timestamp=_ts(order_ts)),
@@ -1301,35 +1247,6 @@ def order_timeline(
         )
 
 
-def _product_map(conn, product_ids: List[int]) -> Dict[int, dict]:
-    if not product_ids:
-        return {}
-
-    placeholders = ",".join(["%s"] * len(product_ids))
-    sql = f"""
-        SELECT product_id, sku, product_name, category_l1, category_l2, brand, unit_cost, list_price
-        FROM globalcart.vw_customer_products
-        WHERE product_id IN ({placeholders});
-    """
-
-    with conn.cursor() as cur:
-        cur.execute(sql, tuple(product_ids))
-        rows = cur.fetchall()
-
-    out: Dict[int, dict] = {}
-    for r in rows:
-        out[int(r[0])] = {
-            "sku": str(r[1]),
-            "product_name": str(r[2]),
-            "category_l1": str(r[3]),
-            "category_l2": str(r[4]),
-            "brand": str(r[5]),
-            "unit_cost": float(r[6]),
-            "list_price": float(r[7]),
-        }
-    return out
-
-
 @router.post("/customers/resolve", response_model=CustomerResolveOut)
 def resolve_customer(req: CustomerResolveIn, admin_key: str | None = Header(None, alias="X-Admin-Key")):
     _reject_admin(admin_key)
@@ -1463,8 +1380,8 @@ def list_products(
             category_l2 = str(r[4])
             brand = str(r[5])
             list_price = float(r[7])
-            disc = _stable_discount_pct(pid)
-            sell_price = round(list_price * (1 - disc / 100.0), 2)
+            disc = pricing.discount_pct(pid)
+            sell_price = pricing.sell_price(list_price, pid)
 
             products.append(
                 ProductOut(
@@ -1538,8 +1455,8 @@ def get_product(product_id: int, admin_key: str | None = Header(None, alias="X-A
         brand = str(row[5])
         list_price = float(row[7])
 
-        disc = _stable_discount_pct(pid)
-        sell_price = round(list_price * (1 - disc / 100.0), 2)
+        disc = pricing.discount_pct(pid)
+        sell_price = pricing.sell_price(list_price, pid)
 
         stock_qty = 0 if (pid % 17 == 0) else (5 + (pid % 23))
         in_stock = stock_qty > 0
@@ -1582,8 +1499,8 @@ def get_product(product_id: int, admin_key: str | None = Header(None, alias="X-A
         brand = brands[pid % len(brands)]
         product_name = f"Demo Product {pid}"
         list_price = float(199 + (pid % 200) * 10)
-        disc = _stable_discount_pct(pid)
-        sell_price = round(list_price * (1 - disc / 100.0), 2)
+        disc = pricing.discount_pct(pid)
+        sell_price = pricing.sell_price(list_price, pid)
         stock_qty = 0 if (pid % 17 == 0) else (5 + (pid % 23))
         in_stock = stock_qty > 0
         return ProductDetailOut(
@@ -1619,15 +1536,31 @@ def get_product(product_id: int, admin_key: str | None = Header(None, alias="X-A
 
 
 @router.post("/orders", response_model=OrderCreatedOut)
-def create_order(req: CreateOrderRequest, admin_key: str | None = Header(None, alias="X-Admin-Key")):
+def create_order(
+    req: CreateOrderRequest,
+    admin_key: str | None = Header(None, alias="X-Admin-Key"),
+    authorization: str | None = Header(None, alias="Authorization"),
+    idempotency_key: str | None = Header(None, alias="Idempotency-Key"),
+):
     _reject_admin(admin_key)
 
     if not req.items:
         raise HTTPException(status_code=400, detail="Cart is empty")
+    customer_id = _customer_id_from_auth_or_query(
+        authorization=authorization,
+        customer_id=int(req.customer_id) if req.customer_id is not None else None,
+        require=True,
+    )
+    return idempotency.run(
+        idempotency_key,
+        customer_id=customer_id,
+        endpoint="create_order",
+        fingerprint=req,
+        handler=lambda: _create_order(req, customer_id),
+    )
 
-    if req.customer_id is None:
-        raise HTTPException(status_code=401, detail="Sign in required to place an order")
 
+def _create_order(req: CreateOrderRequest, customer_id: int) -> OrderCreatedOut:
     now_ts = _utc_now()
 
     simulate_fail = bool(getattr(req, "simulate_payment_failure", False))
@@ -1643,20 +1576,15 @@ def create_order(req: CreateOrderRequest, admin_key: str | None = Header(None, a
         with get_conn() as conn:
             conn.execute("SET TIME ZONE 'UTC';", prepare=False)
 
-            if req.customer_id is not None:
-                with conn.cursor() as cur:
-                    cur.execute(
-                        "SELECT geo_id FROM globalcart.vw_customer_customers WHERE customer_id = %s",
-                        (int(req.customer_id),),
-                    )
-                    row = cur.fetchone()
-                if row is None:
-                    raise HTTPException(status_code=400, detail="Invalid customer_id")
-                customer_id = int(req.customer_id)
-                geo_id = int(row[0])
-            else:
-                customer_id = _pick_any(conn, "globalcart.vw_customer_customers", "customer_id")
-                geo_id = _pick_any(conn, "globalcart.vw_customer_geo", "geo_id")
+            with conn.cursor() as cur:
+                cur.execute(
+                    "SELECT geo_id FROM globalcart.vw_customer_customers WHERE customer_id = %s",
+                    (int(customer_id),),
+                )
+                row = cur.fetchone()
+            if row is None:
+                raise HTTPException(status_code=400, detail="Invalid customer_id")
+            geo_id = int(row[0])
             fc_id = _pick_any(conn, "globalcart.vw_customer_fc", "fc_id")
 
             order_id = _next_id(conn, "globalcart.vw_customer_orders", "order_id")
@@ -1664,63 +1592,40 @@ def create_order(req: CreateOrderRequest, admin_key: str | None = Header(None, a
             shipment_id = _next_id(conn, "globalcart.vw_customer_shipments", "shipment_id")
             next_item_id = _next_id(conn, "globalcart.vw_customer_order_items_core", "order_item_id")
 
-            product_ids = [i.product_id for i in req.items]
-            prod = _product_map(conn, product_ids)
+            product_ids = [int(i.product_id) for i in req.items]
+            prod = load_products(conn, product_ids)
 
             missing = [pid for pid in product_ids if pid not in prod]
             if missing:
                 raise HTTPException(status_code=400, detail=f"Invalid product_ids: {missing}")
 
-            gross_amount = 0.0
-            discount_amount = 0.0
-            tax_amount = 0.0
-            net_amount = 0.0
-            promo_discount_amount = 0.0
+            priced = price_items([(int(i.product_id), int(i.qty)) for i in req.items], prod)
+            gross_amount = priced.gross_amount
+            discount_amount = priced.discount_amount
+            tax_amount = priced.tax_amount
+            net_amount = priced.net_amount
+            promo_discount_amount = pricing.money(0)
 
             order_items_rows: List[tuple] = []
-
-            for item in req.items:
-                pid = int(item.product_id)
-                qty = int(item.qty)
-                list_price = float(prod[pid]["list_price"])
-                unit_cost = float(prod[pid]["unit_cost"])
-
-                disc = _stable_discount_pct(pid)
-                unit_sell = round(list_price * (1 - disc / 100.0), 2)
-
-                line_gross = round(list_price * qty, 2)
-                line_discount = round((list_price - unit_sell) * qty, 2)
-                line_tax = round(0.07 * (unit_sell * qty), 2)
-                line_net = round((unit_sell * qty) + line_tax, 2)
-
-                gross_amount += line_gross
-                discount_amount += line_discount
-                tax_amount += line_tax
-                net_amount += line_net
-
+            for line in priced.lines:
                 order_items_rows.append(
                     (
                         next_item_id,
                         order_id,
-                        pid,
-                        qty,
-                        round(list_price, 2),
-                        unit_sell,
-                        round(unit_cost, 2),
-                        line_discount,
-                        line_tax,
-                        line_net,
+                        line.product.product_id,
+                        line.qty,
+                        line.product.list_price,
+                        line.product.sell_price,
+                        line.product.unit_cost,
+                        line.line_discount,
+                        line.line_tax,
+                        line.line_total,
                         now_ts,
                         now_ts,
                     )
                 )
                 next_item_id += 1
 
-            gross_amount = round(gross_amount, 2)
-            discount_amount = round(discount_amount, 2)
-            tax_amount = round(tax_amount, 2)
-            net_amount = round(net_amount, 2)
-
             if promo_code:
                 with conn.cursor() as cur:
                     cur.execute(
@@ -1737,8 +1642,6 @@ def create_order(req: CreateOrderRequest, admin_key: str | None = Header(None, a
                     raise HTTPException(status_code=400, detail="Invalid promo code")
 
                 discount_type = str(pr[0] or "").upper()
-                discount_value = float(pr[1] or 0)
-                max_discount = float(pr[2]) if pr[2] is not None else None
                 min_order_amount = float(pr[3]) if pr[3] is not None else None
                 active = bool(pr[4])
                 expires_at = pr[5]
@@ -1747,23 +1650,16 @@ def create_order(req: CreateOrderRequest, admin_key: str | None = Header(None, a
                     raise HTTPException(status_code=400, detail="Promo code is not active")
                 if expires_at is not None and expires_at <= now_ts:
                     raise HTTPException(status_code=400, detail="Promo code has expired")
-                if min_order_amount is not None and net_amount < min_order_amount:
+                if min_order_amount is not None and float(net_amount) < min_order_amount:
                     raise HTTPException(status_code=400, detail=f"Minimum order amount is {min_order_amount}")
 
-                if discount_type == "PERCENT":
-                    promo_discount_amount = round((net_amount * discount_value) / 100.0, 2)
-                elif discount_type == "FLAT":
-                    promo_discount_amount = round(discount_value, 2)
-                else:
+                try:
+                    promo_discount_amount = promo_discount(net_amount, discount_type, pr[1], pr[2])
+                except ValueError:
                     raise HTTPException(status_code=400, detail="Invalid promo configuration")
 
-                if max_discount is not None:
-                    promo_discount_amount = min(promo_discount_amount, round(max_discount, 2))
-                promo_discount_amount = min(promo_discount_amount, net_amount)
-                promo_discount_amount = round(promo_discount_amount, 2)
-
-                discount_amount = round(discount_amount + promo_discount_amount, 2)
-                net_amount = round(max(0.0, net_amount - promo_discount_amount), 2)
+                discount_amount += promo_discount_amount
+                net_amount -= promo_discount_amount
 
             order_sql = """
                 INSERT INTO globalcart.fact_orders (
@@ -1853,49 +1749,25 @@ def create_order(req: CreateOrderRequest, admin_key: str | None = Header(None, a
                         (int(order_id), promo_code, promo_discount_amount),
                     )
 
-                try:
-                    cur.execute("SELECT to_regclass('globalcart.app_users');")
-                    has_users = cur.fetchone()[0] is not None
-                    cur.execute("SELECT to_regclass('globalcart.app_email_outbox');")
-                    has_outbox = cur.fetchone()[0] is not None
-
-                    to_email = None
-                    if has_users and customer_id is not None:
-                        cur.execute(
-                            """
-                            SELECT email
-                            FROM globalcart.app_users
-                            WHERE customer_id = %s
-                            ORDER BY updated_at DESC
-                            LIMIT 1;
-                            """,
-                            (int(customer_id),),
-                        )
-                        er = cur.fetchone()
-                        if er is not None:
-                            to_email = str(er[0])
-
-                    if has_outbox and to_email:
-                        if simulate_fail:
-                            subject = f"Payment failed for order #{order_id}"
-                            body = f"Your payment failed for order #{order_id}. Please retry."
-                            kind = "PAYMENT_FAILED"
-                        else:
-                            subject = f"Order confirmed #{order_id}"
-                            body = f"Your order #{order_id} has been confirmed. Total: {net_amount}."
-                            if promo_code and promo_discount_amount > 0:
-                                body += f" Promo applied: {promo_code} (-{promo_discount_amount})."
-                            kind = "ORDER_CONFIRMED"
-
-                        cur.execute(
-                            """
-                            INSERT INTO globalcart.app_email_outbox (customer_id, to_email, subject, body, kind, order_id)
-                            VALUES (%s, %s, %s, %s, %s, %s);
-                            """,
-                            (int(customer_id), to_email, subject, body, kind, int(order_id)),
-                        )
-                except Exception:
-                    pass
+                if customer_id is not None:
+                    if simulate_fail:
+                        subject = f"Payment failed for order #{order_id}"
+                        body = f"Your payment failed for order #{order_id}. Please retry."
+                        kind = "PAYMENT_FAILED"
+                    else:
+                        subject = f"Order confirmed #{order_id}"
+                        body = f"Your order #{order_id} has been confirmed. Total: {net_amount}."
+                        if promo_code and promo_discount_amount > 0:
+                            body += f" Promo applied: {promo_code} (-{promo_discount_amount})."
+                        kind = "ORDER_CONFIRMED"
+                    _send_outbox_email_safe(
+                        conn,
+                        customer_id=int(customer_id),
+                        kind=kind,
+                        subject=subject,
+                        body=body,
+                        order_id=int(order_id),
+                    )
 
                 if not simulate_fail:
                     cur.execute(
@@ -1915,28 +1787,24 @@ def create_order(req: CreateOrderRequest, admin_key: str | None = Header(None, a
                         ),
                     )
 
-            conn.commit()
-            return OrderCreatedOut(
+            refresh_order_history(conn, [int(order_id)])
+            out = OrderCreatedOut(
                 order_id=order_id,
-                net_amount=net_amount,
+                net_amount=float(net_amount),
                 order_status="PAYMENT_FAILED" if simulate_fail else "PLACED",
                 payment_status="FAILED" if simulate_fail else "CAPTURED",
                 promo_code=promo_code,
-                promo_discount_amount=promo_discount_amount if promo_discount_amount > 0 else None,
+                promo_discount_amount=float(promo_discount_amount) if promo_discount_amount > 0 else None,
             )
+            idempotency.commit(conn, out)
+            return out
 
     except psycopg.OperationalError:
-        net_amount = 0.0
-        for item in req.items:
-            pid = int(item.product_id)
-            qty = int(item.qty)
-            list_price = float(199 + (pid % 200) * 10)
-            disc = _stable_discount_pct(pid)
-            unit_sell = round(list_price * (1 - disc / 100.0), 2)
-            line_tax = round(0.07 * (unit_sell * qty), 2)
-            line_net = round((unit_sell * qty) + line_tax, 2)
-            net_amount += line_net
-        net_amount = round(net_amount, 2)
+        demo_products = {
+            int(i.product_id): pricing.PricedProduct.build(i.product_id, 199 + (int(i.product_id) % 200) * 10)
+            for i in req.items
+        }
+        net_amount = float(price_items([(int(i.product_id), int(i.qty)) for i in req.items], demo_products).net_amount)
         demo_order_id = int(900000 + (int(now_ts.timestamp()) % 100000))
         promo_discount_amount = None
         return OrderCreatedOut(
@@ -1969,6 +1837,7 @@ def checkout_start(
     req: CreateOrderRequest,
     admin_key: str | None = Header(None, alias="X-Admin-Key"),
     authorization: str | None = Header(None, alias="Authorization"),
+    idempotency_key: str | None = Header(None, alias="Idempotency-Key"),
 ) -> CheckoutStartOut:
     _reject_admin(admin_key)
 
@@ -1979,7 +1848,16 @@ def checkout_start(
         customer_id=int(req.customer_id) if req.customer_id is not None else None,
         require=True,
     )
+    return idempotency.run(
+        idempotency_key,
+        customer_id=customer_id,
+        endpoint="checkout_start",
+        fingerprint=req,
+        handler=lambda: _checkout_start(req, customer_id),
+    )
 
+
+def _checkout_start(req: CreateOrderRequest, customer_id: int) -> CheckoutStartOut:
     now_ts = _utc_now()
     payment_method = str(getattr(req, "payment_method", "UPI") or "UPI")
 
@@ -2003,59 +1881,37 @@ def checkout_start(
                 next_item_id = _next_id(conn, "globalcart.fact_order_items", "order_item_id")
 
                 product_ids = [int(i.product_id) for i in req.items]
-                prod = _product_map(conn, product_ids)
+                prod = load_products(conn, product_ids)
                 missing = [pid for pid in product_ids if pid not in prod]
                 if missing:
                     raise HTTPException(status_code=400, detail=f"Invalid product_ids: {missing}")
 
-                gross_amount = 0.0
-                discount_amount = 0.0
-                tax_amount = 0.0
-                net_amount = 0.0
-                order_items_rows: List[tuple] = []
-
-                for item in req.items:
-                    pid = int(item.product_id)
-                    qty = int(item.qty)
-                    list_price = float(prod[pid]["list_price"])
-                    unit_cost = float(prod[pid]["unit_cost"])
-
-                    disc = _stable_discount_pct(pid)
-                    unit_sell = round(list_price * (1 - disc / 100.0), 2)
-
-                    line_gross = round(list_price * qty, 2)
-                    line_discount = round((list_price - unit_sell) * qty, 2)
-                    line_tax = round(0.07 * (unit_sell * qty), 2)
-                    line_net = round((unit_sell * qty) + line_tax, 2)
-
-                    gross_amount += line_gross
-                    discount_amount += line_discount
-                    tax_amount += line_tax
-                    net_amount += line_net
+                priced = price_items([(int(i.product_id), int(i.qty)) for i in req.items], prod)
+                gross_amount = priced.gross_amount
+                discount_amount = priced.discount_amount
+                tax_amount = priced.tax_amount
+                net_amount = priced.net_amount
 
+                order_items_rows: List[tuple] = []
+                for line in priced.lines:
                     order_items_rows.append(
                         (
                             next_item_id,
                             order_id,
-                            pid,
-                            qty,
-                            round(list_price, 2),
-                            unit_sell,
-                            round(unit_cost, 2),
-                            line_discount,
-                            line_tax,
-                            line_net,
+                            line.product.product_id,
+                            line.qty,
+                            line.product.list_price,
+                            line.product.sell_price,
+                            line.product.unit_cost,
+                            line.line_discount,
+                            line.line_tax,
+                            line.line_total,
                             now_ts,
                             now_ts,
                         )
                     )
                     next_item_id += 1
 
-                gross_amount = round(gross_amount, 2)
-                discount_amount = round(discount_amount, 2)
-                tax_amount = round(tax_amount, 2)
-                net_amount = round(net_amount, 2)
-
                 with conn.cursor() as cur:
                     cur.execute(
                         """
@@ -2128,14 +1984,16 @@ def checkout_start(
                         ),
                     )
 
-                conn.commit()
-                return CheckoutStartOut(
+                refresh_order_history(conn, [int(order_id)])
+                out = CheckoutStartOut(
                     order_id=int(order_id),
                     payment_id=int(payment_id),
                     order_status="ORDER_CREATED",
                     payment_status="PAYMENT_PENDING",
                     amount=float(net_amount),
                 )
+                idempotency.commit(conn, out)
+                return out
             except Exception:
                 conn.rollback()
                 raise
@@ -2161,9 +2019,20 @@ def simulate_payment(
     customer_id: int | None = Query(None, ge=1),
     admin_key: str | None = Header(None, alias="X-Admin-Key"),
     authorization: str | None = Header(None, alias="Authorization"),
+    idempotency_key: str | None = Header(None, alias="Idempotency-Key"),
 ) -> PaymentSimulateOut:
     _reject_admin(admin_key)
     customer_id = _customer_id_from_auth_or_query(authorization=authorization, customer_id=customer_id, require=True)
+    return idempotency.run(
+        idempotency_key,
+        customer_id=customer_id,
+        endpoint="simulate_payment",
+        fingerprint={"order_id": int(order_id), "payload": payload},
+        handler=lambda: _simulate_payment(order_id, payload, customer_id),
+    )
+
+
+def _simulate_payment(order_id: int, payload: PaymentSimulateIn, customer_id: int) -> PaymentSimulateOut:
     now_ts = _utc_now()
 
     try:
@@ -2262,13 +2131,15 @@ def simulate_payment(
                             order_id=int(order_id),
                         )
 
-                        conn.commit()
-                        return PaymentSimulateOut(
+                        refresh_order_history(conn, [int(order_id)])
+                        out = PaymentSimulateOut(
                             order_id=int(order_id),
                             payment_id=int(payment_id),
                             order_status="ORDER_CONFIRMED",
                             payment_status="PAYMENT_SUCCESS",
                         )
+                        idempotency.commit(conn, out)
+                        return out
 
                     reason = (payload.failure_reason or "PAYMENT_FAILED").strip() or "PAYMENT_FAILED"
                     release_inventory(conn, order_id=int(order_id))
@@ -2305,13 +2176,15 @@ def simulate_payment(
                         order_id=int(order_id),
                     )
 
-                conn.commit()
-                return PaymentSimulateOut(
+                refresh_order_history(conn, [int(order_id)])
+                out = PaymentSimulateOut(
                     order_id=int(order_id),
                     payment_id=int(payment_id),
                     order_status="ORDER_CANCELLED",
                     payment_status="PAYMENT_FAILED",
                 )
+                idempotency.commit(conn, out)
+                return out
 
             except Exception:
                 conn.rollback()
@@ -2325,6 +2198,57 @@ def simulate_payment(
         raise HTTPException(status_code=500, detail=f"Failed to simulate payment: {e}")
 
 
+def _order_history_from_facts(cur, customer_id: int, limit: int) -> List[tuple]:
+    # Same row shape as globalcart.customer_order_history, for databases without sql/14 applied.
+    cur.execute(
+        """
+        SELECT order_id, customer_id, order_ts, order_status, net_amount
+        FROM globalcart.vw_customer_orders
+        WHERE customer_id = %s
+        ORDER BY order_ts DESC
+        LIMIT %s;
+        """,
+        (int(customer_id), int(limit)),
+    )
+    rows = cur.fetchall()
+    order_ids = [int(r[0]) for r in rows]
+    if not order_ids:
+        return []
+
+    items_by_order: Dict[int, List[dict]] = {oid: [] for oid in order_ids}
+    cur.execute(
+        """
+        SELECT order_id, product_id, product_name, qty
+        FROM globalcart.vw_customer_order_items
+        WHERE order_id = ANY(%s)
+        ORDER BY order_id, product_id;
+        """,
+        (order_ids,),
+    )
+    for ir in cur.fetchall():
+        items_by_order.setdefault(int(ir[0]), []).append(
+            {"product_id": int(ir[1]), "product_name": str(ir[2]), "qty": int(ir[3])}
+        )
+
+    cur.execute(
+        """
+        SELECT order_id, MAX(shipped_ts) AS shipped_ts, MAX(delivered_dt) AS delivered_dt
+        FROM globalcart.vw_customer_shipments_timeline
+        WHERE order_id = ANY(%s)
+        GROUP BY order_id;
+        """,
+        (order_ids,),
+    )
+    ship_by_order = {int(sr[0]): (sr[1], sr[2]) for sr in cur.fetchall()}
+
+    out: List[tuple] = []
+    for r in rows:
+        oid = int(r[0])
+        shipped_ts, delivered_dt = ship_by_order.get(oid, (None, None))
+        out.append((oid, r[1], r[2], r[3], r[4], items_by_order.get(oid, []), shipped_ts, delivered_dt, None, None))
+    return out
+
+
 @router.get("/orders/by-customer/{customer_id}", response_model=OrdersByCustomerOut)
 def orders_by_customer(
     customer_id: int,
@@ -2347,89 +2271,31 @@ def orders_by_customer(
         with get_conn() as conn:
             conn.execute("SET TIME ZONE 'UTC';", prepare=False)
             with conn.cursor() as cur:
-                cur.execute(
-                    """
-                    SELECT order_id, order_ts, order_status, net_amount
-                    FROM globalcart.vw_customer_orders
-                    WHERE customer_id = %s
-                    ORDER BY order_ts DESC
-                    LIMIT %s;
-                    """,
-                    (int(customer_id), int(limit)),
-                )
-                rows = cur.fetchall()
-
-                ship_by_order: Dict[int, tuple] = {}
-
-                order_ids = [int(r[0]) for r in rows]
-                items_by_order: Dict[int, List[dict]] = {oid: [] for oid in order_ids}
-
-                if order_ids:
-                    placeholders = ",".join(["%s"] * len(order_ids))
-                    cur.execute(
-                        f"""
-                        SELECT order_id, product_id, product_name, qty
-                        FROM globalcart.vw_customer_order_items
-                        WHERE order_id IN ({placeholders})
-                        ORDER BY order_id, product_id;
-                        """,
-                        tuple(order_ids),
-                    )
-                    item_rows = cur.fetchall()
-
-                    for ir in item_rows:
-                        oid = int(ir[0])
-                        items_by_order.setdefault(oid, []).append(
-                            {
-                                "product_id": int(ir[1]),
-                                "product_name": str(ir[2]),
-                                "qty": int(ir[3]),
-                            }
-                        )
-
-                    placeholders = ",".join(["%s"] * len(order_ids))
+                if history_available(conn):
                     cur.execute(
                         f"""
-                        SELECT order_id, MAX(shipped_ts) AS shipped_ts, MAX(delivered_dt) AS delivered_dt
-                        FROM globalcart.vw_customer_shipments_timeline
-                        WHERE order_id IN ({placeholders})
-                        GROUP BY order_id
-                        ORDER BY order_id;
+                        SELECT {HISTORY_COLUMNS}
+                        FROM globalcart.customer_order_history
+                        WHERE customer_id = %s
+                        ORDER BY order_ts DESC
+                        LIMIT %s;
                         """,
-                        tuple(order_ids),
+                        (int(customer_id), int(limit)),
                     )
-                    ship_rows = cur.fetchall()
-                    for sr in ship_rows:
-                        oid = int(sr[0])
-                        if oid not in ship_by_order:
-                            ship_by_order[oid] = (sr[1], sr[2])
+                    history = cur.fetchall()
+                else:
+                    history = _order_history_from_facts(cur, int(customer_id), int(limit))
 
         now = _utc_now()
         orders = []
-        for r in rows:
-            oid = int(r[0])
-            ts = r[1].isoformat() if hasattr(r[1], "isoformat") else str(r[1])
-
-            status_raw = str(r[2] or "").upper()
-            status = status_raw
-            if status_raw != "CANCELLED":
-                shipped_ts, delivered_dt = ship_by_order.get(oid, (None, None))
-                delivered_done = delivered_dt is not None and delivered_dt <= now.date()
-                shipped_done = shipped_ts is not None and shipped_ts <= now
-                if delivered_done:
-                    status = "DELIVERED"
-                elif shipped_done:
-                    status = "SHIPPED"
-                else:
-                    status = "PLACED"
-
+        for h in history:
             orders.append(
                 {
-                    "order_id": oid,
-                    "order_ts": ts,
-                    "order_status": status,
-                    "net_amount": float(r[3]),
-                    "items": items_by_order.get(oid, []),
+                    "order_id": int(h[0]),
+                    "order_ts": h[2].isoformat() if hasattr(h[2], "isoformat") else str(h[2]),
+                    "order_status": derive_order_status(h[3], h[6], h[7], now),
+                    "net_amount": float(h[4]),
+                    "items": list(h[5] or []),
                 }
             )
 
@@ -2491,8 +2357,7 @@ def cancel_order(
         with get_conn() as conn:
             conn.execute("SET TIME ZONE 'UTC';", prepare=False)
             with conn.cursor() as cur:
-                cur.execute("SELECT to_regclass('globalcart.order_cancellations');")
-                if cur.fetchone()[0] is None:
+                if not schema_caps.has(conn, "globalcart.order_cancellations"):
                     raise HTTPException(
                         status_code=500,
                         detail=(
@@ -2558,6 +2423,7 @@ def cancel_order(
                     (int(order_id), int(req.customer_id), reason),
                 )
 
+            refresh_order_history(conn, [int(order_id)])
             conn.commit()
 
         return CancelOrderOut(order_id=int(order_id), order_status="CANCELLED")
@@ -6,6 +6,7 @@ import psycopg
 from fastapi import APIRouter, Header, HTTPException
 
 from ..db import get_conn
+from ..metrics import FUNNEL_EVENTS, FUNNEL_EVENTS_INFLIGHT
 from ..models import FunnelEventIn
 
 
@@ -39,12 +40,13 @@ def ingest_funnel_event(
         "ORDER_PLACED",
     }
     if stage not in allowed:
+        FUNNEL_EVENTS.inc(result="rejected")
         raise HTTPException(status_code=400, detail=f"Invalid stage: {event.stage}. Allowed: {sorted(list(allowed))}")
 
     now_ts = _utc_now()
 
     try:
-        with get_conn() as conn:
+        with FUNNEL_EVENTS_INFLIGHT.track_inprogress(), get_conn() as conn:
             conn.execute("SET TIME ZONE 'UTC';", prepare=False)
 
             with conn.cursor() as cur:
@@ -77,12 +79,15 @@ def ingest_funnel_event(
 
             conn.commit()
 
+        FUNNEL_EVENTS.inc(result="stored")
         return {"status": "ok", "event_id": int(event_id)}
 
     except psycopg.OperationalError:
+        FUNNEL_EVENTS.inc(result="db_unavailable")
         base = abs(hash(f"{event.session_id}:{stage}")) % 100000
         return {"status": "ok", "event_id": int(800000 + base)}
     except (psycopg.errors.UndefinedTable, psycopg.errors.InvalidSchemaName):
+        FUNNEL_EVENTS.inc(result="error")
         raise HTTPException(
             status_code=500,
             detail=(
@@ -7,13 +7,16 @@ import os
 from hashlib import sha256
 from typing import Any, Dict, Optional
 
-import httpx
 import psycopg
 from fastapi import APIRouter, Header, HTTPException, Request
+from starlette.concurrency import run_in_threadpool
 
 from ..db import get_conn
+from ..idempotency import idempotency
 from ..inventory import consume_inventory, release_inventory
 from ..models import RazorpayConfirmIn, RazorpayConfirmOut, RazorpayCreateOrderOut
+from ..order_history import refresh_order_history
+from ..razorpay_client import RazorpayError, razorpay_client
 from ..security import decode_access_token, parse_bearer_token
 
 
@@ -65,76 +68,45 @@ def _verify_razorpay_signature(*, body: bytes, signature: str | None, secret: st
     return hmac.compare_digest(digest, signature)
 
 
-@router.post("/razorpay/order")
-def razorpay_create_order(
-    order_id: int,
-    authorization: str | None = Header(None, alias="Authorization"),
- ) -> RazorpayCreateOrderOut:
-    customer_id = _customer_id_from_authorization(authorization)
-
-    with get_conn() as conn:
-        conn.execute("SET TIME ZONE 'UTC';", prepare=False)
-        with conn.cursor() as cur:
-            cur.execute(
-                """
-                SELECT o.customer_id, o.order_status, o.net_amount,
-                       p.payment_id, p.payment_status
-                FROM globalcart.fact_orders o
-                JOIN globalcart.fact_payments p ON p.order_id = o.order_id
-                WHERE o.order_id = %s
-                ORDER BY p.payment_id DESC
-                LIMIT 1;
-                """,
-                (int(order_id),),
-            )
-            row = cur.fetchone()
-            if row is None:
-                raise HTTPException(status_code=404, detail="Order not found")
-
-            if int(row[0]) != int(customer_id):
-                raise HTTPException(status_code=403, detail="Order does not belong to this customer")
-
-            order_status = str(row[1] or "").upper()
-            amount = float(row[2] or 0.0)
-            payment_id = int(row[3])
-            payment_status = str(row[4] or "").upper()
-
-            if order_status not in {"ORDER_CREATED"}:
-                raise HTTPException(status_code=400, detail=f"Order not in payable state: {order_status}")
-            if payment_status not in {"PAYMENT_PENDING"}:
-                raise HTTPException(status_code=400, detail=f"Payment not pending: {payment_status}")
-
-    # Razorpay expects amount in paise.
-    amount_paise = int(round(amount * 100))
-
-    payload = {
-        "amount": amount_paise,
-        "currency": "INR",
-        "receipt": f"gc_order_{int(order_id)}",
-        "notes": {"globalcart_order_id": str(int(order_id)), "customer_id": str(int(customer_id))},
-    }
+def _load_payable_payment(order_id: int, customer_id: int) -> tuple:
+    """(amount, payment_id, existing Razorpay order id) for an order awaiting payment."""
+    try:
+        with get_conn() as conn:
+            conn.execute("SET TIME ZONE 'UTC';", prepare=False)
+            with conn.cursor() as cur:
+                cur.execute(
+                    """
+                    SELECT o.customer_id, o.order_status, o.net_amount,
+                           p.payment_id, p.payment_status, p.payment_provider, p.payment_provider_order_id
+                    FROM globalcart.fact_orders o
+                    JOIN globalcart.fact_payments p ON p.order_id = o.order_id
+                    WHERE o.order_id = %s
+                    ORDER BY p.payment_id DESC
+                    LIMIT 1;
+                    """,
+                    (int(order_id),),
+                )
+                row = cur.fetchone()
+    except psycopg.OperationalError:
+        raise HTTPException(status_code=503, detail="Database unavailable")
 
-    auth = _basic_auth_header(_razorpay_key_id(), _razorpay_key_secret())
+    if row is None:
+        raise HTTPException(status_code=404, detail="Order not found")
+    if int(row[0]) != int(customer_id):
+        raise HTTPException(status_code=403, detail="Order does not belong to this customer")
 
-    try:
-        with httpx.Client(timeout=10.0) as client:
-            resp = client.post(
-                "https://api.razorpay.com/v1/orders",
-                headers={"Authorization": auth, "Content-Type": "application/json"},
-                json=payload,
-            )
-        if resp.status_code >= 400:
-            raise HTTPException(status_code=502, detail=f"Razorpay order create failed: {resp.text}")
-        data = resp.json()
-    except httpx.HTTPError as e:
-        raise HTTPException(status_code=502, detail=f"Razorpay request failed: {e}")
+    order_status = str(row[1] or "").upper()
+    payment_status = str(row[4] or "").upper()
+    if order_status not in {"ORDER_CREATED"}:
+        raise HTTPException(status_code=400, detail=f"Order not in payable state: {order_status}")
+    if payment_status not in {"PAYMENT_PENDING"}:
+        raise HTTPException(status_code=400, detail=f"Payment not pending: {payment_status}")
 
-    rp_order_id = str(data.get("id") or "").strip()
-    if not rp_order_id:
-        raise HTTPException(status_code=502, detail="Razorpay response missing order id")
+    existing = str(row[6] or "").strip() if str(row[5] or "").upper() == "RAZORPAY" else ""
+    return float(row[2] or 0.0), int(row[3]), existing or None
 
-    now_sql = "NOW() AT TIME ZONE 'UTC'"
 
+def _save_provider_order(payment_id: int, rp_order_id: str) -> None:
     try:
         with get_conn() as conn:
             conn.execute("SET TIME ZONE 'UTC';", prepare=False)
@@ -164,10 +136,47 @@ def razorpay_create_order(
     except psycopg.OperationalError:
         raise HTTPException(status_code=503, detail="Database unavailable")
 
+
+@router.post("/razorpay/order")
+async def razorpay_create_order(
+    order_id: int,
+    authorization: str | None = Header(None, alias="Authorization"),
+ ) -> RazorpayCreateOrderOut:
+    customer_id = _customer_id_from_authorization(authorization)
+    key_id = _razorpay_key_id()
+    auth = _basic_auth_header(key_id, _razorpay_key_secret())
+
+    # DB work runs in the threadpool; the Razorpay call is awaited on the event loop so a slow
+    # provider does not tie up a worker thread.
+    amount, payment_id, rp_order_id = await run_in_threadpool(_load_payable_payment, int(order_id), customer_id)
+
+    # Razorpay expects amount in paise.
+    amount_paise = int(round(amount * 100))
+
+    if rp_order_id is None:
+        # A retry after a lost response reuses the Razorpay order already recorded above.
+        payload = {
+            "amount": amount_paise,
+            "currency": "INR",
+            "receipt": f"gc_order_{int(order_id)}",
+            "notes": {"globalcart_order_id": str(int(order_id)), "customer_id": str(int(customer_id))},
+        }
+        try:
+            data = await razorpay_client.create_order(payload, auth=auth)
+        except RazorpayError as e:
+            headers = {"Retry-After": str(max(1, int(e.retry_after)))} if e.retry_after is not None else None
+            raise HTTPException(status_code=e.status_code, detail=e.detail, headers=headers)
+
+        rp_order_id = str(data.get("id") or "").strip()
+        if not rp_order_id:
+            raise HTTPException(status_code=502, detail="Razorpay response missing order id")
+
+        await run_in_threadpool(_save_provider_order, payment_id, rp_order_id)
+
     return {
         "order_id": int(order_id),
         "payment_id": int(payment_id),
-        "razorpay_key_id": _razorpay_key_id(),
+        "razorpay_key_id": key_id,
         "razorpay_order_id": rp_order_id,
         "amount_paise": amount_paise,
         "currency": "INR",
@@ -178,9 +187,19 @@ def razorpay_create_order(
 def razorpay_confirm_payment(
     req: RazorpayConfirmIn,
     authorization: str | None = Header(None, alias="Authorization"),
+    idempotency_key: str | None = Header(None, alias="Idempotency-Key"),
 ) -> RazorpayConfirmOut:
     customer_id = _customer_id_from_authorization(authorization)
+    return idempotency.run(
+        idempotency_key,
+        customer_id=customer_id,
+        endpoint="razorpay_confirm",
+        fingerprint=req,
+        handler=lambda: _razorpay_confirm_payment(req, customer_id),
+    )
 
+
+def _razorpay_confirm_payment(req: RazorpayConfirmIn, customer_id: int) -> RazorpayConfirmOut:
     order_id = int(req.order_id)
     rp_order_id = str(req.razorpay_order_id or "").strip()
     rp_payment_id = str(req.razorpay_payment_id or "").strip()
@@ -276,14 +295,16 @@ def razorpay_confirm_payment(
                     (order_id,),
                 )
 
-            conn.commit()
+            refresh_order_history(conn, [order_id])
+            out = RazorpayConfirmOut(
+                order_id=order_id,
+                payment_id=payment_id,
+                order_status="ORDER_CONFIRMED",
+                payment_status="PAYMENT_SUCCESS",
+            )
+            idempotency.commit(conn, out)
 
-        return RazorpayConfirmOut(
-            order_id=order_id,
-            payment_id=payment_id,
-            order_status="ORDER_CONFIRMED",
-            payment_status="PAYMENT_SUCCESS",
-        )
+        return out
 
     except psycopg.OperationalError:
         raise HTTPException(status_code=503, detail="Database unavailable")
@@ -428,6 +449,7 @@ async def razorpay_webhook(request: Request, x_razorpay_signature: str | None =
                         """,
                         (new_order_status, int(order_id)),
                     )
+                    refresh_order_history(conn, [int(order_id)])
 
             conn.commit()
 
@@ -0,0 +1,129 @@
+from __future__ import annotations
+
+import hmac
+import os
+import threading
+import time
+from typing import Any, Dict, List, Tuple
+
+import psycopg
+from fastapi import APIRouter, Header, HTTPException
+from fastapi.responses import PlainTextResponse
+
+from ..analytics.render_pool import render_pool
+from ..db import get_conn
+from ..metrics import REGISTRY, collect_all, render_text
+from ..schema_caps import schema_caps
+from ..security import parse_bearer_token
+
+
+router = APIRouter(tags=["metrics"])
+
+_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+RENDER_QUEUE_DEPTH = REGISTRY.gauge("globalcart_chart_render_queue_depth", "Charts submitted to the render pool and not finished.")
+RENDER_WORKERS = REGISTRY.gauge("globalcart_chart_render_workers", "Chart render pool processes (0 = inline).")
+RENDERS = REGISTRY.counter("globalcart_chart_renders_total", "Chart renders by outcome.", ("result",))
+
+
+def _collect_render_pool() -> None:
+    s = render_pool.stats()
+    RENDER_QUEUE_DEPTH.set(s["queue_depth"])
+    RENDER_WORKERS.set(s["workers"])
+    RENDERS.set(s["completed"], result="completed")
+    RENDERS.set(s["failed"], result="failed")
+    RENDERS.set(s["timeouts"], result="timeout")
+
+
+REGISTRY.add_collector(_collect_render_pool)
+
+
+def _db_cache_seconds() -> float:
+    try:
+        return max(0.0, float(os.getenv("METRICS_DB_CACHE_SECONDS", "15")))
+    except ValueError:
+        return 15.0
+
+
+_DB_LOCK = threading.Lock()
+_DB_STATE: Dict[str, Any] = {"families": {}, "at": 0.0}
+
+
+def _gauge_family(help: str, labelnames: List[str], values: Dict[Tuple[str, ...], float]) -> Dict[str, Any]:
+    return {"type": "gauge", "help": help, "labelnames": labelnames, "buckets": [], "values": values}
+
+
+def _db_families() -> Dict[str, Any]:
+    """Database-wide gauges, read once per scrape by the answering worker (not summed per worker)."""
+    with _DB_LOCK:
+        if time.time() - float(_DB_STATE["at"]) < _db_cache_seconds():
+            return dict(_DB_STATE["families"])
+
+    families: Dict[str, Any] = {}
+    up = 1.0
+    try:
+        with get_conn() as conn:
+            conn.execute("SET TIME ZONE 'UTC';", prepare=False)
+            with conn.cursor() as cur:
+                if schema_caps.has(conn, "globalcart.app_email_outbox"):
+                    cur.execute(
+                        """
+                        SELECT status, COUNT(*), COALESCE(EXTRACT(EPOCH FROM NOW() - MIN(created_at)), 0)
+                        FROM globalcart.app_email_outbox
+                        WHERE status IN ('PENDING', 'SENDING')
+                        GROUP BY status;
+                        """
+                    )
+                    rows = cur.fetchall()
+                    backlog = {("PENDING",): 0.0, ("SENDING",): 0.0}
+                    oldest = 0.0
+                    for status, n, age in rows:
+                        backlog[(str(status),)] = float(n)
+                        oldest = max(oldest, float(age or 0))
+                    families["globalcart_outbox_backlog"] = _gauge_family(
+                        "Queued emails not yet delivered, by status.", ["status"], backlog
+                    )
+                    families["globalcart_outbox_oldest_pending_seconds"] = _gauge_family(
+                        "Age of the oldest undelivered email.", [], {(): oldest}
+                    )
+
+                if schema_caps.has(conn, "globalcart.etl_watermarks"):
+                    cur.execute(
+                        """
+                        SELECT source_name, EXTRACT(EPOCH FROM LOCALTIMESTAMP - last_processed_ts)
+                        FROM globalcart.etl_watermarks;
+                        """
+                    )
+                    families["globalcart_mart_refresh_age_seconds"] = _gauge_family(
+                        "Seconds since each ETL watermark (bi_marts = last refresh_bi_marts()) advanced.",
+                        ["source"],
+                        {(str(name),): float(age or 0) for name, age in cur.fetchall()},
+                    )
+    except psycopg.Error:
+        up = 0.0
+
+    families["globalcart_db_up"] = _gauge_family("Whether the metrics scrape could query the database.", [], {(): up})
+    with _DB_LOCK:
+        _DB_STATE["families"] = families
+        _DB_STATE["at"] = time.time()
+    return dict(families)
+
+
+def _require_metrics_token(authorization: str | None) -> None:
+    expected = (os.getenv("METRICS_TOKEN") or "").strip()
+    if not expected:
+        return
+    token = parse_bearer_token(authorization) or ""
+    if not hmac.compare_digest(token, expected):
+        raise HTTPException(status_code=401, detail="Metrics token required")
+
+
+@router.get("/metrics", include_in_schema=False)
+def metrics(authorization: str | None = Header(None, alias="Authorization")) -> PlainTextResponse:
+    _require_metrics_token(authorization)
+    merged, workers = collect_all()
+    merged["globalcart_metrics_workers"] = _gauge_family(
+        "API worker processes whose counters are included in this scrape.", [], {(): float(workers)}
+    )
+    merged.update(_db_families())
+    return PlainTextResponse(render_text(merged), media_type=_CONTENT_TYPE)
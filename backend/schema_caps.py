@@ -0,0 +1,140 @@
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from typing import Dict, Iterable, Optional
+
+import psycopg
+
+from .db import _dsn, get_conn
+
+_log = logging.getLogger("globalcart")
+
+# Optional tables/views created by the later sql/*.sql migrations. Route code asks the registry
+# instead of running SELECT to_regclass(...) on every request.
+OPTIONAL_OBJECTS = (
+    "globalcart.app_users",
+    "globalcart.app_email_outbox",
+    "globalcart.product_inventory",
+    "globalcart.order_inventory_reservations",
+    "globalcart.order_cancellations",
+    "globalcart.vw_customer_order_cancellations",
+    "globalcart.vw_admin_order_cancellations",
+    "globalcart.customer_order_history",
+    "globalcart.etl_watermarks",
+    "globalcart.customer_cart_versions",
+    "globalcart.idempotency_keys",
+)
+
+# src.run_sql notifies this channel after applying a file; API workers listening on it re-probe.
+SCHEMA_CHANGED_CHANNEL = "globalcart_schema_changed"
+
+
+class SchemaCapabilities:
+    """Cached answers to "does this optional relation exist?".
+
+    All registered objects are probed together in one query, on first use or after
+    ``invalidate()``. Missing objects are re-probed after ``missing_ttl_seconds`` so a
+    migration applied without a refresh signal is still picked up.
+    """
+
+    def __init__(self, names: Iterable[str], missing_ttl_seconds: float = 30.0) -> None:
+        self._names = tuple(dict.fromkeys(names))
+        self._missing_ttl = float(missing_ttl_seconds)
+        self._lock = threading.Lock()
+        self._present: Dict[str, bool] = {}
+        self._probed_at = 0.0
+        self._stale = True
+
+    def _probe(self, conn, names: Iterable[str]) -> Dict[str, bool]:
+        with conn.cursor() as cur:
+            cur.execute(
+                "SELECT n, to_regclass(n) IS NOT NULL FROM unnest(%s::text[]) AS n;",
+                (list(names),),
+            )
+            return {str(n): bool(ok) for (n, ok) in cur.fetchall()}
+
+    def refresh(self, conn=None) -> Dict[str, bool]:
+        names = tuple(dict.fromkeys(self._names + tuple(self._present)))
+        if conn is None:
+            with get_conn() as own:
+                found = self._probe(own, names)
+        else:
+            found = self._probe(conn, names)
+        with self._lock:
+            self._present = found
+            self._probed_at = time.monotonic()
+            self._stale = False
+        return dict(found)
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._stale = True
+
+    def _needs_probe_locked(self, name: str) -> bool:
+        if self._stale or name not in self._present:
+            return True
+        return not self._present[name] and time.monotonic() - self._probed_at >= self._missing_ttl
+
+    def has(self, conn, name: str) -> bool:
+        """True if ``name`` exists; probes through ``conn`` only when the cached answer is stale."""
+        with self._lock:
+            if not self._needs_probe_locked(name):
+                return self._present[name]
+            if name not in self._present:
+                self._present[name] = False
+        return self.refresh(conn).get(name, False)
+
+    def has_all(self, conn, names: Iterable[str]) -> bool:
+        return all(self.has(conn, n) for n in names)
+
+    def snapshot(self) -> Dict[str, bool]:
+        with self._lock:
+            return dict(self._present)
+
+
+schema_caps = SchemaCapabilities(OPTIONAL_OBJECTS)
+
+
+_LISTEN_STOP = threading.Event()
+_LISTEN_THREAD: Optional[threading.Thread] = None
+
+
+def _listen_loop() -> None:
+    backoff = 1.0
+    while not _LISTEN_STOP.is_set():
+        try:
+            with psycopg.connect(_dsn(), autocommit=True) as conn:
+                conn.execute(f"LISTEN {SCHEMA_CHANGED_CHANNEL};")
+                # Anything may have changed while we weren't listening.
+                schema_caps.invalidate()
+                backoff = 1.0
+                while not _LISTEN_STOP.is_set():
+                    for _ in conn.notifies(timeout=2.0):
+                        _log.info("schema change notification; re-probing optional objects")
+                        schema_caps.invalidate()
+        except psycopg.OperationalError:
+            _LISTEN_STOP.wait(backoff)
+            backoff = min(backoff * 2, 60.0)
+        except Exception as e:
+            _log.warning("schema listener error=%s", e)
+            _LISTEN_STOP.wait(backoff)
+            backoff = min(backoff * 2, 60.0)
+
+
+def start_schema_listener() -> None:
+    global _LISTEN_THREAD
+    if _LISTEN_THREAD is not None and _LISTEN_THREAD.is_alive():
+        return
+    _LISTEN_STOP.clear()
+    _LISTEN_THREAD = threading.Thread(target=_listen_loop, name="schema-listener", daemon=True)
+    _LISTEN_THREAD.start()
+
+
+def stop_schema_listener(timeout: float = 5.0) -> None:
+    global _LISTEN_THREAD
+    _LISTEN_STOP.set()
+    if _LISTEN_THREAD is not None:
+        _LISTEN_THREAD.join(timeout=timeout)
+    _LISTEN_THREAD = None
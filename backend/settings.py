@@ -2,6 +2,15 @@ from __future__ import annotations
 
 import os
 from dataclasses import dataclass
+from typing import Tuple
+
+
+@dataclass(frozen=True)
+class RouteLimit:
+    method: str
+    path: str
+    requests: int
+    window_seconds: int
 
 
 @dataclass(frozen=True)
@@ -11,6 +20,38 @@ class Settings:
     rate_limit_enabled: bool
     rate_limit_requests: int
     rate_limit_window_seconds: int
+    rate_limit_backend: str
+    rate_limit_algorithm: str
+    rate_limit_max_keys: int
+    rate_limit_routes: Tuple[RouteLimit, ...]
+    chart_prewarm_enabled: bool
+    schema_listen_enabled: bool
+    outbox_dispatcher_enabled: bool
+
+
+def _parse_route_limits(raw: str) -> Tuple[RouteLimit, ...]:
+    """Parse RATE_LIMIT_ROUTES, e.g. ``POST /api/auth/request-otp=5/60; /api/customer/cart=60/60``.
+
+    Paths are route templates as declared on the routers (``/api/customer/orders/{order_id}``);
+    entries without a method apply to every method on that route.
+    """
+    out = []
+    for entry in raw.replace(",", ";").split(";"):
+        entry = entry.strip()
+        if not entry:
+            continue
+        try:
+            target, spec = entry.rsplit("=", 1)
+            requests_s, window_s = spec.split("/", 1)
+            parts = target.split()
+            method, path = (parts[0].upper(), parts[1]) if len(parts) == 2 else ("*", parts[0])
+            limit = RouteLimit(method=method, path=path, requests=int(requests_s), window_seconds=int(window_s))
+        except (ValueError, IndexError):
+            raise RuntimeError(f"Invalid RATE_LIMIT_ROUTES entry: {entry!r} (expected '[METHOD] /path=requests/seconds')")
+        if not limit.path.startswith("/") or limit.window_seconds <= 0:
+            raise RuntimeError(f"Invalid RATE_LIMIT_ROUTES entry: {entry!r}")
+        out.append(limit)
+    return tuple(out)
 
 
 def load_settings() -> Settings:
@@ -36,10 +77,38 @@ def load_settings() -> Settings:
     except ValueError:
         rate_limit_window_seconds = 60
 
+    rate_limit_backend = (os.getenv("RATE_LIMIT_BACKEND", "memory") or "memory").strip().lower()
+    if rate_limit_backend not in {"memory", "postgres"}:
+        raise RuntimeError("RATE_LIMIT_BACKEND must be 'memory' or 'postgres'")
+
+    rate_limit_algorithm = (os.getenv("RATE_LIMIT_ALGORITHM", "token_bucket") or "token_bucket").strip().lower()
+    if rate_limit_algorithm not in {"token_bucket", "sliding_window"}:
+        raise RuntimeError("RATE_LIMIT_ALGORITHM must be 'token_bucket' or 'sliding_window'")
+
+    try:
+        rate_limit_max_keys = int(os.getenv("RATE_LIMIT_MAX_KEYS", "50000"))
+    except ValueError:
+        rate_limit_max_keys = 50000
+
+    rate_limit_routes = _parse_route_limits(os.getenv("RATE_LIMIT_ROUTES", "") or "")
+
+    chart_prewarm_enabled = str(os.getenv("CHART_PREWARM_ENABLED", "1")).strip().lower() not in {"0", "false"}
+
+    schema_listen_enabled = str(os.getenv("SCHEMA_LISTEN_ENABLED", "1")).strip().lower() not in {"0", "false"}
+
+    outbox_dispatcher_enabled = str(os.getenv("OUTBOX_DISPATCHER_ENABLED", "1")).strip().lower() not in {"0", "false"}
+
     return Settings(
         env=env,
         jwt_secret=jwt_secret,
         rate_limit_enabled=rate_limit_enabled,
         rate_limit_requests=rate_limit_requests,
         rate_limit_window_seconds=rate_limit_window_seconds,
+        rate_limit_backend=rate_limit_backend,
+        rate_limit_algorithm=rate_limit_algorithm,
+        rate_limit_max_keys=rate_limit_max_keys,
+        rate_limit_routes=rate_limit_routes,
+        chart_prewarm_enabled=chart_prewarm_enabled,
+        schema_listen_enabled=schema_listen_enabled,
+        outbox_dispatcher_enabled=outbox_dispatcher_enabled,
     )
@@ -0,0 +1,138 @@
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sys
+from pathlib import Path
+
+from .stats import compare
+from .workloads import DEFAULT_MIX, parse_mix
+
+# Storefront/admin load benchmark.
+#
+#   python -m bench seed --scale small
+#   python -m bench run --concurrency 32 --duration 60 --out bench/results/$(git rev-parse --short HEAD).json
+#   python -m bench compare bench/results/base.json bench/results/head.json --fail-above 15
+#
+# `run` starts uvicorn locally (unless --base-url is given) with rate limiting and background
+# workers disabled and drives the weighted scenario mix. DB statements per endpoint come from the
+# Server-Timing header, or from a sequential pg_stat_statements pass on builds that lack it.
+
+
+def _cmd_seed(args: argparse.Namespace) -> int:
+    from .seed import seed
+
+    seed(scale=args.scale, seed_value=args.seed)
+    return 0
+
+
+def _cmd_run(args: argparse.Namespace) -> int:
+    from .runner import RunConfig, endpoints_table, run
+    from .server import LocalServer
+
+    try:
+        mix = parse_mix(args.mix)
+    except ValueError as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 2
+
+    server = None
+    base_url = args.base_url
+    if not base_url:
+        # Tokens minted by the runner must verify in the server it starts.
+        os.environ.setdefault("JWT_SECRET", "bench-secret")
+        server = LocalServer(workers=args.workers)
+        server.start()
+        base_url = server.base_url
+
+    try:
+        result = run(
+            RunConfig(
+                base_url=base_url,
+                mix=mix,
+                concurrency=args.concurrency,
+                duration_s=args.duration,
+                warmup_s=args.warmup,
+                probe_iterations=args.probe_iterations,
+                customers=args.customers,
+                products=args.products,
+                seed=args.seed,
+            )
+        )
+    finally:
+        if server is not None:
+            server.stop()
+    result["meta"]["server_workers"] = args.workers if server is not None else None
+
+    print("\n".join(endpoints_table(result)))
+    if args.out:
+        out = Path(args.out)
+        out.parent.mkdir(parents=True, exist_ok=True)
+        out.write_text(json.dumps(result, indent=2, sort_keys=True), encoding="utf-8")
+        print(f"wrote {out}")
+    return 0
+
+
+def _cmd_compare(args: argparse.Namespace) -> int:
+    baseline = json.loads(Path(args.baseline).read_text(encoding="utf-8"))
+    candidate = json.loads(Path(args.candidate).read_text(encoding="utf-8"))
+    rows = compare(baseline, candidate, metric=args.metric)
+
+    print(f"{'endpoint':<62} {'base':>9} {'cand':>9} {'change':>8} {'db':>11}")
+    regressions = []
+    for r in rows:
+        change = "-" if r["change_pct"] is None else f"{r['change_pct']:+.1f}%"
+        db = "-"
+        if r["baseline_db_round_trips"] is not None or r["candidate_db_round_trips"] is not None:
+            db = f"{_n(r['baseline_db_round_trips'])}->{_n(r['candidate_db_round_trips'])}"
+        print(f"{r['endpoint']:<62} {_n(r['baseline']):>9} {_n(r['candidate']):>9} {change:>8} {db:>11}")
+        if args.fail_above is not None and r["change_pct"] is not None and r["change_pct"] > args.fail_above:
+            regressions.append(r["endpoint"])
+
+    if regressions:
+        print(f"{len(regressions)} endpoint(s) regressed more than {args.fail_above}% on {args.metric}", file=sys.stderr)
+        return 1
+    return 0
+
+
+def _n(x) -> str:
+    return "-" if x is None else f"{float(x):.1f}"
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m bench")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_seed = sub.add_parser("seed", help="Generate and load a dataset at a generate_data scale")
+    p_seed.add_argument("--scale", default="small", choices=["small", "medium", "large"])
+    p_seed.add_argument("--seed", type=int, default=42)
+    p_seed.set_defaults(func=_cmd_seed)
+
+    p_run = sub.add_parser("run", help="Drive a mixed workload and report per-endpoint latency")
+    p_run.add_argument("--base-url", default=None, help="Benchmark an already running server instead of starting one")
+    p_run.add_argument("--workers", type=int, default=1, help="uvicorn workers for the local server")
+    p_run.add_argument("--mix", default=DEFAULT_MIX, help=f"Scenario weights (default: {DEFAULT_MIX})")
+    p_run.add_argument("--concurrency", type=int, default=16, help="Virtual users")
+    p_run.add_argument("--duration", type=float, default=60.0, help="Measured seconds")
+    p_run.add_argument("--warmup", type=float, default=5.0, help="Unmeasured seconds before the run")
+    p_run.add_argument("--probe-iterations", type=int, default=3, help="Sequential passes per scenario for DB round trips (0 = skip)")
+    p_run.add_argument("--customers", type=int, default=500)
+    p_run.add_argument("--products", type=int, default=500)
+    p_run.add_argument("--seed", type=int, default=7)
+    p_run.add_argument("--out", default=None, help="Write the JSON result here")
+    p_run.set_defaults(func=_cmd_run)
+
+    p_cmp = sub.add_parser("compare", help="Compare two result files")
+    p_cmp.add_argument("baseline")
+    p_cmp.add_argument("candidate")
+    p_cmp.add_argument("--metric", default="p95_ms", choices=["p50_ms", "p95_ms", "p99_ms", "mean_ms"])
+    p_cmp.add_argument("--fail-above", type=float, default=None, help="Exit 1 if any endpoint regresses by more than this %%")
+    p_cmp.set_defaults(func=_cmd_compare)
+
+    args = parser.parse_args(argv)
+    return int(args.func(args))
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,45 @@
+from __future__ import annotations
+
+from typing import Optional
+
+import psycopg
+
+from backend.db import _dsn
+
+# Statements the probe itself issues are excluded by the NOT ILIKE filter.
+_CALLS_SQL = """
+SELECT COALESCE(SUM(calls), 0)::bigint
+FROM pg_stat_statements
+WHERE dbid = (SELECT oid FROM pg_database WHERE datname = current_database())
+  AND query NOT ILIKE '%%pg_stat_statements%%';
+"""
+
+
+class RoundTripProbe:
+    """Counts statements the server ran between two calls, using pg_stat_statements.
+
+    Only meaningful while a single request is in flight, so the runner uses it in a sequential
+    probe pass after the load phase. ``available`` is False when the extension isn't installed
+    (it needs ``shared_preload_libraries = 'pg_stat_statements'``).
+    """
+
+    def __init__(self) -> None:
+        self._conn: Optional[psycopg.Connection] = None
+        self.available = False
+        try:
+            self._conn = psycopg.connect(_dsn(), autocommit=True)
+            self._conn.execute("CREATE EXTENSION IF NOT EXISTS pg_stat_statements;")
+            self.calls()
+            self.available = True
+        except psycopg.Error:
+            self.close()
+
+    def calls(self) -> int:
+        assert self._conn is not None
+        row = self._conn.execute(_CALLS_SQL).fetchone()
+        return int(row[0] if row else 0)
+
+    def close(self) -> None:
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            conn.close()
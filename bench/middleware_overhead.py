@@ -0,0 +1,186 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import statistics
+import time
+import uuid
+from typing import Any, Dict, List
+
+from fastapi import FastAPI
+from fastapi.middleware.cors import CORSMiddleware
+from starlette.requests import Request
+
+from backend.middleware import GlobalCartMiddleware
+from backend.rate_limit import RateLimiter
+from backend.settings import Settings
+
+# Per-request cost of the middleware stack on a trivial endpoint, measured by driving the ASGI
+# app directly (no sockets, no HTTP client) so only framework + middleware time is counted.
+#
+#   python -m bench.middleware_overhead --requests 20000
+
+
+def _settings() -> Settings:
+    return Settings(
+        env="dev",
+        jwt_secret="",
+        rate_limit_enabled=True,
+        rate_limit_requests=10**9,
+        rate_limit_window_seconds=60,
+        rate_limit_backend="memory",
+        rate_limit_algorithm="token_bucket",
+        rate_limit_max_keys=50000,
+        rate_limit_routes=(),
+        chart_prewarm_enabled=False,
+        schema_listen_enabled=False,
+        outbox_dispatcher_enabled=False,
+    )
+
+
+def _base_app() -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/api/ping")
+    def ping() -> Dict[str, bool]:
+        return {"ok": True}
+
+    return app
+
+
+def _with_cors(app: FastAPI) -> FastAPI:
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+    return app
+
+
+def build_legacy_app() -> FastAPI:
+    """The four @app.middleware("http") layers as they were before backend/middleware.py."""
+    app = _base_app()
+    buckets: Dict[Any, Any] = {}
+
+    @app.middleware("http")
+    async def request_id_middleware(request: Request, call_next):
+        rid = request.headers.get("x-request-id") or uuid.uuid4().hex[:12]
+        response = await call_next(request)
+        response.headers["X-Request-ID"] = rid
+        return response
+
+    @app.middleware("http")
+    async def security_headers_and_rate_limit_middleware(request: Request, call_next):
+        if request.url.path.startswith("/api/"):
+            ip = request.headers.get("x-forwarded-for") or (request.client.host if request.client else "")
+            key = ((ip or "").split(",")[0].strip() or "unknown", request.url.path)
+            now = time.time()
+            window_start, count = buckets.get(key, (now, 0))
+            if now - window_start >= 60:
+                window_start, count = now, 0
+            buckets[key] = (window_start, count + 1)
+        response = await call_next(request)
+        response.headers.setdefault("X-Content-Type-Options", "nosniff")
+        response.headers.setdefault("X-Frame-Options", "DENY")
+        response.headers.setdefault("Referrer-Policy", "no-referrer")
+        response.headers.setdefault("Permissions-Policy", "geolocation=(), microphone=(), camera=()")
+        response.headers.setdefault("Cross-Origin-Opener-Policy", "same-origin")
+        response.headers.setdefault("Cross-Origin-Resource-Policy", "same-origin")
+        return response
+
+    @app.middleware("http")
+    async def shop_html_no_cache_middleware(request: Request, call_next):
+        path = request.url.path or ""
+        is_shop_html = request.method == "GET" and (
+            path == "/shop" or path == "/shop/" or (path.startswith("/shop/") and path.endswith(".html"))
+        )
+        response = await call_next(request)
+        if is_shop_html:
+            response.headers["Cache-Control"] = "no-store, no-cache, must-revalidate, max-age=0"
+        return response
+
+    @app.middleware("http")
+    async def admin_no_cache_middleware(request: Request, call_next):
+        path = request.url.path or ""
+        is_admin = request.method == "GET" and (path == "/admin" or path.startswith("/admin/"))
+        response = await call_next(request)
+        if is_admin:
+            response.headers["Cache-Control"] = "no-store, no-cache, must-revalidate, max-age=0"
+        return response
+
+    return _with_cors(app)
+
+
+def build_asgi_app() -> FastAPI:
+    app = _base_app()
+    app.add_middleware(GlobalCartMiddleware, rate_limiter=RateLimiter(_settings(), app.router.routes))
+    return _with_cors(app)
+
+
+def build_bare_app() -> FastAPI:
+    return _with_cors(_base_app())
+
+
+async def _drive(app: FastAPI, n: int) -> List[float]:
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": "/api/ping",
+        "raw_path": b"/api/ping",
+        "root_path": "",
+        "query_string": b"",
+        "client": ("127.0.0.1", 50000),
+        "server": ("testserver", 80),
+    }
+    request_headers = [(b"host", b"testserver"), (b"user-agent", b"bench"), (b"accept", b"*/*")]
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        return None
+
+    timings: List[float] = []
+    for _ in range(n):
+        s = dict(scope)
+        s["headers"] = list(request_headers)
+        t0 = time.perf_counter()
+        await app(s, receive, send)
+        timings.append((time.perf_counter() - t0) * 1e6)
+    return timings
+
+
+def run(requests: int, warmup: int) -> Dict[str, Dict[str, float]]:
+    results: Dict[str, Dict[str, float]] = {}
+    for name, builder in (("no_middleware", build_bare_app), ("legacy_http_middleware", build_legacy_app), ("pure_asgi", build_asgi_app)):
+        app = builder()
+        asyncio.run(_drive(app, warmup))
+        timings = sorted(asyncio.run(_drive(app, requests)))
+        results[name] = {
+            "mean_us": statistics.fmean(timings),
+            "p50_us": timings[len(timings) // 2],
+            "p99_us": timings[int(len(timings) * 0.99) - 1],
+        }
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Per-request middleware overhead on a trivial endpoint")
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--warmup", type=int, default=2000)
+    args = parser.parse_args()
+
+    results = run(args.requests, args.warmup)
+    base = results["no_middleware"]["mean_us"]
+    print(f"{'stack':<24}{'mean us':>10}{'p50 us':>10}{'p99 us':>10}{'overhead us':>14}")
+    for name, r in results.items():
+        print(f"{name:<24}{r['mean_us']:>10.1f}{r['p50_us']:>10.1f}{r['p99_us']:>10.1f}{r['mean_us'] - base:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
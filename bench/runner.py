@@ -0,0 +1,185 @@
+from __future__ import annotations
+
+import asyncio
+import os
+import platform
+import random
+import subprocess
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from backend.db import get_conn
+
+from .dbprobe import RoundTripProbe
+from .stats import Recorder
+from .workloads import SCENARIOS, BenchContext, Fixtures
+
+_ROOT = Path(__file__).resolve().parents[1]
+
+
+@dataclass(frozen=True)
+class RunConfig:
+    base_url: str
+    mix: Dict[str, float]
+    concurrency: int = 16
+    duration_s: float = 60.0
+    warmup_s: float = 5.0
+    probe_iterations: int = 3
+    customers: int = 500
+    products: int = 500
+    seed: int = 7
+    timeout_s: float = 30.0
+
+
+def load_fixtures(customers: int, products: int, seed: int) -> Fixtures:
+    """Stable pseudo-random customers/products from the seeded DB, plus customer JWTs."""
+    from backend.security import create_access_token
+
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                "SELECT customer_id FROM globalcart.dim_customer ORDER BY md5(customer_id::text || %s) LIMIT %s;",
+                (str(seed), int(customers)),
+            )
+            customer_ids = [int(r[0]) for r in cur.fetchall()]
+            cur.execute(
+                """
+                SELECT p.product_id
+                FROM globalcart.dim_product p
+                JOIN globalcart.product_inventory i ON i.product_id = p.product_id
+                WHERE i.on_hand_qty - i.reserved_qty > 100
+                ORDER BY md5(p.product_id::text || %s)
+                LIMIT %s;
+                """,
+                (str(seed), int(products)),
+            )
+            product_ids = [int(r[0]) for r in cur.fetchall()]
+
+    if not customer_ids or not product_ids:
+        raise SystemExit("No customers/products with stock found. Run: python -m bench seed --scale small")
+
+    tokens = {
+        cid: create_access_token(subject=f"bench-{cid}@example.com", role="customer", extra={"customer_id": cid})
+        for cid in customer_ids
+    }
+    return Fixtures(
+        customer_ids=customer_ids,
+        product_ids=product_ids,
+        customer_tokens=tokens,
+        admin_key=os.getenv("ADMIN_KEY", "admin"),
+    )
+
+
+async def _virtual_user(ctx: BenchContext, mix: Dict[str, float], deadline: float) -> None:
+    names = list(mix)
+    weights = [mix[n] for n in names]
+    while time.monotonic() < deadline:
+        scenario = SCENARIOS[ctx.rng.choices(names, weights=weights)[0]]
+        await scenario(ctx)
+
+
+async def _drive(
+    cfg: RunConfig,
+    fixtures: Fixtures,
+    recorder: Recorder,
+    seconds: float,
+    concurrency: int,
+    seed_offset: int,
+) -> float:
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=cfg.base_url, timeout=cfg.timeout_s, limits=limits) as client:
+        started = time.monotonic()
+        deadline = started + seconds
+        users = [
+            BenchContext(client, recorder, fixtures, random.Random(cfg.seed * 1000 + seed_offset + i))
+            for i in range(concurrency)
+        ]
+        await asyncio.gather(*(_virtual_user(u, cfg.mix, deadline) for u in users))
+        return time.monotonic() - started
+
+
+async def _probe(cfg: RunConfig, fixtures: Fixtures, recorder: Recorder, probe: RoundTripProbe) -> None:
+    # One request in flight at a time so pg_stat_statements deltas belong to a single request.
+    async with httpx.AsyncClient(base_url=cfg.base_url, timeout=cfg.timeout_s) as client:
+        ctx = BenchContext(client, recorder, fixtures, random.Random(cfg.seed), probe=probe)
+        for name in cfg.mix:
+            for _ in range(max(1, cfg.probe_iterations)):
+                await SCENARIOS[name](ctx)
+
+
+def run(cfg: RunConfig) -> Dict[str, Any]:
+    fixtures = load_fixtures(cfg.customers, cfg.products, cfg.seed)
+
+    if cfg.warmup_s > 0:
+        asyncio.run(_drive(cfg, fixtures, Recorder(), cfg.warmup_s, cfg.concurrency, seed_offset=10_000))
+
+    recorder = Recorder()
+    elapsed = asyncio.run(_drive(cfg, fixtures, recorder, cfg.duration_s, cfg.concurrency, seed_offset=0))
+    result = recorder.summary(elapsed)
+
+    # Servers with the DB instrumentation report per-request query counts in Server-Timing; the
+    # pg_stat_statements probe pass is only needed for older builds.
+    round_trip_source: Optional[str] = None
+    if any(s.get("db_round_trips") is not None for s in result["endpoints"].values()):
+        round_trip_source = "server-timing"
+    elif cfg.probe_iterations > 0:
+        probe = RoundTripProbe()
+        try:
+            if probe.available:
+                probed = Recorder()
+                asyncio.run(_probe(cfg, fixtures, probed, probe))
+                for endpoint, stats in probed.summary(1.0)["endpoints"].items():
+                    result["endpoints"].setdefault(endpoint, {})["db_round_trips"] = stats["db_round_trips"]
+                round_trip_source = "pg_stat_statements"
+        finally:
+            probe.close()
+
+    result["meta"] = _meta(cfg, round_trip_source)
+    return result
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=str(_ROOT), capture_output=True, text=True, timeout=10
+        )
+        return out.stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def _meta(cfg: RunConfig, round_trip_source: Optional[str]) -> Dict[str, Any]:
+    return {
+        "commit": _git_commit(),
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "base_url": cfg.base_url,
+        "mix": cfg.mix,
+        "concurrency": cfg.concurrency,
+        "duration_s": cfg.duration_s,
+        "warmup_s": cfg.warmup_s,
+        "seed": cfg.seed,
+        "db_round_trips_source": round_trip_source,
+        "python": platform.python_version(),
+        "host": platform.node(),
+    }
+
+
+def endpoints_table(result: Dict[str, Any]) -> List[str]:
+    lines = [f"{'endpoint':<62} {'count':>7} {'rps':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'err':>5} {'db':>5}"]
+    for endpoint, s in result["endpoints"].items():
+        lines.append(
+            f"{endpoint:<62} {s.get('count', 0):>7} {_fmt(s.get('rps'))} {_fmt(s.get('p50_ms'))} "
+            f"{_fmt(s.get('p95_ms'))} {_fmt(s.get('p99_ms'))} {s.get('errors', 0):>5} {_fmt(s.get('db_round_trips'), 5)}"
+        )
+    t = result["totals"]
+    lines.append(f"total requests={t['requests']} errors={t['errors']} rps={t['rps']} duration={t['duration_s']}s")
+    return lines
+
+
+def _fmt(x: Any, width: int = 8) -> str:
+    return f"{'-':>{width}}" if x is None else f"{x:>{width}.1f}"
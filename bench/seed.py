@@ -0,0 +1,58 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+from src.config import PostgresConfig
+from src.db import get_conn
+from src.dedupe_products import dedupe_products
+from src.generate_data import generate
+from src.load_to_postgres import load
+from src.run_sql import run_sql_file
+
+_ROOT = Path(__file__).resolve().parents[1]
+
+# Everything the storefront/admin APIs touch; 13_rate_limits.sql is skipped because the bench
+# server runs with rate limiting disabled.
+SQL_FILES = (
+    "02_views.sql",
+    "06_bi_marts.sql",
+    "07_app_auth.sql",
+    "08_add_order_address.sql",
+    "09_customer_addresses.sql",
+    "10_shop_features.sql",
+    "11_razorpay.sql",
+    "12_inventory.sql",
+    "14_customer_order_history.sql",
+)
+
+# Checkout reserves stock; give every product enough that a long run never hits 409s.
+BENCH_ON_HAND_QTY = 1_000_000
+
+
+def seed(scale: str, seed_value: int = 42, raw_dir: Path | None = None) -> None:
+    """Regenerate the synthetic dataset at ``scale`` and load it into a clean schema."""
+    raw_dir = raw_dir or (_ROOT / "data" / "bench" / scale)
+    raw_dir.mkdir(parents=True, exist_ok=True)
+
+    print(f"[bench] generating scale={scale} seed={seed_value} -> {raw_dir}")
+    generate(scale_name=scale, out_dir=raw_dir, seed=seed_value)
+
+    print("[bench] loading into PostgreSQL")
+    load(raw_dir=raw_dir, schema_sql=_ROOT / "sql" / "00_schema.sql", truncate=True)
+    dedupe_products(PostgresConfig())
+
+    for name in SQL_FILES:
+        print(f"[bench] applying sql/{name}")
+        run_sql_file(_ROOT / "sql" / name, stop_on_error=True)
+
+    with get_conn(PostgresConfig()) as conn:
+        conn.execute(
+            """
+            UPDATE globalcart.product_inventory
+            SET on_hand_qty = GREATEST(on_hand_qty, %s), reserved_qty = 0, updated_at = NOW();
+            """,
+            (BENCH_ON_HAND_QTY,),
+        )
+        conn.execute("ANALYZE;", prepare=False)
+        conn.commit()
+    print("[bench] seed complete")
@@ -0,0 +1,94 @@
+from __future__ import annotations
+
+import os
+import socket
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+import httpx
+
+_ROOT = Path(__file__).resolve().parents[1]
+
+# Background work that would otherwise compete with (and add DB round trips to) the measured
+# requests. Explicit values in the caller's environment still win for anything not listed here.
+BENCH_SERVER_ENV: Dict[str, str] = {
+    "RATE_LIMIT_ENABLED": "0",
+    "CHART_PREWARM_ENABLED": "0",
+    "SCHEMA_LISTEN_ENABLED": "0",
+    "OUTBOX_DISPATCHER_ENABLED": "0",
+}
+
+
+def _free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return int(s.getsockname()[1])
+
+
+class LocalServer:
+    """Runs ``uvicorn backend.main:app`` in a subprocess for the duration of a benchmark."""
+
+    def __init__(self, workers: int = 1, port: Optional[int] = None, env: Optional[Dict[str, str]] = None) -> None:
+        self.workers = max(1, int(workers))
+        self.port = int(port or _free_port())
+        self.env = dict(os.environ)
+        self.env.update(BENCH_SERVER_ENV)
+        self.env.update(env or {})
+        self.env.setdefault("JWT_SECRET", "bench-secret")
+        self._proc: Optional[subprocess.Popen] = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def start(self, timeout: float = 60.0) -> None:
+        cmd = [
+            sys.executable,
+            "-m",
+            "uvicorn",
+            "backend.main:app",
+            "--host",
+            "127.0.0.1",
+            "--port",
+            str(self.port),
+            "--workers",
+            str(self.workers),
+            "--log-level",
+            "warning",
+            "--no-access-log",
+        ]
+        self._proc = subprocess.Popen(cmd, cwd=str(_ROOT), env=self.env)
+
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self._proc.poll() is not None:
+                raise RuntimeError(f"uvicorn exited with code {self._proc.returncode}")
+            try:
+                if httpx.get(self.base_url + "/api/config/powerbi", timeout=1.0).status_code < 500:
+                    return
+            except httpx.HTTPError:
+                pass
+            time.sleep(0.2)
+        self.stop()
+        raise RuntimeError(f"uvicorn did not become ready within {timeout:.0f}s")
+
+    def stop(self) -> None:
+        proc, self._proc = self._proc, None
+        if proc is None or proc.poll() is not None:
+            return
+        proc.terminate()
+        try:
+            proc.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.wait()
+
+    def __enter__(self) -> "LocalServer":
+        self.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
@@ -0,0 +1,103 @@
+from __future__ import annotations
+
+import math
+from collections import Counter, defaultdict
+from typing import Any, Dict, List, Optional, Sequence
+
+
+def percentile(sorted_values: Sequence[float], q: float) -> Optional[float]:
+    """Linear-interpolated percentile (``q`` in 0..100) of an already sorted sequence."""
+    if not sorted_values:
+        return None
+    if len(sorted_values) == 1:
+        return float(sorted_values[0])
+    pos = (len(sorted_values) - 1) * (float(q) / 100.0)
+    lo = int(math.floor(pos))
+    hi = min(lo + 1, len(sorted_values) - 1)
+    frac = pos - lo
+    return float(sorted_values[lo]) + (float(sorted_values[hi]) - float(sorted_values[lo])) * frac
+
+
+class Recorder:
+    """Per-endpoint latencies (ms), status codes and DB round-trip samples for one run.
+
+    Endpoints are keyed by "METHOD /route/{template}" so ids in the path don't split the stats.
+    """
+
+    def __init__(self) -> None:
+        self.latencies_ms: Dict[str, List[float]] = defaultdict(list)
+        self.statuses: Dict[str, Counter] = defaultdict(Counter)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.round_trips: Dict[str, List[int]] = defaultdict(list)
+
+    def record(self, endpoint: str, elapsed_ms: float, status: Optional[int]) -> None:
+        self.latencies_ms[endpoint].append(float(elapsed_ms))
+        self.statuses[endpoint][str(status) if status is not None else "error"] += 1
+        if status is None or status >= 500:
+            self.errors[endpoint] += 1
+
+    def record_round_trips(self, endpoint: str, n: int) -> None:
+        self.round_trips[endpoint].append(int(n))
+
+    def summary(self, duration_s: float) -> Dict[str, Any]:
+        duration_s = max(float(duration_s), 1e-9)
+        endpoints: Dict[str, Any] = {}
+        total = 0
+        total_errors = 0
+        for endpoint in sorted(set(self.latencies_ms) | set(self.round_trips)):
+            values = sorted(self.latencies_ms.get(endpoint, []))
+            count = len(values)
+            total += count
+            total_errors += self.errors.get(endpoint, 0)
+            rts = self.round_trips.get(endpoint, [])
+            endpoints[endpoint] = {
+                "count": count,
+                "errors": self.errors.get(endpoint, 0),
+                "status": dict(self.statuses.get(endpoint, {})),
+                "rps": round(count / duration_s, 2),
+                "mean_ms": round(sum(values) / count, 2) if count else None,
+                "p50_ms": _round(percentile(values, 50)),
+                "p95_ms": _round(percentile(values, 95)),
+                "p99_ms": _round(percentile(values, 99)),
+                "max_ms": _round(values[-1] if values else None),
+                "db_round_trips": round(sum(rts) / len(rts), 2) if rts else None,
+            }
+        return {
+            "totals": {
+                "requests": total,
+                "errors": total_errors,
+                "duration_s": round(duration_s, 2),
+                "rps": round(total / duration_s, 2),
+            },
+            "endpoints": endpoints,
+        }
+
+
+def _round(x: Optional[float]) -> Optional[float]:
+    return None if x is None else round(float(x), 2)
+
+
+def compare(baseline: Dict[str, Any], candidate: Dict[str, Any], metric: str = "p95_ms") -> List[Dict[str, Any]]:
+    """Per-endpoint change in ``metric`` between two result files (positive pct = slower)."""
+    rows: List[Dict[str, Any]] = []
+    base_eps = baseline.get("endpoints", {})
+    cand_eps = candidate.get("endpoints", {})
+    for endpoint in sorted(set(base_eps) | set(cand_eps)):
+        b = (base_eps.get(endpoint) or {}).get(metric)
+        c = (cand_eps.get(endpoint) or {}).get(metric)
+        pct = None
+        if b not in (None, 0) and c is not None:
+            pct = round((float(c) - float(b)) / float(b) * 100.0, 1)
+        rows.append(
+            {
+                "endpoint": endpoint,
+                "baseline": b,
+                "candidate": c,
+                "change_pct": pct,
+                "baseline_rps": (base_eps.get(endpoint) or {}).get("rps"),
+                "candidate_rps": (cand_eps.get(endpoint) or {}).get("rps"),
+                "baseline_db_round_trips": (base_eps.get(endpoint) or {}).get("db_round_trips"),
+                "candidate_db_round_trips": (cand_eps.get(endpoint) or {}).get("db_round_trips"),
+            }
+        )
+    return rows
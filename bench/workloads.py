@@ -0,0 +1,195 @@
+from __future__ import annotations
+
+import random
+import re
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import httpx
+
+from .dbprobe import RoundTripProbe
+from .stats import Recorder
+
+
+# Emitted by backend.middleware: db;dur=..;desc="queries=N rows=M"
+_SERVER_TIMING_QUERIES = re.compile(r'\bdb;[^,]*desc="queries=(\d+)')
+
+
+def server_timing_queries(resp: Optional[httpx.Response]) -> Optional[int]:
+    if resp is None:
+        return None
+    m = _SERVER_TIMING_QUERIES.search(resp.headers.get("server-timing", ""))
+    return int(m.group(1)) if m else None
+
+
+@dataclass
+class Fixtures:
+    customer_ids: List[int]
+    product_ids: List[int]
+    customer_tokens: Dict[int, str]
+    admin_key: str
+
+
+@dataclass
+class BenchContext:
+    client: httpx.AsyncClient
+    recorder: Recorder
+    fixtures: Fixtures
+    rng: random.Random
+    probe: Optional[RoundTripProbe] = None
+    session_id: str = field(default_factory=lambda: uuid.uuid4().hex[:16])
+
+    async def call(
+        self,
+        method: str,
+        template: str,
+        *,
+        headers: Optional[Dict[str, str]] = None,
+        params: Optional[Dict[str, Any]] = None,
+        json: Any = None,
+        **path: Any,
+    ) -> Optional[httpx.Response]:
+        endpoint = f"{method} {template}"
+        before = self.probe.calls() if self.probe is not None else None
+        started = time.perf_counter()
+        try:
+            resp: Optional[httpx.Response] = await self.client.request(
+                method, template.format(**path), headers=headers, params=params, json=json
+            )
+            status: Optional[int] = resp.status_code
+        except httpx.HTTPError:
+            resp, status = None, None
+        self.recorder.record(endpoint, (time.perf_counter() - started) * 1000.0, status)
+        if before is not None:
+            self.recorder.record_round_trips(endpoint, self.probe.calls() - before)
+        else:
+            queries = server_timing_queries(resp)
+            if queries is not None:
+                self.recorder.record_round_trips(endpoint, queries)
+        return resp
+
+    def customer(self) -> tuple[int, Dict[str, str]]:
+        cid = self.rng.choice(self.fixtures.customer_ids)
+        return cid, {"Authorization": f"Bearer {self.fixtures.customer_tokens[cid]}"}
+
+    def product(self) -> int:
+        return self.rng.choice(self.fixtures.product_ids)
+
+    def admin_headers(self) -> Dict[str, str]:
+        return {"X-Admin-Key": self.fixtures.admin_key}
+
+    async def event(self, stage: str, customer_id: Optional[int] = None, **fields: Any) -> None:
+        payload = {"session_id": self.session_id, "stage": stage, "customer_id": customer_id}
+        payload.update(fields)
+        await self.call("POST", "/api/events/funnel", json=payload)
+
+
+def _json(resp: Optional[httpx.Response]) -> Any:
+    if resp is None or resp.status_code >= 400:
+        return None
+    try:
+        return resp.json()
+    except ValueError:
+        return None
+
+
+# --- scenarios ----------------------------------------------------------------------------------
+# Each scenario is one user journey; virtual users pick scenarios by weight and loop until the
+# run ends.
+
+
+async def browse(ctx: BenchContext) -> None:
+    sort = ctx.rng.choice(["default", "default", "price_asc", "best_sellers"])
+    await ctx.call("GET", "/api/customer/products", params={"limit": 24, "offset": ctx.rng.randrange(0, 200), "sort": sort})
+    for _ in range(ctx.rng.randint(1, 3)):
+        pid = ctx.product()
+        await ctx.call("GET", "/api/customer/products/{product_id}", product_id=pid)
+        await ctx.call("GET", "/api/customer/products/{product_id}/rating", product_id=pid)
+        await ctx.call("GET", "/api/customer/products/{product_id}/reviews", product_id=pid)
+        await ctx.event("VIEW_PRODUCT", product_id=pid)
+
+
+async def purchase(ctx: BenchContext) -> None:
+    cid, auth = ctx.customer()
+    await ctx.call("GET", "/api/customer/products", params={"limit": 24})
+
+    items = []
+    for pid in {ctx.product() for _ in range(ctx.rng.randint(1, 3))}:
+        qty = ctx.rng.randint(1, 2)
+        await ctx.call("GET", "/api/customer/products/{product_id}", product_id=pid)
+        await ctx.event("VIEW_PRODUCT", customer_id=cid, product_id=pid)
+        await ctx.call("POST", "/api/customer/cart", headers=auth, json={"product_id": pid, "qty": qty})
+        await ctx.event("ADD_TO_CART", customer_id=cid, product_id=pid)
+        items.append({"product_id": pid, "qty": qty})
+
+    await ctx.call("GET", "/api/customer/cart", headers=auth)
+    await ctx.event("CHECKOUT_STARTED", customer_id=cid)
+    started = _json(await ctx.call("POST", "/api/customer/checkout/start", headers=auth, json={"items": items}))
+    if started and started.get("order_id"):
+        order_id = int(started["order_id"])
+        success = ctx.rng.random() < 0.9
+        await ctx.event("PAYMENT_ATTEMPTED", customer_id=cid, order_id=order_id)
+        await ctx.call(
+            "POST",
+            "/api/customer/orders/{order_id}/simulate-payment",
+            headers=auth,
+            json={"success": success, "failure_reason": None if success else "BANK_DECLINED"},
+            order_id=order_id,
+        )
+        await ctx.event("ORDER_PLACED" if success else "PAYMENT_FAILED", customer_id=cid, order_id=order_id)
+        await ctx.call("GET", "/api/customer/orders/{order_id}/timeline", params={"customer_id": cid}, order_id=order_id)
+
+    await ctx.call("DELETE", "/api/customer/cart", headers=auth)
+    await ctx.call("GET", "/api/customer/orders/by-customer/{customer_id}", headers=auth, customer_id=cid)
+
+
+async def admin(ctx: BenchContext) -> None:
+    headers = ctx.admin_headers()
+    await ctx.call("GET", "/api/admin/kpis/latest", headers=headers)
+    await ctx.call("GET", "/api/admin/orders", headers=headers, params={"limit": 50})
+    await ctx.call("GET", "/api/admin/funnel/summary", headers=headers)
+    await ctx.call("GET", "/api/admin/finance/summary", headers=headers)
+    await ctx.call("GET", "/api/admin/finance/top-products", headers=headers)
+    await ctx.call("GET", "/api/admin/analytics/sales_trend/data", headers=headers)
+    await ctx.call("GET", "/api/admin/analytics/top_products/data", headers=headers)
+
+
+async def events(ctx: BenchContext) -> None:
+    cid = ctx.rng.choice(ctx.fixtures.customer_ids)
+    ctx.session_id = uuid.uuid4().hex[:16]
+    for _ in range(ctx.rng.randint(3, 8)):
+        await ctx.event("VIEW_PRODUCT", customer_id=cid, product_id=ctx.product())
+    await ctx.event("VIEW_CART", customer_id=cid)
+
+
+SCENARIOS: Dict[str, Callable[[BenchContext], Awaitable[None]]] = {
+    "browse": browse,
+    "purchase": purchase,
+    "admin": admin,
+    "events": events,
+}
+
+DEFAULT_MIX = "browse=5,purchase=3,admin=1,events=1"
+
+
+def parse_mix(raw: str) -> Dict[str, float]:
+    """"browse=5,purchase=3" -> weights; raises ValueError on unknown scenarios or bad weights."""
+    mix: Dict[str, float] = {}
+    for part in (raw or "").split(","):
+        part = part.strip()
+        if not part:
+            continue
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in SCENARIOS:
+            raise ValueError(f"Unknown scenario {name!r}. Choose from {sorted(SCENARIOS)}")
+        w = float(weight) if weight.strip() else 1.0
+        if w < 0:
+            raise ValueError(f"Negative weight for {name!r}")
+        if w > 0:
+            mix[name] = w
+    if not mix:
+        raise ValueError("Workload mix is empty")
+    return mix
@@ -86,7 +86,8 @@ async function apiGetPng(path, opts) {
     const headers = Object.assign({}, (opts && opts.headers) || {});
     const adminKey = getAdminKey();
     if (adminKey) headers["X-Admin-Key"] = adminKey;
-    res = await fetch(`${API_BASE}${path}`, { headers, cache: "no-store" });
+    // "no-cache" revalidates with the chart's ETag, so unchanged charts come back as 304 from the browser cache.
+    res = await fetch(`${API_BASE}${path}`, { headers, cache: "no-cache" });
   } catch {
     throw new Error("Backend not reachable. Start server with: make dev");
   }
@@ -106,7 +107,7 @@ async function apiGetPng(path, opts) {
     }
     throw new Error(msg);
   }
-  return true;
+  return res.blob();
 }
 
 async function apiPost(path, body, opts) {
@@ -579,18 +580,33 @@ async function refreshAnalyticsCharts() {
   const categoryLevel = encodeURIComponent(strVal("categoryLevel", "category_l1"));
 
   const endpoints = [
-    ["sales_trend", `${API_ADMIN}/analytics/sales_trend?window_days=${trendDays}`],
-    ["orders_vs_revenue", `${API_ADMIN}/analytics/orders_vs_revenue?window_days=${trendDays}`],
-    ["funnel_conversion", `${API_ADMIN}/analytics/funnel_conversion?window_days=${perfDays}`],
-    ["top_products", `${API_ADMIN}/analytics/top_products?window_days=${perfDays}&top_n=${topN}`],
-    ["category_contribution", `${API_ADMIN}/analytics/category_contribution?window_days=${perfDays}&level=${categoryLevel}&top_n=${topN}`],
-    ["refund_leakage", `${API_ADMIN}/analytics/refund_leakage?window_days=${trendDays}`],
+    ["sales_trend", "imgSalesTrend", `${API_ADMIN}/analytics/sales_trend?window_days=${trendDays}`],
+    ["orders_vs_revenue", "imgOrdersVsRevenue", `${API_ADMIN}/analytics/orders_vs_revenue?window_days=${trendDays}`],
+    ["funnel_conversion", "imgFunnelConversion", `${API_ADMIN}/analytics/funnel_conversion?window_days=${perfDays}`],
+    ["top_products", "imgTopProducts", `${API_ADMIN}/analytics/top_products?window_days=${perfDays}&top_n=${topN}`],
+    ["category_contribution", "imgCategoryContribution", `${API_ADMIN}/analytics/category_contribution?window_days=${perfDays}&level=${categoryLevel}&top_n=${topN}`],
+    ["refund_leakage", "imgRefundLeakage", `${API_ADMIN}/analytics/refund_leakage?window_days=${trendDays}`],
   ];
 
+  // Show exactly the PNG each request returned instead of re-reading the shared /static copy,
+  // which another admin may have just re-rendered with different parameters.
+  const setImg = (id, blob) => {
+    const el = document.getElementById(id);
+    if (!el) return;
+    const prev = el.dataset.objectUrl;
+    const url = URL.createObjectURL(blob);
+    el.dataset.objectUrl = url;
+    el.src = url;
+    if (prev) URL.revokeObjectURL(prev);
+  };
+
   const results = await Promise.allSettled(
-    endpoints.map(([name, url]) =>
+    endpoints.map(([name, imgId, url]) =>
       apiGetPng(url).then(
-        () => ({ name, ok: true }),
+        (blob) => {
+          setImg(imgId, blob);
+          return { name, ok: true };
+        },
         (e) => {
           console.error(`Error generating ${name}:`, e);
           return { name, ok: false, error: e.message || String(e) };
@@ -613,19 +629,6 @@ async function refreshAnalyticsCharts() {
     statusEl.textContent = "Charts updated.";
     if (updatedEl) updatedEl.textContent = `Updated • ${new Date().toLocaleString()}`;
   }
-
-  const bust = `t=${Date.now()}`;
-  const setImg = (id, src) => {
-    const el = document.getElementById(id);
-    if (el) el.src = `${src}?${bust}`;
-  };
-
-  setImg("imgSalesTrend", "/static/analytics/sales_trend.png");
-  setImg("imgOrdersVsRevenue", "/static/analytics/orders_vs_revenue.png");
-  setImg("imgFunnelConversion", "/static/analytics/funnel_conversion.png");
-  setImg("imgTopProducts", "/static/analytics/top_products.png");
-  setImg("imgCategoryContribution", "/static/analytics/category_contribution.png");
-  setImg("imgRefundLeakage", "/static/analytics/refund_leakage.png");
 }
 
 async function initAnalytics() {
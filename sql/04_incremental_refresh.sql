@@ -13,6 +13,24 @@ CREATE TABLE IF NOT EXISTS globalcart.kpi_snapshots (
   metric_value NUMERIC(20,4) NOT NULL
 );
 
+-- One row per incremental_refresh batch (one-shot or --daemon): the watermark window it covered,
+-- rows merged per table and per-stage latency in milliseconds.
+CREATE TABLE IF NOT EXISTS globalcart.etl_batch_runs (
+  batch_id BIGSERIAL PRIMARY KEY,
+  source_name VARCHAR(80) NOT NULL,
+  started_at TIMESTAMP NOT NULL,
+  finished_at TIMESTAMP NOT NULL,
+  window_start TIMESTAMP NOT NULL,
+  window_end TIMESTAMP NOT NULL,
+  row_counts JSONB NOT NULL,
+  stage_ms JSONB NOT NULL
+);
+
+ALTER TABLE globalcart.etl_batch_runs ADD COLUMN IF NOT EXISTS merge_ms JSONB;
+
+CREATE INDEX IF NOT EXISTS idx_etl_batch_runs_source_started
+ON globalcart.etl_batch_runs (source_name, started_at DESC);
+
 CREATE TABLE IF NOT EXISTS globalcart.stg_fact_orders (LIKE globalcart.fact_orders INCLUDING DEFAULTS);
 CREATE TABLE IF NOT EXISTS globalcart.stg_fact_order_items (LIKE globalcart.fact_order_items INCLUDING DEFAULTS);
 CREATE TABLE IF NOT EXISTS globalcart.stg_fact_payments (LIKE globalcart.fact_payments INCLUDING DEFAULTS);
@@ -286,16 +304,6 @@ RETURNS TABLE(inserted_count INT, updated_count INT)
 LANGUAGE plpgsql
 AS $$
 BEGIN
-  INSERT INTO globalcart.audit_fact_orders
-  SELECT
-    nextval('globalcart.audit_fact_orders_audit_id_seq') AS audit_id,
-    NOW() AS audit_ts,
-    'UPDATE' AS audit_action,
-    fo.*
-  FROM globalcart.fact_orders fo
-  JOIN globalcart.stg_fact_orders s ON s.order_id = fo.order_id
-  WHERE s.updated_at > fo.updated_at;
-
   WITH upserted AS (
     INSERT INTO globalcart.fact_orders (order_id, customer_id, geo_id, order_ts, order_status, channel, currency, gross_amount, discount_amount, tax_amount, net_amount, created_at, updated_at)
     SELECT order_id, customer_id, geo_id, order_ts, order_status, channel, currency, gross_amount, discount_amount, tax_amount, net_amount, created_at, updated_at
@@ -308,7 +316,19 @@ BEGIN
           net_amount = EXCLUDED.net_amount,
           updated_at = EXCLUDED.updated_at
       WHERE EXCLUDED.updated_at > globalcart.fact_orders.updated_at
-    RETURNING (xmax = 0) AS inserted
+    RETURNING order_id, (xmax = 0) AS inserted
+  ),
+  audited AS (
+    -- CTEs read the snapshot taken before this statement, so fo.* is the row as it was
+    -- before the upsert overwrote it; only keys the upsert actually updated are audited.
+    INSERT INTO globalcart.audit_fact_orders
+    SELECT
+      nextval('globalcart.audit_fact_orders_audit_id_seq') AS audit_id,
+      NOW() AS audit_ts,
+      'UPDATE' AS audit_action,
+      fo.*
+    FROM globalcart.fact_orders fo
+    JOIN upserted u ON u.order_id = fo.order_id AND NOT u.inserted
   )
   SELECT
     COUNT(*) FILTER (WHERE inserted),
@@ -374,16 +394,6 @@ RETURNS TABLE(inserted_count INT, updated_count INT)
 LANGUAGE plpgsql
 AS $$
 BEGIN
-  INSERT INTO globalcart.audit_fact_payments
-  SELECT
-    nextval('globalcart.audit_fact_payments_audit_id_seq') AS audit_id,
-    NOW() AS audit_ts,
-    'UPDATE' AS audit_action,
-    p.*
-  FROM globalcart.fact_payments p
-  JOIN globalcart.stg_fact_payments s ON s.payment_id = p.payment_id
-  WHERE s.updated_at > p.updated_at;
-
   WITH upserted AS (
     INSERT INTO globalcart.fact_payments (payment_id, order_id, payment_method, payment_status, payment_provider, amount, gateway_fee_amount, authorized_ts, captured_ts, failure_reason, refund_amount, chargeback_flag, created_at, updated_at)
     SELECT payment_id, order_id, payment_method, payment_status, payment_provider, amount, gateway_fee_amount, authorized_ts, captured_ts, failure_reason, refund_amount, chargeback_flag, created_at, updated_at
@@ -397,7 +407,17 @@ BEGIN
           gateway_fee_amount = EXCLUDED.gateway_fee_amount,
           updated_at = EXCLUDED.updated_at
       WHERE EXCLUDED.updated_at > globalcart.fact_payments.updated_at
-    RETURNING (xmax = 0) AS inserted
+    RETURNING payment_id, (xmax = 0) AS inserted
+  ),
+  audited AS (
+    INSERT INTO globalcart.audit_fact_payments
+    SELECT
+      nextval('globalcart.audit_fact_payments_audit_id_seq') AS audit_id,
+      NOW() AS audit_ts,
+      'UPDATE' AS audit_action,
+      p.*
+    FROM globalcart.fact_payments p
+    JOIN upserted u ON u.payment_id = p.payment_id AND NOT u.inserted
   )
   SELECT
     COUNT(*) FILTER (WHERE inserted),
@@ -414,16 +434,6 @@ RETURNS TABLE(inserted_count INT, updated_count INT)
 LANGUAGE plpgsql
 AS $$
 BEGIN
-  INSERT INTO globalcart.audit_fact_shipments
-  SELECT
-    nextval('globalcart.audit_fact_shipments_audit_id_seq') AS audit_id,
-    NOW() AS audit_ts,
-    'UPDATE' AS audit_action,
-    s0.*
-  FROM globalcart.fact_shipments s0
-  JOIN globalcart.stg_fact_shipments s ON s.shipment_id = s0.shipment_id
-  WHERE s.updated_at > s0.updated_at;
-
   WITH upserted AS (
     INSERT INTO globalcart.fact_shipments (shipment_id, order_id, fc_id, carrier, shipped_ts, promised_delivery_dt, delivered_dt, shipping_cost, sla_breached_flag, created_at, updated_at)
     SELECT shipment_id, order_id, fc_id, carrier, shipped_ts, promised_delivery_dt, delivered_dt, shipping_cost, sla_breached_flag, created_at, updated_at
@@ -434,7 +444,17 @@ BEGIN
           sla_breached_flag = EXCLUDED.sla_breached_flag,
           updated_at = EXCLUDED.updated_at
       WHERE EXCLUDED.updated_at > globalcart.fact_shipments.updated_at
-    RETURNING (xmax = 0) AS inserted
+    RETURNING shipment_id, (xmax = 0) AS inserted
+  ),
+  audited AS (
+    INSERT INTO globalcart.audit_fact_shipments
+    SELECT
+      nextval('globalcart.audit_fact_shipments_audit_id_seq') AS audit_id,
+      NOW() AS audit_ts,
+      'UPDATE' AS audit_action,
+      s0.*
+    FROM globalcart.fact_shipments s0
+    JOIN upserted u ON u.shipment_id = s0.shipment_id AND NOT u.inserted
   )
   SELECT
     COUNT(*) FILTER (WHERE inserted),
@@ -451,16 +471,6 @@ RETURNS TABLE(inserted_count INT, updated_count INT)
 LANGUAGE plpgsql
 AS $$
 BEGIN
-  INSERT INTO globalcart.audit_fact_returns
-  SELECT
-    nextval('globalcart.audit_fact_returns_audit_id_seq') AS audit_id,
-    NOW() AS audit_ts,
-    'UPDATE' AS audit_action,
-    r0.*
-  FROM globalcart.fact_returns r0
-  JOIN globalcart.stg_fact_returns s ON s.return_id = r0.return_id
-  WHERE s.updated_at > r0.updated_at;
-
   WITH upserted AS (
     INSERT INTO globalcart.fact_returns (return_id, order_id, order_item_id, product_id, return_ts, return_reason, refund_amount, return_status, restocked_flag, created_at, updated_at)
     SELECT return_id, order_id, order_item_id, product_id, return_ts, return_reason, refund_amount, return_status, restocked_flag, created_at, updated_at
@@ -471,7 +481,17 @@ BEGIN
           restocked_flag = EXCLUDED.restocked_flag,
           updated_at = EXCLUDED.updated_at
       WHERE EXCLUDED.updated_at > globalcart.fact_returns.updated_at
-    RETURNING (xmax = 0) AS inserted
+    RETURNING return_id, (xmax = 0) AS inserted
+  ),
+  audited AS (
+    INSERT INTO globalcart.audit_fact_returns
+    SELECT
+      nextval('globalcart.audit_fact_returns_audit_id_seq') AS audit_id,
+      NOW() AS audit_ts,
+      'UPDATE' AS audit_action,
+      r0.*
+    FROM globalcart.fact_returns r0
+    JOIN upserted u ON u.return_id = r0.return_id AND NOT u.inserted
   )
   SELECT
     COUNT(*) FILTER (WHERE inserted),
@@ -482,3 +502,28 @@ BEGIN
   TRUNCATE TABLE globalcart.stg_fact_returns;
   RETURN QUERY SELECT inserted_count, updated_count;
 END $$;
+
+-- All eight staging merges in FK order inside the caller's transaction, with per-table timings.
+-- One round trip instead of eight; commit once afterwards so the batch lands atomically.
+CREATE OR REPLACE FUNCTION globalcart.merge_all_from_stg()
+RETURNS TABLE(table_name TEXT, inserted_count INT, updated_count INT, elapsed_ms NUMERIC)
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  t TEXT;
+  t0 TIMESTAMPTZ;
+BEGIN
+  FOREACH t IN ARRAY ARRAY[
+    'dim_customer', 'dim_product',
+    'fact_orders',
+    'fact_order_items', 'fact_payments', 'fact_shipments', 'fact_funnel_events',
+    'fact_returns'
+  ] LOOP
+    t0 := clock_timestamp();
+    EXECUTE format('SELECT inserted_count, updated_count FROM globalcart.%I()', 'upsert_' || t || '_from_stg')
+    INTO inserted_count, updated_count;
+    table_name := t;
+    elapsed_ms := ROUND((EXTRACT(EPOCH FROM clock_timestamp() - t0) * 1000)::NUMERIC, 1);
+    RETURN NEXT;
+  END LOOP;
+END $$;
@@ -396,6 +396,13 @@ LEFT JOIN globalcart.dim_date d_last ON d_last.date_value = r.last_order_dt;
 CREATE UNIQUE INDEX IF NOT EXISTS ux_mart_customer_segments_customer_id ON globalcart.mart_customer_segments(customer_id);
 CREATE INDEX IF NOT EXISTS ix_mart_customer_segments_geo_id ON globalcart.mart_customer_segments(geo_id);
 
+-- 'bi_marts' watermark: bumped on every mart rebuild so consumers (e.g. cached admin charts) can tell
+-- when mart data changed without re-querying the marts themselves.
+CREATE TABLE IF NOT EXISTS globalcart.etl_watermarks (
+  source_name VARCHAR(80) PRIMARY KEY,
+  last_processed_ts TIMESTAMP NOT NULL
+);
+
 CREATE OR REPLACE FUNCTION globalcart.refresh_bi_marts() RETURNS void AS $$
 BEGIN
   REFRESH MATERIALIZED VIEW globalcart.mart_exec_daily_kpis;
@@ -403,5 +410,15 @@ BEGIN
   REFRESH MATERIALIZED VIEW globalcart.mart_funnel_conversion;
   REFRESH MATERIALIZED VIEW globalcart.mart_product_performance;
   REFRESH MATERIALIZED VIEW globalcart.mart_customer_segments;
+
+  INSERT INTO globalcart.etl_watermarks(source_name, last_processed_ts)
+  VALUES ('bi_marts', clock_timestamp()::timestamp)
+  ON CONFLICT (source_name) DO UPDATE
+  SET last_processed_ts = EXCLUDED.last_processed_ts;
 END;
 $$ LANGUAGE plpgsql;
+
+INSERT INTO globalcart.etl_watermarks(source_name, last_processed_ts)
+VALUES ('bi_marts', clock_timestamp()::timestamp)
+ON CONFLICT (source_name) DO UPDATE
+SET last_processed_ts = EXCLUDED.last_processed_ts;
@@ -19,6 +19,34 @@ CREATE TABLE IF NOT EXISTS globalcart.customer_cart_items (
 CREATE INDEX IF NOT EXISTS idx_customer_cart_items_customer_updated
 ON globalcart.customer_cart_items (customer_id, updated_at DESC);
 
+-- Bumped by trigger on every cart change; API workers key their cached cart summaries on it.
+CREATE TABLE IF NOT EXISTS globalcart.customer_cart_versions (
+  customer_id BIGINT PRIMARY KEY,
+  version BIGINT NOT NULL DEFAULT 0,
+  updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+CREATE OR REPLACE FUNCTION globalcart.bump_customer_cart_version() RETURNS trigger AS $$
+BEGIN
+  INSERT INTO globalcart.customer_cart_versions (customer_id, version, updated_at)
+  VALUES (COALESCE(NEW.customer_id, OLD.customer_id), 1, NOW())
+  ON CONFLICT (customer_id) DO UPDATE
+  SET version = globalcart.customer_cart_versions.version + 1,
+      updated_at = EXCLUDED.updated_at;
+  IF TG_OP = 'UPDATE' AND NEW.customer_id <> OLD.customer_id THEN
+    UPDATE globalcart.customer_cart_versions
+    SET version = version + 1, updated_at = NOW()
+    WHERE customer_id = OLD.customer_id;
+  END IF;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_customer_cart_items_version ON globalcart.customer_cart_items;
+CREATE TRIGGER trg_customer_cart_items_version
+AFTER INSERT OR UPDATE OR DELETE ON globalcart.customer_cart_items
+FOR EACH ROW EXECUTE FUNCTION globalcart.bump_customer_cart_version();
+
 CREATE TABLE IF NOT EXISTS globalcart.promo_codes (
   code VARCHAR(40) PRIMARY KEY,
   discount_type VARCHAR(20) NOT NULL,
@@ -83,5 +111,35 @@ ON globalcart.app_email_outbox (customer_id, created_at DESC);
 CREATE INDEX IF NOT EXISTS idx_app_email_outbox_order_created
 ON globalcart.app_email_outbox (order_id, created_at DESC);
 
+-- Delivery bookkeeping for backend/outbox.py (claims due rows with FOR UPDATE SKIP LOCKED).
+-- Rows queued before the dispatcher existed were never meant to be mailed later, so the first run
+-- of this block moves them out of PENDING (and drops any OTP they hold) instead of delivering the
+-- whole backlog on the first deploy.
+DO $$
+BEGIN
+  IF NOT EXISTS (
+    SELECT 1 FROM information_schema.columns
+    WHERE table_schema = 'globalcart' AND table_name = 'app_email_outbox' AND column_name = 'next_attempt_at'
+  ) THEN
+    ALTER TABLE globalcart.app_email_outbox
+      ADD COLUMN IF NOT EXISTS attempts INTEGER NOT NULL DEFAULT 0,
+      ADD COLUMN next_attempt_at TIMESTAMPTZ NULL;
+
+    UPDATE globalcart.app_email_outbox
+    SET status = 'SKIPPED',
+        error = 'queued before outbox delivery was enabled',
+        body = CASE WHEN kind IN ('OTP_LOGIN', 'OTP_SIGNUP') THEN '[redacted]' ELSE body END
+    WHERE status = 'PENDING';
+  END IF;
+END $$;
+
+-- Mail that is pointless after a deadline (OTP codes) is failed instead of sent once it passes.
+ALTER TABLE IF EXISTS globalcart.app_email_outbox
+  ADD COLUMN IF NOT EXISTS expires_at TIMESTAMPTZ NULL;
+
+CREATE INDEX IF NOT EXISTS idx_app_email_outbox_undelivered
+ON globalcart.app_email_outbox (email_id)
+WHERE status IN ('PENDING', 'SENDING');
+
 ALTER TABLE IF EXISTS globalcart.customer_addresses
   ADD COLUMN IF NOT EXISTS label VARCHAR(40);
@@ -0,0 +1,108 @@
+CREATE SCHEMA IF NOT EXISTS globalcart;
+
+-- Shared API rate-limit state (RATE_LIMIT_BACKEND=postgres). UNLOGGED: losing buckets on a crash
+-- only resets limits, and skipping WAL keeps the per-request upsert cheap.
+CREATE UNLOGGED TABLE IF NOT EXISTS globalcart.api_rate_limits (
+  bucket_key TEXT PRIMARY KEY,
+  tokens DOUBLE PRECISION NOT NULL,
+  window_start TIMESTAMPTZ NOT NULL,
+  prev_count INTEGER NOT NULL DEFAULT 0,
+  curr_count INTEGER NOT NULL DEFAULT 0,
+  updated_at TIMESTAMPTZ NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_api_rate_limits_updated_at
+ON globalcart.api_rate_limits (updated_at);
+
+-- Token bucket: capacity p_capacity, refilled at p_rate tokens/second. One row lock per call.
+CREATE OR REPLACE FUNCTION globalcart.rate_limit_token_bucket(
+  p_key TEXT,
+  p_capacity DOUBLE PRECISION,
+  p_rate DOUBLE PRECISION
+)
+RETURNS TABLE (allowed BOOLEAN, remaining DOUBLE PRECISION, retry_after DOUBLE PRECISION)
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  v_now TIMESTAMPTZ := clock_timestamp();
+  v_tokens DOUBLE PRECISION;
+BEGIN
+  INSERT INTO globalcart.api_rate_limits AS rl (bucket_key, tokens, window_start, updated_at)
+  VALUES (p_key, p_capacity, v_now, v_now)
+  ON CONFLICT (bucket_key) DO UPDATE
+  SET tokens = LEAST(p_capacity, rl.tokens + GREATEST(0, EXTRACT(EPOCH FROM (v_now - rl.updated_at))) * p_rate),
+      updated_at = v_now
+  RETURNING rl.tokens INTO v_tokens;
+
+  IF v_tokens >= 1 THEN
+    UPDATE globalcart.api_rate_limits SET tokens = v_tokens - 1 WHERE bucket_key = p_key;
+    RETURN QUERY SELECT TRUE, v_tokens - 1, 0::DOUBLE PRECISION;
+  ELSE
+    RETURN QUERY SELECT FALSE, v_tokens, (1 - v_tokens) / NULLIF(p_rate, 0);
+  END IF;
+END;
+$$;
+
+-- Sliding-window counter: weights the previous fixed window by how much of it still overlaps.
+CREATE OR REPLACE FUNCTION globalcart.rate_limit_sliding_window(
+  p_key TEXT,
+  p_limit INTEGER,
+  p_window_seconds DOUBLE PRECISION
+)
+RETURNS TABLE (allowed BOOLEAN, remaining DOUBLE PRECISION, retry_after DOUBLE PRECISION)
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  v_now TIMESTAMPTZ := clock_timestamp();
+  v_row globalcart.api_rate_limits%ROWTYPE;
+  v_elapsed DOUBLE PRECISION;
+  v_windows BIGINT;
+  v_estimate DOUBLE PRECISION;
+BEGIN
+  INSERT INTO globalcart.api_rate_limits (bucket_key, tokens, window_start, prev_count, curr_count, updated_at)
+  VALUES (p_key, 0, v_now, 0, 0, v_now)
+  ON CONFLICT (bucket_key) DO NOTHING;
+
+  SELECT * INTO v_row FROM globalcart.api_rate_limits WHERE bucket_key = p_key FOR UPDATE;
+
+  v_elapsed := EXTRACT(EPOCH FROM (v_now - v_row.window_start));
+  IF v_elapsed >= p_window_seconds THEN
+    v_windows := FLOOR(v_elapsed / p_window_seconds);
+    v_row.prev_count := CASE WHEN v_windows = 1 THEN v_row.curr_count ELSE 0 END;
+    v_row.curr_count := 0;
+    v_row.window_start := v_row.window_start + make_interval(secs => v_windows * p_window_seconds);
+    v_elapsed := EXTRACT(EPOCH FROM (v_now - v_row.window_start));
+  END IF;
+
+  v_estimate := v_row.prev_count * (1 - v_elapsed / p_window_seconds) + v_row.curr_count;
+  IF v_estimate + 1 <= p_limit THEN
+    v_row.curr_count := v_row.curr_count + 1;
+  END IF;
+
+  UPDATE globalcart.api_rate_limits
+  SET window_start = v_row.window_start,
+      prev_count = v_row.prev_count,
+      curr_count = v_row.curr_count,
+      updated_at = v_now
+  WHERE bucket_key = p_key;
+
+  IF v_estimate + 1 <= p_limit THEN
+    RETURN QUERY SELECT TRUE, p_limit - v_estimate - 1, 0::DOUBLE PRECISION;
+  ELSE
+    RETURN QUERY SELECT FALSE, 0::DOUBLE PRECISION, p_window_seconds - v_elapsed;
+  END IF;
+END;
+$$;
+
+-- Buckets idle for longer than any configured window carry no state worth keeping.
+CREATE OR REPLACE FUNCTION globalcart.rate_limit_purge(p_idle_seconds INTEGER)
+RETURNS INTEGER
+LANGUAGE sql
+AS $$
+WITH d AS (
+  DELETE FROM globalcart.api_rate_limits
+  WHERE updated_at < clock_timestamp() - make_interval(secs => p_idle_seconds)
+  RETURNING 1
+)
+SELECT COUNT(*)::int FROM d;
+$$;
@@ -0,0 +1,93 @@
+CREATE SCHEMA IF NOT EXISTS globalcart;
+
+-- Read model for the customer order list and order timeline: one row per order with its items
+-- and the shipment/cancellation timestamps the API derives PLACED/SHIPPED/DELIVERED/CANCELLED from.
+-- Kept current by the checkout, payment and cancel routes and the ETL scripts via
+-- refresh_customer_order_history(); rebuild with: python3 -m src.backfill_order_history
+CREATE TABLE IF NOT EXISTS globalcart.customer_order_history (
+  order_id BIGINT PRIMARY KEY,
+  customer_id BIGINT NOT NULL,
+  order_ts TIMESTAMP NOT NULL,
+  order_status VARCHAR(30) NOT NULL,
+  net_amount NUMERIC(14,2) NOT NULL,
+  items JSONB NOT NULL DEFAULT '[]'::jsonb,
+  shipped_ts TIMESTAMP NULL,
+  delivered_dt DATE NULL,
+  cancelled_at TIMESTAMPTZ NULL,
+  cancel_reason TEXT NULL,
+  refreshed_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_customer_order_history_customer_ts
+ON globalcart.customer_order_history (customer_id, order_ts DESC);
+
+-- Re-derive the given orders (all orders when p_order_ids is NULL). Rows for orders that no
+-- longer exist in fact_orders are dropped.
+CREATE OR REPLACE FUNCTION globalcart.refresh_customer_order_history(p_order_ids BIGINT[] DEFAULT NULL)
+RETURNS INTEGER
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  v_rows INTEGER;
+BEGIN
+  DELETE FROM globalcart.customer_order_history h
+  WHERE (p_order_ids IS NULL OR h.order_id = ANY(p_order_ids))
+    AND NOT EXISTS (SELECT 1 FROM globalcart.fact_orders o WHERE o.order_id = h.order_id);
+
+  INSERT INTO globalcart.customer_order_history AS h (
+    order_id, customer_id, order_ts, order_status, net_amount, items,
+    shipped_ts, delivered_dt, cancelled_at, cancel_reason, refreshed_at
+  )
+  SELECT
+    o.order_id,
+    o.customer_id,
+    o.order_ts,
+    o.order_status,
+    o.net_amount,
+    COALESCE(i.items, '[]'::jsonb),
+    s.shipped_ts,
+    s.delivered_dt,
+    c.created_at,
+    c.reason,
+    NOW()
+  FROM globalcart.fact_orders o
+  LEFT JOIN LATERAL (
+    SELECT jsonb_agg(
+      jsonb_build_object('product_id', oi.product_id, 'product_name', p.product_name, 'qty', oi.qty)
+      ORDER BY oi.product_id
+    ) AS items
+    FROM globalcart.fact_order_items oi
+    JOIN globalcart.dim_product p ON p.product_id = oi.product_id
+    WHERE oi.order_id = o.order_id
+  ) i ON TRUE
+  LEFT JOIN LATERAL (
+    SELECT MAX(fs.shipped_ts) AS shipped_ts, MAX(fs.delivered_dt) AS delivered_dt
+    FROM globalcart.fact_shipments fs
+    WHERE fs.order_id = o.order_id
+  ) s ON TRUE
+  LEFT JOIN LATERAL (
+    SELECT oc.created_at, oc.reason
+    FROM globalcart.order_cancellations oc
+    WHERE oc.order_id = o.order_id AND oc.customer_id = o.customer_id
+    ORDER BY oc.created_at DESC
+    LIMIT 1
+  ) c ON TRUE
+  WHERE p_order_ids IS NULL OR o.order_id = ANY(p_order_ids)
+  ON CONFLICT (order_id) DO UPDATE
+  SET customer_id = EXCLUDED.customer_id,
+      order_ts = EXCLUDED.order_ts,
+      order_status = EXCLUDED.order_status,
+      net_amount = EXCLUDED.net_amount,
+      items = EXCLUDED.items,
+      shipped_ts = EXCLUDED.shipped_ts,
+      delivered_dt = EXCLUDED.delivered_dt,
+      cancelled_at = EXCLUDED.cancelled_at,
+      cancel_reason = EXCLUDED.cancel_reason,
+      refreshed_at = EXCLUDED.refreshed_at;
+
+  GET DIAGNOSTICS v_rows = ROW_COUNT;
+  RETURN v_rows;
+END;
+$$;
+
+SELECT globalcart.refresh_customer_order_history();
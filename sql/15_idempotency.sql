@@ -0,0 +1,48 @@
+CREATE SCHEMA IF NOT EXISTS globalcart;
+
+-- Idempotency-Key records for the checkout/order/payment POSTs. A retry with the same key is
+-- answered from response_body with one primary-key read; IN_PROGRESS rows make concurrent
+-- duplicates wait for the first request instead of running the write transaction again.
+-- request_hash is the SHA-256 of the request body, so a key reused for a different request is
+-- rejected rather than replayed.
+CREATE TABLE IF NOT EXISTS globalcart.idempotency_keys (
+  customer_id BIGINT NOT NULL,
+  endpoint VARCHAR(64) NOT NULL,
+  idempotency_key VARCHAR(255) NOT NULL,
+  request_hash CHAR(64) NOT NULL,
+  status VARCHAR(12) NOT NULL DEFAULT 'IN_PROGRESS' CHECK (status IN ('IN_PROGRESS', 'COMPLETED')),
+  response_code SMALLINT NULL,
+  response_body JSONB NULL,
+  claim_token VARCHAR(32) NULL,
+  locked_until TIMESTAMPTZ NULL,
+  created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+  expires_at TIMESTAMPTZ NOT NULL,
+  PRIMARY KEY (customer_id, endpoint, idempotency_key)
+);
+
+-- Identifies the request holding an IN_PROGRESS row. The response is stored in the handler's own
+-- transaction only while that request still holds the claim, so a request whose lease expired and
+-- was taken over rolls back instead of writing twice.
+ALTER TABLE globalcart.idempotency_keys ADD COLUMN IF NOT EXISTS claim_token VARCHAR(32) NULL;
+
+CREATE INDEX IF NOT EXISTS idx_idempotency_keys_expires_at
+ON globalcart.idempotency_keys (expires_at);
+
+-- Delete up to p_limit expired keys; called periodically by the API workers.
+CREATE OR REPLACE FUNCTION globalcart.idempotency_purge(p_limit INTEGER DEFAULT 1000)
+RETURNS INTEGER
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  v_deleted INTEGER;
+BEGIN
+  DELETE FROM globalcart.idempotency_keys
+  WHERE ctid IN (
+    SELECT ctid FROM globalcart.idempotency_keys
+    WHERE expires_at < NOW()
+    LIMIT p_limit
+  );
+  GET DIAGNOSTICS v_deleted = ROW_COUNT;
+  RETURN v_deleted;
+END;
+$$;
@@ -0,0 +1,165 @@
+CREATE SCHEMA IF NOT EXISTS globalcart;
+
+-- Incremental state for the offline analytics jobs (src/analytics). Each job keeps compact
+-- per-customer aggregates here and, on later runs, re-derives only customers whose orders, order
+-- items or returns changed since its watermark. source_relfilenode is fact_orders' relfilenode at
+-- the last run: a TRUNCATE or reload gives the table a new one, which forces the next run to
+-- rebuild from scratch.
+CREATE TABLE IF NOT EXISTS globalcart.analytics_state (
+  job_name VARCHAR(80) PRIMARY KEY,
+  watermark_ts TIMESTAMP NOT NULL,
+  source_relfilenode OID NOT NULL,
+  updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+-- "Orders changed since" lookups for the incremental jobs.
+CREATE INDEX IF NOT EXISTS idx_fact_orders_updated_at ON globalcart.fact_orders(updated_at);
+
+-- RFM inputs per customer over vw_orders_completed (src/analytics/rfm.py).
+CREATE TABLE IF NOT EXISTS globalcart.rfm_customer_state (
+  customer_id BIGINT PRIMARY KEY,
+  last_order_ts TIMESTAMP NOT NULL,
+  frequency INTEGER NOT NULL,
+  monetary NUMERIC(16,2) NOT NULL,
+  refreshed_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+-- Re-aggregate the given customers (all customers when p_customer_ids is NULL). Customers left
+-- with no completed orders are removed. Returns the number of customers written.
+CREATE OR REPLACE FUNCTION globalcart.refresh_rfm_customer_state(p_customer_ids BIGINT[] DEFAULT NULL)
+RETURNS INTEGER
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  n INTEGER;
+BEGIN
+  IF p_customer_ids IS NULL THEN
+    TRUNCATE TABLE globalcart.rfm_customer_state;
+  ELSE
+    DELETE FROM globalcart.rfm_customer_state WHERE customer_id = ANY(p_customer_ids);
+  END IF;
+
+  INSERT INTO globalcart.rfm_customer_state (customer_id, last_order_ts, frequency, monetary)
+  SELECT customer_id, MAX(order_ts), COUNT(DISTINCT order_id), COALESCE(SUM(net_amount), 0)
+  FROM globalcart.vw_orders_completed
+  WHERE p_customer_ids IS NULL OR customer_id = ANY(p_customer_ids)
+  GROUP BY customer_id;
+
+  GET DIAGNOSTICS n = ROW_COUNT;
+  RETURN n;
+END $$;
+
+-- Cohort/churn inputs (src/analytics/churn_cohort.py): first and last completed order per customer,
+-- and one row per customer per month with a completed order. The cohort matrix and the churn list
+-- are derived from these instead of scanning vw_orders_completed.
+CREATE TABLE IF NOT EXISTS globalcart.customer_first_purchase (
+  customer_id BIGINT PRIMARY KEY,
+  first_order_ts TIMESTAMP NOT NULL,
+  cohort_month TIMESTAMP NOT NULL,
+  last_order_ts TIMESTAMP NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_customer_first_purchase_last_order
+ON globalcart.customer_first_purchase (last_order_ts);
+
+CREATE TABLE IF NOT EXISTS globalcart.customer_activity (
+  customer_id BIGINT NOT NULL,
+  activity_month TIMESTAMP NOT NULL,
+  PRIMARY KEY (customer_id, activity_month)
+);
+
+-- Same contract as refresh_rfm_customer_state(); returns the number of customers written.
+CREATE OR REPLACE FUNCTION globalcart.refresh_customer_cohort_state(p_customer_ids BIGINT[] DEFAULT NULL)
+RETURNS INTEGER
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  n INTEGER;
+BEGIN
+  IF p_customer_ids IS NULL THEN
+    TRUNCATE TABLE globalcart.customer_first_purchase, globalcart.customer_activity;
+  ELSE
+    DELETE FROM globalcart.customer_first_purchase WHERE customer_id = ANY(p_customer_ids);
+    DELETE FROM globalcart.customer_activity WHERE customer_id = ANY(p_customer_ids);
+  END IF;
+
+  INSERT INTO globalcart.customer_activity (customer_id, activity_month)
+  SELECT DISTINCT customer_id, date_trunc('month', order_ts)
+  FROM globalcart.vw_orders_completed
+  WHERE p_customer_ids IS NULL OR customer_id = ANY(p_customer_ids);
+
+  INSERT INTO globalcart.customer_first_purchase (customer_id, first_order_ts, cohort_month, last_order_ts)
+  SELECT customer_id, MIN(order_ts), date_trunc('month', MIN(order_ts)), MAX(order_ts)
+  FROM globalcart.vw_orders_completed
+  WHERE p_customer_ids IS NULL OR customer_id = ANY(p_customer_ids)
+  GROUP BY customer_id;
+
+  GET DIAGNOSTICS n = ROW_COUNT;
+  RETURN n;
+END $$;
+
+-- Outlier inputs per customer (src/analytics/outliers.py): per-order discount share over completed
+-- orders and return totals. percentile_cont matches pandas' default (linear) quantile. Same
+-- contract as refresh_rfm_customer_state(); customers with no completed orders are not kept.
+CREATE TABLE IF NOT EXISTS globalcart.customer_outlier_stats (
+  customer_id BIGINT PRIMARY KEY,
+  orders INTEGER NOT NULL,
+  avg_discount_pct DOUBLE PRECISION NOT NULL,
+  p95_discount_pct DOUBLE PRECISION NOT NULL,
+  net_revenue NUMERIC(16,2) NOT NULL,
+  return_lines INTEGER NOT NULL,
+  refund_amount NUMERIC(16,2) NOT NULL,
+  refreshed_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+CREATE OR REPLACE FUNCTION globalcart.refresh_customer_outlier_stats(p_customer_ids BIGINT[] DEFAULT NULL)
+RETURNS INTEGER
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  n INTEGER;
+BEGIN
+  IF p_customer_ids IS NULL THEN
+    TRUNCATE TABLE globalcart.customer_outlier_stats;
+  ELSE
+    DELETE FROM globalcart.customer_outlier_stats WHERE customer_id = ANY(p_customer_ids);
+  END IF;
+
+  INSERT INTO globalcart.customer_outlier_stats
+    (customer_id, orders, avg_discount_pct, p95_discount_pct, net_revenue, return_lines, refund_amount)
+  WITH per_order AS (
+    SELECT o.customer_id,
+           i.order_id,
+           CASE WHEN SUM(i.line_net_revenue + i.line_discount) = 0 THEN 0.0
+                ELSE 100.0 * SUM(i.line_discount) / SUM(i.line_net_revenue + i.line_discount)
+           END::float8 AS discount_pct,
+           SUM(i.line_net_revenue) AS net_revenue
+    FROM globalcart.fact_order_items i
+    JOIN globalcart.vw_orders_completed o ON o.order_id = i.order_id
+    WHERE p_customer_ids IS NULL OR o.customer_id = ANY(p_customer_ids)
+    GROUP BY 1, 2
+  ),
+  per_customer AS (
+    SELECT customer_id,
+           COUNT(*) AS orders,
+           AVG(discount_pct) AS avg_discount_pct,
+           percentile_cont(0.95) WITHIN GROUP (ORDER BY discount_pct) AS p95_discount_pct,
+           SUM(net_revenue) AS net_revenue
+    FROM per_order
+    GROUP BY 1
+  ),
+  returns AS (
+    SELECT o.customer_id, COUNT(*) AS return_lines, SUM(r.refund_amount) AS refund_amount
+    FROM globalcart.fact_returns r
+    JOIN globalcart.fact_orders o ON o.order_id = r.order_id
+    WHERE p_customer_ids IS NULL OR o.customer_id = ANY(p_customer_ids)
+    GROUP BY 1
+  )
+  SELECT c.customer_id, c.orders, c.avg_discount_pct, c.p95_discount_pct, c.net_revenue,
+         COALESCE(r.return_lines, 0), COALESCE(r.refund_amount, 0)
+  FROM per_customer c
+  LEFT JOIN returns r ON r.customer_id = c.customer_id;
+
+  GET DIAGNOSTICS n = ROW_COUNT;
+  RETURN n;
+END $$;
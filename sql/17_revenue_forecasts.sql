@@ -0,0 +1,14 @@
+CREATE SCHEMA IF NOT EXISTS globalcart;
+
+-- Daily net revenue forecasts per segment from src/analytics/forecasting.py, replaced on every run.
+-- segment_type is one of total / channel / region / country / category_l1 / category_l2;
+-- forecast_arima is NULL where ARIMA(1,1,1) could not be fitted (e.g. too short a history).
+CREATE TABLE IF NOT EXISTS globalcart.revenue_forecasts (
+  segment_type VARCHAR(20) NOT NULL,
+  segment_value VARCHAR(60) NOT NULL,
+  forecast_dt DATE NOT NULL,
+  forecast_lr DOUBLE PRECISION NOT NULL,
+  forecast_arima DOUBLE PRECISION,
+  generated_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+  PRIMARY KEY (segment_type, segment_value, forecast_dt)
+);
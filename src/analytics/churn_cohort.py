@@ -1,53 +1,49 @@
 from __future__ import annotations
 
+import argparse
 import os
 
-import pandas as pd
-
 from .common import get_paths, read_sql_df
+from .state import refresh_job_state
+
+
+_JOB = "churn_cohort"
+
+_CHURN_SQL = """
+SELECT customer_id, last_order_ts
+FROM globalcart.customer_first_purchase
+WHERE last_order_ts < (CURRENT_DATE - INTERVAL '90 days')
+"""
+
+# customer_activity holds one row per customer and month, so COUNT(*) is the distinct count.
+_COHORT_SQL = """
+SELECT fp.cohort_month,
+       ((EXTRACT(YEAR FROM a.activity_month) - EXTRACT(YEAR FROM fp.cohort_month)) * 12
+        + (EXTRACT(MONTH FROM a.activity_month) - EXTRACT(MONTH FROM fp.cohort_month))) AS months_since_cohort,
+       COUNT(*) AS customers
+FROM globalcart.customer_activity a
+JOIN globalcart.customer_first_purchase fp ON fp.customer_id = a.customer_id
+GROUP BY 1,2
+ORDER BY 1,2
+"""
+
 
+def refresh_state(full: bool = False) -> int:
+    """Update customer_first_purchase/customer_activity for customers whose orders changed since the
+    last run (everyone when ``full`` or after a fact_orders reload)."""
+    return refresh_job_state(_JOB, "globalcart.refresh_customer_cohort_state", full=full)
 
-def run() -> None:
+
+def run(full: bool = False) -> None:
     paths = get_paths()
     os.makedirs(paths.data_processed_dir, exist_ok=True)
 
-    churned = read_sql_df(
-        """
-        WITH last_order AS (
-          SELECT customer_id, MAX(order_ts) AS last_order_ts
-          FROM globalcart.vw_orders_completed
-          GROUP BY 1
-        )
-        SELECT customer_id, last_order_ts
-        FROM last_order
-        WHERE last_order_ts < (CURRENT_DATE - INTERVAL '90 days')
-        """
-    )
+    refresh_state(full=full)
+
+    churned = read_sql_df(_CHURN_SQL)
     churned.to_csv(os.path.join(paths.data_processed_dir, "churned_customers_90d.csv"), index=False)
 
-    cohort = read_sql_df(
-        """
-        WITH first_purchase AS (
-          SELECT customer_id, date_trunc('month', MIN(order_ts)) AS cohort_month
-          FROM globalcart.vw_orders_completed
-          GROUP BY 1
-        ),
-        activity AS (
-          SELECT o.customer_id,
-                 fp.cohort_month,
-                 date_trunc('month', o.order_ts) AS activity_month
-          FROM globalcart.vw_orders_completed o
-          JOIN first_purchase fp ON fp.customer_id = o.customer_id
-        )
-        SELECT cohort_month,
-               ((EXTRACT(YEAR FROM activity_month) - EXTRACT(YEAR FROM cohort_month)) * 12
-                + (EXTRACT(MONTH FROM activity_month) - EXTRACT(MONTH FROM cohort_month))) AS months_since_cohort,
-               COUNT(DISTINCT customer_id) AS customers
-        FROM activity
-        GROUP BY 1,2
-        ORDER BY 1,2
-        """
-    )
+    cohort = read_sql_df(_COHORT_SQL)
 
     cohort.to_csv(os.path.join(paths.data_processed_dir, "cohort_retention_long.csv"), index=False)
 
@@ -62,7 +58,11 @@ def run() -> None:
 
 
 def main() -> None:
-    run()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--full", action="store_true", help="Rebuild the cohort state for every customer")
+    args = parser.parse_args()
+
+    run(full=args.full)
 
 
 if __name__ == "__main__":
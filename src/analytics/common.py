@@ -1,19 +1,155 @@
 from __future__ import annotations
 
+import io
+from contextlib import contextmanager
 from pathlib import Path
+from typing import Any, Iterator, Sequence
 
 import pandas as pd
 
 from ..config import Paths, PostgresConfig
 from ..db import get_engine
 
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+except ImportError:  # pyarrow is not pinned for every Python version (requirements.txt)
+    pa = None
+    pa_csv = None
+
 
 def get_paths() -> Paths:
     project_root = str(Path(__file__).resolve().parents[2])
     return Paths(project_root=project_root)
 
 
-def read_sql_df(sql: str) -> pd.DataFrame:
-    cfg = PostgresConfig()
-    engine = get_engine(cfg)
-    return pd.read_sql(sql, engine)
+# Postgres type OIDs read into typed Arrow columns; anything else is read as text.
+_INT_OIDS = {20, 21, 23}
+_FLOAT_OIDS = {700, 701}
+_NUMERIC_OID, _BOOL_OID, _DATE_OID, _TIMESTAMP_OID, _TIMESTAMPTZ_OID = 1700, 16, 1082, 1114, 1184
+
+
+def _arrow_type(oid: int, numeric_as_text: bool = False):
+    if oid in _INT_OIDS:
+        return pa.int64()
+    if oid in _FLOAT_OIDS or (oid == _NUMERIC_OID and not numeric_as_text):
+        return pa.float64()
+    if oid == _BOOL_OID:
+        return pa.bool_()
+    if oid == _DATE_OID:
+        return pa.date32()
+    if oid == _TIMESTAMP_OID:
+        return pa.timestamp("us")
+    if oid == _TIMESTAMPTZ_OID:
+        return pa.timestamp("us", tz="UTC")
+    return pa.string()
+
+
+@contextmanager
+def _raw_conn():
+    # A pooled psycopg connection from the shared engine, for COPY.
+    fairy = get_engine(PostgresConfig()).raw_connection()
+    try:
+        yield fairy.driver_connection
+        fairy.commit()
+    finally:
+        fairy.close()
+
+
+class _CopyStream(io.RawIOBase):
+    """File-like view over ``psycopg.Copy`` so Arrow can parse COPY output as it arrives."""
+
+    def __init__(self, copy) -> None:
+        self._copy = copy
+        self._buf = b""
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        while not self._buf:
+            chunk = self._copy.read()
+            if not chunk:
+                return 0
+            self._buf = bytes(chunk)
+        n = min(len(b), len(self._buf))
+        b[:n] = self._buf[:n]
+        self._buf = self._buf[n:]
+        return n
+
+
+def _to_pandas(table, dtype_backend: str) -> pd.DataFrame:
+    if dtype_backend == "pyarrow":
+        return table.to_pandas(types_mapper=pd.ArrowDtype)
+    return table.to_pandas()
+
+
+def _copy_batches(
+    conn, sql: str, params: Sequence[Any] | None, block_bytes: int, numeric_as_text: bool = False
+):
+    with conn.cursor() as cur:
+        cur.execute(f"SELECT * FROM ({sql}) AS q LIMIT 0", params)
+        schema = pa.schema([(d.name, _arrow_type(d.type_code, numeric_as_text)) for d in cur.description])
+        convert = pa_csv.ConvertOptions(
+            column_types=dict(zip(schema.names, schema.types)),
+            strings_can_be_null=True,
+            quoted_strings_can_be_null=False,  # COPY writes NULL unquoted and '' quoted
+            true_values=["t"],
+            false_values=["f"],
+        )
+        read = pa_csv.ReadOptions(column_names=schema.names, block_size=block_bytes)
+        parse = pa_csv.ParseOptions(newlines_in_values=True)  # COPY quotes text with embedded newlines
+        with cur.copy(f"COPY ({sql}) TO STDOUT WITH (FORMAT csv)", params) as copy:
+            stream = io.BufferedReader(_CopyStream(copy), buffer_size=1 << 20)
+            if not stream.peek(1):
+                # Arrow rejects an empty CSV; an empty result still gets its typed columns.
+                yield pa.RecordBatch.from_pylist([], schema=schema)
+                return
+            yield from pa_csv.open_csv(stream, read_options=read, parse_options=parse, convert_options=convert)
+
+
+def read_sql_df(
+    sql: str,
+    params: Sequence[Any] | None = None,
+    *,
+    dtype_backend: str = "numpy",
+    block_bytes: int = 16 << 20,
+    numeric_as_text: bool = False,
+) -> pd.DataFrame:
+    """Run ``sql`` and return a DataFrame with dtypes taken from the result's Postgres types.
+
+    Rows are streamed with ``COPY (sql) TO STDOUT`` into Arrow, so no per-row Python objects are
+    built. ``dtype_backend="pyarrow"`` keeps Arrow-backed columns (compact strings, nullable ints).
+    NUMERIC columns are read as float64; ``numeric_as_text=True`` keeps Postgres' own rendering
+    (``1234.50``) for exports that must not change the written digits.
+    Without pyarrow this falls back to ``pd.read_sql`` on the shared engine.
+    """
+    if pa is None:
+        return pd.read_sql(sql, get_engine(PostgresConfig()), params=tuple(params) if params else None)
+    with _raw_conn() as conn:
+        table = pa.Table.from_batches(list(_copy_batches(conn, sql, params, block_bytes, numeric_as_text)))
+    return _to_pandas(table, dtype_backend)
+
+
+def iter_sql_df(
+    sql: str,
+    params: Sequence[Any] | None = None,
+    *,
+    dtype_backend: str = "numpy",
+    block_bytes: int = 16 << 20,
+    numeric_as_text: bool = False,
+) -> Iterator[pd.DataFrame]:
+    """Like :func:`read_sql_df` but yields one DataFrame per ~``block_bytes`` of COPY output.
+
+    Memory stays bounded by the block size, so order-level reads over ``vw_orders_completed`` at
+    ``large`` scale can be reduced chunk by chunk instead of materialized whole.
+    """
+    if pa is None:
+        rows = max(1, block_bytes // 256)
+        yield from pd.read_sql(
+            sql, get_engine(PostgresConfig()), params=tuple(params) if params else None, chunksize=rows
+        )
+        return
+    with _raw_conn() as conn:
+        for batch in _copy_batches(conn, sql, params, block_bytes, numeric_as_text):
+            yield _to_pandas(pa.Table.from_batches([batch]), dtype_backend)
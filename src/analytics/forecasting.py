@@ -1,57 +1,244 @@
 from __future__ import annotations
 
+import argparse
+import concurrent.futures
+import hashlib
+import io
+import json
+import multiprocessing
 import os
+import time
+import warnings
+from pathlib import Path
 
 import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
 from sklearn.linear_model import LinearRegression
 from statsmodels.tsa.arima.model import ARIMA
+from threadpoolctl import threadpool_limits
 
+from ..config import PostgresConfig
+from ..db import get_conn
+from ..run_sql import apply_sql_files
 from .common import get_paths, read_sql_df
 
+_FORECAST_SQL = Path(__file__).resolve().parents[2] / "sql" / "17_revenue_forecasts.sql"
 
-def run(horizon_days: int = 30) -> None:
-    paths = get_paths()
-    os.makedirs(paths.data_processed_dir, exist_ok=True)
-    os.makedirs(paths.reports_dir, exist_ok=True)
+_ORDER = (1, 1, 1)
+_TOTAL = ("total", "all")
+
+# Daily completed net revenue per segment. Categories use item-level net revenue, the rest order-level.
+_SERIES_SQL = """
+SELECT 'total' AS segment_type, 'all' AS segment_value, order_dt AS dt, SUM(net_amount) AS net_revenue
+FROM globalcart.vw_orders_completed
+GROUP BY 3
+UNION ALL
+SELECT 'channel', channel, order_dt, SUM(net_amount)
+FROM globalcart.vw_orders_completed
+GROUP BY 2, 3
+UNION ALL
+SELECT 'region', g.region, o.order_dt, SUM(o.net_amount)
+FROM globalcart.vw_orders_completed o
+JOIN globalcart.dim_geo g ON g.geo_id = o.geo_id
+GROUP BY 2, 3
+UNION ALL
+SELECT 'country', g.country, o.order_dt, SUM(o.net_amount)
+FROM globalcart.vw_orders_completed o
+JOIN globalcart.dim_geo g ON g.geo_id = o.geo_id
+GROUP BY 2, 3
+UNION ALL
+SELECT 'category_l1', p.category_l1, o.order_dt, SUM(i.line_net_revenue)
+FROM globalcart.fact_order_items i
+JOIN globalcart.vw_orders_completed o ON o.order_id = i.order_id
+JOIN globalcart.dim_product p ON p.product_id = i.product_id
+GROUP BY 2, 3
+UNION ALL
+SELECT 'category_l2', p.category_l2, o.order_dt, SUM(i.line_net_revenue)
+FROM globalcart.fact_order_items i
+JOIN globalcart.vw_orders_completed o ON o.order_id = i.order_id
+JOIN globalcart.dim_product p ON p.product_id = i.product_id
+GROUP BY 2, 3
+"""
+
+_FORECAST_COLUMNS = ["segment_type", "segment_value", "forecast_dt", "forecast_lr", "forecast_arima"]
 
-    daily = read_sql_df(
-        """
-        SELECT date(order_ts) AS dt, SUM(net_amount) AS net_revenue
-        FROM globalcart.vw_orders_completed
-        GROUP BY 1
-        ORDER BY 1
-        """
-    )
 
+def segment_series(daily: pd.DataFrame) -> dict[tuple[str, str], pd.Series]:
+    """Split long ``segment_type``/``segment_value``/``dt``/``net_revenue`` rows into one daily
+    series per segment, all on the same calendar (days without revenue are 0)."""
+    daily = daily.copy()
     daily["dt"] = pd.to_datetime(daily["dt"])
-    daily = daily.set_index("dt").asfreq("D", fill_value=0.0)
+    if daily.empty:
+        return {}
+    idx = pd.date_range(daily["dt"].min(), daily["dt"].max(), freq="D", name="dt")
+    wide = daily.pivot_table(
+        index="dt", columns=["segment_type", "segment_value"], values="net_revenue", aggfunc="sum", fill_value=0.0
+    ).reindex(idx, fill_value=0.0)
+    return {key: wide[key].astype(float) for key in wide.columns}
 
-    y = daily["net_revenue"].values
-    X = np.arange(len(y)).reshape(-1, 1)
 
+def fit_series(y: np.ndarray, horizon_days: int, start_params: list[float] | None = None):
+    """Fit the linear trend and ARIMA(1,1,1) to one daily series.
+
+    Returns ``(lr_forecast, arima_forecast, arima_params)``; the ARIMA parts are None when the
+    model cannot be fitted. ``start_params`` (the previous run's parameters) warm-starts the
+    optimizer, which usually converges in a few iterations when a day or two was appended.
+    """
+    X = np.arange(len(y)).reshape(-1, 1)
     lr = LinearRegression().fit(X, y)
-    X_f = np.arange(len(y), len(y) + horizon_days).reshape(-1, 1)
-    lr_fc = lr.predict(X_f)
+    lr_fc = lr.predict(np.arange(len(y), len(y) + horizon_days).reshape(-1, 1))
+
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            model = ARIMA(y, order=_ORDER)
+            try:
+                res = model.fit(start_params=start_params)
+            except Exception:
+                if start_params is None:
+                    raise
+                res = model.fit()
+        return lr_fc, np.asarray(res.forecast(steps=horizon_days)), [float(p) for p in res.params]
+    except Exception:
+        return lr_fc, None, None
+
+
+def _init_worker() -> None:
+    # One BLAS thread per process: the pool already uses every core.
+    threadpool_limits(1)
+
+
+def _fit_task(task):
+    key, y, horizon_days, start_params = task
+    return key, fit_series(y, horizon_days, start_params)
+
+
+def _series_digest(s: pd.Series, horizon_days: int) -> str:
+    h = hashlib.sha256()
+    h.update(f"{_ORDER}|{horizon_days}|{s.index[0].date()}|{len(s)}".encode("utf-8"))
+    h.update(np.ascontiguousarray(s.to_numpy(dtype=float)).tobytes())
+    return h.hexdigest()
+
+
+def _cache_key(key: tuple[str, str]) -> str:
+    return f"{key[0]}/{key[1]}"
+
+
+def forecast_segments(
+    series: dict[tuple[str, str], pd.Series],
+    horizon_days: int = 30,
+    *,
+    workers: int = 1,
+    cache: dict | None = None,
+) -> tuple[pd.DataFrame, dict, dict[str, int]]:
+    """Forecast every series, fitting in ``workers`` processes.
+
+    ``cache`` is the model state from the previous run (see :func:`load_model_cache`): a series
+    whose history is unchanged reuses its stored forecast, others are refit warm-started from the
+    stored ARIMA parameters. Returns the long forecast frame, the new cache and fit counts.
+    """
+    cache = cache or {}
+    new_cache: dict = {}
+    counts = {"reused": 0, "warm": 0, "cold": 0, "arima_failed": 0}
+    results: dict[tuple[str, str], tuple] = {}
+
+    tasks = []
+    for key, s in series.items():
+        ck = _cache_key(key)
+        digest = _series_digest(s, horizon_days)
+        prev = cache.get(ck) or {}
+        if prev.get("digest") == digest:
+            arima = prev.get("arima")
+            results[key] = (np.asarray(prev["lr"]), None if arima is None else np.asarray(arima), prev.get("params"))
+            counts["reused"] += 1
+        else:
+            start = prev.get("params")
+            counts["warm" if start else "cold"] += 1
+            tasks.append((key, s.to_numpy(dtype=float), horizon_days, start))
+        new_cache[ck] = {"digest": digest}
 
-    arima = ARIMA(daily["net_revenue"], order=(1, 1, 1)).fit()
-    arima_fc = arima.forecast(steps=horizon_days)
+    if workers > 1 and len(tasks) > 1:
+        ctx = multiprocessing.get_context("spawn")
+        with concurrent.futures.ProcessPoolExecutor(
+            max_workers=min(workers, len(tasks)), mp_context=ctx, initializer=_init_worker
+        ) as ex:
+            chunksize = max(1, len(tasks) // (workers * 4))
+            for key, fitted in ex.map(_fit_task, tasks, chunksize=chunksize):
+                results[key] = fitted
+    else:
+        for task in tasks:
+            key, fitted = _fit_task(task)
+            results[key] = fitted
 
-    future_idx = pd.date_range(daily.index.max() + pd.Timedelta(days=1), periods=horizon_days, freq="D")
+    frames = []
+    for key, s in series.items():
+        lr_fc, arima_fc, params = results[key]
+        if arima_fc is None:
+            counts["arima_failed"] += 1
+        new_cache[_cache_key(key)].update(
+            lr=[float(v) for v in lr_fc],
+            arima=None if arima_fc is None else [float(v) for v in arima_fc],
+            params=params,
+        )
+        frames.append(
+            pd.DataFrame(
+                {
+                    "segment_type": key[0],
+                    "segment_value": key[1],
+                    "forecast_dt": pd.date_range(s.index.max() + pd.Timedelta(days=1), periods=horizon_days, freq="D"),
+                    "forecast_lr": lr_fc,
+                    "forecast_arima": np.nan if arima_fc is None else arima_fc,
+                }
+            )
+        )
+
+    out = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=_FORECAST_COLUMNS)
+    return out, new_cache, counts
+
+
+def load_model_cache(path: Path) -> dict:
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+
+
+def save_model_cache(path: Path, cache: dict) -> None:
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    tmp.write_text(json.dumps(cache), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def write_forecasts(forecasts: pd.DataFrame) -> int:
+    """Replace globalcart.revenue_forecasts with ``forecasts`` in one transaction."""
+    buf = io.StringIO()
+    forecasts[_FORECAST_COLUMNS].to_csv(buf, index=False, header=False, date_format="%Y-%m-%d")
+    with get_conn(PostgresConfig()) as conn:
+        apply_sql_files(conn, [_FORECAST_SQL])
+        with conn.cursor() as cur:
+            cur.execute("DELETE FROM globalcart.revenue_forecasts")
+            with cur.copy(
+                f"COPY globalcart.revenue_forecasts ({', '.join(_FORECAST_COLUMNS)}) FROM STDIN WITH (FORMAT csv)"
+            ) as copy:
+                copy.write(buf.getvalue())
+        conn.commit()
+    return len(forecasts)
+
+
+def _write_total(series: pd.Series, forecasts: pd.DataFrame, paths) -> None:
+    total = forecasts[(forecasts["segment_type"] == _TOTAL[0]) & (forecasts["segment_value"] == _TOTAL[1])]
     out = pd.DataFrame(
         {
-            "dt": future_idx,
-            "forecast_lr": lr_fc,
-            "forecast_arima": arima_fc.values,
+            "dt": total["forecast_dt"].to_numpy(),
+            "forecast_lr": total["forecast_lr"].to_numpy(),
+            "forecast_arima": total["forecast_arima"].to_numpy(),
         }
     )
-
-    out_path = os.path.join(paths.data_processed_dir, "revenue_forecast.csv")
-    out.to_csv(out_path, index=False)
+    out.to_csv(os.path.join(paths.data_processed_dir, "revenue_forecast.csv"), index=False)
 
     plt.figure(figsize=(10, 4))
-    plt.plot(daily.index, daily["net_revenue"], label="actual")
+    plt.plot(series.index, series.to_numpy(), label="actual")
     plt.plot(out["dt"], out["forecast_lr"], label="lr")
     plt.plot(out["dt"], out["forecast_arima"], label="arima")
     plt.title("Daily Net Revenue Forecast")
@@ -61,8 +248,43 @@ def run(horizon_days: int = 30) -> None:
     plt.close()
 
 
+def run(horizon_days: int = 30, workers: int = 0, warm_start: bool = True) -> pd.DataFrame:
+    paths = get_paths()
+    os.makedirs(paths.data_processed_dir, exist_ok=True)
+    os.makedirs(paths.reports_dir, exist_ok=True)
+    cache_path = Path(paths.data_processed_dir) / ".forecast_models.json"
+
+    series = segment_series(read_sql_df(_SERIES_SQL))
+
+    started = time.perf_counter()
+    forecasts, cache, counts = forecast_segments(
+        series,
+        horizon_days,
+        workers=workers or os.cpu_count() or 1,
+        cache=load_model_cache(cache_path) if warm_start else None,
+    )
+    fit_seconds = time.perf_counter() - started
+
+    write_forecasts(forecasts)
+    save_model_cache(cache_path, cache)
+    if _TOTAL in series:
+        _write_total(series[_TOTAL], forecasts, paths)
+
+    print(
+        f"Forecast {len(series)} series in {fit_seconds:.1f}s "
+        f"(reused={counts['reused']} warm={counts['warm']} cold={counts['cold']} arima_failed={counts['arima_failed']})"
+    )
+    return forecasts
+
+
 def main() -> None:
-    run()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--horizon_days", type=int, default=30)
+    parser.add_argument("--workers", type=int, default=0, help="Processes for model fitting (0 = CPU count; 1 = in-process)")
+    parser.add_argument("--no_warm_start", action="store_true", help="Ignore cached model state and refit every series from scratch")
+    args = parser.parse_args()
+
+    run(horizon_days=args.horizon_days, workers=args.workers, warm_start=not args.no_warm_start)
 
 
 if __name__ == "__main__":
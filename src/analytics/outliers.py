@@ -1,11 +1,40 @@
 from __future__ import annotations
 
+import argparse
 import os
+from typing import Iterable, Iterator
 
 import numpy as np
 import pandas as pd
 
-from .common import get_paths, read_sql_df
+from .common import get_paths, iter_sql_df, read_sql_df
+from .state import refresh_job_state
+
+_JOB = "outliers"
+
+_STAT_COLUMNS = ["customer_id", "orders", "avg_discount_pct", "p95_discount_pct", "net_revenue", "return_lines", "refund_amount"]
+
+# Per-order discount history, ordered so each customer's orders arrive contiguously across chunks.
+_ORDERS_SQL = """
+SELECT o.customer_id,
+       i.order_id,
+       SUM(i.line_discount) AS discount_amount,
+       SUM(i.line_net_revenue + i.line_discount) AS gross_before_discount,
+       SUM(i.line_net_revenue) AS net_revenue
+FROM globalcart.fact_order_items i
+JOIN globalcart.vw_orders_completed o ON o.order_id = i.order_id
+GROUP BY 1,2
+ORDER BY 1
+"""
+
+_RETURNS_SQL = """
+SELECT o.customer_id,
+       COUNT(*) AS return_lines,
+       SUM(r.refund_amount) AS refund_amount
+FROM globalcart.fact_returns r
+JOIN globalcart.fact_orders o ON o.order_id = r.order_id
+GROUP BY 1
+"""
 
 
 def _iqr_bounds(s: pd.Series) -> tuple[float, float]:
@@ -17,60 +46,98 @@ def _iqr_bounds(s: pd.Series) -> tuple[float, float]:
     return float(lo), float(hi)
 
 
-def run() -> pd.DataFrame:
-    paths = get_paths()
-    os.makedirs(paths.data_processed_dir, exist_ok=True)
-
-    items = read_sql_df(
-        """
-        SELECT o.customer_id,
-               i.order_id,
-               SUM(i.line_discount) AS discount_amount,
-               SUM(i.line_net_revenue + i.line_discount) AS gross_before_discount,
-               SUM(i.line_net_revenue) AS net_revenue
-        FROM globalcart.fact_order_items i
-        JOIN globalcart.vw_orders_completed o ON o.order_id = i.order_id
-        GROUP BY 1,2
-        """
+def _discount_stats(orders: pd.DataFrame) -> pd.DataFrame:
+    discount_pct = pd.Series(
+        np.where(
+            orders["gross_before_discount"] == 0,
+            0.0,
+            100.0 * orders["discount_amount"] / orders["gross_before_discount"],
+        ),
+        index=orders.index,
     )
+    by = orders["customer_id"]
+    g = discount_pct.groupby(by)
+    return pd.DataFrame(
+        {
+            "orders": orders["order_id"].groupby(by).nunique(),
+            "avg_discount_pct": g.mean(),
+            "p95_discount_pct": g.quantile(0.95),
+            "net_revenue": orders["net_revenue"].groupby(by).sum(),
+        }
+    ).reset_index()
+
+
+def customer_discount_stats(chunks: Iterable[pd.DataFrame]) -> pd.DataFrame:
+    """Reduce per-order rows (``customer_id``, ``order_id``, ``discount_amount``,
+    ``gross_before_discount``, ``net_revenue``), sorted by customer, to per-customer discount stats.
+
+    Chunks may split a customer's orders; the last customer of each chunk is held back until the
+    next one, so memory stays bounded by the chunk size rather than the item history.
+    """
+
+    def reduced() -> Iterator[pd.DataFrame]:
+        carry = None
+        for chunk in chunks:
+            if carry is not None:
+                chunk = pd.concat([carry, chunk], ignore_index=True)
+            if chunk.empty:
+                continue
+            tail = chunk["customer_id"].to_numpy() == chunk["customer_id"].iloc[-1]
+            carry = chunk[tail]
+            if not tail.all():
+                yield _discount_stats(chunk[~tail])
+        if carry is not None and not carry.empty:
+            yield _discount_stats(carry)
+
+    parts = list(reduced())
+    if not parts:
+        return pd.DataFrame(columns=_STAT_COLUMNS[:5])
+    return pd.concat(parts, ignore_index=True)
+
+
+def flag_outliers(cust: pd.DataFrame) -> pd.DataFrame:
+    """Flag customers above the IQR fence on average discount share or refund amount."""
+    cust = cust.copy()
+    lo_d, hi_d = _iqr_bounds(cust["avg_discount_pct"])
+    lo_r, hi_r = _iqr_bounds(cust["refund_amount"])
 
-    items["discount_pct"] = np.where(
-        items["gross_before_discount"] == 0,
-        0.0,
-        100.0 * items["discount_amount"] / items["gross_before_discount"],
-    )
+    cust["flag_discount_abuse"] = cust["avg_discount_pct"] > hi_d
+    cust["flag_refund_abuse"] = cust["refund_amount"] > hi_r
+    cust["flag_any"] = cust["flag_discount_abuse"] | cust["flag_refund_abuse"]
+    return cust
 
-    returns = read_sql_df(
-        """
-        SELECT o.customer_id,
-               COUNT(*) AS return_lines,
-               SUM(r.refund_amount) AS refund_amount
-        FROM globalcart.fact_returns r
-        JOIN globalcart.fact_orders o ON o.order_id = r.order_id
-        GROUP BY 1
-        """
-    )
 
-    cust = (
-        items.groupby("customer_id")
-        .agg(
-            orders=("order_id", "nunique"),
-            avg_discount_pct=("discount_pct", "mean"),
-            p95_discount_pct=("discount_pct", lambda s: float(s.quantile(0.95))),
-            net_revenue=("net_revenue", "sum"),
-        )
-        .reset_index()
-    )
+def refresh_state(full: bool = False) -> int:
+    """Bring globalcart.customer_outlier_stats up to date; returns the number of customers re-aggregated.
+
+    Only customers whose orders, items or returns changed since the previous run are
+    re-aggregated, unless ``full`` is set or fact_orders was reloaded since.
+    """
+    return refresh_job_state(_JOB, "globalcart.refresh_customer_outlier_stats", full=full)
 
+
+def _stream_stats() -> pd.DataFrame:
+    cust = customer_discount_stats(iter_sql_df(_ORDERS_SQL))
+    returns = read_sql_df(_RETURNS_SQL)
     cust = cust.merge(returns, on="customer_id", how="left")
     cust[["return_lines", "refund_amount"]] = cust[["return_lines", "refund_amount"]].fillna(0)
+    cust["return_lines"] = cust["return_lines"].astype(int)
+    return cust[_STAT_COLUMNS]
 
-    lo_d, hi_d = _iqr_bounds(cust["avg_discount_pct"])
-    lo_r, hi_r = _iqr_bounds(cust["refund_amount"])
 
-    cust["flag_discount_abuse"] = cust["avg_discount_pct"] > hi_d
-    cust["flag_refund_abuse"] = cust["refund_amount"] > hi_r
-    cust["flag_any"] = cust["flag_discount_abuse"] | cust["flag_refund_abuse"]
+def run(method: str = "state", full: bool = False) -> pd.DataFrame:
+    paths = get_paths()
+    os.makedirs(paths.data_processed_dir, exist_ok=True)
+
+    if method == "stream":
+        cust = _stream_stats()
+    else:
+        refresh_state(full=full)
+        cust = read_sql_df(
+            f"SELECT {', '.join(_STAT_COLUMNS)} FROM globalcart.customer_outlier_stats ORDER BY customer_id"
+        )
+
+    cust = flag_outliers(cust)
 
     out_path = os.path.join(paths.data_processed_dir, "outlier_customers.csv")
     cust.sort_values(["flag_any", "refund_amount"], ascending=[False, False]).to_csv(out_path, index=False)
@@ -78,7 +145,17 @@ def run() -> pd.DataFrame:
 
 
 def main() -> None:
-    run()
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--method",
+        default="state",
+        choices=["state", "stream"],
+        help="Read incrementally maintained per-customer stats, or recompute them by streaming the item history",
+    )
+    parser.add_argument("--full", action="store_true", help="Re-aggregate every customer instead of only those with changed orders/returns")
+    args = parser.parse_args()
+
+    run(method=args.method, full=args.full)
 
 
 if __name__ == "__main__":
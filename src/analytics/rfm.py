@@ -1,54 +1,106 @@
 from __future__ import annotations
 
+import argparse
 import os
 from datetime import timedelta
 
+import numpy as np
 import pandas as pd
 
 from .common import get_paths, read_sql_df
-
-
-def run() -> pd.DataFrame:
-    paths = get_paths()
-    os.makedirs(paths.data_processed_dir, exist_ok=True)
-
-    orders = read_sql_df(
-        """
-        SELECT customer_id, order_id, order_ts, net_amount
-        FROM globalcart.vw_orders_completed
-        """
-    )
-
-    orders["order_ts"] = pd.to_datetime(orders["order_ts"], utc=True, errors="coerce")
-    as_of = orders["order_ts"].max() + timedelta(days=1)
-
-    rfm = (
-        orders.groupby("customer_id")
-        .agg(
-            recency_days=("order_ts", lambda s: int((as_of - s.max()).days)),
-            frequency=("order_id", "nunique"),
-            monetary=("net_amount", "sum"),
-        )
-        .reset_index()
+from .state import refresh_job_state
+
+_JOB = "rfm"
+
+_SEGMENTS = ["Champions", "New Customers", "At Risk Loyal", "Lost"]
+_DEFAULT_SEGMENT = "Potential Loyalist"
+
+_COLUMNS = ["customer_id", "recency_days", "frequency", "monetary", "r_score", "f_score", "m_score", "segment", "rfm_score"]
+
+# Same scoring as score_rfm(), in SQL over globalcart.rfm_customer_state. NTILE splits ties by
+# row order where qcut keeps them in one bin, so scores at quintile edges can differ slightly.
+_SCORE_SQL = """
+WITH base AS (
+  SELECT customer_id,
+         EXTRACT(DAY FROM (MAX(last_order_ts) OVER () + INTERVAL '1 day') - last_order_ts)::int AS recency_days,
+         frequency,
+         monetary::float8 AS monetary
+  FROM globalcart.rfm_customer_state
+),
+scored AS (
+  SELECT base.*,
+         6 - NTILE(5) OVER (ORDER BY recency_days, customer_id) AS r_score,
+         NTILE(5) OVER (ORDER BY frequency, customer_id) AS f_score,
+         NTILE(5) OVER (ORDER BY monetary, customer_id) AS m_score
+  FROM base
+)
+SELECT customer_id, recency_days, frequency, monetary, r_score, f_score, m_score,
+       CASE
+         WHEN r_score >= 4 AND f_score >= 4 THEN 'Champions'
+         WHEN r_score >= 4 AND f_score <= 2 THEN 'New Customers'
+         WHEN r_score <= 2 AND f_score >= 4 THEN 'At Risk Loyal'
+         WHEN r_score <= 2 AND f_score <= 2 THEN 'Lost'
+         ELSE 'Potential Loyalist'
+       END AS segment,
+       r_score * 100 + f_score * 10 + m_score AS rfm_score
+FROM scored
+ORDER BY customer_id
+"""
+
+
+def score_rfm(state: pd.DataFrame) -> pd.DataFrame:
+    """Score per-customer ``last_order_ts``/``frequency``/``monetary`` into quintiles and segments."""
+    # f_score ranks ties by position, so fix the order first (by customer, as a groupby would).
+    state = state.sort_values("customer_id", kind="stable")
+    last = pd.to_datetime(state["last_order_ts"], utc=True, errors="coerce")
+    as_of = last.max() + timedelta(days=1)
+
+    rfm = pd.DataFrame(
+        {
+            "customer_id": state["customer_id"].to_numpy(),
+            "recency_days": (as_of - last).dt.days.to_numpy(),
+            "frequency": state["frequency"].to_numpy(),
+            "monetary": state["monetary"].astype(float).to_numpy(),
+        }
     )
 
     rfm["r_score"] = pd.qcut(rfm["recency_days"], 5, labels=[5, 4, 3, 2, 1]).astype(int)
     rfm["f_score"] = pd.qcut(rfm["frequency"].rank(method="first"), 5, labels=[1, 2, 3, 4, 5]).astype(int)
     rfm["m_score"] = pd.qcut(rfm["monetary"], 5, labels=[1, 2, 3, 4, 5]).astype(int)
 
-    def segment(row: pd.Series) -> str:
-        if row["r_score"] >= 4 and row["f_score"] >= 4:
-            return "Champions"
-        if row["r_score"] >= 4 and row["f_score"] <= 2:
-            return "New Customers"
-        if row["r_score"] <= 2 and row["f_score"] >= 4:
-            return "At Risk Loyal"
-        if row["r_score"] <= 2 and row["f_score"] <= 2:
-            return "Lost"
-        return "Potential Loyalist"
-
-    rfm["segment"] = rfm.apply(segment, axis=1)
+    r = rfm["r_score"].to_numpy()
+    f = rfm["f_score"].to_numpy()
+    rfm["segment"] = np.select(
+        [(r >= 4) & (f >= 4), (r >= 4) & (f <= 2), (r <= 2) & (f >= 4), (r <= 2) & (f <= 2)],
+        _SEGMENTS,
+        default=_DEFAULT_SEGMENT,
+    )
     rfm["rfm_score"] = rfm["r_score"] * 100 + rfm["f_score"] * 10 + rfm["m_score"]
+    return rfm[_COLUMNS]
+
+
+def refresh_state(full: bool = False) -> int:
+    """Bring globalcart.rfm_customer_state up to date; returns the number of customers re-aggregated.
+
+    Only customers with orders changed since the previous run are re-aggregated, unless ``full``
+    is set or fact_orders was reloaded since.
+    """
+    return refresh_job_state(_JOB, "globalcart.refresh_rfm_customer_state", full=full)
+
+
+def run(method: str = "pandas", full: bool = False) -> pd.DataFrame:
+    paths = get_paths()
+    os.makedirs(paths.data_processed_dir, exist_ok=True)
+
+    refresh_state(full=full)
+
+    if method == "sql":
+        rfm = read_sql_df(_SCORE_SQL)[_COLUMNS]
+    else:
+        state = read_sql_df(
+            "SELECT customer_id, last_order_ts, frequency, monetary FROM globalcart.rfm_customer_state"
+        )
+        rfm = score_rfm(state)
 
     out = os.path.join(paths.data_processed_dir, "rfm_segments.csv")
     rfm.to_csv(out, index=False)
@@ -56,7 +108,12 @@ def run() -> pd.DataFrame:
 
 
 def main() -> None:
-    run()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--method", default="pandas", choices=["pandas", "sql"], help="Score in pandas (qcut) or in Postgres (NTILE)")
+    parser.add_argument("--full", action="store_true", help="Re-aggregate every customer instead of only those with changed orders")
+    args = parser.parse_args()
+
+    run(method=args.method, full=args.full)
 
 
 if __name__ == "__main__":
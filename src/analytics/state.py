@@ -0,0 +1,101 @@
+from __future__ import annotations
+
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from ..config import PostgresConfig
+from ..db import get_conn
+from ..run_sql import apply_sql_files
+
+_STATE_SQL = Path(__file__).resolve().parents[2] / "sql" / "16_analytics_state.sql"
+
+# Re-read this much before the stored watermark: an order committed late by a long transaction
+# can carry an updated_at older than the newest row seen at the previous run. Re-aggregating a
+# customer twice is harmless.
+_OVERLAP = timedelta(minutes=10)
+
+
+def ensure_state_objects(conn) -> None:
+    apply_sql_files(conn, [_STATE_SQL])
+
+
+def _fact_orders_position(conn) -> tuple[datetime, int]:
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            SELECT COALESCE(MAX(updated_at), TIMESTAMP 'epoch'),
+                   (SELECT relfilenode FROM pg_class WHERE oid = 'globalcart.fact_orders'::regclass)
+            FROM globalcart.fact_orders
+            """
+        )
+        ts, relfilenode = cur.fetchone()
+    return ts, int(relfilenode)
+
+
+def changed_customers(conn, job_name: str) -> tuple[list[int] | None, tuple[datetime, int]]:
+    """Customers whose orders, order items or returns changed since ``job_name``'s last run, or
+    None when the job must rebuild (first run, or fact_orders was truncated/reloaded since).
+
+    Also returns the current fact_orders position to pass to :func:`save_position` once the job's
+    state has been written.
+    """
+    position = _fact_orders_position(conn)
+    with conn.cursor() as cur:
+        cur.execute(
+            "SELECT watermark_ts, source_relfilenode FROM globalcart.analytics_state WHERE job_name = %s",
+            (job_name,),
+        )
+        row = cur.fetchone()
+    if row is None or int(row[1]) != position[1]:
+        return None, position
+    since = row[0] - _OVERLAP
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            SELECT customer_id FROM globalcart.fact_orders WHERE updated_at > %(since)s
+            UNION
+            SELECT o.customer_id
+            FROM globalcart.fact_order_items i
+            JOIN globalcart.fact_orders o ON o.order_id = i.order_id
+            WHERE i.updated_at > %(since)s
+            UNION
+            SELECT o.customer_id
+            FROM globalcart.fact_returns r
+            JOIN globalcart.fact_orders o ON o.order_id = r.order_id
+            WHERE r.updated_at > %(since)s
+            """,
+            {"since": since},
+        )
+        return [int(r[0]) for r in cur.fetchall()], position
+
+
+def save_position(conn, job_name: str, position: tuple[datetime, int]) -> None:
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            INSERT INTO globalcart.analytics_state (job_name, watermark_ts, source_relfilenode, updated_at)
+            VALUES (%s, %s, %s, NOW())
+            ON CONFLICT (job_name) DO UPDATE
+              SET watermark_ts = EXCLUDED.watermark_ts,
+                  source_relfilenode = EXCLUDED.source_relfilenode,
+                  updated_at = EXCLUDED.updated_at
+            """,
+            (job_name, position[0], position[1]),
+        )
+
+
+def refresh_job_state(job_name: str, refresh_fn: str, full: bool = False) -> int:
+    """Run ``refresh_fn(customer_ids bigint[])`` for the customers changed since ``job_name``'s last
+    run (all customers when ``full`` or on a rebuild) and advance the job's position, in one
+    transaction. Returns the function's result (rows written)."""
+    with get_conn(PostgresConfig()) as conn:
+        ensure_state_objects(conn)
+        customers, position = changed_customers(conn, job_name)
+        if full:
+            customers = None
+        with conn.cursor() as cur:
+            cur.execute(f"SELECT {refresh_fn}(%s::bigint[])", (customers,))
+            written = int(cur.fetchone()[0])
+        save_position(conn, job_name, position)
+        conn.commit()
+    return written
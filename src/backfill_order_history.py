@@ -0,0 +1,72 @@
+from __future__ import annotations
+
+import argparse
+from typing import Iterable, Optional
+
+from .config import PostgresConfig
+from .db import get_conn
+
+
+def history_table_exists(conn) -> bool:
+    with conn.cursor() as cur:
+        cur.execute("SELECT to_regclass('globalcart.customer_order_history') IS NOT NULL;")
+        row = cur.fetchone()
+    return bool(row and row[0])
+
+
+def rebuild_order_history(conn, order_ids: Iterable[int], batch_size: int = 5000) -> int:
+    """Re-derive history rows for ``order_ids`` (committing per batch); returns rows written."""
+    ids = sorted({int(i) for i in order_ids})
+    written = 0
+    for start in range(0, len(ids), max(1, int(batch_size))):
+        chunk = ids[start : start + batch_size]
+        with conn.cursor() as cur:
+            cur.execute("SELECT globalcart.refresh_customer_order_history(%s::bigint[]);", (chunk,))
+            written += int(cur.fetchone()[0] or 0)
+        conn.commit()
+    return written
+
+
+def backfill(batch_size: int = 5000, customer_id: Optional[int] = None) -> int:
+    cfg = PostgresConfig()
+    with get_conn(cfg) as conn:
+        conn.execute("SET TIME ZONE 'UTC';", prepare=False)
+        if not history_table_exists(conn):
+            raise SystemExit(
+                "globalcart.customer_order_history not found. "
+                "Run: python3 -m src.run_sql --sql sql/14_customer_order_history.sql"
+            )
+
+        with conn.cursor() as cur:
+            if customer_id is None:
+                # Orders deleted from fact_orders since the last run.
+                cur.execute(
+                    """
+                    DELETE FROM globalcart.customer_order_history h
+                    WHERE NOT EXISTS (SELECT 1 FROM globalcart.fact_orders o WHERE o.order_id = h.order_id);
+                    """
+                )
+                cur.execute("SELECT order_id FROM globalcart.fact_orders ORDER BY order_id;")
+            else:
+                cur.execute(
+                    "SELECT order_id FROM globalcart.fact_orders WHERE customer_id = %s ORDER BY order_id;",
+                    (int(customer_id),),
+                )
+            order_ids = [int(r[0]) for r in cur.fetchall()]
+        conn.commit()
+
+        return rebuild_order_history(conn, order_ids, batch_size=batch_size)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Rebuild globalcart.customer_order_history from the fact tables")
+    parser.add_argument("--batch-size", type=int, default=5000, help="Orders per transaction")
+    parser.add_argument("--customer-id", type=int, default=None, help="Only rebuild this customer's orders")
+    args = parser.parse_args()
+
+    written = backfill(batch_size=args.batch_size, customer_id=args.customer_id)
+    print(f"customer_order_history: refreshed={written}")
+
+
+if __name__ == "__main__":
+    main()
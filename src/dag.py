@@ -0,0 +1,212 @@
+from __future__ import annotations
+
+import concurrent.futures
+import hashlib
+import json
+import multiprocessing
+import os
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Iterable
+
+
+@dataclass
+class Step:
+    """One pipeline step.
+
+    ``deps`` are step names that must finish first. A step with ``cache=True`` is skipped when its
+    fingerprint (code hash of ``code`` files + ``params`` + positions of the source ``tables``)
+    matches the last successful run and all of its ``outputs`` still exist. ``parallel`` steps run
+    in the process pool; the rest run in the calling process.
+    """
+
+    name: str
+    fn: Callable[[], Any]
+    deps: tuple[str, ...] = ()
+    tables: tuple[str, ...] = ()
+    code: tuple[Path, ...] = ()
+    params: dict[str, Any] = field(default_factory=dict)
+    outputs: tuple[Path, ...] = ()
+    cache: bool = False
+    parallel: bool = False
+
+
+@dataclass
+class StepResult:
+    name: str
+    status: str  # ran | cached | failed | skipped
+    seconds: float = 0.0
+    started: float = 0.0
+    error: str | None = None
+
+
+def file_digest(paths: Iterable[Path]) -> str:
+    h = hashlib.sha256()
+    for p in sorted(Path(p) for p in paths):
+        h.update(p.name.encode("utf-8"))
+        h.update(p.read_bytes())
+    return h.hexdigest()
+
+
+def table_watermarks(conn, tables: Iterable[str]) -> dict[str, list[Any]]:
+    """``[MAX(updated_at), relfilenode]`` per ``globalcart`` table, the position
+    src/analytics/state.py tracks for fact_orders.
+
+    Inserts and updates advance ``updated_at`` (indexed on the fact and dim tables); a TRUNCATE or
+    reload gives the table a new relfilenode. Both are read from committed data, so a write is
+    visible as soon as it commits. Tables without ``updated_at`` are tracked by relfilenode alone.
+    """
+    from psycopg import sql  # not at module level: the spawned step processes import this module
+
+    names = sorted(set(tables))
+    if not names:
+        return {}
+    out: dict[str, list[Any]] = {}
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            SELECT c.relname,
+                   c.relfilenode,
+                   EXISTS (
+                     SELECT 1 FROM pg_attribute a
+                     WHERE a.attrelid = c.oid AND a.attname = 'updated_at' AND NOT a.attisdropped
+                   )
+            FROM pg_class c
+            JOIN pg_namespace n ON n.oid = c.relnamespace
+            WHERE n.nspname = 'globalcart' AND c.relkind = 'r' AND c.relname = ANY(%s)
+            """,
+            (names,),
+        )
+        for relname, relfilenode, has_updated_at in cur.fetchall():
+            latest = None
+            if has_updated_at:
+                cur.execute(sql.SQL("SELECT MAX(updated_at) FROM globalcart.{}").format(sql.Identifier(relname)))
+                latest = cur.fetchone()[0]
+            out[relname] = [None if latest is None else latest.isoformat(), int(relfilenode)]
+    return out
+
+
+def fingerprint(step: Step, watermarks: dict[str, list[Any]]) -> str:
+    payload = {
+        "code": file_digest(step.code) if step.code else "",
+        "params": step.params,
+        "tables": {t: watermarks.get(t) for t in sorted(step.tables)},
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def _load_cache(path: Path) -> dict[str, str]:
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_cache(path: Path, cache: dict[str, str]) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(cache, indent=2, sort_keys=True), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def _timed(fn: Callable[[], Any]) -> float:
+    started = time.perf_counter()
+    fn()
+    return time.perf_counter() - started
+
+
+def run_dag(
+    steps: list[Step],
+    *,
+    workers: int,
+    cache_path: Path,
+    watermarks: Callable[[Iterable[str]], dict[str, list[Any]]],
+    force: bool = False,
+) -> list[StepResult]:
+    """Run ``steps`` in dependency order, ``parallel`` ones concurrently in ``workers`` processes.
+
+    ``watermarks(tables)`` is called when a cached step becomes ready, i.e. after everything
+    upstream of it has written. Raises RuntimeError after the run if any step failed; steps
+    downstream of a failure are reported as skipped.
+    """
+    by_name = {s.name: s for s in steps}
+    for s in steps:
+        missing = [d for d in s.deps if d not in by_name]
+        if missing:
+            raise ValueError(f"step {s.name!r} depends on unknown step(s): {', '.join(missing)}")
+
+    cache = {} if force else _load_cache(cache_path)
+    results: dict[str, StepResult] = {}
+    fingerprints: dict[str, str] = {}
+    running: dict[concurrent.futures.Future, tuple[Step, float]] = {}
+    t0 = time.perf_counter()
+
+    def finish(step: Step, status: str, started: float, seconds: float = 0.0, error: str | None = None) -> None:
+        results[step.name] = StepResult(step.name, status, seconds, started - t0, error)
+        if status == "ran" and step.cache:
+            cache[step.name] = fingerprints[step.name]
+            _save_cache(cache_path, cache)
+
+    executor = None
+    if workers > 1 and any(s.parallel for s in steps):
+        executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+        )
+
+    try:
+        while len(results) < len(steps):
+            in_flight = {s.name for s, _ in running.values()}
+            ready = [
+                s
+                for s in steps
+                if s.name not in results and s.name not in in_flight and all(d in results for d in s.deps)
+            ]
+            for step in ready:
+                now = time.perf_counter()
+                if any(results[d].status in ("failed", "skipped") for d in step.deps):
+                    finish(step, "skipped", now)
+                    continue
+                if step.cache:
+                    fingerprints[step.name] = fingerprint(step, watermarks(step.tables) if step.tables else {})
+                    if cache.get(step.name) == fingerprints[step.name] and all(Path(p).exists() for p in step.outputs):
+                        finish(step, "cached", now)
+                        continue
+                if executor is not None and step.parallel:
+                    running[executor.submit(_timed, step.fn)] = (step, now)
+                    continue
+                try:
+                    finish(step, "ran", now, _timed(step.fn))
+                except Exception as e:
+                    finish(step, "failed", now, time.perf_counter() - now, f"{e.__class__.__name__}: {e}")
+
+            if ready:
+                continue
+            if not running:
+                raise ValueError("dependency cycle between: " + ", ".join(s.name for s in steps if s.name not in results))
+            done, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+            for fut in done:
+                step, started = running.pop(fut)
+                try:
+                    finish(step, "ran", started, fut.result())
+                except Exception as e:
+                    finish(step, "failed", started, time.perf_counter() - started, f"{e.__class__.__name__}: {e}")
+    finally:
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    ordered = [results[s.name] for s in steps]
+    failed = [r for r in ordered if r.status == "failed"]
+    if failed:
+        print(format_timings(ordered, time.perf_counter() - t0))
+        raise RuntimeError("; ".join(f"{r.name}: {r.error}" for r in failed))
+    return ordered
+
+
+def format_timings(results: list[StepResult], wall_seconds: float) -> str:
+    width = max([len(r.name) for r in results] + [4])
+    lines = [f"{'step':<{width}}  {'status':<7}  {'start_s':>8}  {'seconds':>8}"]
+    for r in results:
+        lines.append(f"{r.name:<{width}}  {r.status:<7}  {r.started:>8.1f}  {r.seconds:>8.1f}")
+    lines.append(f"{'total':<{width}}  {'':<7}  {'':>8}  {sum(r.seconds for r in results):>8.1f}  (wall {wall_seconds:.1f}s)")
+    return "\n".join(lines)
@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 from contextlib import contextmanager
+from functools import lru_cache
 
 import psycopg
 from sqlalchemy import create_engine
@@ -8,8 +9,14 @@ from sqlalchemy import create_engine
 from .config import PostgresConfig
 
 
+@lru_cache(maxsize=None)
+def _engine(url: str):
+    return create_engine(url, future=True, pool_size=4, max_overflow=4, pool_pre_ping=True)
+
+
 def get_engine(cfg: PostgresConfig):
-    return create_engine(cfg.sqlalchemy_url(), future=True)
+    """Process-wide engine (and connection pool) per database URL; callers must not dispose it."""
+    return _engine(cfg.sqlalchemy_url())
 
 
 @contextmanager
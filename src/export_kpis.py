@@ -4,10 +4,7 @@ import argparse
 import os
 from pathlib import Path
 
-import pandas as pd
-
-from .config import PostgresConfig
-from .db import get_engine
+from .analytics.common import read_sql_df
 
 
 EXPORTS: dict[str, str] = {
@@ -59,13 +56,10 @@ EXPORTS: dict[str, str] = {
 
 
 def export_all(out_dir: Path) -> None:
-    cfg = PostgresConfig()
-    engine = get_engine(cfg)
-
     out_dir.mkdir(parents=True, exist_ok=True)
 
     for name, sql in EXPORTS.items():
-        df = pd.read_sql(sql, engine)
+        df = read_sql_df(sql, numeric_as_text=True)
         df.to_csv(out_dir / f"{name}.csv", index=False)
 
 
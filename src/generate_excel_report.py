@@ -1,24 +1,25 @@
 from __future__ import annotations
 
 import argparse
+import concurrent.futures
 import os
+import resource
+import time
 from pathlib import Path
+from typing import Iterable
 
 import pandas as pd
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font
 
-from .config import Paths, PostgresConfig
-from .db import get_engine
+from .analytics.common import iter_sql_df, read_sql_df
+from .config import Paths
 
-
-def _ensure_dir(p: Path) -> None:
-    p.mkdir(parents=True, exist_ok=True)
-
-
-def build_excel_report(out_path: Path) -> None:
-    cfg = PostgresConfig()
-    engine = get_engine(cfg)
-
-    kpi = pd.read_sql(
+# Summary sheets in workbook order. Each is a small aggregate, so they are read whole, concurrently.
+SUMMARY_SHEETS: list[tuple[str, str]] = [
+    (
+        "KPI_Summary",
         """
         SELECT
           COUNT(DISTINCT order_id) AS orders,
@@ -26,10 +27,9 @@ def build_excel_report(out_path: Path) -> None:
           ROUND(SUM(net_amount) / NULLIF(COUNT(DISTINCT order_id),0), 2) AS aov
         FROM globalcart.vw_orders_completed
         """,
-        engine,
-    )
-
-    monthly = pd.read_sql(
+    ),
+    (
+        "Monthly_Trend",
         """
         SELECT date_trunc('month', order_ts) AS month,
                COUNT(DISTINCT order_id) AS orders,
@@ -38,10 +38,9 @@ def build_excel_report(out_path: Path) -> None:
         GROUP BY 1
         ORDER BY 1
         """,
-        engine,
-    )
-
-    category_profit = pd.read_sql(
+    ),
+    (
+        "Category_Profit",
         """
         SELECT category_l1,
                SUM(line_net_revenue) AS revenue,
@@ -52,10 +51,9 @@ def build_excel_report(out_path: Path) -> None:
         GROUP BY 1
         ORDER BY gross_profit DESC
         """,
-        engine,
-    )
-
-    returns = pd.read_sql(
+    ),
+    (
+        "Returns",
         """
         SELECT category_l1,
                return_reason,
@@ -65,10 +63,9 @@ def build_excel_report(out_path: Path) -> None:
         GROUP BY 1,2
         ORDER BY refund_amount DESC
         """,
-        engine,
-    )
-
-    sla = pd.read_sql(
+    ),
+    (
+        "SLA",
         """
         SELECT carrier,
                COUNT(*) AS shipments,
@@ -78,18 +75,109 @@ def build_excel_report(out_path: Path) -> None:
         GROUP BY 1
         ORDER BY sla_breach_pct DESC
         """,
-        engine,
-    )
+    ),
+]
+
+# Order-level detail; can be hundreds of thousands of rows, so it is streamed in chunks.
+LOSS_ORDERS_SQL = """
+SELECT order_id, customer_id, order_dt, order_status, channel,
+       revenue_ex_tax, discount_amount, cogs, shipping_cost, gateway_fee_amount, refund_amount,
+       net_profit_ex_tax, net_margin_pct
+FROM globalcart.vw_finance_order_pnl
+WHERE loss_order_flag
+ORDER BY net_profit_ex_tax, order_id
+"""
+
+# Excel's per-sheet row limit (header included); longer detail continues on "<name>_2", ...
+EXCEL_MAX_ROWS = 1_048_576
+
+_HEADER_FONT = Font(bold=True)
 
+
+def _ensure_dir(p: Path) -> None:
+    p.mkdir(parents=True, exist_ok=True)
+
+
+def _header(ws, columns) -> list[WriteOnlyCell]:
+    cells = []
+    for name in columns:
+        cell = WriteOnlyCell(ws, value=str(name))
+        cell.font = _HEADER_FONT
+        cells.append(cell)
+    return cells
+
+
+def _rows(df: pd.DataFrame):
+    # Plain Python values with NaN/NaT as empty cells, as DataFrame.to_excel writes them.
+    return df.astype(object).where(df.notna(), None).itertuples(index=False, name=None)
+
+
+def write_sheet(wb: Workbook, name: str, frames: Iterable[pd.DataFrame], max_rows: int = EXCEL_MAX_ROWS) -> int:
+    """Append ``frames`` to a new write-only sheet ``name`` and return the data rows written.
+
+    Frames are written as they arrive and not kept, so a streamed result never has to fit in
+    memory. Rows beyond ``max_rows`` continue on ``name_2``, ``name_3``, ...
+    """
+    ws = None
+    part = 0
+    used = 0
+    written = 0
+    columns = None
+    for df in frames:
+        if columns is None:
+            columns = list(df.columns)
+        for row in _rows(df):
+            if ws is None or used >= max_rows:
+                part += 1
+                ws = wb.create_sheet(name if part == 1 else f"{name}_{part}")
+                ws.append(_header(ws, columns))
+                used = 1
+            ws.append(row)
+            used += 1
+            written += 1
+    if ws is None:
+        ws = wb.create_sheet(name)
+        if columns:
+            ws.append(_header(ws, columns))
+    return written
+
+
+def build_excel_report(out_path: Path, loss_orders: bool = True, workers: int = 4) -> dict[str, int]:
+    """Write the management workbook to ``out_path``; returns data rows per sheet.
+
+    Summary queries run concurrently on the shared engine's pool, then the loss-order detail is
+    streamed chunk by chunk. The workbook is built in openpyxl's write-only mode and swapped into
+    place once complete.
+    """
     out_path = out_path.resolve()
     _ensure_dir(out_path.parent)
 
-    with pd.ExcelWriter(out_path, engine="openpyxl") as writer:
-        kpi.to_excel(writer, sheet_name="KPI_Summary", index=False)
-        monthly.to_excel(writer, sheet_name="Monthly_Trend", index=False)
-        category_profit.to_excel(writer, sheet_name="Category_Profit", index=False)
-        returns.to_excel(writer, sheet_name="Returns", index=False)
-        sla.to_excel(writer, sheet_name="SLA", index=False)
+    wb = Workbook(write_only=True)
+    rows: dict[str, int] = {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = {name: pool.submit(read_sql_df, sql) for name, sql in SUMMARY_SHEETS}
+        for name, _ in SUMMARY_SHEETS:
+            rows[name] = write_sheet(wb, name, [futures[name].result()])
+    if loss_orders:
+        rows["Loss_Orders"] = write_sheet(wb, "Loss_Orders", iter_sql_df(LOSS_ORDERS_SQL, block_bytes=4 << 20))
+
+    tmp = out_path.with_name(f".{out_path.name}.tmp")
+    try:
+        wb.save(tmp)
+        os.replace(tmp, out_path)
+    finally:
+        if tmp.exists():
+            tmp.unlink()
+    return rows
+
+
+def _peak_rss_mb() -> float:
+    try:
+        with open("/proc/self/status") as f:
+            kb = next(int(line.split()[1]) for line in f if line.startswith("VmHWM:"))
+    except (OSError, StopIteration):
+        kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return kb / 1024.0
 
 
 def main() -> None:
@@ -101,9 +189,18 @@ def main() -> None:
         "--out",
         default=os.path.join(paths.reports_dir, "globalcart_management_report.xlsx"),
     )
+    parser.add_argument("--no_loss_orders", action="store_true", help="Skip the order-level Loss_Orders detail sheet")
+    parser.add_argument("--workers", type=int, default=4, help="Concurrent summary queries")
     args = parser.parse_args()
 
-    build_excel_report(Path(args.out))
+    started = time.perf_counter()
+    rows = build_excel_report(Path(args.out), loss_orders=not args.no_loss_orders, workers=args.workers)
+    elapsed = time.perf_counter() - started
+
+    print(f"Wrote {args.out}")
+    for name, n in rows.items():
+        print(f"  {name}: {n} rows")
+    print(f"Report built in {elapsed:.2f}s, peak RSS {_peak_rss_mb():.1f} MB")
 
 
 if __name__ == "__main__":
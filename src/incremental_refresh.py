@@ -2,18 +2,26 @@ from __future__ import annotations
 
 import argparse
 import io
+import json
 import os
 import random
-from dataclasses import dataclass
+import signal
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
 from datetime import datetime, timedelta
 from pathlib import Path
 
 import numpy as np
 import pandas as pd
+import psycopg
 
+from .backfill_order_history import history_table_exists, rebuild_order_history
 from .config import PostgresConfig
 from .db import get_conn
-from .run_sql import run_sql_file
+from .run_sql import apply_sql_files
+from .staging_merge import merge_staging, merge_staging_parallel
 
 
 @dataclass(frozen=True)
@@ -74,11 +82,21 @@ def _scalar(conn, sql: str, params: tuple | None = None) -> float | int | str |
         return row[0]
 
 
-def _ensure_incremental_objects() -> None:
+# Source producers can `NOTIFY globalcart_etl_source` to start the next daemon batch early.
+SOURCE_CHANNEL = "globalcart_etl_source"
+
+
+def _ensure_incremental_objects(conn) -> list[str]:
+    """Apply the schema/views/staging DDL, skipping files unchanged since they were last applied."""
     root = _project_root()
-    run_sql_file(root / "sql" / "00_schema.sql", stop_on_error=True)
-    run_sql_file(root / "sql" / "02_views.sql", stop_on_error=True)
-    run_sql_file(root / "sql" / "04_incremental_refresh.sql", stop_on_error=True)
+    return apply_sql_files(
+        conn,
+        [
+            root / "sql" / "00_schema.sql",
+            root / "sql" / "02_views.sql",
+            root / "sql" / "04_incremental_refresh.sql",
+        ],
+    )
 
 
 def _parse_since_ts(s: str | None) -> datetime:
@@ -117,6 +135,40 @@ def _select_ids(conn) -> dict[str, int]:
     }
 
 
+def _sample_dim(conn, table: str, columns: str, target_rows: int, seed: int) -> pd.DataFrame:
+    """About ``target_rows`` random rows of ``table`` (only ``columns``), sampled server-side.
+
+    Small tables, and tables whose size the planner does not know yet, are read whole.
+    """
+    est = _scalar(conn, "SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass", (table,))
+    est = int(est or 0)
+    if target_rows > 0 and est > 2 * target_rows:
+        # 1.5x headroom so BERNOULLI's binomial row count rarely falls short of the target.
+        pct = min(100.0, 150.0 * target_rows / est)
+        df = _read_df(
+            conn,
+            f"SELECT {columns} FROM {table} TABLESAMPLE BERNOULLI ({pct:.6f}) REPEATABLE ({int(seed)})",
+        )
+        if len(df) >= min(target_rows, est) // 2:
+            return df
+    return _read_df(conn, f"SELECT {columns} FROM {table}")
+
+
+def _distinct_picks(np_rng: np.random.Generator, pool_size: int, n: int, k: int) -> np.ndarray:
+    """(n, k) indices into a pool, distinct within each row."""
+    picks = np_rng.integers(0, pool_size, size=(n, k))
+    while k > 1:
+        s = np.sort(picks, axis=1)
+        dup = (s[:, 1:] == s[:, :-1]).any(axis=1)
+        if not dup.any():
+            break
+        picks[dup] = np_rng.integers(0, pool_size, size=(int(dup.sum()), k))
+    return picks
+
+
+CUSTOMER_POOL_FACTOR = 20
+
+
 def _generate_new_orders(
     conn,
     cfg: DeltaConfig,
@@ -125,326 +177,269 @@ def _generate_new_orders(
     ids: dict[str, int],
     seed: int,
 ) -> tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame, pd.DataFrame, pd.DataFrame]:
-    rng = random.Random(seed)
-    np_rng = np.random.default_rng(seed)
-
-    customers = _read_df(conn, "SELECT customer_id, geo_id FROM globalcart.dim_customer")
+    n = max(int(cfg.new_orders), 0)
+    if n == 0:
+        return pd.DataFrame(), pd.DataFrame(), pd.DataFrame(), pd.DataFrame(), pd.DataFrame()
+
+    # Customers are drawn independently per order with replacement, as if from the whole table. A
+    # pool of CUSTOMER_POOL_FACTOR x n keeps the repeats the pool itself adds to about
+    # 1 / (2 * factor) of the batch (2.5%), on top of those a draw over all of dim_customer has; the
+    # pool is capped at the table. The product pool is reused across orders like the full catalog.
+    customers = _sample_dim(conn, "globalcart.dim_customer", "customer_id, geo_id", CUSTOMER_POOL_FACTOR * n, seed)
+    products = _sample_dim(conn, "globalcart.dim_product", "product_id, unit_cost, list_price", max(2000, n), seed + 1)
     geos = _read_df(conn, "SELECT geo_id, currency FROM globalcart.dim_geo")
-    products = _read_df(conn, "SELECT product_id, unit_cost, list_price FROM globalcart.dim_product")
     fcs = _read_df(conn, "SELECT fc_id FROM globalcart.dim_fc")
 
-    geo_currency = dict(zip(geos["geo_id"], geos["currency"]))
+    return _build_new_orders(
+        customers=customers,
+        products=products,
+        geo_currency=dict(zip(geos["geo_id"].astype(int), geos["currency"].astype(str))),
+        fc_ids=fcs["fc_id"].astype(int).to_numpy(),
+        n=n,
+        since_ts=since_ts,
+        now_ts=now_ts,
+        ids=ids,
+        seed=seed,
+    )
 
-    order_statuses = ["CREATED", "CANCELLED", "DELIVERED", "COMPLETED"]
-    status_probs = [0.10, 0.08, 0.50, 0.32]
 
-    payment_methods = ["CARD", "UPI", "WALLET", "COD"]
-    providers = ["VISA", "MASTERCARD", "PAYPAL", "STRIPE", "RAZORPAY"]
-    channels = ["WEB", "APP"]
-    carriers = ["DHL", "FEDEX", "UPS", "LOCAL_XPRESS"]
+def _build_new_orders(
+    customers: pd.DataFrame,
+    products: pd.DataFrame,
+    geo_currency: dict[int, str],
+    fc_ids: np.ndarray,
+    n: int,
+    since_ts: datetime,
+    now_ts: datetime,
+    ids: dict[str, int],
+    seed: int,
+) -> tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+    """Orders, items, payments, shipments and funnel events for ``n`` new orders, built column-wise."""
+    rng = np.random.default_rng(seed)
 
-    next_order_id = ids["max_order_id"] + 1
-    next_item_id = ids["max_order_item_id"] + 1
-    next_payment_id = ids["max_payment_id"] + 1
-    next_event_id = ids["max_event_id"] + 1
-    next_shipment_id = ids["max_shipment_id"] + 1
+    order_statuses = np.array(["CREATED", "CANCELLED", "DELIVERED", "COMPLETED"])
+    status_probs = [0.10, 0.08, 0.50, 0.32]
 
-    order_rows = []
-    item_rows = []
-    payment_rows = []
-    shipment_rows = []
-    funnel_rows = []
+    payment_methods = np.array(["CARD", "UPI", "WALLET", "COD"])
+    providers = np.array(["VISA", "MASTERCARD", "PAYPAL", "STRIPE", "RAZORPAY"])
+    channels = np.array(["WEB", "APP"])
+    carriers = np.array(["DHL", "FEDEX", "UPS", "LOCAL_XPRESS"])
+    failure_reasons = np.array(["INSUFFICIENT_FUNDS", "NETWORK_ERROR", "FRAUD_FLAG", "BANK_DECLINE"])
 
     total_seconds = max(int((now_ts - since_ts).total_seconds()), 1)
+    since = np.datetime64(since_ts, "s")
+    updated_at = pd.Timestamp(now_ts)
+
+    # --- orders ---
+    order_ids = ids["max_order_id"] + 1 + np.arange(n, dtype=np.int64)
+    cust_idx = rng.choice(len(customers), size=n, replace=True)
+    customer_ids = customers["customer_id"].to_numpy(dtype=np.int64)[cust_idx]
+    geo_ids = customers["geo_id"].to_numpy(dtype=np.int64)[cust_idx]
+    currency = pd.Series(geo_ids).map(geo_currency).fillna("USD").to_numpy()
+
+    order_ts = since + rng.integers(0, total_seconds, size=n).astype("timedelta64[s]")
+    status = rng.choice(order_statuses, size=n, p=status_probs)
+    channel = rng.choice(channels, size=n)
+    device = np.where((channel == "APP") | (rng.random(n) < 0.65), "MOBILE", "DESKTOP")
+    session_id = (
+        "sess_inc_"
+        + pd.Series(order_ids).astype(str)
+        + "_"
+        + pd.Series(rng.integers(0, 1_000_000_000, size=n)).astype(str).str.zfill(9)
+    ).to_numpy()
+
+    # --- items: up to 4 distinct products per order ---
+    n_products = len(products)
+    max_items = min(4, n_products)
+    num_items = np.minimum(rng.integers(1, 5, size=n), max_items)
+    picks = _distinct_picks(rng, n_products, n, max_items)
+    in_order = np.arange(max_items)[None, :] < num_items[:, None]
+    item_order = np.repeat(np.arange(n), num_items)
+    item_pos = np.nonzero(in_order)[1]
+    item_prod = picks[in_order]
+    m = len(item_order)
+
+    product_ids = products["product_id"].to_numpy(dtype=np.int64)
+    list_price = products["list_price"].to_numpy(dtype=float)[item_prod]
+    unit_cost = products["unit_cost"].to_numpy(dtype=float)[item_prod]
+    qty = rng.integers(1, 4, size=m)
+    disc_pct = np.minimum(rng.uniform(0.02, 0.35, size=m), 0.55)
+    unit_sell = np.round(list_price * (1.0 - disc_pct), 2)
+    line_gross = np.round(list_price * qty, 2)
+    line_discount = np.round((list_price - unit_sell) * qty, 2)
+    line_tax = np.round(0.07 * (unit_sell * qty), 2)
+    line_net = np.round(unit_sell * qty + line_tax, 2)
+
+    def per_order(values: np.ndarray) -> np.ndarray:
+        return np.round(np.bincount(item_order, weights=values, minlength=n), 2)
+
+    gross, discount, tax, net = per_order(line_gross), per_order(line_discount), per_order(line_tax), per_order(line_net)
+
+    items = pd.DataFrame(
+        {
+            "order_item_id": ids["max_order_item_id"] + 1 + np.arange(m, dtype=np.int64),
+            "order_id": order_ids[item_order],
+            "product_id": product_ids[item_prod],
+            "qty": qty,
+            "unit_list_price": np.round(list_price, 2),
+            "unit_sell_price": unit_sell,
+            "unit_cost": np.round(unit_cost, 2),
+            "line_discount": line_discount,
+            "line_tax": line_tax,
+            "line_net_revenue": line_net,
+            "created_at": order_ts[item_order],
+            "updated_at": updated_at,
+        }
+    )
 
-    for _ in range(cfg.new_orders):
-        cust = customers.sample(n=1, random_state=rng.randint(1, 10_000)).iloc[0]
-        customer_id = int(cust["customer_id"])
-        geo_id = int(cust["geo_id"])
-        currency = str(geo_currency.get(geo_id, "USD"))
-
-        order_ts = since_ts + timedelta(seconds=rng.randrange(total_seconds))
-        updated_at = now_ts
-
-        status = str(np_rng.choice(order_statuses, p=status_probs))
-        channel = channels[rng.randrange(len(channels))]
-
-        device = "MOBILE" if (channel == "APP" or rng.random() < 0.65) else "DESKTOP"
-        session_id = f"sess_inc_{next_order_id}_{rng.randrange(1_000_000_000):09d}"
-
-        num_items = rng.randint(1, 4)
-        chosen = products.sample(n=num_items, random_state=rng.randint(1, 10_000))
-
-        gross = 0.0
-        discount = 0.0
-        tax = 0.0
-        net = 0.0
-
-        for _, p in chosen.iterrows():
-            pid = int(p["product_id"])
-            qty = rng.randint(1, 3)
-            list_price = float(p["list_price"])
-            unit_cost = float(p["unit_cost"])
-
-            disc_pct = min(rng.uniform(0.02, 0.35), 0.55)
-            unit_sell = round(list_price * (1.0 - disc_pct), 2)
-
-            line_gross = round(list_price * qty, 2)
-            line_discount = round((list_price - unit_sell) * qty, 2)
-            line_tax = round(0.07 * (unit_sell * qty), 2)
-            line_net = round((unit_sell * qty) + line_tax, 2)
-
-            gross += line_gross
-            discount += line_discount
-            tax += line_tax
-            net += line_net
-
-            item_rows.append(
-                {
-                    "order_item_id": next_item_id,
-                    "order_id": next_order_id,
-                    "product_id": pid,
-                    "qty": qty,
-                    "unit_list_price": round(list_price, 2),
-                    "unit_sell_price": unit_sell,
-                    "unit_cost": round(unit_cost, 2),
-                    "line_discount": line_discount,
-                    "line_tax": line_tax,
-                    "line_net_revenue": line_net,
-                    "created_at": order_ts,
-                    "updated_at": updated_at,
-                }
-            )
-            next_item_id += 1
-
-        session_start = order_ts - timedelta(minutes=rng.randint(3, 75))
-        t = session_start
-        viewed_products = chosen["product_id"].astype(int).tolist()
-        if rng.random() < 0.45:
-            extra_pid = int(products.sample(n=1, random_state=rng.randint(1, 10_000)).iloc[0]["product_id"])
-            viewed_products.append(extra_pid)
-
-        viewed_products = list(dict.fromkeys(viewed_products))
-        for pid in viewed_products:
-            for _ in range(rng.randint(1, 3)):
-                t = t + timedelta(seconds=rng.randint(6, 35))
-                funnel_rows.append(
-                    {
-                        "event_id": next_event_id,
-                        "event_ts": t,
-                        "session_id": session_id,
-                        "customer_id": customer_id,
-                        "product_id": int(pid),
-                        "order_id": None,
-                        "stage": "VIEW_PRODUCT",
-                        "channel": channel,
-                        "device": device,
-                        "failure_reason": None,
-                    }
-                )
-                next_event_id += 1
-
-        for pid in chosen["product_id"].astype(int).tolist():
-            if rng.random() < 0.92:
-                t = t + timedelta(seconds=rng.randint(8, 55))
-                funnel_rows.append(
-                    {
-                        "event_id": next_event_id,
-                        "event_ts": t,
-                        "session_id": session_id,
-                        "customer_id": customer_id,
-                        "product_id": int(pid),
-                        "order_id": None,
-                        "stage": "ADD_TO_CART",
-                        "channel": channel,
-                        "device": device,
-                        "failure_reason": None,
-                    }
-                )
-                next_event_id += 1
-
-        t = t + timedelta(seconds=rng.randint(10, 70))
-        funnel_rows.append(
-            {
-                "event_id": next_event_id,
-                "event_ts": t,
-                "session_id": session_id,
-                "customer_id": customer_id,
-                "product_id": None,
-                "order_id": None,
-                "stage": "VIEW_CART",
-                "channel": channel,
-                "device": device,
-                "failure_reason": None,
-            }
-        )
-        next_event_id += 1
-
-        if rng.random() < 0.96:
-            t = t + timedelta(seconds=rng.randint(12, 95))
-            funnel_rows.append(
-                {
-                    "event_id": next_event_id,
-                    "event_ts": t,
-                    "session_id": session_id,
-                    "customer_id": customer_id,
-                    "product_id": None,
-                    "order_id": None,
-                    "stage": "CHECKOUT_STARTED",
-                    "channel": channel,
-                    "device": device,
-                    "failure_reason": None,
-                }
-            )
-            next_event_id += 1
-
-        order_rows.append(
-            {
-                "order_id": next_order_id,
-                "customer_id": customer_id,
-                "geo_id": geo_id,
-                "order_ts": order_ts,
-                "order_status": status,
-                "channel": channel,
-                "currency": currency,
-                "gross_amount": round(gross, 2),
-                "discount_amount": round(discount, 2),
-                "tax_amount": round(tax, 2),
-                "net_amount": round(net, 2),
-                "created_at": order_ts,
-                "updated_at": updated_at,
-            }
-        )
-
-        pay_method = payment_methods[rng.randrange(len(payment_methods))]
-        provider = providers[rng.randrange(len(providers))]
-
-        payment_status = "CAPTURED"
-        failure_reason = None
-        refund_amount = 0.0
-        chargeback_flag = False
-
-        if status == "CANCELLED":
-            payment_status = np_rng.choice(["FAILED", "DECLINED"], p=[0.55, 0.45])
-            failure_reason = str(np_rng.choice(["INSUFFICIENT_FUNDS", "NETWORK_ERROR", "FRAUD_FLAG", "BANK_DECLINE"]))
+    orders = pd.DataFrame(
+        {
+            "order_id": order_ids,
+            "customer_id": customer_ids,
+            "geo_id": geo_ids,
+            "order_ts": order_ts,
+            "order_status": status,
+            "channel": channel,
+            "currency": currency,
+            "gross_amount": gross,
+            "discount_amount": discount,
+            "tax_amount": tax,
+            "net_amount": net,
+            "created_at": order_ts,
+            "updated_at": updated_at,
+        }
+    )
 
-        t = t + timedelta(seconds=rng.randint(10, 75))
-        funnel_rows.append(
-            {
-                "event_id": next_event_id,
-                "event_ts": t,
-                "session_id": session_id,
-                "customer_id": customer_id,
-                "product_id": None,
-                "order_id": next_order_id,
-                "stage": "PAYMENT_ATTEMPTED",
-                "channel": channel,
-                "device": device,
-                "failure_reason": None,
-            }
-        )
-        next_event_id += 1
+    # --- payments ---
+    failed = status == "CANCELLED"
+    pay_method = rng.choice(payment_methods, size=n)
+    payment_status = np.where(failed, rng.choice(["FAILED", "DECLINED"], size=n, p=[0.55, 0.45]), "CAPTURED")
+    failure_reason = np.where(failed, rng.choice(failure_reasons, size=n), None)
+    fee_rate = np.where(pay_method == "UPI", rng.uniform(0.010, 0.016, size=n), rng.uniform(0.015, 0.025, size=n))
+    fixed_fee = rng.uniform(0.0, 6.0, size=n)
+    gateway_fee = np.where((pay_method != "COD") & ~failed, np.round(net * fee_rate + fixed_fee, 2), 0.0)
+    captured_ts = pd.Series(order_ts + rng.integers(5, 31, size=n).astype("timedelta64[m]")).mask(failed)
+
+    payments = pd.DataFrame(
+        {
+            "payment_id": ids["max_payment_id"] + 1 + np.arange(n, dtype=np.int64),
+            "order_id": order_ids,
+            "payment_method": pay_method,
+            "payment_status": payment_status,
+            "payment_provider": rng.choice(providers, size=n),
+            "amount": net,
+            "gateway_fee_amount": gateway_fee,
+            "authorized_ts": order_ts + rng.integers(0, 11, size=n).astype("timedelta64[m]"),
+            "captured_ts": captured_ts,
+            "failure_reason": failure_reason,
+            "refund_amount": 0.0,
+            "chargeback_flag": False,
+            "created_at": order_ts,
+            "updated_at": updated_at,
+        }
+    )
 
-        if payment_status in ("FAILED", "DECLINED"):
-            t = t + timedelta(seconds=rng.randint(5, 45))
-            funnel_rows.append(
-                {
-                    "event_id": next_event_id,
-                    "event_ts": t,
-                    "session_id": session_id,
-                    "customer_id": customer_id,
-                    "product_id": None,
-                    "order_id": next_order_id,
-                    "stage": "PAYMENT_FAILED",
-                    "channel": channel,
-                    "device": device,
-                    "failure_reason": failure_reason,
-                }
-            )
-            next_event_id += 1
-        else:
-            t = t + timedelta(seconds=rng.randint(5, 45))
-            funnel_rows.append(
+    # --- shipments for delivered/completed orders ---
+    shipped = np.nonzero(np.isin(status, ["DELIVERED", "COMPLETED"]))[0]
+    k = len(shipped)
+    ship_order_ts = order_ts[shipped]
+    promised_days = rng.integers(2, 7, size=k)
+    delivered_delay = rng.choice([0, 0, 0, 1, 1, 2], size=k)
+    promised_dt = (ship_order_ts + promised_days.astype("timedelta64[D]")).astype("datetime64[D]")
+    delivered_dt = (ship_order_ts + (promised_days + delivered_delay).astype("timedelta64[D]")).astype("datetime64[D]")
+
+    shipments = pd.DataFrame(
+        {
+            "shipment_id": ids["max_shipment_id"] + 1 + np.arange(k, dtype=np.int64),
+            "order_id": order_ids[shipped],
+            "fc_id": rng.choice(fc_ids, size=k) if len(fc_ids) else np.zeros(k, dtype=np.int64),
+            "carrier": rng.choice(carriers, size=k),
+            "shipped_ts": ship_order_ts + rng.integers(4, 49, size=k).astype("timedelta64[h]"),
+            "promised_delivery_dt": pd.Series(promised_dt).dt.date,
+            "delivered_dt": pd.Series(delivered_dt).dt.date,
+            "shipping_cost": np.round(rng.lognormal(mean=2.1, sigma=0.35, size=k), 2),
+            "sla_breached_flag": delivered_dt > promised_dt,
+            "created_at": ship_order_ts,
+            "updated_at": updated_at,
+        }
+    )
+    if k == 0:
+        shipments = pd.DataFrame()
+
+    # --- funnel events ---
+    # Every event is (order, sequence key, gap since the previous event in the session). Sorting by
+    # (order, key) lays out each session in order; a per-order cumulative sum of the gaps, added
+    # to the session start, gives the timestamps.
+    segments = []
+
+    def segment(order_idx, key, stage, gap_lo, gap_hi, product_id=None, with_order_id=False, reason=None):
+        size = len(order_idx)
+        segments.append(
+            pd.DataFrame(
                 {
-                    "event_id": next_event_id,
-                    "event_ts": t,
-                    "session_id": session_id,
-                    "customer_id": customer_id,
-                    "product_id": None,
-                    "order_id": next_order_id,
-                    "stage": "ORDER_PLACED",
-                    "channel": channel,
-                    "device": device,
-                    "failure_reason": None,
+                    "o": order_idx,
+                    "key": key,
+                    "stage": stage,
+                    "gap": rng.integers(gap_lo, gap_hi + 1, size=size),
+                    "product_id": product_id if product_id is not None else pd.array([pd.NA] * size, dtype="Int64"),
+                    "order_id": np.where(with_order_id, order_ids[order_idx], -1),
+                    "failure_reason": reason,
                 }
             )
-            next_event_id += 1
-
-        gateway_fee_amount = 0.0
-        if pay_method != "COD" and payment_status not in ("FAILED", "DECLINED"):
-            fee_rate = rng.uniform(0.015, 0.025)
-            if pay_method == "UPI":
-                fee_rate = rng.uniform(0.010, 0.016)
-            fixed_fee = rng.uniform(0.0, 6.0)
-            gateway_fee_amount = round((net * fee_rate) + fixed_fee, 2)
-
-        payment_rows.append(
-            {
-                "payment_id": next_payment_id,
-                "order_id": next_order_id,
-                "payment_method": pay_method,
-                "payment_status": payment_status,
-                "payment_provider": provider,
-                "amount": round(net, 2),
-                "gateway_fee_amount": gateway_fee_amount,
-                "authorized_ts": order_ts + timedelta(minutes=rng.randint(0, 10)),
-                "captured_ts": None if payment_status in ("FAILED", "DECLINED") else order_ts + timedelta(minutes=rng.randint(5, 30)),
-                "failure_reason": failure_reason,
-                "refund_amount": refund_amount,
-                "chargeback_flag": chargeback_flag,
-                "created_at": order_ts,
-                "updated_at": updated_at,
-            }
         )
-        next_payment_id += 1
-
-        if status in ("DELIVERED", "COMPLETED"):
-            fc_id = int(fcs.sample(n=1, random_state=rng.randint(1, 10_000)).iloc[0]["fc_id"])
-            carrier = carriers[rng.randrange(len(carriers))]
-            promised_days = rng.randint(2, 6)
-            delivered_delay = rng.choice([0, 0, 0, 1, 1, 2])
-            promised_dt = (order_ts + timedelta(days=promised_days)).date()
-            delivered_dt = (order_ts + timedelta(days=promised_days + delivered_delay)).date()
-            sla_breached = delivered_dt > promised_dt
-
-            shipment_rows.append(
-                {
-                    "shipment_id": next_shipment_id,
-                    "order_id": next_order_id,
-                    "fc_id": fc_id,
-                    "carrier": carrier,
-                    "shipped_ts": order_ts + timedelta(hours=rng.randint(4, 48)),
-                    "promised_delivery_dt": promised_dt,
-                    "delivered_dt": delivered_dt,
-                    "shipping_cost": round(float(np_rng.lognormal(mean=2.1, sigma=0.35)), 2),
-                    "sla_breached_flag": bool(sla_breached),
-                    "created_at": order_ts,
-                    "updated_at": updated_at,
-                }
-            )
-            next_shipment_id += 1
 
-        next_order_id += 1
+    # VIEW_PRODUCT: each ordered product, plus (45% of sessions) one extra product, viewed 1-3 times.
+    extra_prod = rng.integers(0, n_products, size=n)
+    extra = (rng.random(n) < 0.45) & ~((picks == extra_prod[:, None]) & in_order).any(axis=1)
+    viewed_order = np.concatenate([item_order, np.nonzero(extra)[0]])
+    viewed_pos = np.concatenate([item_pos, np.full(int(extra.sum()), max_items)])
+    viewed_prod = np.concatenate([item_prod, extra_prod[extra]])
+    views = rng.integers(1, 4, size=len(viewed_order))
+    v_rep = np.repeat(np.arange(len(viewed_order)), views)
+    v_idx = np.arange(len(v_rep)) - np.repeat(np.cumsum(views) - views, views)
+    segment(
+        viewed_order[v_rep],
+        viewed_pos[v_rep] * 3 + v_idx,
+        "VIEW_PRODUCT",
+        6,
+        35,
+        product_id=product_ids[viewed_prod[v_rep]],
+    )
 
-    return (
-        pd.DataFrame(order_rows),
-        pd.DataFrame(item_rows),
-        pd.DataFrame(payment_rows),
-        pd.DataFrame(shipment_rows),
-        (lambda df: df.assign(**{c: pd.to_numeric(df[c], errors="coerce").astype("Int64") for c in ["event_id", "customer_id", "product_id", "order_id"] if c in df.columns}) if not df.empty else df)(
-            pd.DataFrame(funnel_rows)
-        ),
+    added = rng.random(m) < 0.92
+    segment(item_order[added], 100 + item_pos[added], "ADD_TO_CART", 8, 55, product_id=product_ids[item_prod[added]])
+
+    all_orders = np.arange(n)
+    segment(all_orders, 200, "VIEW_CART", 10, 70)
+    checkout = rng.random(n) < 0.96
+    segment(all_orders[checkout], 300, "CHECKOUT_STARTED", 12, 95)
+    segment(all_orders, 400, "PAYMENT_ATTEMPTED", 10, 75, with_order_id=True)
+    pay_failed = np.isin(payment_status, ["FAILED", "DECLINED"])
+    segment(all_orders[pay_failed], 500, "PAYMENT_FAILED", 5, 45, with_order_id=True, reason=failure_reason[pay_failed])
+    segment(all_orders[~pay_failed], 500, "ORDER_PLACED", 5, 45, with_order_id=True)
+
+    ev = pd.concat(segments, ignore_index=True).sort_values(["o", "key"], kind="stable", ignore_index=True)
+    ev_order = ev["o"].to_numpy()
+    session_start = order_ts - rng.integers(3, 76, size=n).astype("timedelta64[m]")
+    elapsed = ev.groupby("o", sort=False)["gap"].cumsum().to_numpy()
+
+    funnel = pd.DataFrame(
+        {
+            "event_id": pd.array(ids["max_event_id"] + 1 + np.arange(len(ev)), dtype="Int64"),
+            "event_ts": session_start[ev_order] + elapsed.astype("timedelta64[s]"),
+            "session_id": session_id[ev_order],
+            "customer_id": pd.array(customer_ids[ev_order], dtype="Int64"),
+            "product_id": ev["product_id"].astype("Int64").array,
+            "order_id": pd.array(ev["order_id"].to_numpy(dtype=np.int64), dtype="Int64"),
+            "stage": ev["stage"].to_numpy(),
+            "channel": channel[ev_order],
+            "device": device[ev_order],
+            "failure_reason": ev["failure_reason"].to_numpy(),
+        }
     )
+    funnel.loc[funnel["order_id"] < 0, "order_id"] = pd.NA
+
+    return orders, items, payments, shipments, funnel
 
 
 def _generate_updates_and_late_events(
@@ -651,19 +646,55 @@ def _generate_dim_deltas(conn, dim_cfg: DimDeltaConfig, since_ts: datetime, now_
     return pd.DataFrame(new_customers), products
 
 
-def incremental_refresh(
-    since_ts: datetime,
+@dataclass
+class BatchResult:
+    since_ts: datetime
+    now_ts: datetime
+    counts: dict[str, tuple[int, int]]
+    history_rows: int
+    stage_ms: dict[str, float] = field(default_factory=dict)
+    merge_ms: dict[str, float] = field(default_factory=dict)
+
+
+class _StageTimer:
+    def __init__(self) -> None:
+        self.ms: dict[str, float] = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.ms[name] = round(self.ms.get(name, 0.0) + (time.perf_counter() - started) * 1000.0, 1)
+
+
+def _has_function(conn, signature: str) -> bool:
+    return bool(_scalar(conn, "SELECT to_regprocedure(%s) IS NOT NULL", (signature,)))
+
+
+def run_micro_batch(
+    conn,
+    *,
+    since_ts: datetime | None,
     delta_cfg: DeltaConfig,
+    dim_cfg: DimDeltaConfig,
     source_name: str,
     seed: int,
-    dim_cfg: DimDeltaConfig,
-) -> None:
-    _ensure_incremental_objects()
-
-    cfg = PostgresConfig()
-    now_ts = datetime.utcnow().replace(microsecond=0)
-
-    with get_conn(cfg) as conn:
+    snapshot_label: str | None = None,
+    refresh_marts: bool = False,
+    merge_workers: int = 1,
+) -> BatchResult:
+    """Generate one delta and merge it: staging COPY -> merge + watermark -> order history, then
+    optionally a KPI snapshot and a BI mart refresh. Timings are kept per stage and per merged table.
+
+    With ``merge_workers`` > 1 the merge runs FK level by level on separate connections
+    (see :mod:`src.staging_merge`) instead of as one transaction."""
+    timer = _StageTimer()
+    started_at = datetime.utcnow().replace(microsecond=0)
+    now_ts = started_at
+
+    with timer.stage("prepare"):
         conn.execute("SET TIME ZONE 'UTC';", prepare=False)
 
         if since_ts is None:
@@ -678,6 +709,7 @@ def incremental_refresh(
         )
         conn.commit()
 
+    with timer.stage("generate_dims"):
         new_customers, product_updates = _generate_dim_deltas(
             conn=conn,
             dim_cfg=dim_cfg,
@@ -685,26 +717,10 @@ def incremental_refresh(
             now_ts=now_ts,
             seed=seed,
         )
+        new_customers = _dedupe_latest(new_customers, ["customer_id"])
+        product_updates = _dedupe_latest(product_updates, ["product_id"])
 
-        for df, table in [
-            (new_customers, "globalcart.stg_dim_customer"),
-            (product_updates, "globalcart.stg_dim_product"),
-        ]:
-            _copy_df(conn, table, df)
-
-        conn.commit()
-
-        def call_counts(fn: str) -> tuple[int, int]:
-            with conn.cursor() as cur:
-                cur.execute(f"SELECT inserted_count, updated_count FROM {fn}()")
-                row = cur.fetchone()
-                if row is None:
-                    return 0, 0
-                return int(row[0]), int(row[1])
-
-        ins_dc, upd_dc = call_counts("globalcart.upsert_dim_customer_from_stg")
-        ins_dp, upd_dp = call_counts("globalcart.upsert_dim_product_from_stg")
-
+    with timer.stage("generate_facts"):
         new_orders, new_items, new_payments, new_shipments, new_funnel_events = _generate_new_orders(
             conn=conn,
             cfg=delta_cfg,
@@ -729,15 +745,16 @@ def incremental_refresh(
         fact_shipments_delta = pd.concat([new_shipments, shipment_updates], ignore_index=True) if not shipment_updates.empty else new_shipments
         fact_payments_delta = pd.concat([new_payments, payment_updates], ignore_index=True) if not payment_updates.empty else new_payments
 
-        new_customers = _dedupe_latest(new_customers, ["customer_id"])
-        product_updates = _dedupe_latest(product_updates, ["product_id"])
         fact_orders_delta = _dedupe_latest(fact_orders_delta, ["order_id"])
         new_items = _dedupe_latest(new_items, ["order_item_id"])
         fact_payments_delta = _dedupe_latest(fact_payments_delta, ["payment_id"])
         fact_shipments_delta = _dedupe_latest(fact_shipments_delta, ["shipment_id"])
         late_returns = _dedupe_latest(late_returns, ["return_id"])
 
+    with timer.stage("stage"):
         for df, table in [
+            (new_customers, "globalcart.stg_dim_customer"),
+            (product_updates, "globalcart.stg_dim_product"),
             (fact_orders_delta, "globalcart.stg_fact_orders"),
             (new_items, "globalcart.stg_fact_order_items"),
             (fact_payments_delta, "globalcart.stg_fact_payments"),
@@ -746,30 +763,202 @@ def incremental_refresh(
             (late_returns, "globalcart.stg_fact_returns"),
         ]:
             _copy_df(conn, table, df)
+        if merge_workers > 1:
+            # The per-table merge connections can only see committed staging rows.
+            conn.commit()
 
-        conn.commit()
-
-        ins_o, upd_o = call_counts("globalcart.upsert_fact_orders_from_stg")
-        ins_i, upd_i = call_counts("globalcart.upsert_fact_order_items_from_stg")
-        ins_p, upd_p = call_counts("globalcart.upsert_fact_payments_from_stg")
-        ins_fe, upd_fe = call_counts("globalcart.upsert_fact_funnel_events_from_stg")
-        ins_s, upd_s = call_counts("globalcart.upsert_fact_shipments_from_stg")
-        ins_r, upd_r = call_counts("globalcart.upsert_fact_returns_from_stg")
-
+    with timer.stage("merge"):
+        if merge_workers > 1:
+            merges = merge_staging_parallel(PostgresConfig(), merge_workers)
+        else:
+            merges = merge_staging(conn)
+        # With a single merge worker, staging, all eight merges and the watermark commit together.
         with conn.cursor() as cur:
             cur.execute("SELECT globalcart.set_watermark(%s, %s)", (source_name, now_ts))
         conn.commit()
 
+    counts = {m.table: (m.inserted, m.updated) for m in merges}
+    merge_ms = {m.table: m.elapsed_ms for m in merges}
+
+    history_rows = 0
+    with timer.stage("order_history"):
+        if history_table_exists(conn):
+            touched_orders = set()
+            for df in (fact_orders_delta, new_items, fact_shipments_delta):
+                if not df.empty:
+                    touched_orders.update(int(x) for x in df["order_id"].tolist())
+            history_rows = rebuild_order_history(conn, touched_orders)
+
+    if snapshot_label:
+        with timer.stage("kpi_snapshot"):
+            conn.execute("SELECT globalcart.snapshot_kpis(%s)", (snapshot_label,))
+            conn.commit()
+
+    if refresh_marts and _has_function(conn, "globalcart.refresh_bi_marts()"):
+        with timer.stage("mart_refresh"):
+            conn.execute("SELECT globalcart.refresh_bi_marts()")
+            conn.commit()
+
+    result = BatchResult(
+        since_ts=since_ts,
+        now_ts=now_ts,
+        counts=counts,
+        history_rows=history_rows,
+        stage_ms=timer.ms,
+        merge_ms=merge_ms,
+    )
+    _record_batch(conn, source_name, started_at, result)
+    return result
+
+
+def _record_batch(conn, source_name: str, started_at: datetime, result: BatchResult) -> None:
+    row_counts = {t: {"inserted": i, "updated": u} for t, (i, u) in result.counts.items()}
+    row_counts["customer_order_history"] = {"refreshed": result.history_rows}
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            INSERT INTO globalcart.etl_batch_runs
+              (source_name, started_at, finished_at, window_start, window_end, row_counts, stage_ms, merge_ms)
+            VALUES (%s, %s, %s, %s, %s, %s::jsonb, %s::jsonb, %s::jsonb)
+            """,
+            (
+                source_name,
+                started_at,
+                datetime.utcnow().replace(microsecond=0),
+                result.since_ts,
+                result.now_ts,
+                json.dumps(row_counts),
+                json.dumps(result.stage_ms),
+                json.dumps(result.merge_ms),
+            ),
+        )
+    conn.commit()
+
+
+def _format_stage_ms(stage_ms: dict[str, float]) -> str:
+    total = sum(stage_ms.values())
+    return " ".join(f"{k}={v:.0f}" for k, v in stage_ms.items()) + f" total={total:.0f}"
+
+
+def incremental_refresh(
+    since_ts: datetime,
+    delta_cfg: DeltaConfig,
+    source_name: str,
+    seed: int,
+    dim_cfg: DimDeltaConfig,
+    merge_workers: int = 1,
+) -> None:
+    cfg = PostgresConfig()
+
+    with get_conn(cfg) as conn:
+        _ensure_incremental_objects(conn)
+        result = run_micro_batch(
+            conn,
+            since_ts=since_ts,
+            delta_cfg=delta_cfg,
+            dim_cfg=dim_cfg,
+            source_name=source_name,
+            seed=seed,
+            merge_workers=merge_workers,
+        )
+
     print("Incremental refresh completed")
-    print(f"dim_customer: inserted={ins_dc}, updated={upd_dc}")
-    print(f"dim_product: inserted={ins_dp}, updated={upd_dp}")
-    print(f"fact_orders: inserted={ins_o}, updated={upd_o}")
-    print(f"fact_order_items: inserted={ins_i}, updated={upd_i}")
-    print(f"fact_payments: inserted={ins_p}, updated={upd_p}")
-    print(f"fact_funnel_events: inserted={ins_fe}, updated={upd_fe}")
-    print(f"fact_shipments: inserted={ins_s}, updated={upd_s}")
-    print(f"fact_returns: inserted={ins_r}, updated={upd_r}")
-    print(f"watermark({source_name})={now_ts.isoformat()}")
+    for table, (inserted, updated) in result.counts.items():
+        print(f"{table}: inserted={inserted}, updated={updated}, merge_ms={result.merge_ms.get(table, 0.0):.0f}")
+    print(f"customer_order_history: refreshed={result.history_rows}")
+    print(f"watermark({source_name})={result.now_ts.isoformat()}")
+    print(f"stage_ms: {_format_stage_ms(result.stage_ms)}")
+
+
+def run_daemon(
+    *,
+    interval_seconds: float,
+    delta_cfg: DeltaConfig,
+    dim_cfg: DimDeltaConfig,
+    source_name: str,
+    seed: int,
+    kpi_snapshots: bool = True,
+    refresh_marts_every: int = 5,
+    max_batches: int = 0,
+    merge_workers: int = 1,
+    stop: threading.Event | None = None,
+) -> None:
+    """Run micro-batches until stopped (SIGINT/SIGTERM or ``stop``).
+
+    One connection is kept open across batches and the DDL check runs once per connection. Between
+    batches the daemon waits ``interval_seconds``, or less when a source producer sends
+    ``NOTIFY globalcart_etl_source``.
+    """
+    cfg = PostgresConfig()
+    stop = stop or threading.Event()
+    if threading.current_thread() is threading.main_thread():
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(sig, lambda *_: stop.set())
+
+    conn = None
+    listener = None
+    batch_no = 0
+    backoff = 1.0
+    try:
+        while not stop.is_set():
+            try:
+                if conn is None or conn.closed:
+                    conn = psycopg.connect(cfg.dsn())
+                    applied = _ensure_incremental_objects(conn)
+                    if applied:
+                        print(f"applied: {', '.join(applied)}")
+                if listener is None or listener.closed:
+                    listener = psycopg.connect(cfg.dsn(), autocommit=True)
+                    listener.execute(f"LISTEN {SOURCE_CHANNEL};")
+
+                batch_no += 1
+                result = run_micro_batch(
+                    conn,
+                    since_ts=None,
+                    delta_cfg=delta_cfg,
+                    dim_cfg=dim_cfg,
+                    source_name=source_name,
+                    # A fresh delta every batch, still reproducible from (seed, window end).
+                    seed=seed + int(datetime.utcnow().timestamp()),
+                    snapshot_label="micro_batch" if kpi_snapshots else None,
+                    refresh_marts=refresh_marts_every > 0 and batch_no % refresh_marts_every == 0,
+                    merge_workers=merge_workers,
+                )
+                backoff = 1.0
+                orders = result.counts.get("fact_orders", (0, 0))
+                print(
+                    f"batch={batch_no} window={result.since_ts.isoformat()}..{result.now_ts.isoformat()} "
+                    f"orders_inserted={orders[0]} orders_updated={orders[1]} stage_ms: {_format_stage_ms(result.stage_ms)}",
+                    flush=True,
+                )
+                if max_batches and batch_no >= max_batches:
+                    break
+
+                deadline = time.monotonic() + interval_seconds
+                while not stop.is_set():
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    if any(True for _ in listener.notifies(timeout=min(remaining, 1.0), stop_after=1)):
+                        break
+            except psycopg.OperationalError as e:
+                print(f"database unavailable ({e.__class__.__name__}); retrying in {backoff:.0f}s", flush=True)
+                for c in (conn, listener):
+                    if c is not None:
+                        c.close()
+                conn = listener = None
+                stop.wait(backoff)
+                backoff = min(backoff * 2, 60.0)
+            except Exception as e:
+                print(f"batch {batch_no} failed: {e}", flush=True)
+                if conn is not None and not conn.closed:
+                    conn.rollback()
+                stop.wait(backoff)
+                backoff = min(backoff * 2, 60.0)
+    finally:
+        for c in (conn, listener):
+            if c is not None:
+                c.close()
 
 
 def main() -> None:
@@ -783,6 +972,17 @@ def main() -> None:
     parser.add_argument("--source_name", default="globalcart_incremental")
     parser.add_argument("--new_customers", type=int, default=200)
     parser.add_argument("--update_products", type=int, default=40)
+    parser.add_argument("--daemon", action="store_true", help="Keep running micro-batches instead of a single refresh")
+    parser.add_argument("--interval_seconds", type=float, default=60.0, help="Daemon: pause between batches")
+    parser.add_argument("--refresh_marts_every", type=int, default=5, help="Daemon: refresh BI marts every N batches (0 = never)")
+    parser.add_argument("--no_kpi_snapshots", action="store_true", help="Daemon: skip snapshot_kpis('micro_batch') after each batch")
+    parser.add_argument("--max_batches", type=int, default=0, help="Daemon: stop after N batches (0 = run until stopped)")
+    parser.add_argument(
+        "--merge_workers",
+        type=int,
+        default=1,
+        help="1 = merge all staging tables in one transaction; N > 1 = merge independent tables on N connections",
+    )
     args = parser.parse_args()
 
     since_ts = None if args.since_timestamp is None else _parse_since_ts(args.since_timestamp)
@@ -792,13 +992,29 @@ def main() -> None:
         update_shipments=args.update_shipments,
         late_returns=args.late_returns,
     )
+    dim_cfg = DimDeltaConfig(new_customers=args.new_customers, update_products=args.update_products)
+
+    if args.daemon:
+        run_daemon(
+            interval_seconds=args.interval_seconds,
+            delta_cfg=delta_cfg,
+            dim_cfg=dim_cfg,
+            source_name=args.source_name,
+            seed=args.seed,
+            kpi_snapshots=not args.no_kpi_snapshots,
+            refresh_marts_every=args.refresh_marts_every,
+            max_batches=args.max_batches,
+            merge_workers=args.merge_workers,
+        )
+        return
 
     incremental_refresh(
         since_ts=since_ts,
         delta_cfg=delta_cfg,
         source_name=args.source_name,
         seed=args.seed,
-        dim_cfg=DimDeltaConfig(new_customers=args.new_customers, update_products=args.update_products),
+        dim_cfg=dim_cfg,
+        merge_workers=args.merge_workers,
     )
 
 
@@ -3,6 +3,8 @@ from __future__ import annotations
 import argparse
 from pathlib import Path
 
+from .backfill_order_history import backfill as backfill_order_history
+from .backfill_order_history import history_table_exists
 from .config import PostgresConfig
 from .db import get_conn
 
@@ -65,6 +67,10 @@ def load(raw_dir: Path, schema_sql: Path, truncate: bool) -> None:
             _copy_csv(conn, table, p)
 
         conn.commit()
+        has_history = history_table_exists(conn)
+
+    if has_history:
+        backfill_order_history()
 
 
 def main() -> None:
@@ -2,12 +2,16 @@ from __future__ import annotations
 
 import argparse
 import os
+import time
+from functools import partial
 from pathlib import Path
 
 from .config import PostgresConfig
+from .dag import Step, format_timings, run_dag, table_watermarks
+from .db import get_conn
 from .dedupe_products import dedupe_products
 from .generate_data import generate
-from .load_to_postgres import load
+from .load_to_postgres import TABLE_LOAD_ORDER, load
 from .run_sql import run_sql_file
 from .generate_excel_report import build_excel_report
 from .analytics.eda import run as run_eda
@@ -16,44 +20,155 @@ from .analytics.outliers import run as run_outliers
 from .analytics.churn_cohort import run as run_churn_cohort
 from .analytics.forecasting import run as run_forecasting
 
+_SRC = Path(__file__).resolve().parent
+_ANALYTICS = _SRC / "analytics"
 
-def run_pipeline(scale: str, truncate: bool) -> None:
-    root = Path(__file__).resolve().parents[1]
-    raw_dir = root / "data" / "raw"
-
-    os.makedirs(raw_dir, exist_ok=True)
-
-    generate(scale_name=scale, out_dir=raw_dir, seed=42)
-
-    load(
-        raw_dir=raw_dir,
-        schema_sql=root / "sql" / "00_schema.sql",
-        truncate=truncate,
-    )
+_SEED = 42
 
-    dedupe_products(PostgresConfig())
 
-    run_sql_file(root / "sql" / "04_incremental_refresh.sql", stop_on_error=True)
+def build_steps(root: Path, scale: str, truncate: bool) -> list[Step]:
+    raw_dir = root / "data" / "raw"
+    processed = root / "data" / "processed"
+    reports = root / "reports"
+    common = _ANALYTICS / "common.py"
+    schema_sql = root / "sql" / "00_schema.sql"
+    source = {"scale": scale, "seed": _SEED}
+
+    # generate and load are skipped while the generator, loader and schema are unchanged for the
+    # same scale/seed, so a re-run only re-runs the analytics whose source tables moved since
+    # (e.g. through the incremental refresh). Reloading a reset database needs --force.
+    # Source tables are the base tables behind the views each job reads (sql/02_views.sql).
+    return [
+        Step(
+            "generate",
+            partial(generate, scale_name=scale, out_dir=raw_dir, seed=_SEED),
+            code=(_SRC / "generate_data.py",),
+            params=source,
+            outputs=tuple(raw_dir / fname for _, fname in TABLE_LOAD_ORDER),
+            cache=True,
+        ),
+        Step(
+            "load",
+            partial(load, raw_dir=raw_dir, schema_sql=schema_sql, truncate=truncate),
+            deps=("generate",),
+            code=(_SRC / "generate_data.py", _SRC / "load_to_postgres.py", schema_sql),
+            params=source,
+            cache=True,
+        ),
+        Step("dedupe_products", partial(dedupe_products, PostgresConfig()), deps=("load",)),
+        Step(
+            "incremental_sql",
+            partial(run_sql_file, root / "sql" / "04_incremental_refresh.sql", stop_on_error=True),
+            deps=("dedupe_products",),
+        ),
+        Step(
+            "views_sql",
+            partial(run_sql_file, root / "sql" / "02_views.sql", stop_on_error=True),
+            deps=("incremental_sql",),
+        ),
+        Step(
+            "eda",
+            run_eda,
+            deps=("views_sql",),
+            tables=("fact_orders", "fact_order_items", "dim_product"),
+            code=(_ANALYTICS / "eda.py", common),
+            outputs=(reports / "monthly_net_revenue.png", reports / "gross_profit_by_category.png"),
+            cache=True,
+            parallel=True,
+        ),
+        Step(
+            "rfm",
+            run_rfm,
+            deps=("views_sql",),
+            tables=("fact_orders",),
+            code=(_ANALYTICS / "rfm.py", _ANALYTICS / "state.py", root / "sql" / "16_analytics_state.sql", common),
+            outputs=(processed / "rfm_segments.csv",),
+            cache=True,
+            parallel=True,
+        ),
+        Step(
+            "outliers",
+            run_outliers,
+            deps=("views_sql",),
+            tables=("fact_orders", "fact_order_items", "fact_returns"),
+            code=(_ANALYTICS / "outliers.py", _ANALYTICS / "state.py", root / "sql" / "16_analytics_state.sql", common),
+            outputs=(processed / "outlier_customers.csv",),
+            cache=True,
+            parallel=True,
+        ),
+        Step(
+            "churn_cohort",
+            run_churn_cohort,
+            deps=("views_sql",),
+            tables=("fact_orders",),
+            code=(_ANALYTICS / "churn_cohort.py", _ANALYTICS / "state.py", root / "sql" / "16_analytics_state.sql", common),
+            outputs=(
+                processed / "churned_customers_90d.csv",
+                processed / "cohort_retention_long.csv",
+                processed / "cohort_retention_matrix.csv",
+            ),
+            cache=True,
+            parallel=True,
+        ),
+        Step(
+            "forecasting",
+            # Already one process of the DAG pool; a nested per-segment pool would oversubscribe.
+            partial(run_forecasting, workers=1),
+            deps=("views_sql",),
+            tables=("fact_orders", "fact_order_items", "dim_product", "dim_geo"),
+            code=(_ANALYTICS / "forecasting.py", root / "sql" / "17_revenue_forecasts.sql", common),
+            outputs=(processed / "revenue_forecast.csv", reports / "revenue_forecast.png"),
+            cache=True,
+            parallel=True,
+        ),
+        Step(
+            "excel_report",
+            partial(build_excel_report, reports / "globalcart_management_report.xlsx"),
+            deps=("views_sql",),
+            tables=("fact_orders", "fact_order_items", "fact_returns", "fact_shipments", "fact_payments", "dim_product", "dim_fc"),
+            code=(_SRC / "generate_excel_report.py", common),
+            outputs=(reports / "globalcart_management_report.xlsx",),
+            cache=True,
+            parallel=True,
+        ),
+    ]
+
+
+def _watermarks(tables) -> dict[str, list]:
+    with get_conn(PostgresConfig()) as conn:
+        return table_watermarks(conn, tables)
+
+
+def run_pipeline(scale: str, truncate: bool, workers: int = 0, force: bool = False) -> None:
+    root = Path(__file__).resolve().parents[1]
 
-    run_sql_file(root / "sql" / "02_views.sql", stop_on_error=True)
+    os.makedirs(root / "data" / "raw", exist_ok=True)
+    os.makedirs(root / "data" / "processed", exist_ok=True)
+    os.makedirs(root / "reports", exist_ok=True)
 
-    run_eda()
-    run_rfm()
-    run_outliers()
-    run_churn_cohort()
-    run_forecasting()
+    steps = build_steps(root, scale=scale, truncate=truncate)
+    workers = workers or min(sum(s.parallel for s in steps), os.cpu_count() or 1)
 
-    os.makedirs(root / "reports", exist_ok=True)
-    build_excel_report(root / "reports" / "globalcart_management_report.xlsx")
+    started = time.perf_counter()
+    results = run_dag(
+        steps,
+        workers=workers,
+        cache_path=root / "data" / "processed" / ".pipeline_cache.json",
+        watermarks=_watermarks,
+        force=force,
+    )
+    print(format_timings(results, time.perf_counter() - started))
 
 
 def main() -> None:
     parser = argparse.ArgumentParser()
     parser.add_argument("--scale", default="small", choices=["small", "medium", "large"])
     parser.add_argument("--truncate", action="store_true")
+    parser.add_argument("--workers", type=int, default=0, help="Processes for the analytics jobs (0 = one per job, capped at CPU count; 1 = sequential)")
+    parser.add_argument("--force", action="store_true", help="Re-run every step, including generate/load, even if its inputs are unchanged")
     args = parser.parse_args()
 
-    run_pipeline(scale=args.scale, truncate=args.truncate)
+    run_pipeline(scale=args.scale, truncate=args.truncate, workers=args.workers, force=args.force)
 
 
 if __name__ == "__main__":
@@ -1,7 +1,9 @@
 from __future__ import annotations
 
 import argparse
+import hashlib
 from pathlib import Path
+from typing import Iterable
 
 from .config import PostgresConfig
 from .db import get_conn
@@ -14,12 +16,67 @@ def run_sql_file(sql_path: Path, stop_on_error: bool = False) -> None:
         try:
             conn.execute(sql, prepare=False)
             conn.commit()
+            # Running API workers re-probe optional tables/views (backend/schema_caps.py).
+            conn.execute("NOTIFY globalcart_schema_changed;")
+            conn.commit()
         except Exception as e:
             if stop_on_error:
                 raise
             print(f"Error occurred: {e}")
 
 
+def apply_sql_files(conn, sql_paths: Iterable[Path]) -> list[str]:
+    """Apply each file whose checksum differs from the one recorded in globalcart.sql_migrations.
+
+    Lets long-running jobs call this on every start (or every batch) without re-executing DDL:
+    an unchanged file costs one primary-key read. Returns the names of the files applied.
+    """
+    # Concurrent callers (e.g. analytics jobs started together) take turns; whoever comes second
+    # sees the new checksum and skips the file.
+    lock = "SELECT pg_advisory_xact_lock(hashtext('globalcart.sql_migrations'))"
+    conn.execute(lock)
+    conn.execute(
+        """
+        CREATE SCHEMA IF NOT EXISTS globalcart;
+        CREATE TABLE IF NOT EXISTS globalcart.sql_migrations (
+          filename TEXT PRIMARY KEY,
+          checksum CHAR(64) NOT NULL,
+          applied_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+        );
+        """,
+        prepare=False,
+    )
+    conn.commit()
+
+    applied = []
+    for path in sql_paths:
+        sql = Path(path).read_text(encoding="utf-8")
+        checksum = hashlib.sha256(sql.encode("utf-8")).hexdigest()
+        conn.execute(lock)
+        with conn.cursor() as cur:
+            cur.execute("SELECT checksum FROM globalcart.sql_migrations WHERE filename = %s", (Path(path).name,))
+            row = cur.fetchone()
+        if row is not None and row[0] == checksum:
+            conn.commit()
+            continue
+        conn.execute(sql, prepare=False)
+        conn.execute(
+            """
+            INSERT INTO globalcart.sql_migrations (filename, checksum, applied_at)
+            VALUES (%s, %s, NOW())
+            ON CONFLICT (filename) DO UPDATE SET checksum = EXCLUDED.checksum, applied_at = EXCLUDED.applied_at
+            """,
+            (Path(path).name, checksum),
+        )
+        conn.commit()
+        applied.append(Path(path).name)
+
+    if applied:
+        conn.execute("NOTIFY globalcart_schema_changed;")
+        conn.commit()
+    return applied
+
+
 def main() -> None:
     parser = argparse.ArgumentParser()
     parser.add_argument("--sql", required=True, help="Path to a .sql file")
@@ -0,0 +1,64 @@
+from __future__ import annotations
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+import psycopg
+
+from .config import PostgresConfig
+
+# Staging tables merged by the globalcart.upsert_<table>_from_stg() functions (sql/04), grouped by
+# foreign-key depth: every table only references tables in earlier levels, so the tables within
+# one level can be merged concurrently once the previous level has committed.
+MERGE_LEVELS: list[tuple[str, ...]] = [
+    ("dim_customer", "dim_product"),
+    ("fact_orders",),
+    ("fact_order_items", "fact_payments", "fact_shipments", "fact_funnel_events"),
+    ("fact_returns",),
+]
+
+
+@dataclass
+class TableMerge:
+    table: str
+    inserted: int
+    updated: int
+    elapsed_ms: float
+
+
+def merge_staging(conn) -> list[TableMerge]:
+    """Merge all staging tables in one statement on ``conn`` (FK order, one transaction).
+
+    Does not commit: the caller commits once after anything else that belongs to the same batch
+    (e.g. the watermark), so a failed batch leaves the warehouse untouched.
+    """
+    with conn.cursor() as cur:
+        cur.execute("SELECT table_name, inserted_count, updated_count, elapsed_ms FROM globalcart.merge_all_from_stg()")
+        rows = cur.fetchall()
+    return [TableMerge(table=r[0], inserted=int(r[1]), updated=int(r[2]), elapsed_ms=float(r[3])) for r in rows]
+
+
+def _merge_table(cfg: PostgresConfig, table: str) -> TableMerge:
+    started = time.perf_counter()
+    with psycopg.connect(cfg.dsn()) as conn:
+        with conn.cursor() as cur:
+            cur.execute(f"SELECT inserted_count, updated_count FROM globalcart.upsert_{table}_from_stg()")
+            row = cur.fetchone()
+        conn.commit()
+    inserted, updated = (0, 0) if row is None else (int(row[0]), int(row[1]))
+    return TableMerge(table=table, inserted=inserted, updated=updated, elapsed_ms=round((time.perf_counter() - started) * 1000.0, 1))
+
+
+def merge_staging_parallel(cfg: PostgresConfig, workers: int) -> list[TableMerge]:
+    """Merge each level's tables concurrently, one connection (and transaction) per table.
+
+    Staging must already be committed. Each table commits on its own, so unlike
+    :func:`merge_staging` a failure part-way leaves earlier levels applied; the upserts only
+    overwrite older rows, so re-running the batch is safe.
+    """
+    results: list[TableMerge] = []
+    with ThreadPoolExecutor(max_workers=max(1, int(workers)), thread_name_prefix="staging-merge") as pool:
+        for level in MERGE_LEVELS:
+            results.extend(pool.map(lambda t: _merge_table(cfg, t), level))
+    return results
@@ -0,0 +1,53 @@
+from src.run_sql import apply_sql_files
+
+
+class _FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self.row = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params=None):
+        checksum = self.conn.migrations.get(params[0])
+        self.row = None if checksum is None else (checksum,)
+
+    def fetchone(self):
+        return self.row
+
+
+class _FakeConn:
+    def __init__(self):
+        self.migrations = {}
+        self.executed = []
+
+    def cursor(self):
+        return _FakeCursor(self)
+
+    def execute(self, sql, params=None, prepare=None):
+        if "INSERT INTO globalcart.sql_migrations" in sql:
+            self.migrations[params[0]] = params[1]
+        elif "sql_migrations" not in sql:
+            self.executed.append(sql)
+
+    def commit(self):
+        pass
+
+
+def test_unchanged_files_are_not_reapplied(tmp_path):
+    a = tmp_path / "a.sql"
+    b = tmp_path / "b.sql"
+    a.write_text("CREATE TABLE a (x INT);")
+    b.write_text("CREATE TABLE b (x INT);")
+    conn = _FakeConn()
+
+    assert apply_sql_files(conn, [a, b]) == ["a.sql", "b.sql"]
+    assert apply_sql_files(conn, [a, b]) == []
+
+    b.write_text("CREATE TABLE b (x INT, y INT);")
+    assert apply_sql_files(conn, [a, b]) == ["b.sql"]
+    assert conn.executed.count("NOTIFY globalcart_schema_changed;") == 2
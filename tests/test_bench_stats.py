@@ -0,0 +1,57 @@
+import pytest
+
+from bench.stats import Recorder, compare, percentile
+from bench.workloads import parse_mix
+
+
+def test_percentile_interpolates():
+    values = [10.0, 20.0, 30.0, 40.0, 50.0]
+    assert percentile(values, 50) == 30.0
+    assert percentile(values, 95) == pytest.approx(48.0)
+    assert percentile([7.0], 99) == 7.0
+    assert percentile([], 50) is None
+
+
+def test_recorder_summary_groups_by_endpoint():
+    rec = Recorder()
+    for ms in (5, 10, 15, 20):
+        rec.record("GET /api/customer/products", ms, 200)
+    rec.record("GET /api/customer/products", 100, 503)
+    rec.record("POST /api/customer/cart", 8, None)
+    rec.record_round_trips("GET /api/customer/products", 3)
+    rec.record_round_trips("GET /api/customer/products", 5)
+
+    out = rec.summary(2.0)
+    products = out["endpoints"]["GET /api/customer/products"]
+    assert products["count"] == 5
+    assert products["errors"] == 1
+    assert products["status"] == {"200": 4, "503": 1}
+    assert products["rps"] == 2.5
+    assert products["p50_ms"] == 15.0
+    assert products["max_ms"] == 100.0
+    assert products["db_round_trips"] == 4.0
+
+    cart = out["endpoints"]["POST /api/customer/cart"]
+    assert cart["status"] == {"error": 1}
+    assert cart["db_round_trips"] is None
+    assert out["totals"] == {"requests": 6, "errors": 2, "duration_s": 2.0, "rps": 3.0}
+
+
+def test_compare_reports_relative_change():
+    base = {"endpoints": {"GET /a": {"p95_ms": 100.0, "db_round_trips": 4}, "GET /gone": {"p95_ms": 5.0}}}
+    cand = {"endpoints": {"GET /a": {"p95_ms": 120.0, "db_round_trips": 2}, "GET /new": {"p95_ms": 1.0}}}
+    rows = {r["endpoint"]: r for r in compare(base, cand)}
+
+    assert rows["GET /a"]["change_pct"] == 20.0
+    assert rows["GET /a"]["candidate_db_round_trips"] == 2
+    assert rows["GET /gone"]["change_pct"] is None
+    assert rows["GET /new"]["baseline"] is None
+
+
+def test_parse_mix():
+    assert parse_mix("browse=5, purchase=3,admin=0") == {"browse": 5.0, "purchase": 3.0}
+    assert parse_mix("events") == {"events": 1.0}
+    with pytest.raises(ValueError):
+        parse_mix("checkout=1")
+    with pytest.raises(ValueError):
+        parse_mix("browse=0")
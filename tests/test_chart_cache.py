@@ -0,0 +1,79 @@
+import threading
+import time
+
+import pytest
+
+from backend.analytics.chart_cache import ChartCache
+
+
+def _slow_render(calls, delay=0.05):
+    def render(path):
+        calls.append(path)
+        time.sleep(delay)
+        path.write_bytes(b"\x89PNG fake")
+
+    return render
+
+
+def test_concurrent_requests_share_one_render(tmp_path):
+    cache = ChartCache(cache_dir=tmp_path / "cache", publish_dir=tmp_path)
+    calls = []
+    render = _slow_render(calls)
+    results = []
+
+    def worker():
+        results.append(cache.get_or_render("sales_trend", {"window_days": 90}, "wm-1", render))
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(calls) == 1
+    assert len({r.etag for r in results}) == 1
+    assert results[0].path.exists()
+    assert (tmp_path / "sales_trend.png").read_bytes() == b"\x89PNG fake"
+
+
+def test_new_watermark_or_params_change_key(tmp_path):
+    cache = ChartCache(cache_dir=tmp_path / "cache")
+    calls = []
+    render = _slow_render(calls, delay=0)
+
+    a = cache.get_or_render("sales_trend", {"window_days": 90}, "wm-1", render)
+    b = cache.get_or_render("sales_trend", {"window_days": 90}, "wm-1", render)
+    c = cache.get_or_render("sales_trend", {"window_days": 30}, "wm-1", render)
+    d = cache.get_or_render("sales_trend", {"window_days": 90}, "wm-2", render)
+
+    assert a.etag == b.etag
+    assert len({a.etag, c.etag, d.etag}) == 3
+    assert len(calls) == 3
+
+
+def test_failed_render_is_not_cached(tmp_path):
+    cache = ChartCache(cache_dir=tmp_path / "cache")
+
+    def boom(path):
+        raise RuntimeError("no data")
+
+    with pytest.raises(RuntimeError):
+        cache.get_or_render("top_products", {"top_n": 10}, "wm-1", boom)
+
+    calls = []
+    entry = cache.get_or_render("top_products", {"top_n": 10}, "wm-1", _slow_render(calls, delay=0))
+    assert len(calls) == 1
+    assert entry.path.exists()
+    assert list((tmp_path / "cache").glob("*.tmp")) == []
+
+
+def test_eviction_removes_old_files(tmp_path):
+    cache = ChartCache(cache_dir=tmp_path / "cache", max_entries=2)
+    render = _slow_render([], delay=0)
+
+    first = cache.get_or_render("funnel_conversion", {"window_days": 7}, "wm-1", render)
+    cache.get_or_render("funnel_conversion", {"window_days": 14}, "wm-1", render)
+    cache.get_or_render("funnel_conversion", {"window_days": 30}, "wm-1", render)
+
+    assert not first.path.exists()
+    assert cache.stats()["entries"] == 2
@@ -0,0 +1,92 @@
+import psycopg
+import pytest
+
+from src.analytics.churn_cohort import _CHURN_SQL, _COHORT_SQL
+from src.analytics.state import ensure_state_objects
+from src.config import PostgresConfig
+
+# The original queries over vw_orders_completed, before the state tables.
+_REFERENCE_CHURN_SQL = """
+WITH last_order AS (
+  SELECT customer_id, MAX(order_ts) AS last_order_ts
+  FROM globalcart.vw_orders_completed
+  GROUP BY 1
+)
+SELECT customer_id, last_order_ts
+FROM last_order
+WHERE last_order_ts < (CURRENT_DATE - INTERVAL '90 days')
+"""
+
+_REFERENCE_COHORT_SQL = """
+WITH first_purchase AS (
+  SELECT customer_id, date_trunc('month', MIN(order_ts)) AS cohort_month
+  FROM globalcart.vw_orders_completed
+  GROUP BY 1
+),
+activity AS (
+  SELECT o.customer_id,
+         fp.cohort_month,
+         date_trunc('month', o.order_ts) AS activity_month
+  FROM globalcart.vw_orders_completed o
+  JOIN first_purchase fp ON fp.customer_id = o.customer_id
+)
+SELECT cohort_month,
+       ((EXTRACT(YEAR FROM activity_month) - EXTRACT(YEAR FROM cohort_month)) * 12
+        + (EXTRACT(MONTH FROM activity_month) - EXTRACT(MONTH FROM cohort_month))) AS months_since_cohort,
+       COUNT(DISTINCT customer_id) AS customers
+FROM activity
+GROUP BY 1,2
+ORDER BY 1,2
+"""
+
+
+def _rows(conn, sql, params=None):
+    with conn.cursor() as cur:
+        cur.execute(sql, params)
+        return sorted(cur.fetchall())
+
+
+@pytest.fixture
+def conn():
+    try:
+        c = psycopg.connect(PostgresConfig().dsn() + " connect_timeout=2")
+    except psycopg.OperationalError:
+        pytest.skip("PostgreSQL not reachable; set PGHOST/PGPORT/PGDATABASE/PGUSER/PGPASSWORD to run DB tests")
+    try:
+        if _rows(c, "SELECT to_regclass('globalcart.vw_orders_completed') IS NOT NULL") != [(True,)]:
+            pytest.skip("globalcart views not loaded; run the pipeline first")
+        if _rows(c, "SELECT EXISTS (SELECT 1 FROM globalcart.vw_orders_completed)") != [(True,)]:
+            pytest.skip("no completed orders loaded")
+        ensure_state_objects(c)
+        yield c
+    finally:
+        # Everything the tests write to the state tables is rolled back.
+        c.rollback()
+        c.close()
+
+
+def test_state_cohort_matrix_and_churn_match_the_view_queries(conn):
+    conn.execute("SELECT globalcart.refresh_customer_cohort_state(NULL::bigint[])")
+
+    assert _rows(conn, _COHORT_SQL) == _rows(conn, _REFERENCE_COHORT_SQL)
+    assert _rows(conn, _CHURN_SQL) == _rows(conn, _REFERENCE_CHURN_SQL)
+
+
+def test_incremental_refresh_restores_the_full_rebuild(conn):
+    conn.execute("SELECT globalcart.refresh_customer_cohort_state(NULL::bigint[])")
+    fp_sql = "SELECT * FROM globalcart.customer_first_purchase"
+    act_sql = "SELECT * FROM globalcart.customer_activity"
+    full_fp, full_act = _rows(conn, fp_sql), _rows(conn, act_sql)
+
+    ids = [r[0] for r in _rows(conn, "SELECT customer_id FROM globalcart.customer_first_purchase ORDER BY customer_id LIMIT 50")]
+    conn.execute("DELETE FROM globalcart.customer_first_purchase WHERE customer_id = ANY(%s)", (ids,))
+    # A stale month the refresh must drop for these customers.
+    conn.execute(
+        "INSERT INTO globalcart.customer_activity (customer_id, activity_month) SELECT unnest(%s::bigint[]), TIMESTAMP '1990-01-01'",
+        (ids,),
+    )
+    conn.execute("SELECT globalcart.refresh_customer_cohort_state(%s::bigint[])", (ids,))
+
+    assert _rows(conn, fp_sql) == full_fp
+    assert _rows(conn, act_sql) == full_act
+    assert _rows(conn, _COHORT_SQL) == _rows(conn, _REFERENCE_COHORT_SQL)
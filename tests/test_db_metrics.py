@@ -0,0 +1,79 @@
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from backend import db_metrics
+from backend.db_metrics import QueryStats, RequestDbStats, normalize_sql, query_stats
+from backend.middleware import GlobalCartMiddleware
+
+
+class _Cursor:
+    def __init__(self, rowcount):
+        self.rowcount = rowcount
+
+
+def test_normalize_sql_strips_literals_and_params():
+    sql = """
+        SELECT * FROM globalcart.fact_orders  -- recent first
+        WHERE customer_id = %s AND order_status = 'PLACED' AND order_id IN (%s, %s, %s)
+        LIMIT 50 OFFSET $1;
+    """
+    assert normalize_sql(sql) == (
+        "SELECT * FROM globalcart.fact_orders WHERE customer_id = ? AND order_status = ? "
+        "AND order_id IN (?, ...) LIMIT ? OFFSET ?;"
+    )
+    assert normalize_sql("SELECT col1, t2.x FROM t2") == "SELECT col1, t2.x FROM t2"
+
+
+def test_request_stats_and_slow_queries():
+    stats = QueryStats(slow_query_ms=50, slow_log_size=2, repeat_threshold=3)
+    req = RequestDbStats(request_id="r1", method="GET", path="/api/x/1")
+    token = db_metrics.begin_request(req)
+    try:
+        for _ in range(3):
+            stats.observe(_Cursor(1), "SELECT 1 FROM t WHERE id = %s", 0.002)
+        stats.observe(_Cursor(10), "SELECT * FROM big WHERE note = 'x'", 0.080)
+        stats.observe(_Cursor(-1), "UPDATE t SET a = 1", 0.001)
+    finally:
+        db_metrics.end_request(token)
+
+    assert (req.queries, req.rows, req.slow_queries) == (5, 13, 1)
+    assert round(req.db_ms, 1) == 87.0
+
+    stats.finish_request("GET /api/x/{id}", req, 120.0)
+    snap = stats.snapshot()
+    [ep] = snap["endpoints"]
+    assert ep["endpoint"] == "GET /api/x/{id}"
+    assert ep["queries_per_request"] == 5
+    assert ep["repeated_statement_requests"] == 1
+    assert snap["slow_queries"][0]["sql"] == "SELECT * FROM big WHERE note = ?"
+    assert snap["slow_queries"][0]["request_id"] == "r1"
+
+    # Outside a request only slow statements are recorded.
+    stats.observe(_Cursor(0), "SELECT pg_sleep(1)", 1.0)
+    assert len(stats.snapshot()["slow_queries"]) == 2
+
+    stats.reset()
+    assert stats.snapshot()["endpoints"] == []
+
+
+def test_server_timing_header_and_route_template():
+    inner = FastAPI()
+
+    @inner.get("/api/items/{item_id}")
+    def item(item_id: int):
+        # Sync endpoints run in the threadpool; the request's stats must still be visible there.
+        query_stats.observe(_Cursor(1), "SELECT 1", 0.001)
+        query_stats.observe(_Cursor(2), "SELECT 2", 0.001)
+        return {"item_id": item_id}
+
+    inner.add_middleware(GlobalCartMiddleware)
+    query_stats.reset()
+
+    r = TestClient(inner).get("/api/items/7")
+    assert r.status_code == 200
+    assert 'desc="queries=2 rows=3"' in r.headers["server-timing"]
+
+    [ep] = query_stats.snapshot()["endpoints"]
+    assert ep["endpoint"] == "GET /api/items/{item_id}"
+    assert ep["queries_total"] == 2
+    query_stats.reset()
@@ -0,0 +1,43 @@
+import math
+
+from backend.analytics.downsample import bucket_bounds, bucket_mean, lttb_indices, lttb_multi_indices
+
+
+def test_lttb_keeps_endpoints_and_size():
+    xs = list(range(1000))
+    ys = [math.sin(x / 25.0) for x in xs]
+
+    idx = lttb_indices(xs, ys, 100)
+
+    assert len(idx) == 100
+    assert idx[0] == 0 and idx[-1] == 999
+    assert idx == sorted(set(idx))
+
+
+def test_lttb_preserves_spike():
+    xs = list(range(500))
+    ys = [0.0] * 500
+    ys[257] = 100.0
+
+    assert 257 in lttb_indices(xs, ys, 20)
+
+
+def test_lttb_short_series_untouched():
+    assert lttb_indices([0, 1, 2], [5, 6, 7], 10) == [0, 1, 2]
+
+
+def test_multi_series_stays_aligned_within_budget():
+    xs = list(range(365))
+    a = [float(x % 30) for x in xs]
+    b = [float((x * 7) % 11) for x in xs]
+
+    idx = lttb_multi_indices(xs, [a, b], 60)
+
+    assert len(idx) == 60
+    assert idx[0] == 0 and idx[-1] == 364
+
+
+def test_bucket_mean():
+    bounds = bucket_bounds(10, 3)
+    assert [len(r) for r in bounds] == [3, 3, 4]
+    assert bucket_mean(list(range(10)), bounds) == [1.0, 4.0, 7.5]
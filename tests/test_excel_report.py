@@ -0,0 +1,65 @@
+import numpy as np
+import pandas as pd
+from openpyxl import Workbook, load_workbook
+
+from src import generate_excel_report as report
+
+
+def _save_and_load(wb, tmp_path):
+    path = tmp_path / "out.xlsx"
+    wb.save(path)
+    return load_workbook(path)
+
+
+def test_write_sheet_streams_chunks_and_blanks_missing_values(tmp_path):
+    wb = Workbook(write_only=True)
+    chunks = (
+        pd.DataFrame({"order_id": [i, i + 1], "net_profit": [-1.5, np.nan], "order_dt": pd.to_datetime(["2024-01-02", None])})
+        for i in (1, 3, 5)
+    )
+    assert report.write_sheet(wb, "Loss_Orders", chunks) == 6
+
+    ws = _save_and_load(wb, tmp_path)["Loss_Orders"]
+    rows = list(ws.iter_rows(values_only=True))
+    assert rows[0] == ("order_id", "net_profit", "order_dt")
+    assert ws["A1"].font.b
+    assert [r[0] for r in rows[1:]] == [1, 2, 3, 4, 5, 6]
+    assert rows[2] == (2, None, None)
+    assert rows[1][2].year == 2024
+
+
+def test_write_sheet_continues_on_new_sheets_past_max_rows(tmp_path):
+    wb = Workbook(write_only=True)
+    df = pd.DataFrame({"n": range(10)})
+    assert report.write_sheet(wb, "Detail", [df.iloc[:4], df.iloc[4:]], max_rows=4) == 10
+
+    loaded = _save_and_load(wb, tmp_path)
+    assert loaded.sheetnames == ["Detail", "Detail_2", "Detail_3", "Detail_4"]
+    values = []
+    for ws in loaded.worksheets:
+        rows = list(ws.iter_rows(values_only=True))
+        assert rows[0] == ("n",)
+        values += [r[0] for r in rows[1:]]
+    assert values == list(range(10))
+
+
+def test_write_sheet_keeps_header_for_empty_result(tmp_path):
+    wb = Workbook(write_only=True)
+    assert report.write_sheet(wb, "Loss_Orders", [pd.DataFrame({"order_id": pd.Series([], dtype="int64")})]) == 0
+    rows = list(_save_and_load(wb, tmp_path)["Loss_Orders"].iter_rows(values_only=True))
+    assert rows == [("order_id",)]
+
+
+def test_build_excel_report_keeps_sheet_order(tmp_path, monkeypatch):
+    monkeypatch.setattr(report, "read_sql_df", lambda sql: pd.DataFrame({"sql_len": [len(sql)]}))
+    monkeypatch.setattr(
+        report, "iter_sql_df", lambda sql, block_bytes: iter([pd.DataFrame({"order_id": [7, 8]})])
+    )
+    out = tmp_path / "reports" / "report.xlsx"
+
+    rows = report.build_excel_report(out, workers=3)
+
+    names = [name for name, _ in report.SUMMARY_SHEETS]
+    assert rows == {**{n: 1 for n in names}, "Loss_Orders": 2}
+    assert load_workbook(out).sheetnames == names + ["Loss_Orders"]
+    assert list(out.parent.iterdir()) == [out]
@@ -0,0 +1,68 @@
+import numpy as np
+import pandas as pd
+from statsmodels.tsa.arima.model import ARIMA
+
+from src.analytics.forecasting import forecast_segments, segment_series
+
+
+def _daily(n_days=120, seed=11):
+    rng = np.random.default_rng(seed)
+    days = pd.date_range("2024-01-01", periods=n_days, freq="D")
+    rows = []
+    for seg_type, seg_value, level in [("total", "all", 5000.0), ("channel", "WEB", 3000.0), ("channel", "APP", 2000.0)]:
+        y = level + 5 * np.arange(n_days) + rng.normal(0, level * 0.05, n_days)
+        rows.append(pd.DataFrame({"segment_type": seg_type, "segment_value": seg_value, "dt": days.date, "net_revenue": y}))
+    daily = pd.concat(rows, ignore_index=True)
+    # A sparse segment: missing days become zero revenue on the shared calendar.
+    sparse = daily[daily["segment_value"] == "APP"].iloc[::3].assign(segment_type="region", segment_value="APAC")
+    return pd.concat([daily, sparse], ignore_index=True)
+
+
+def test_segment_series_share_one_daily_calendar():
+    series = segment_series(_daily())
+    assert set(series) == {("total", "all"), ("channel", "WEB"), ("channel", "APP"), ("region", "APAC")}
+    lengths = {len(s) for s in series.values()}
+    assert lengths == {120}
+    assert (series[("region", "APAC")] == 0).sum() == 80
+
+
+def test_forecasts_match_a_direct_arima_fit():
+    series = segment_series(_daily())
+    fc, _, counts = forecast_segments(series, horizon_days=14)
+    assert counts["cold"] == 4 and counts["reused"] == 0
+    assert len(fc) == 4 * 14
+
+    s = series[("total", "all")]
+    expected = ARIMA(s, order=(1, 1, 1)).fit().forecast(steps=14).to_numpy()
+    got = fc[fc["segment_type"] == "total"]
+    np.testing.assert_allclose(got["forecast_arima"].to_numpy(), expected)
+    assert got["forecast_dt"].iloc[0] == s.index.max() + pd.Timedelta(days=1)
+
+
+def test_model_cache_reuses_unchanged_series_and_warm_starts_changed_ones():
+    series = segment_series(_daily())
+    first, cache, _ = forecast_segments(series, horizon_days=7)
+
+    again, _, counts = forecast_segments(series, horizon_days=7, cache=cache)
+    assert counts == {"reused": 4, "warm": 0, "cold": 0, "arima_failed": 0}
+    pd.testing.assert_frame_equal(again, first)
+
+    grown = dict(series)
+    s = grown[("channel", "WEB")]
+    grown[("channel", "WEB")] = pd.concat([s, pd.Series([s.iloc[-1]], index=[s.index.max() + pd.Timedelta(days=1)])])
+    warm, _, counts = forecast_segments(grown, horizon_days=7, cache=cache)
+    assert counts["reused"] == 3 and counts["warm"] == 1
+
+    cold, _, _ = forecast_segments({("channel", "WEB"): grown[("channel", "WEB")]}, horizon_days=7)
+    web = warm[warm["segment_value"] == "WEB"]["forecast_arima"].to_numpy()
+    np.testing.assert_allclose(web, cold["forecast_arima"].to_numpy(), rtol=1e-3)
+
+
+def test_unfittable_series_still_gets_a_trend_forecast():
+    s = pd.Series([100.0, 120.0], index=pd.date_range("2024-01-01", periods=2, freq="D"))
+    fc, cache, counts = forecast_segments({("country", "X"): s}, horizon_days=3)
+    assert len(fc) == 3
+    assert fc["forecast_lr"].notna().all()
+    assert counts["arima_failed"] == 1
+    assert fc["forecast_arima"].isna().all()
+    assert cache["country/X"]["lr"] == [float(v) for v in fc["forecast_lr"]]
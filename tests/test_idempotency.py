@@ -0,0 +1,263 @@
+import json
+import threading
+from contextlib import contextmanager
+
+import psycopg
+import pytest
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
+
+from backend import idempotency as idem
+from backend.idempotency import IdempotencyGuard, StoredKey, request_hash
+
+
+class _Conn:
+    autocommit = False
+
+    def __init__(self):
+        self.committed = self.rolled_back = False
+
+    def commit(self):
+        self.committed = True
+
+    def rollback(self):
+        self.rolled_back = True
+
+
+class _MemoryStore:
+    """Stand-in for globalcart.idempotency_keys (no lease/TTL expiry)."""
+
+    def __init__(self):
+        self.rows = {}
+        self.lock = threading.Lock()
+
+    def install(self, monkeypatch):
+        @contextmanager
+        def get_conn():
+            yield _Conn()
+
+        monkeypatch.setattr(idem, "get_conn", get_conn)
+        monkeypatch.setattr(idem.schema_caps, "has", lambda conn, name: True)
+        monkeypatch.setattr(idem, "lookup", self.lookup)
+        monkeypatch.setattr(idem, "try_claim", self.try_claim)
+        monkeypatch.setattr(idem, "complete", self.complete)
+        monkeypatch.setattr(idem, "release", self.release)
+        monkeypatch.setattr(idem, "purge_expired", lambda conn: None)
+
+    def lookup(self, conn, ident):
+        with self.lock:
+            row = self.rows.get(ident)
+        if row is None:
+            return None
+        return StoredKey(row["hash"], row["status"], row["code"], row["body"], expired=False, lease_expired=False)
+
+    def try_claim(self, conn, ident, req_hash, token, lease_seconds, ttl_seconds):
+        with self.lock:
+            if ident in self.rows:
+                return False
+            self.rows[ident] = {"hash": req_hash, "status": "IN_PROGRESS", "token": token, "code": None, "body": None}
+            return True
+
+    def complete(self, conn, ident, token, code, body):
+        with self.lock:
+            row = self.rows.get(ident)
+            if row is None or row["status"] != "IN_PROGRESS" or row["token"] != token:
+                return False
+            row.update(status="COMPLETED", code=code, body=json.loads(json.dumps(body)))
+            return True
+
+    def release(self, conn, ident, token):
+        with self.lock:
+            row = self.rows.get(ident)
+            if row is not None and row["status"] == "IN_PROGRESS" and row["token"] == token:
+                del self.rows[ident]
+
+
+@pytest.fixture()
+def store(monkeypatch):
+    s = _MemoryStore()
+    s.install(monkeypatch)
+    return s
+
+
+def _writes(guard, body):
+    """A handler that commits its transaction through the guard, as the routes do."""
+
+    def handler():
+        conn = _Conn()
+        guard.commit(conn, body)
+        assert conn.committed
+        return body
+
+    return handler
+
+
+def test_request_hash_is_canonical():
+    assert request_hash({"a": 1, "b": [1, 2]}) == request_hash({"b": [1, 2], "a": 1})
+    assert request_hash({"a": 1}) != request_hash({"a": 2})
+
+
+def test_replays_stored_response_without_rerunning(store):
+    guard = IdempotencyGuard(poll_seconds=0.01)
+    calls = []
+
+    write = _writes(guard, {"order_id": 42, "status": "ORDER_CREATED"})
+
+    def handler():
+        calls.append(1)
+        return write()
+
+    ident = (7, "checkout_start", "k1")
+    first = guard._run(ident, "h", handler)
+    assert first == {"order_id": 42, "status": "ORDER_CREATED"}
+
+    replay = guard._run(ident, "h", handler)
+    assert len(calls) == 1
+    assert replay.status_code == 200
+    assert replay.headers[idem.REPLAY_HEADER] == "true"
+    assert json.loads(replay.body) == {"order_id": 42, "status": "ORDER_CREATED"}
+
+    with pytest.raises(HTTPException) as e:
+        guard._run(ident, "other-body", handler)
+    assert e.value.status_code == 422
+
+
+def test_errors_release_the_key(store):
+    guard = IdempotencyGuard(poll_seconds=0.01)
+    ident = (7, "create_order", "k2")
+
+    def boom():
+        raise HTTPException(status_code=409, detail="Insufficient stock")
+
+    with pytest.raises(HTTPException):
+        guard._run(ident, "h", boom)
+    assert ident not in store.rows
+    assert guard._run(ident, "h", _writes(guard, {"ok": True})) == {"ok": True}
+    assert store.rows[ident]["status"] == "COMPLETED"
+
+
+def test_in_flight_duplicate_waits_for_first_request(store):
+    guard = IdempotencyGuard(wait_seconds=5, poll_seconds=0.01)
+    ident = (7, "razorpay_confirm", "k3")
+    started, proceed = threading.Event(), threading.Event()
+    calls = []
+
+    write = _writes(guard, {"payment_status": "PAYMENT_SUCCESS"})
+
+    def slow():
+        calls.append(1)
+        started.set()
+        proceed.wait(5)
+        return write()
+
+    results = {}
+    first = threading.Thread(target=lambda: results.setdefault("first", guard._run(ident, "h", slow)))
+    first.start()
+    assert started.wait(5)
+    second = threading.Thread(target=lambda: results.setdefault("second", guard._run(ident, "h", slow)))
+    second.start()
+    proceed.set()
+    first.join(5)
+    second.join(5)
+
+    assert len(calls) == 1
+    assert results["first"] == {"payment_status": "PAYMENT_SUCCESS"}
+    assert json.loads(results["second"].body) == {"payment_status": "PAYMENT_SUCCESS"}
+
+
+def test_still_in_progress_after_wait_is_409(store):
+    guard = IdempotencyGuard(wait_seconds=0, poll_seconds=0.01)
+    ident = (7, "simulate_payment", "k4")
+    store.try_claim(None, ident, "h", "other", 60, 60)
+    with pytest.raises(HTTPException) as e:
+        guard._run(ident, "h", lambda: {"ok": True})
+    assert e.value.status_code == 409
+    assert e.value.headers["Retry-After"] == "1"
+
+
+def test_runs_handler_directly_without_key_or_database(monkeypatch):
+    guard = IdempotencyGuard()
+
+    @contextmanager
+    def down():
+        raise psycopg.OperationalError("connection refused")
+        yield
+
+    monkeypatch.setattr(idem, "get_conn", down)
+    assert guard.run(None, customer_id=1, endpoint="e", fingerprint={}, handler=lambda: "plain") == "plain"
+    assert guard.run("k", customer_id=1, endpoint="e", fingerprint={}, handler=lambda: "demo") == "demo"
+    with pytest.raises(HTTPException) as e:
+        guard.run("x" * 256, customer_id=1, endpoint="e", fingerprint={}, handler=lambda: None)
+    assert e.value.status_code == 400
+
+
+def test_stores_the_real_status_code(store):
+    guard = IdempotencyGuard(poll_seconds=0.01)
+    created = (7, "create_order", "k5")
+    guard._run(created, "h", _writes(guard, {"order_id": 1}), status_code=201)
+    assert guard._run(created, "h", lambda: None).status_code == 201
+
+    custom = (7, "create_order", "k6")
+    guard._run(custom, "h", _writes(guard, JSONResponse({"queued": True}, status_code=202)))
+    replay = guard._run(custom, "h", lambda: None)
+    assert replay.status_code == 202 and json.loads(replay.body) == {"queued": True}
+
+
+def test_key_stays_completed_when_handler_fails_after_commit(store):
+    guard = IdempotencyGuard(poll_seconds=0.01)
+    ident = (7, "create_order", "k7")
+    write = _writes(guard, {"order_id": 9})
+
+    def commit_then_fail():
+        write()
+        raise RuntimeError("connection lost after commit")
+
+    with pytest.raises(RuntimeError):
+        guard._run(ident, "h", commit_then_fail)
+    assert store.rows[ident]["status"] == "COMPLETED"
+    assert json.loads(guard._run(ident, "h", lambda: None).body) == {"order_id": 9}
+
+
+def test_handler_that_wrote_nothing_releases_the_key(store):
+    guard = IdempotencyGuard(poll_seconds=0.01)
+    ident = (7, "razorpay_confirm", "k8")
+    assert guard._run(ident, "h", lambda: {"demo": True}) == {"demo": True}
+    assert ident not in store.rows
+
+
+def test_lost_lease_rolls_the_handler_back(store):
+    guard = IdempotencyGuard(poll_seconds=0.01)
+    ident = (7, "checkout_start", "k9")
+    conn = _Conn()
+
+    def overtaken():
+        # The lease expired mid-request and a retry claimed the key.
+        store.rows[ident]["token"] = "retry"
+        guard.commit(conn, {"order_id": 3})
+
+    with pytest.raises(HTTPException) as e:
+        guard._run(ident, "h", overtaken)
+    assert e.value.status_code == 409
+    assert conn.rolled_back and not conn.committed
+    assert store.rows[ident]["status"] == "IN_PROGRESS"
+
+
+def test_anonymous_callers_are_keyed_on_the_key_alone(store):
+    guard = IdempotencyGuard(poll_seconds=0.01)
+    calls = []
+    write = _writes(guard, {"order_id": 5})
+
+    def handler():
+        calls.append(1)
+        return write()
+
+    for _ in range(2):
+        guard.run("anon", customer_id=None, endpoint="create_order", fingerprint={"a": 1}, handler=handler)
+    assert len(calls) == 1
+    assert (idem.ANONYMOUS_CUSTOMER_ID, "create_order", "anon") in store.rows
+
+
+def test_commit_outside_a_guarded_request_just_commits():
+    conn = _Conn()
+    IdempotencyGuard().commit(conn, {"ok": True})
+    assert conn.committed
@@ -0,0 +1,104 @@
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from src import incremental_refresh as inc
+from src.incremental_refresh import _build_new_orders, _distinct_picks
+
+_IDS = {"max_order_id": 100, "max_order_item_id": 200, "max_payment_id": 300, "max_event_id": 400, "max_shipment_id": 500}
+
+
+def _build(n=300, n_products=50, seed=7, n_customers=1000):
+    customers = pd.DataFrame(
+        {"customer_id": np.arange(1, n_customers + 1), "geo_id": np.arange(n_customers) % 3 + 1}
+    )
+    products = pd.DataFrame(
+        {
+            "product_id": np.arange(1, n_products + 1),
+            "unit_cost": np.full(n_products, 40.0),
+            "list_price": np.linspace(99.0, 999.0, n_products),
+        }
+    )
+    return _build_new_orders(
+        customers=customers,
+        products=products,
+        geo_currency={1: "INR", 2: "USD"},
+        fc_ids=np.array([11, 12]),
+        n=n,
+        since_ts=datetime(2025, 1, 1, 12, 0),
+        now_ts=datetime(2025, 1, 1, 12, 30),
+        ids=_IDS,
+        seed=seed,
+    )
+
+
+def test_distinct_picks_rows_have_no_duplicates():
+    picks = _distinct_picks(np.random.default_rng(0), 5, 1000, 4)
+    assert all(len(set(row)) == 4 for row in picks.tolist())
+
+
+def test_new_orders_are_consistent_across_tables():
+    orders, items, payments, shipments, funnel = _build()
+
+    assert orders["order_id"].tolist() == list(range(101, 401))
+    assert orders["customer_id"].between(1, 1000).all()
+    assert set(orders["currency"]) <= {"INR", "USD"}
+    assert items["order_item_id"].tolist() == list(range(201, 201 + len(items)))
+    assert (items.groupby("order_id")["product_id"].nunique() == items.groupby("order_id").size()).all()
+    assert items.groupby("order_id").size().between(1, 4).all()
+
+    totals = items.groupby("order_id")["line_net_revenue"].sum().round(2)
+    assert np.allclose(orders.set_index("order_id")["net_amount"], totals)
+    assert np.allclose(payments["amount"], orders["net_amount"])
+
+    failed = payments["payment_status"].isin(["FAILED", "DECLINED"])
+    assert (orders.loc[failed, "order_status"] == "CANCELLED").all()
+    assert payments.loc[failed, "captured_ts"].isna().all()
+    assert (payments.loc[payments["payment_method"] == "COD", "gateway_fee_amount"] == 0).all()
+
+    assert set(shipments["order_id"]) == set(orders.loc[orders["order_status"].isin(["DELIVERED", "COMPLETED"]), "order_id"])
+    assert (shipments["sla_breached_flag"] == (shipments["delivered_dt"] > shipments["promised_delivery_dt"])).all()
+
+
+def test_funnel_sessions_are_ordered_and_end_in_payment_outcome():
+    orders, _, payments, _, funnel = _build()
+
+    assert funnel["event_id"].tolist() == list(range(401, 401 + len(funnel)))
+    assert funnel.groupby("session_id")["event_ts"].apply(lambda s: s.is_monotonic_increasing).all()
+
+    last = funnel.groupby("session_id").tail(1).set_index("order_id")
+    outcome = payments.set_index("order_id")["payment_status"].map(
+        lambda s: "PAYMENT_FAILED" if s in ("FAILED", "DECLINED") else "ORDER_PLACED"
+    )
+    assert (last["stage"] == outcome.reindex(last.index)).all()
+    assert funnel.loc[funnel["stage"] == "VIEW_PRODUCT", "order_id"].isna().all()
+    assert funnel.loc[funnel["stage"] == "VIEW_PRODUCT", "product_id"].notna().all()
+
+
+def test_same_seed_same_delta():
+    a = _build(n=50, seed=3)
+    b = _build(n=50, seed=3)
+    for x, y in zip(a, b):
+        pd.testing.assert_frame_equal(x, y)
+
+
+def test_repeat_buyers_stay_near_independent_draws(monkeypatch):
+    n = 1500
+    requested = {}
+
+    def sample_dim(conn, table, columns, target_rows, seed):
+        requested[table] = target_rows
+        return pd.DataFrame()
+
+    monkeypatch.setattr(inc, "_sample_dim", sample_dim)
+    monkeypatch.setattr(inc, "_read_df", lambda conn, sql: pd.DataFrame({"geo_id": [], "currency": [], "fc_id": []}))
+    monkeypatch.setattr(inc, "_build_new_orders", lambda **kw: None)
+    inc._generate_new_orders(None, inc.DeltaConfig(new_orders=n, update_orders=0, update_shipments=0, late_returns=0), datetime(2025, 1, 1), datetime(2025, 1, 2), _IDS, 1)
+    pool = requested["globalcart.dim_customer"]
+    assert pool >= 20 * n
+
+    # Drawing n orders from that pool repeats ~n / (2 * pool) of customers, not the ~32% a 1.2x pool gave.
+    orders = _build(n=n, n_customers=pool)[0]
+    repeat_rate = orders["customer_id"].duplicated().mean()
+    assert 0 < repeat_rate < 0.05
@@ -0,0 +1,117 @@
+import json
+import os
+
+from fastapi.testclient import TestClient
+
+from backend.main import app
+from backend.metrics import Registry, collect_all, merge_snapshots, metrics_dir, prune_snapshots, render_text
+
+
+def _registry():
+    reg = Registry()
+    requests = reg.counter("t_requests_total", "Requests.", ("route", "status"))
+    inflight = reg.gauge("t_inflight", "In flight.")
+    latency = reg.histogram("t_latency_seconds", "Latency.", ("route",), buckets=(0.1, 1.0))
+    return reg, requests, inflight, latency
+
+
+def test_render_text_exposition_format():
+    reg, requests, inflight, latency = _registry()
+    requests.inc(route="/api/x/{id}", status=200)
+    requests.inc(2, route="/api/x/{id}", status=200)
+    inflight.inc()
+    latency.observe(0.05, route="/a")
+    latency.observe(0.5, route="/a")
+    latency.observe(3.0, route="/a")
+
+    text = render_text(merge_snapshots([reg.snapshot()]))
+    assert "# TYPE t_requests_total counter" in text
+    assert 't_requests_total{route="/api/x/{id}",status="200"} 3' in text
+    assert "t_inflight 1" in text
+    assert 't_latency_seconds_bucket{route="/a",le="0.1"} 1' in text
+    assert 't_latency_seconds_bucket{route="/a",le="1"} 2' in text
+    assert 't_latency_seconds_bucket{route="/a",le="+Inf"} 3' in text
+    assert 't_latency_seconds_count{route="/a"} 3' in text
+    assert 't_latency_seconds_sum{route="/a"} 3.55' in text
+
+
+def test_merge_sums_workers():
+    a, req_a, _, lat_a = _registry()
+    b, req_b, _, lat_b = _registry()
+    req_a.inc(route="/r", status=200)
+    req_b.inc(route="/r", status=200)
+    req_b.inc(route="/r", status=500)
+    lat_a.observe(0.05, route="/r")
+    lat_b.observe(0.05, route="/r")
+
+    merged = merge_snapshots([a.snapshot(), b.snapshot()])
+    assert merged["t_requests_total"]["values"] == {("/r", "200"): 2.0, ("/r", "500"): 1.0}
+    assert merged["t_latency_seconds"]["values"][("/r",)]["counts"] == [2, 0, 0]
+
+
+def test_collect_all_reads_live_siblings_and_drops_dead(tmp_path):
+    sibling = {
+        "pid": os.getppid(),
+        "ts": 0,
+        "families": {
+            "globalcart_funnel_events_total": {
+                "type": "counter",
+                "help": "Funnel events received by result.",
+                "labelnames": ["result"],
+                "samples": [[["stored"], 5]],
+            }
+        },
+    }
+    (tmp_path / f"{os.getppid()}.json").write_text(json.dumps(sibling))
+    (tmp_path / "999999999.json").write_text(json.dumps(sibling))
+
+    merged, workers = collect_all(tmp_path)
+    assert workers == 2
+    assert merged["globalcart_funnel_events_total"]["values"][("stored",)] >= 5
+    assert not (tmp_path / "999999999.json").exists()
+    assert (tmp_path / f"{os.getpid()}.json").exists()
+
+
+def test_metrics_endpoint(monkeypatch, tmp_path):
+    monkeypatch.setenv("METRICS_DIR", str(tmp_path))
+    monkeypatch.delenv("METRICS_TOKEN", raising=False)
+    client = TestClient(app)
+    client.get("/api/admin/kpis/latest")
+
+    r = client.get("/metrics")
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("text/plain; version=0.0.4")
+    assert 'globalcart_http_requests_total{method="GET",route="/api/admin/kpis/latest",status="403"}' in r.text
+    assert "globalcart_chart_render_queue_depth" in r.text
+    assert "globalcart_db_up" in r.text
+
+    monkeypatch.setenv("METRICS_TOKEN", "s3cret")
+    assert client.get("/metrics").status_code == 401
+    assert client.get("/metrics", headers={"Authorization": "Bearer s3cret"}).status_code == 200
+
+
+def test_metrics_dir_is_explicit(monkeypatch, tmp_path):
+    monkeypatch.delenv("METRICS_DIR", raising=False)
+    monkeypatch.delenv("PROMETHEUS_MULTIPROC_DIR", raising=False)
+    assert metrics_dir() is None
+
+    monkeypatch.setenv("PROMETHEUS_MULTIPROC_DIR", str(tmp_path / "prom"))
+    assert metrics_dir() == tmp_path / "prom"
+    monkeypatch.setenv("METRICS_DIR", str(tmp_path / "own"))
+    assert metrics_dir() == tmp_path / "own"
+    monkeypatch.setenv("METRICS_DIR", "off")
+    assert metrics_dir() is None
+
+
+def test_prune_at_startup_drops_snapshots_from_a_previous_run(tmp_path):
+    live_recent = tmp_path / f"{os.getppid()}.json"
+    live_stale = tmp_path / "1.json"  # init is alive, but its file stopped being refreshed long ago
+    dead = tmp_path / "999999999.json"
+    own_leftover = tmp_path / f"{os.getpid()}.json"
+    for path in (live_recent, live_stale, dead, own_leftover):
+        path.write_text("{}")
+    os.utime(live_stale, (0, 0))
+
+    prune_snapshots(tmp_path)
+
+    assert sorted(p.name for p in tmp_path.iterdir()) == [live_recent.name]
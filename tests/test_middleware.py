@@ -0,0 +1,80 @@
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+
+from backend.main import app
+from backend.middleware import GlobalCartMiddleware
+from backend.rate_limit import RateLimiter
+from backend.settings import Settings
+
+client = TestClient(app)
+
+
+def test_security_headers_and_request_id():
+    r = client.get("/", follow_redirects=False, headers={"X-Request-ID": "abc123"})
+    assert r.headers["x-request-id"] == "abc123"
+    assert r.headers["x-content-type-options"] == "nosniff"
+    assert r.headers["x-frame-options"] == "DENY"
+
+    r = client.get("/", follow_redirects=False)
+    assert len(r.headers["x-request-id"]) == 12
+
+
+def test_shop_and_admin_html_are_never_cached():
+    for path in ("/shop/", "/admin/"):
+        r = client.get(path, headers={"If-None-Match": '"stale"', "If-Modified-Since": "Wed, 01 Jan 2020 00:00:00 GMT"})
+        assert r.status_code == 200
+        assert r.headers["cache-control"].startswith("no-store")
+        assert "etag" not in r.headers
+        assert "last-modified" not in r.headers
+
+    r = client.get("/admin/app.js")
+    assert r.headers["cache-control"].startswith("no-store")
+
+
+def _limited_app():
+    inner = FastAPI()
+
+    @inner.get("/api/ping")
+    def ping():
+        return {"ok": True}
+
+    @inner.get("/api/stream")
+    def stream():
+        return StreamingResponse(iter([b"a", b"b", b"c"]), media_type="text/plain")
+
+    settings = Settings(
+        env="dev",
+        jwt_secret="",
+        rate_limit_enabled=True,
+        rate_limit_requests=2,
+        rate_limit_window_seconds=60,
+        rate_limit_backend="memory",
+        rate_limit_algorithm="token_bucket",
+        rate_limit_max_keys=100,
+        rate_limit_routes=(),
+        chart_prewarm_enabled=False,
+        schema_listen_enabled=False,
+        outbox_dispatcher_enabled=False,
+    )
+    inner.add_middleware(GlobalCartMiddleware, rate_limiter=RateLimiter(settings, inner.router.routes))
+    return inner
+
+
+def test_rate_limited_response():
+    c = TestClient(_limited_app())
+    assert c.get("/api/ping").status_code == 200
+    assert c.get("/api/ping").status_code == 200
+
+    r = c.get("/api/ping", headers={"X-Request-ID": "rl-1"})
+    assert r.status_code == 429
+    assert r.json()["error"] == {"type": "rate_limited", "message": "Too many requests", "request_id": "rl-1"}
+    assert int(r.headers["retry-after"]) >= 1
+    assert r.headers["x-content-type-options"] == "nosniff"
+
+
+def test_streaming_response_passes_through():
+    r = TestClient(_limited_app()).get("/api/stream")
+    assert r.status_code == 200
+    assert r.text == "abc"
+    assert "x-request-id" in r.headers
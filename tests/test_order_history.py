@@ -0,0 +1,35 @@
+from datetime import date, datetime
+
+import psycopg
+import pytest
+
+from backend import order_history
+from backend.order_history import derive_order_status, refresh_order_history
+
+NOW = datetime(2025, 1, 10, 12, 0, 0)
+
+
+def test_cancelled_orders_stay_cancelled_even_with_shipments():
+    assert derive_order_status("cancelled", datetime(2025, 1, 9), date(2025, 1, 9), NOW) == "CANCELLED"
+
+
+def test_status_follows_shipment_timestamps():
+    assert derive_order_status("PLACED", None, None, NOW) == "PLACED"
+    assert derive_order_status("ORDER_CONFIRMED", datetime(2025, 1, 10, 11), None, NOW) == "SHIPPED"
+    assert derive_order_status("ORDER_CONFIRMED", datetime(2025, 1, 10, 11), date(2025, 1, 10), NOW) == "DELIVERED"
+
+
+def test_future_shipment_timestamps_do_not_advance_status():
+    assert derive_order_status("PLACED", datetime(2025, 1, 10, 12, 1), date(2025, 1, 13), NOW) == "PLACED"
+
+
+class _FailingConn:
+    def execute(self, query, params=None):
+        raise psycopg.errors.DivisionByZero("division by zero")
+
+
+def test_refresh_failures_fail_the_triggering_write(monkeypatch):
+    # The refresh shares the write's transaction, so an error must reach the caller and roll it back.
+    monkeypatch.setattr(order_history, "history_available", lambda conn: True)
+    with pytest.raises(psycopg.errors.DivisionByZero):
+        refresh_order_history(_FailingConn(), [3, 1])
@@ -0,0 +1,197 @@
+import json
+import smtplib
+
+import pytest
+
+from backend.outbox import (
+    REDACTED_BODY,
+    FileSink,
+    OutboxDispatcher,
+    PermanentDeliveryError,
+    SmtpSink,
+    delivery_configured,
+    enqueue_email,
+    retry_delay_seconds,
+)
+
+
+class _Cursor:
+    def __init__(self, conn):
+        self._conn = conn
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params=None):
+        self._conn.statements.append((" ".join(sql.split()), params))
+
+    def fetchall(self):
+        rows, self._conn.claimable = self._conn.claimable, []
+        return rows
+
+
+class _Conn:
+    def __init__(self, claimable):
+        self.claimable = list(claimable)
+        self.statements = []
+
+    def cursor(self):
+        return _Cursor(self)
+
+
+class _FlakySink:
+    name = "flaky"
+
+    def __init__(self, fail):
+        self.fail = fail
+        self.sent = []
+        self.idled = 0
+
+    def send(self, to_email, subject, body):
+        if to_email in self.fail:
+            raise self.fail[to_email]
+        self.sent.append(to_email)
+
+    def idle(self):
+        self.idled += 1
+
+    def close(self):
+        pass
+
+
+def test_dispatch_once_records_sent_retry_and_permanent_failures():
+    sink = _FlakySink({"retry@example.com": OSError("timeout"), "bad@example.com": PermanentDeliveryError("550")})
+    conn = _Conn(
+        [
+            (1, "ok@example.com", "s", "b", "ORDER_CONFIRMED", 1),
+            (2, "retry@example.com", "s", "b", "OTP_LOGIN", 1),
+            (3, "bad@example.com", "s", "b", "ORDER_CONFIRMED", 1),
+        ]
+    )
+    dispatcher = OutboxDispatcher(sink, batch_size=10, max_attempts=3)
+
+    assert dispatcher.dispatch_once(conn) == 3
+    assert sink.sent == ["ok@example.com"]
+
+    expire, claim, sent, failed = conn.statements
+    assert "expires_at <= NOW()" in expire[0]
+    assert "FOR UPDATE SKIP LOCKED" in claim[0] and "expires_at > NOW()" in claim[0]
+    assert sent[1] == ("flaky", ["OTP_LOGIN", "OTP_SIGNUP"], REDACTED_BODY, [1])
+    ids, statuses, errors, delays, provider, redacted_kinds, redacted_body = failed[1]
+    assert ids == [2, 3]
+    assert statuses == ["PENDING", "FAILED"]
+    assert delays[0] > 0 and delays[1] == 0.0
+    # Failed OTP rows lose their code too; retries past a mail's deadline fail it.
+    assert (provider, redacted_kinds, redacted_body) == ("flaky", ["OTP_LOGIN", "OTP_SIGNUP"], REDACTED_BODY)
+    assert "o.expires_at <= NOW() + make_interval(secs => f.delay)" in failed[0]
+
+
+def test_last_attempt_marks_failed_and_empty_batch_idles_the_sink():
+    sink = _FlakySink({"retry@example.com": OSError("timeout")})
+    conn = _Conn([(7, "retry@example.com", "s", "b", "ORDER_CONFIRMED", 3)])
+    dispatcher = OutboxDispatcher(sink, max_attempts=3)
+
+    dispatcher.dispatch_once(conn)
+    assert conn.statements[-1][1][1] == ["FAILED"]
+
+    assert dispatcher.dispatch_once(conn) == 0
+    assert sink.idled == 1
+
+
+def test_retry_delay_grows_exponentially_and_is_capped():
+    assert 24.0 <= retry_delay_seconds(1, base=30, cap=3600) <= 36.0
+    assert 96.0 <= retry_delay_seconds(3, base=30, cap=3600) <= 144.0
+    assert retry_delay_seconds(30, base=30, cap=3600) <= 3600 * 1.2
+
+
+def test_file_sink_writes_json_lines(tmp_path):
+    path = tmp_path / "mail.jsonl"
+    sink = FileSink(str(path))
+    sink.send("a@example.com", "Hi", "Body")
+    sink.send("b@example.com", "Hi", "Body")
+
+    lines = [json.loads(l) for l in path.read_text().splitlines()]
+    assert [l["to"] for l in lines] == ["a@example.com", "b@example.com"]
+
+
+def test_delivery_configured_follows_outbox_sink(monkeypatch):
+    for k in ("SENDGRID_API_KEY", "SENDGRID_FROM_EMAIL", "SMTP_HOST", "SMTP_USER", "SMTP_PASSWORD", "SMTP_FROM_EMAIL"):
+        monkeypatch.delenv(k, raising=False)
+    monkeypatch.setenv("OUTBOX_SINK", "auto")
+    assert delivery_configured() is False
+    monkeypatch.setenv("OUTBOX_SINK", "file")
+    assert delivery_configured() is True
+    monkeypatch.setenv("OUTBOX_SINK", "none")
+    monkeypatch.setenv("SENDGRID_API_KEY", "SG.x")
+    monkeypatch.setenv("SENDGRID_FROM_EMAIL", "noreply@example.com")
+    assert delivery_configured() is False
+
+
+def test_enqueue_sets_a_deadline_only_when_asked():
+    conn = _Conn([])
+    with conn.cursor() as cur:
+        enqueue_email(cur, to_email="a@example.com", subject="s", body="123456", kind="OTP_LOGIN", expires_in_seconds=300)
+        enqueue_email(cur, to_email="a@example.com", subject="s", body="b", kind="ORDER_CONFIRMED")
+    inserts = [params for sql, params in conn.statements if sql.startswith("INSERT")]
+    assert inserts[0][-1] == 300.0
+    assert inserts[1][-1] is None
+
+
+class _FakeSmtp:
+    def __init__(self, errors):
+        self.errors = errors
+        self.closed = False
+        self.sent = []
+
+    def send_message(self, msg):
+        if self.errors:
+            raise self.errors.pop(0)
+        self.sent.append(msg["To"])
+
+    def close(self):
+        self.closed = True
+
+
+def _smtp_sink(monkeypatch, *sessions):
+    sink = SmtpSink("smtp.test", 587, "u", "p", "noreply@example.com")
+    pending = list(sessions)
+    monkeypatch.setattr(sink, "_connect", lambda: pending.pop(0))
+    return sink
+
+
+def test_smtp_session_is_dropped_after_an_error_mid_transaction(monkeypatch):
+    broken = _FakeSmtp([smtplib.SMTPDataError(451, b"try again")])
+    fresh = _FakeSmtp([])
+    sink = _smtp_sink(monkeypatch, broken, fresh)
+
+    with pytest.raises(smtplib.SMTPDataError):
+        sink.send("a@example.com", "s", "b")
+    assert broken.closed
+
+    sink.send("b@example.com", "s", "b")
+    assert fresh.sent == ["b@example.com"]
+
+
+def test_smtp_refusals_are_permanent_only_for_5xx(monkeypatch):
+    session = _FakeSmtp(
+        [
+            smtplib.SMTPRecipientsRefused({"a@example.com": (450, b"greylisted")}),
+            smtplib.SMTPRecipientsRefused({"a@example.com": (550, b"no such user")}),
+        ]
+    )
+    sink = _smtp_sink(monkeypatch, session)
+
+    with pytest.raises(smtplib.SMTPRecipientsRefused):
+        sink.send("a@example.com", "s", "b")
+    with pytest.raises(PermanentDeliveryError):
+        sink.send("a@example.com", "s", "b")
+    assert not session.closed  # a refused recipient leaves the session usable
+
+    busy = _FakeSmtp([smtplib.SMTPSenderRefused(421, b"busy", "noreply@example.com")])
+    sink = _smtp_sink(monkeypatch, busy)
+    with pytest.raises(smtplib.SMTPSenderRefused):
+        sink.send("a@example.com", "s", "b")
+    assert busy.closed
@@ -0,0 +1,75 @@
+import numpy as np
+import pandas as pd
+
+from src.analytics.outliers import customer_discount_stats, flag_outliers
+
+
+def _orders(n_customers=1500, n_orders=9000, seed=5):
+    rng = np.random.default_rng(seed)
+    gross = rng.gamma(2.0, 500.0, n_orders).round(2)
+    gross[rng.random(n_orders) < 0.02] = 0.0
+    discount = (gross * rng.beta(1.0, 6.0, n_orders)).round(2)
+    orders = pd.DataFrame(
+        {
+            "customer_id": rng.integers(1, n_customers + 1, n_orders),
+            "order_id": np.arange(1, n_orders + 1),
+            "discount_amount": discount,
+            "gross_before_discount": gross,
+            "net_revenue": gross - discount,
+        }
+    )
+    return orders.sort_values("customer_id", kind="stable", ignore_index=True)
+
+
+def _reference(items):
+    # The original per-group lambda implementation.
+    items = items.copy()
+    with np.errstate(divide="ignore", invalid="ignore"):
+        items["discount_pct"] = np.where(
+            items["gross_before_discount"] == 0,
+            0.0,
+            100.0 * items["discount_amount"] / items["gross_before_discount"],
+        )
+    return (
+        items.groupby("customer_id")
+        .agg(
+            orders=("order_id", "nunique"),
+            avg_discount_pct=("discount_pct", "mean"),
+            p95_discount_pct=("discount_pct", lambda s: float(s.quantile(0.95))),
+            net_revenue=("net_revenue", "sum"),
+        )
+        .reset_index()
+    )
+
+
+def _chunks(df, size):
+    return (df.iloc[i : i + size] for i in range(0, len(df), size))
+
+
+def test_streamed_stats_match_groupby_lambda_for_any_chunking():
+    orders = _orders()
+    expected = _reference(orders)
+    for size in (1, 7, 500, len(orders)):
+        got = customer_discount_stats(_chunks(orders, size))
+        pd.testing.assert_frame_equal(got, expected, check_dtype=False)
+
+
+def test_empty_history_has_stat_columns():
+    got = customer_discount_stats(iter([]))
+    assert got.empty
+    assert list(got.columns) == ["customer_id", "orders", "avg_discount_pct", "p95_discount_pct", "net_revenue"]
+
+
+def test_flags_use_iqr_upper_fence():
+    cust = pd.DataFrame(
+        {
+            "customer_id": range(1, 9),
+            "avg_discount_pct": [5.0, 6.0, 5.5, 6.5, 5.0, 6.0, 40.0, 5.5],
+            "refund_amount": [0.0, 10.0, 0.0, 20.0, 10.0, 0.0, 0.0, 900.0],
+        }
+    )
+    flagged = flag_outliers(cust)
+    assert flagged.loc[flagged["flag_discount_abuse"], "customer_id"].tolist() == [7]
+    assert flagged.loc[flagged["flag_refund_abuse"], "customer_id"].tolist() == [8]
+    assert flagged.loc[flagged["flag_any"], "customer_id"].tolist() == [7, 8]
+    assert "flag_any" not in cust
@@ -0,0 +1,104 @@
+import time
+from functools import partial
+from pathlib import Path
+
+import pytest
+
+from src.dag import Step, run_dag
+
+
+def _no_tables(tables):
+    return {}
+
+
+def _run(steps, tmp_path, **kw):
+    kw.setdefault("workers", 1)
+    return {r.name: r for r in run_dag(steps, cache_path=tmp_path / "cache.json", watermarks=kw.pop("watermarks", _no_tables), **kw)}
+
+
+def test_steps_run_after_their_dependencies(tmp_path):
+    order = []
+    steps = [
+        Step("report", lambda: order.append("report"), deps=("a", "b")),
+        Step("a", lambda: order.append("a"), deps=("load",)),
+        Step("b", lambda: order.append("b"), deps=("load",)),
+        Step("load", lambda: order.append("load")),
+    ]
+    results = _run(steps, tmp_path)
+    assert order[0] == "load" and order[-1] == "report"
+    assert all(r.status == "ran" for r in results.values())
+
+
+def test_unchanged_inputs_are_cached_until_a_source_table_changes(tmp_path):
+    out = tmp_path / "rfm.csv"
+    calls = []
+    counters = {"fact_orders": [100, 0, 0]}
+
+    def job():
+        calls.append(1)
+        out.write_text("x")
+
+    def steps():
+        return [Step("rfm", job, tables=("fact_orders",), params={"k": 1}, outputs=(out,), cache=True)]
+
+    watermarks = lambda tables: {t: counters[t] for t in tables}
+    assert _run(steps(), tmp_path, watermarks=watermarks)["rfm"].status == "ran"
+    assert _run(steps(), tmp_path, watermarks=watermarks)["rfm"].status == "cached"
+
+    counters["fact_orders"] = [150, 3, 0]
+    assert _run(steps(), tmp_path, watermarks=watermarks)["rfm"].status == "ran"
+
+    out.unlink()
+    assert _run(steps(), tmp_path, watermarks=watermarks)["rfm"].status == "ran"
+    assert _run(steps(), tmp_path, watermarks=watermarks, force=True)["rfm"].status == "ran"
+    assert len(calls) == 4
+
+
+def test_failure_skips_dependents_and_raises(tmp_path):
+    ran = []
+
+    def boom():
+        raise ValueError("bad input")
+
+    steps = [
+        Step("load", boom),
+        Step("rfm", lambda: ran.append("rfm"), deps=("load",)),
+        Step("other", lambda: ran.append("other")),
+    ]
+    with pytest.raises(RuntimeError, match="load: ValueError: bad input"):
+        _run(steps, tmp_path)
+    assert ran == ["other"]
+
+
+def test_parallel_steps_overlap(tmp_path):
+    steps = [Step(f"job{i}", partial(time.sleep, 1.0), parallel=True) for i in range(3)]
+    started = time.perf_counter()
+    results = _run(steps, tmp_path, workers=3)
+    assert time.perf_counter() - started < 2.5
+    assert all(r.status == "ran" and r.seconds >= 1.0 for r in results.values())
+
+
+def test_parallel_pipeline_steps_do_not_start_nested_pools(tmp_path):
+    from src.pipeline import build_steps
+
+    forecasting = next(s for s in build_steps(tmp_path, scale="small", truncate=False) if s.name == "forecasting")
+    assert forecasting.parallel
+    assert forecasting.fn.keywords == {"workers": 1}
+
+
+def test_generate_and_load_are_cached_on_scale_seed_and_code():
+    from src.dag import fingerprint
+    from src.pipeline import build_steps
+
+    root = Path(__file__).resolve().parents[1]
+
+    def by_name(scale):
+        return {s.name: s for s in build_steps(root, scale=scale, truncate=True)}
+
+    small, medium = by_name("small"), by_name("medium")
+    for name in ("generate", "load"):
+        assert small[name].cache and not small[name].tables
+        assert fingerprint(small[name], {}) == fingerprint(by_name("small")[name], {})
+        assert fingerprint(small[name], {}) != fingerprint(medium[name], {})
+    assert {p.name for p in small["load"].code} == {"generate_data.py", "load_to_postgres.py", "00_schema.sql"}
+    assert all(p.parent == root / "data" / "raw" for p in small["generate"].outputs)
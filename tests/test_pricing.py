@@ -0,0 +1,69 @@
+from decimal import Decimal
+
+import pytest
+
+from backend.pricing import CartSummaryCache, PricedProduct, discount_pct, price_items, promo_discount, sell_price
+
+
+def test_sell_price_rounds_half_up_to_paise():
+    assert discount_pct(7) == 5
+    assert discount_pct(10) == 12
+    # 1999 * 0.88 = 1759.12 exactly; 0.15 * 0.95 = 0.1425 -> 0.14
+    assert sell_price(1999, 10) == Decimal("1759.12")
+    assert sell_price("0.15", 7) == Decimal("0.14")
+    # 0.30 * 0.95 = 0.285 must round up (binary floats give 0.28)
+    assert sell_price("0.30", 7) == Decimal("0.29")
+
+
+def test_price_items_lines_and_totals():
+    products = {1: PricedProduct.build(1, 1000, 600), 2: PricedProduct.build(2, "249.99", 100)}
+    cart = price_items([(1, 2), (2, 3)], products)
+
+    first, second = cart.lines
+    assert first.product.sell_price == Decimal("920.00")
+    assert (first.line_gross, first.line_discount, first.line_tax, first.line_total) == (
+        Decimal("2000.00"),
+        Decimal("160.00"),
+        Decimal("128.80"),
+        Decimal("1968.80"),
+    )
+    assert second.product.sell_price == Decimal("224.99")
+    assert second.line_tax == Decimal("47.25")
+    assert second.line_total == Decimal("722.22")
+    assert cart.gross_amount == first.line_gross + second.line_gross
+    assert cart.net_amount == Decimal("2691.02")
+
+    with pytest.raises(KeyError):
+        price_items([(3, 1)], products)
+
+    empty = price_items([], products)
+    assert empty.net_amount == Decimal("0.00") and empty.lines == ()
+
+
+def test_promo_discount():
+    assert promo_discount("1234.56", "percent", 10, 250) == Decimal("123.46")
+    assert promo_discount("5000", "PERCENT", 10, 250) == Decimal("250.00")
+    assert promo_discount("80", "FLAT", 100) == Decimal("80.00")
+    with pytest.raises(ValueError):
+        promo_discount("100", "BOGO", 1)
+
+
+def test_cart_summary_cache_is_keyed_by_version(monkeypatch):
+    cache = CartSummaryCache(max_entries=2, ttl_seconds=60)
+    cache.put(1, 3, "v3")
+    assert cache.get(1, 3) == "v3"
+    assert cache.get(1, 4) is None
+    assert cache.get(1, None) is None
+
+    cache.put(2, 0, "b")
+    cache.put(3, 0, "c")
+    assert cache.get(1, 3) is None  # evicted (LRU, max 2)
+
+    cache.invalidate(2)
+    assert cache.get(2, 0) is None
+
+    clock = [100.0]
+    monkeypatch.setattr("backend.pricing.time.monotonic", lambda: clock[0])
+    cache.put(4, 1, "d")
+    clock[0] += 61
+    assert cache.get(4, 1) is None
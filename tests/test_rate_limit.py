@@ -0,0 +1,115 @@
+import pytest
+from fastapi import APIRouter, FastAPI
+
+from backend.rate_limit import (
+    MemoryRateLimitBackend,
+    RateLimiter,
+    RouteTemplateResolver,
+    sliding_window_step,
+    token_bucket_step,
+)
+from backend.settings import RouteLimit, Settings, _parse_route_limits
+
+
+def _settings(**overrides):
+    base = dict(
+        env="dev",
+        jwt_secret="",
+        rate_limit_enabled=True,
+        rate_limit_requests=3,
+        rate_limit_window_seconds=60,
+        rate_limit_backend="memory",
+        rate_limit_algorithm="token_bucket",
+        rate_limit_max_keys=1000,
+        rate_limit_routes=(),
+        chart_prewarm_enabled=False,
+        schema_listen_enabled=False,
+        outbox_dispatcher_enabled=False,
+    )
+    base.update(overrides)
+    return Settings(**base)
+
+
+def _app():
+    app = FastAPI()
+    router = APIRouter(prefix="/api/customer")
+
+    @router.get("/products/{product_id}")
+    def product(product_id: int):
+        return {}
+
+    @router.post("/cart")
+    def add_to_cart():
+        return {}
+
+    app.include_router(router)
+    return app
+
+
+def test_token_bucket_refills_over_time():
+    state, d = None, None
+    for _ in range(3):
+        state, d = token_bucket_step(state, 0.0, 3, 60)
+        assert d.allowed
+    state, d = token_bucket_step(state, 0.0, 3, 60)
+    assert not d.allowed and d.retry_after == pytest.approx(20.0)
+
+    state, d = token_bucket_step(state, 20.0, 3, 60)
+    assert d.allowed
+
+
+def test_sliding_window_weights_previous_window():
+    state = None
+    for _ in range(4):
+        state, d = sliding_window_step(state, 0.0, 4, 10)
+        assert d.allowed
+    state, d = sliding_window_step(state, 5.0, 4, 10)
+    assert not d.allowed
+
+    # Halfway into the next window half of the previous window's hits still count.
+    state, d = sliding_window_step(state, 15.0, 4, 10)
+    assert d.allowed
+    state, d = sliding_window_step(state, 15.0, 4, 10)
+    assert d.allowed
+    state, d = sliding_window_step(state, 15.0, 4, 10)
+    assert not d.allowed
+
+
+def test_memory_backend_is_bounded():
+    backend = MemoryRateLimitBackend("token_bucket", max_keys=100, idle_ttl_seconds=60)
+    for i in range(1000):
+        backend.hit(f"10.0.{i // 256}.{i % 256}|*|/api/x", 5, 60)
+    assert len(backend) == 100
+
+
+def test_route_templates_share_one_bucket():
+    app = _app()
+    resolver = RouteTemplateResolver(app.router.routes)
+
+    assert resolver.resolve("GET", "/api/customer/products/1") == "/api/customer/products/{product_id}"
+    assert resolver.resolve("GET", "/api/customer/products/999") == "/api/customer/products/{product_id}"
+    assert resolver.resolve("GET", "/api/customer/cart") == "/api/customer/cart"
+    assert resolver.resolve("GET", "/api/nope/1") == RouteTemplateResolver.UNMATCHED
+
+    limiter = RateLimiter(_settings(), app.router.routes)
+    decisions = [limiter.check("1.2.3.4", "GET", f"/api/customer/products/{i}") for i in range(4)]
+    assert [d.allowed for d in decisions] == [True, True, True, False]
+    assert limiter.check("5.6.7.8", "GET", "/api/customer/products/1").allowed
+    assert limiter.check("1.2.3.4", "GET", "/shop/index.html") is None
+
+
+def test_per_route_limits():
+    app = _app()
+    routes = _parse_route_limits("POST /api/customer/cart=1/60")
+    assert routes == (RouteLimit("POST", "/api/customer/cart", 1, 60),)
+
+    limiter = RateLimiter(_settings(rate_limit_routes=routes), app.router.routes)
+    assert limiter.check("1.2.3.4", "POST", "/api/customer/cart").allowed
+    assert not limiter.check("1.2.3.4", "POST", "/api/customer/cart").allowed
+    # GET on the same path falls back to the default limit.
+    assert limiter.check("1.2.3.4", "GET", "/api/customer/cart").allowed
+
+
+def test_invalid_route_limit_config():
+    with pytest.raises(RuntimeError):
+        _parse_route_limits("POST /api/customer/cart=lots")
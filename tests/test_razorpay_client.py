@@ -0,0 +1,132 @@
+import asyncio
+
+import httpx
+import pytest
+
+from backend.razorpay_client import CircuitBreaker, RazorpayClient, RazorpayError
+from backend.razorpay_stub import StubState, create_app
+
+_AUTH = "Basic cnpwX3Rlc3Q6c2VjcmV0"
+_ORDER = {"amount": 129900, "currency": "INR", "receipt": "gc_order_1"}
+
+
+def _client(state, **kw):
+    transport = httpx.ASGITransport(app=create_app(state))
+    return RazorpayClient(base_url="http://razorpay.test/v1", backoff_base=0.0, transport=transport, **kw)
+
+
+def test_create_order_reuses_one_pooled_client():
+    state = StubState()
+    client = _client(state)
+
+    async def go():
+        first = await client.create_order(_ORDER, auth=_AUTH)
+        http = client._http()
+        second = await client.create_order(_ORDER, auth=_AUTH)
+        assert client._http() is http
+        await client.aclose()
+        return first, second
+
+    first, second = asyncio.run(go())
+    assert first["id"].startswith("order_") and first["amount"] == 129900
+    assert first["id"] != second["id"]
+    assert state.requests == 2
+
+
+def test_rate_limited_create_is_retried():
+    state = StubState()
+    state.fail_next(429, 429)
+    client = _client(state, max_retries=2)
+
+    data = asyncio.run(client.create_order(_ORDER, auth=_AUTH))
+    assert data["status"] == "created"
+    assert state.requests == 3
+    assert client.breaker.state == "closed"
+
+
+def test_create_is_not_retried_after_a_5xx():
+    state = StubState()
+    state.fail_next(503)
+    client = _client(state, max_retries=2)
+
+    with pytest.raises(RazorpayError):
+        asyncio.run(client.create_order(_ORDER, auth=_AUTH))
+    assert state.requests == 1
+
+
+class _FlakyTransport(httpx.AsyncBaseTransport):
+    """Raises ``errors`` in turn, then hands requests to the stub."""
+
+    def __init__(self, state, *errors):
+        self.inner = httpx.ASGITransport(app=create_app(state))
+        self.errors = list(errors)
+        self.calls = 0
+
+    async def handle_async_request(self, request):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return await self.inner.handle_async_request(request)
+
+
+def test_create_is_retried_only_when_the_request_was_not_sent():
+    state = StubState()
+    transport = _FlakyTransport(state, httpx.ConnectError("refused"), httpx.ConnectTimeout("slow"))
+    client = RazorpayClient(base_url="http://razorpay.test/v1", backoff_base=0.0, max_retries=2, transport=transport)
+    assert asyncio.run(client.create_order(_ORDER, auth=_AUTH))["status"] == "created"
+    assert transport.calls == 3 and state.requests == 1
+
+    # The order may have been created before the response was lost.
+    state = StubState()
+    transport = _FlakyTransport(state, httpx.ReadTimeout("lost"))
+    client = RazorpayClient(base_url="http://razorpay.test/v1", backoff_base=0.0, max_retries=2, transport=transport)
+    with pytest.raises(RazorpayError):
+        asyncio.run(client.create_order(_ORDER, auth=_AUTH))
+    assert transport.calls == 1
+
+
+def test_rejected_request_is_not_retried_or_counted_as_outage():
+    state = StubState()
+    client = _client(state, max_retries=2, breaker=CircuitBreaker(failure_threshold=1))
+
+    with pytest.raises(RazorpayError) as e:
+        asyncio.run(client.create_order({**_ORDER, "amount": 5}, auth=_AUTH))
+    assert e.value.status_code == 502
+    assert state.requests == 1
+    assert client.breaker.state == "closed"
+
+
+def test_circuit_opens_then_half_opens_after_reset(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr("backend.razorpay_client.time.monotonic", lambda: clock[0])
+    state = StubState()
+    state.fail_next(500, 500)
+    client = _client(state, max_retries=0, breaker=CircuitBreaker(failure_threshold=2, reset_seconds=30))
+
+    for _ in range(2):
+        with pytest.raises(RazorpayError):
+            asyncio.run(client.create_order(_ORDER, auth=_AUTH))
+    assert client.breaker.state == "open"
+
+    with pytest.raises(RazorpayError) as e:
+        asyncio.run(client.create_order(_ORDER, auth=_AUTH))
+    assert e.value.status_code == 503 and e.value.retry_after == 30
+    assert state.requests == 2  # failed fast, provider not called
+
+    clock[0] += 31
+    assert client.breaker.state == "half_open"
+    asyncio.run(client.create_order(_ORDER, auth=_AUTH))
+    assert client.breaker.state == "closed"
+
+
+def test_failed_half_open_trial_reopens_immediately(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr("backend.razorpay_client.time.monotonic", lambda: clock[0])
+    breaker = CircuitBreaker(failure_threshold=3, reset_seconds=10)
+    for _ in range(3):
+        breaker.record_failure()
+    clock[0] += 11
+    assert breaker.allow()
+    assert not breaker.allow()  # only one trial at a time
+    breaker.record_failure()
+    assert breaker.state == "open"
@@ -0,0 +1,105 @@
+from types import SimpleNamespace
+
+import pytest
+
+pa = pytest.importorskip("pyarrow")
+
+from src.analytics import common  # noqa: E402
+
+_ROWS = b'1,2025-01-01 00:00:00,12.50,t,abc,2025-01-01 05:30:00+05:30\n2,2025-01-02 10:00:00,,f,"",\n3,2025-01-03 00:00:00,3,t,,\n'
+
+
+class _Copy:
+    def __init__(self, data: bytes, chunk: int = 7):
+        self._chunks = [data[i : i + chunk] for i in range(0, len(data), chunk)]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def read(self):
+        return memoryview(self._chunks.pop(0)) if self._chunks else b""
+
+
+class _Cursor:
+    description = [
+        SimpleNamespace(name="order_id", type_code=20),
+        SimpleNamespace(name="order_ts", type_code=1114),
+        SimpleNamespace(name="net_amount", type_code=1700),
+        SimpleNamespace(name="is_paid", type_code=16),
+        SimpleNamespace(name="channel", type_code=1043),
+        SimpleNamespace(name="captured_ts", type_code=1184),
+    ]
+
+    def __init__(self, data: bytes):
+        self.data = data
+        self.executed = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params=None):
+        self.executed.append(sql)
+
+    def copy(self, sql, params=None):
+        self.executed.append(sql)
+        return _Copy(self.data)
+
+
+class _Conn:
+    def __init__(self, data: bytes):
+        self.data = data
+
+    def cursor(self):
+        return _Cursor(self.data)
+
+
+def _frame(data: bytes, dtype_backend="numpy", block_bytes=1 << 20, numeric_as_text=False):
+    batches = list(common._copy_batches(_Conn(data), "SELECT 1", None, block_bytes, numeric_as_text))
+    return common._to_pandas(pa.Table.from_batches(batches), dtype_backend)
+
+
+def test_copy_rows_get_postgres_dtypes():
+    df = _frame(_ROWS)
+
+    assert df["order_id"].dtype == "int64"
+    assert str(df["order_ts"].dtype) == "datetime64[us]"
+    assert df["net_amount"].dtype == "float64" and df["net_amount"].isna().tolist() == [False, True, False]
+    assert df["is_paid"].tolist() == [True, False, True]
+    # COPY quotes empty strings and leaves NULL unquoted.
+    assert df["channel"].tolist() == ["abc", "", None]
+    assert str(df["captured_ts"].iloc[0]) == "2025-01-01 00:00:00+00:00"
+
+
+def test_quoted_newlines_stay_inside_the_value():
+    data = b"".join(b'%d,2025-01-01 00:00:00,1.5,t,"line one\nline two",\n' % i for i in range(50))
+    df = _frame(data, block_bytes=64)
+    assert df["order_id"].tolist() == list(range(50))
+    assert set(df["channel"]) == {"line one\nline two"}
+
+
+def test_numeric_as_text_keeps_postgres_digits():
+    df = _frame(_ROWS, numeric_as_text=True)
+    assert df["net_amount"].tolist() == ["12.50", None, "3"]
+    assert df.to_csv(index=False).splitlines()[1].split(",")[2] == "12.50"
+
+
+def test_arrow_backend_and_empty_result():
+    assert str(_frame(_ROWS, dtype_backend="pyarrow")["channel"].dtype) == "string[pyarrow]"
+
+    empty = _frame(b"")
+    assert empty.empty and list(empty.columns)[0] == "order_id"
+    assert str(empty["order_ts"].dtype) == "datetime64[us]"
+
+
+@pytest.mark.parametrize("block_bytes", [1 << 20, 64])
+def test_small_blocks_stream_the_same_rows(block_bytes):
+    data = b"".join(b"%d,2025-01-01 00:00:00,1.5,t,x,\n" % i for i in range(500))
+    batches = list(common._copy_batches(_Conn(data), "SELECT 1", None, block_bytes))
+    assert sum(b.num_rows for b in batches) == 500
+    assert (len(batches) > 1) == (block_bytes == 64)
@@ -0,0 +1,57 @@
+import os
+import time
+from pathlib import Path
+
+import pytest
+
+from backend.analytics import render_pool as rp
+
+
+def _draw_or_hang(chart, out_path, columns, rows, params):
+    if chart == "hang":
+        time.sleep(60)
+    Path(out_path).write_bytes(b"png:" + chart.encode())
+    return out_path
+
+
+def _skip_warm():
+    pass
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    monkeypatch.setattr(rp, "_draw", _draw_or_hang)
+    monkeypatch.setattr(rp, "_warm_worker", _skip_warm)
+    p = rp.RenderPool(workers=1, timeout_seconds=2)
+    p.start()
+    yield p
+    p.shutdown()
+
+
+def test_timeout_kills_the_worker_and_never_writes_the_output(pool, tmp_path):
+    out = tmp_path / "chart.png"
+    stuck = list(pool._executor._processes.values())
+
+    started = time.monotonic()
+    with pytest.raises(rp.RenderTimeout):
+        pool.render("hang", out, [], [], {})
+    assert time.monotonic() - started < 10
+
+    assert not any(p.is_alive() for p in stuck)
+    assert not out.exists()
+    assert list(tmp_path.iterdir()) == []
+    assert pool.stats()["timeouts"] == 1
+
+    # The single slot is usable again straight away.
+    assert pool.render("ok", out, [], [], {}) == out
+    assert out.read_bytes() == b"png:ok"
+    assert list(tmp_path.iterdir()) == [out]
+    stats = pool.stats()
+    assert stats["completed"] == 1 and stats["failed"] == 0 and stats["queue_depth"] == 0
+
+
+def test_inline_render_moves_the_temp_file_into_place(monkeypatch, tmp_path):
+    monkeypatch.setattr(rp, "_draw", _draw_or_hang)
+    out = tmp_path / "chart.png"
+    assert rp.RenderPool(workers=0, timeout_seconds=2).render("ok", out, [], [], {}) == out
+    assert os.listdir(tmp_path) == ["chart.png"]
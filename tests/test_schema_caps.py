@@ -0,0 +1,63 @@
+from backend.schema_caps import SchemaCapabilities
+
+
+class _Cursor:
+    def __init__(self, conn):
+        self._conn = conn
+        self._rows = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params):
+        self._conn.probes += 1
+        self._rows = [(n, n in self._conn.existing) for n in params[0]]
+
+    def fetchall(self):
+        return self._rows
+
+
+class _Conn:
+    def __init__(self, existing):
+        self.existing = set(existing)
+        self.probes = 0
+
+    def cursor(self):
+        return _Cursor(self)
+
+
+def test_probes_all_objects_once_then_serves_from_cache():
+    caps = SchemaCapabilities(["globalcart.a", "globalcart.b"])
+    conn = _Conn({"globalcart.a"})
+
+    assert caps.has(conn, "globalcart.a") is True
+    assert caps.has(conn, "globalcart.b") is False
+    assert caps.has_all(conn, ["globalcart.a", "globalcart.a"]) is True
+    assert conn.probes == 1
+
+
+def test_invalidate_and_missing_ttl_trigger_reprobe():
+    caps = SchemaCapabilities(["globalcart.a"], missing_ttl_seconds=0)
+    conn = _Conn(set())
+
+    assert caps.has(conn, "globalcart.a") is False
+    conn.existing.add("globalcart.a")
+    # Missing objects are re-checked once the TTL has passed (0 here).
+    assert caps.has(conn, "globalcart.a") is True
+    assert conn.probes == 2
+
+    caps.invalidate()
+    conn.existing.clear()
+    assert caps.has(conn, "globalcart.a") is False
+    assert conn.probes == 3
+
+
+def test_unregistered_name_is_added_to_the_probe_set():
+    caps = SchemaCapabilities(["globalcart.a"])
+    conn = _Conn({"globalcart.a", "globalcart.extra"})
+
+    assert caps.has(conn, "globalcart.extra") is True
+    assert caps.snapshot() == {"globalcart.a": True, "globalcart.extra": True}
@@ -0,0 +1,31 @@
+import re
+from pathlib import Path
+
+from src.staging_merge import MERGE_LEVELS
+
+_SQL = (Path(__file__).resolve().parents[1] / "sql" / "04_incremental_refresh.sql").read_text(encoding="utf-8")
+_SCHEMA = (Path(__file__).resolve().parents[1] / "sql" / "00_schema.sql").read_text(encoding="utf-8")
+
+
+def _references(table: str) -> set:
+    m = re.search(rf"CREATE TABLE IF NOT EXISTS globalcart\.{table} \((.*?)\n\);", _SCHEMA, re.S)
+    assert m, table
+    return set(re.findall(r"REFERENCES globalcart\.(\w+)\(", m.group(1)))
+
+
+def test_every_level_only_references_earlier_levels():
+    merged = set()
+    for level in MERGE_LEVELS:
+        for table in level:
+            assert _references(table) & set(level) == set()
+            assert _references(table) & {t for lvl in MERGE_LEVELS for t in lvl} <= merged
+        merged.update(level)
+
+
+def test_single_transaction_merge_uses_the_same_order():
+    m = re.search(r"FOREACH t IN ARRAY ARRAY\[(.*?)\] LOOP", _SQL, re.S)
+    assert m
+    assert re.findall(r"'(\w+)'", m.group(1)) == [t for level in MERGE_LEVELS for t in level]
+    for level in MERGE_LEVELS:
+        for table in level:
+            assert f"FUNCTION globalcart.upsert_{table}_from_stg()" in _SQL
@@ -0,0 +1,63 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+_PROJECT_ROOT = Path(__file__).resolve().parents[1]
+
+# Only the chart render workers need these; an API worker must not pay for them at import.
+_HEAVY_MODULES = {"pandas", "numpy", "matplotlib", "seaborn", "scipy", "sklearn", "statsmodels"}
+
+# Peak RSS of the probe's own address space. ru_maxrss survives exec, so on Linux it would also
+# count the pytest process the probe was forked from (large once other tests import pandas).
+_PROBE = (
+    "import resource, backend.main\n"
+    "try:\n"
+    "    print(next(int(l.split()[1]) for l in open('/proc/self/status') if l.startswith('VmHWM:')))\n"
+    "except (OSError, StopIteration):\n"
+    "    print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)\n"
+)
+
+
+def _budget(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, str(default)))
+    except ValueError:
+        return default
+
+
+def _cold_import():
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _PROBE],
+        cwd=str(_PROJECT_ROOT),
+        capture_output=True,
+        text=True,
+        timeout=120,
+    )
+    assert proc.returncode == 0, proc.stderr[-2000:]
+
+    cumulative_us = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        parts = [p.strip() for p in line[len("import time:"):].split("|")]
+        if len(parts) != 3 or not parts[1].isdigit():
+            continue
+        cumulative_us[parts[2]] = int(parts[1])
+
+    rss_kb = int(proc.stdout.strip().splitlines()[-1])
+    return cumulative_us, rss_kb
+
+
+def test_api_cold_start_skips_analytics_stack_and_stays_within_budget():
+    cumulative_us, rss_kb = _cold_import()
+
+    imported_heavy = sorted(m for m in cumulative_us if m.split(".")[0] in _HEAVY_MODULES)
+    assert not imported_heavy, f"heavy modules imported by backend.main: {imported_heavy[:10]}"
+
+    import_ms = cumulative_us["backend.main"] / 1000.0
+    rss_mb = rss_kb / 1024.0
+    print(f"\nbackend.main cold import: {import_ms:.0f} ms, worker RSS after import: {rss_mb:.1f} MiB")
+
+    assert import_ms < _budget("STARTUP_IMPORT_BUDGET_MS", 4000)
+    assert rss_mb < _budget("STARTUP_RSS_BUDGET_MB", 150)